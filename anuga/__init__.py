@@ -132,6 +132,7 @@ else:
     from anuga.parallel.parallel_api import send, receive
     from anuga.parallel.parallel_api import pypar_available, barrier, finalize
     from anuga.parallel.parallel_api import collect_value
+    from anuga.parallel.parallel_api import allreduce, allgather, bcast
 
     if pypar_available:
         from anuga.parallel.parallel_api import sequential_distribute_dump
@@ -204,7 +205,9 @@ else:
     from anuga.file_conversion.dem2pts import dem2pts                    
     from anuga.file_conversion.esri2sww import esri2sww   
     from anuga.file_conversion.sww2dem import sww2dem, sww2dem_batch 
+    from anuga.file_conversion.sww2dem import sww2dem_multiple
     from anuga.file_conversion.asc2dem import asc2dem
+    from anuga.file_conversion.asc2ers import asc2ers
     from anuga.file_conversion.xya2pts import xya2pts     
     from anuga.file_conversion.ferret2sww import ferret2sww     
     from anuga.file_conversion.dem2dem import dem2dem
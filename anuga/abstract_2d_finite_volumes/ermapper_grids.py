@@ -2,7 +2,10 @@
 
 import numpy as num
 
-celltype_map = {'IEEE4ByteReal': num.float32, 'IEEE8ByteReal': num.float64}
+celltype_map = {'IEEE4ByteReal': num.float32, 'IEEE8ByteReal': num.float64,
+                'Signed16BitInteger': num.int16,
+                'Signed32BitInteger': num.int32,
+                'Unsigned8BitInteger': num.uint8}
 
 
 def write_ermapper_grid(ofile, data, header = {}):
@@ -143,7 +146,7 @@ def write_ermapper_header(ofile, header = {}):
     fid.write('\tRasterInfo End\n')
     fid.write('DatasetHeader End\n')
     
-    fid.close
+    fid.close()
 
 def read_ermapper_header(ifile):
     # function for reading an ERMapper header from file
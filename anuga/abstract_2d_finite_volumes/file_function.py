@@ -31,7 +31,8 @@ def file_function(filename,
                   verbose=False,
                   use_cache=False,
                   boundary_polygon=None,
-                  output_centroids=False):
+                  output_centroids=False,
+                  window_size=None):
     """Read time history of spatial data from NetCDF file and return
     a callable object.
 
@@ -76,6 +77,11 @@ def file_function(filename,
 
     boundary_polygon - 
 
+    window_size - If specified, values at the interpolation points of an
+                  sww or sts file are read window_size timesteps at a
+                  time as model time advances rather than all up front.
+                  See Streaming_interpolation_function.
+
     
     See Interpolation function in anuga.fit_interpolate.interpolation for
     further documentation
@@ -117,7 +123,8 @@ def file_function(filename,
               'time_limit': time_limit,                                 
               'verbose': verbose,
               'boundary_polygon': boundary_polygon,
-              'output_centroids': output_centroids}
+              'output_centroids': output_centroids,
+              'window_size': window_size}
 
     # Call underlying engine with or without caching
     if use_cache is True:
@@ -169,7 +176,8 @@ def _file_function(filename,
                    time_limit=None,
                    verbose=False,
                    boundary_polygon=None,
-                   output_centroids=False):
+                   output_centroids=False,
+                   window_size=None):
     """Internal function
     
     See file_function for documentatiton
@@ -203,7 +211,8 @@ def _file_function(filename,
                                         time_limit=time_limit,
                                         verbose=verbose,
                                         boundary_polygon=boundary_polygon,
-                                        output_centroids=output_centroids)
+                                        output_centroids=output_centroids,
+                                        window_size=window_size)
     elif ext in [".csv"]:
         # FIXME (Ole): Could add csv file here to address Ted Rigby's
         # suggestion about reading hydrographs.
@@ -222,7 +231,8 @@ def get_netcdf_file_function(filename,
                              time_limit=None,            
                              verbose=False,
                              boundary_polygon=None,
-                             output_centroids=False):
+                             output_centroids=False,
+                             window_size=None):
     """Read time history of spatial data from NetCDF sww file and
     return a callable object f(t,x,y)
     which will return interpolated values based on the input file.
@@ -441,8 +451,39 @@ def get_netcdf_file_function(filename,
             log.critical('    Lower left corner: [%f, %f]'
                          % (xllcorner, yllcorner))
         log.critical('    Start time:   %f' % starttime)
-        
-    
+
+    if window_size is not None and spatial and \
+           interpolation_points is not None and not output_centroids:
+        # Read values from file as model time advances
+        fid.close()
+
+        from anuga.fit_interpolate.interpolate \
+             import Streaming_interpolation_function
+
+        if filename[-3:] == 'sts':
+            triangles = None
+        if boundary_polygon is None:
+            gauge_id = None
+
+        time_index = num.arange(len(time))[::time_thinning]
+
+        if verbose:
+            log.critical('Calling streaming interpolation function')
+
+        return (Streaming_interpolation_function(filename,
+                                                 time[::time_thinning],
+                                                 time_index,
+                                                 quantity_names,
+                                                 vertex_coordinates,
+                                                 triangles,
+                                                 interpolation_points,
+                                                 gauge_id=gauge_id,
+                                                 gauge_neighbour_id=\
+                                                     gauge_neighbour_id,
+                                                 window_size=window_size,
+                                                 verbose=verbose),
+                starttime)
+
     # Produce values for desired data points at
     # each timestep for each quantity
     quantities = {}
@@ -11,6 +11,7 @@
 import numpy as num
 
 from anuga.geospatial_data.geospatial_data import ensure_absolute
+from anuga.utilities.numerical_tools import NAN
 from util import check_list, calc_bearing
 from file_function import file_function
 
@@ -22,61 +23,366 @@ import anuga.utilities.log as log
 
 from math import sqrt
 
-def _quantities2csv(quantities, point_quantities, centroids, point_i):
-    points_list = []
-    
-    for quantity in quantities:
-        #core quantities that are exported from the interpolator     
-        if quantity == 'stage':
-            points_list.append(point_quantities[0])
-            
-        if quantity == 'elevation':
-            points_list.append(point_quantities[1])
-            
-        if quantity == 'xmomentum':
-            points_list.append(point_quantities[2])
-            
-        if quantity == 'ymomentum':
-            points_list.append(point_quantities[3])
+# Quantities stored in sww files from which the others are derived
+core_quantities = ['stage', 'elevation', 'xmomentum', 'ymomentum']
+
+# Quantities derived from the core quantities and the mesh
+derived_quantities = ['depth', 'momentum', 'speed', 'bearing',
+                      'xcentroid', 'ycentroid']
+
+
+def _calc_bearings(uh, vh):
+    """Vectorised calc_bearing: bearings from North (degrees) of arrays
+    of momenta, NAN where both components are zero.
+    """
+
+    momentum = num.sqrt(uh**2 + vh**2)
+    momentum = num.where(momentum > 0, momentum, 1.0)
+
+    # Angle from South ([0, -1]) measured counter clockwise
+    theta = num.arccos(num.clip(-vh/momentum, -1.0, 1.0))
+    theta = num.where(uh < 0, 2*num.pi - theta, theta)
+
+    return num.where((uh == 0) & (vh == 0), NAN, num.degrees(theta))
+
+
+def _gauge_quantities(quantities, values, centroids):
+    """Return list of arrays of the requested quantities at the gauges.
+
+    values is a dictionary of k x n arrays of the quantities read from
+    the sww file at k times and n gauges, centroids the n x 2 array of
+    the centroids of the triangles containing the gauges.
+    """
+
+    stage = values['stage']
+    elevation = values['elevation']
+    uh = values['xmomentum']
+    vh = values['ymomentum']
 
-        #derived quantities that are calculated from the core ones
+    result = []
+    for quantity in quantities:
         if quantity == 'depth':
-            points_list.append(point_quantities[0] 
-                               - point_quantities[1])
+            result.append(stage - elevation)
 
-        if quantity == 'momentum':
-            momentum = sqrt(point_quantities[2]**2 
-                            + point_quantities[3]**2)
-            points_list.append(momentum)
-            
-        if quantity == 'speed':
-            #if depth is less than 0.001 then speed = 0.0
-            if point_quantities[0] - point_quantities[1] < 0.001:
-                vel = 0.0
+        elif quantity == 'momentum':
+            result.append(num.sqrt(uh**2 + vh**2))
+
+        elif quantity == 'speed':
+            # Speed is zero if depth is less than 0.001
+            depth = stage - elevation
+            wet = (depth >= 0.001) & (uh < 1.0e6)
+            depth = num.where(wet, depth, 1.0)
+            result.append(num.where(wet, num.sqrt(uh**2 + vh**2)/depth, 0.0))
+
+        elif quantity == 'bearing':
+            result.append(_calc_bearings(uh, vh))
+
+        elif quantity == 'xcentroid':
+            result.append(num.resize(centroids[:,0], stage.shape))
+
+        elif quantity == 'ycentroid':
+            result.append(num.resize(centroids[:,1], stage.shape))
+
+        else:
+            result.append(values[quantity])
+
+    return result
+
+
+def _gauge_interpolation_matrix(vertex_coordinates, triangles, points,
+                                output_centroids=False):
+    """Build interpolation matrix from the vertex values of the mesh given
+    by vertex_coordinates and triangles to the points inside it.
+
+    All triangles containing the points are located in one batched
+    search. If output_centroids is True values are interpolated at the
+    centroids of these triangles instead of at the points.
+
+    Return sparse matrix A (one row per point inside the mesh), the
+    indices of the points inside the mesh and the centroids of the
+    triangles containing them.
+    """
+
+    from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+    from anuga.utilities.sparse import Sparse_CSR
+
+    mesh = Mesh(vertex_coordinates, triangles)
+
+    ids = mesh.get_triangles_containing_points(points)
+    inside = num.flatnonzero(ids >= 0)
+    ids = ids[inside]
+
+    vertices = mesh.triangles[ids]
+    n = len(ids)
+
+    if output_centroids:
+        # Weight all 3 vertices equally
+        sigmas = num.ones((n, 3), num.float)/3.0
+    else:
+        # Barycentric coordinates of the points in their triangles
+        xy = mesh.nodes[vertices]
+        x = points[inside,0] - xy[:,0,0]
+        y = points[inside,1] - xy[:,0,1]
+        x1 = xy[:,1,0] - xy[:,0,0]
+        y1 = xy[:,1,1] - xy[:,0,1]
+        x2 = xy[:,2,0] - xy[:,0,0]
+        y2 = xy[:,2,1] - xy[:,0,1]
+        det = x1*y2 - x2*y1
+
+        sigmas = num.zeros((n, 3), num.float)
+        sigmas[:,1] = (x*y2 - x2*y)/det
+        sigmas[:,2] = (x1*y - x*y1)/det
+        sigmas[:,0] = 1.0 - sigmas[:,1] - sigmas[:,2]
+
+    A = Sparse_CSR(None,
+                   num.ascontiguousarray(sigmas.reshape(-1)),
+                   num.array(vertices.reshape(-1), num.int),
+                   num.arange(0, 3*n+1, 3).astype(num.int),
+                   int(n), int(mesh.number_of_nodes))
+
+    return A, inside, mesh.centroid_coordinates[ids]
+
+
+def _gauge_frame_blocks(fid, A, quantities, time_thinning=1,
+                        frames_per_block=None):
+    """Read the quantities of an open sww file block of frames by block
+    and interpolate them with matrix A.
+
+    Each block takes one sparse matrix multiplication for all quantities.
+    Yield tuples (time, values) for each block where values is a
+    dictionary of k x n arrays for the k times of the block.
+    """
+
+    from anuga.file.sww import get_frames_per_block
+
+    time = num.array(fid.variables['time'][:], num.float)
+    index = num.arange(0, len(time), time_thinning)
+    n = A.M
+
+    static = {}
+    dynamic = []
+    for name in quantities:
+        variable = fid.variables[name]
+        if len(variable.shape) == 1:
+            # No time dependency
+            if n > 0:
+                static[name] = A * num.array(variable[:], num.float)
             else:
-                if point_quantities[2] < 1.0e6:
-                    momentum = sqrt(point_quantities[2]**2
-                                    + point_quantities[3]**2)
-                    vel = momentum / (point_quantities[0] 
-                                      - point_quantities[1])
-                else:
-                    momentum = 0
-                    vel = 0
-                
-            points_list.append(vel)
-            
-        if quantity == 'bearing':
-            points_list.append(calc_bearing(point_quantities[2],
-                                            point_quantities[3]))
-        if quantity == 'xcentroid':
-            points_list.append(centroids[point_i][0])
+                static[name] = num.zeros(0, num.float)
+        else:
+            dynamic.append(name)
+
+    if frames_per_block is None:
+        number_of_values = A.N*len(dynamic)*time_thinning
+        frames_per_block = get_frames_per_block(number_of_values)
+
+    for start in range(0, len(index), frames_per_block):
+        block = index[start:start+frames_per_block]
+        k = len(block)
+
+        values = {}
+        if n > 0 and len(dynamic) > 0:
+            Q = [num.array(fid.variables[name]
+                           [block[0]:block[-1]+1:time_thinning,:], num.float).T
+                 for name in dynamic]
+            Z = A * num.concatenate(Q, axis=1)
+
+            for i, name in enumerate(dynamic):
+                values[name] = num.transpose(Z[:,i*k:(i+1)*k])
+        else:
+            for name in dynamic:
+                values[name] = num.zeros((k, n), num.float)
+
+        for name in static:
+            values[name] = num.resize(static[name], (k, n))
+
+        yield time[block], values
+
+
+def _open_gauges(sww_file, points, quantities, output_centroids=False,
+                 verbose=False):
+    """Open sww file and prepare interpolation to the gauge points
+    (absolute coordinates).
+
+    Return open file, starttime, list of quantities to read, interpolation
+    matrix, indices of the points inside the mesh and the centroids of
+    the triangles containing them.
+    """
+
+    from anuga.file.netcdf import NetCDFFile
+    from anuga.config import netcdf_mode_r
+
+    fid = NetCDFFile(sww_file, netcdf_mode_r)
+
+    starttime = float(fid.starttime)
+
+    stored = [name for name in quantities
+              if name not in core_quantities + derived_quantities]
+    for name in stored:
+        if not fid.variables.has_key(name):
+            msg = 'Quantity %s is neither stored in file %s nor one of %s' \
+                  % (name, sww_file, core_quantities + derived_quantities)
+            raise Exception(msg)
+
+    x = num.array(fid.variables['x'][:], num.float)
+    y = num.array(fid.variables['y'][:], num.float)
+    triangles = num.array(fid.variables['volumes'][:], num.int)
+
+    # Gauge points relative to the origin of the file
+    points = num.array(points, num.float)
+    points[:,0] -= fid.xllcorner
+    points[:,1] -= fid.yllcorner
+
+    A, inside, centroids = \
+        _gauge_interpolation_matrix(num.column_stack((x, y)), triangles,
+                                    points, output_centroids)
+
+    if verbose:
+        log.critical('%d of %d gauges are inside the mesh of %s'
+                     % (len(inside), len(points), sww_file))
+
+    return fid, starttime, core_quantities + stored, A, inside, centroids
+
+
+def get_gauge_timeseries(sww_file, points, quantities=core_quantities,
+                         output_centroids=False, time_thinning=1,
+                         frames_per_block=None, verbose=False):
+    """Interpolate quantities stored in, or derived from, an sww file at
+    a set of gauge points (absolute coordinates).
+
+    All gauges are located in one batched search of the mesh and the file
+    is read once, block of frames by block of frames.
+
+    Return relative time vector, starttime of the file and dictionary of
+    T x N arrays of values of each quantity, NAN at gauges outside the
+    mesh.
+    """
+
+    points = ensure_absolute(points)
+    quantities = [quantity.lower() for quantity in quantities]
+
+    fid, starttime, read_quantities, A, inside, centroids = \
+        _open_gauges(sww_file, points, quantities, output_centroids,
+                     verbose=verbose)
+
+    times = []
+    values = dict((name, []) for name in quantities)
+    for time, block in _gauge_frame_blocks(fid, A, read_quantities,
+                                           time_thinning, frames_per_block):
+        times.append(time)
+        for name, value in zip(quantities,
+                               _gauge_quantities(quantities, block,
+                                                 centroids)):
+            result = NAN*num.ones((len(time), len(points)), num.float)
+            result[:,inside] = value
+            values[name].append(result)
+
+    fid.close()
+
+    time = num.concatenate(times)
+    for name in quantities:
+        values[name] = num.concatenate(values[name])
+
+    return time, starttime, values
+
+
+class Gauge_timeseries:
+    """Time series of quantities at gauges returned by
+    get_gauge_timeseries, callable like the Interpolation_function
+    returned by file_function: f(t, point_id) gives the vector of values
+    of the quantities at gauge point_id and time t.
+    """
+
+    def __init__(self, sww_file, points, quantities=core_quantities,
+                 output_centroids=False, time_thinning=1, verbose=False):
+
+        self.time, self.starttime, self.values = \
+            get_gauge_timeseries(sww_file, points, quantities,
+                                 output_centroids=output_centroids,
+                                 time_thinning=time_thinning,
+                                 verbose=verbose)
+
+        self.quantity_names = [quantity.lower() for quantity in quantities]
+        self.Q = num.array([self.values[name]
+                            for name in self.quantity_names])
+
+
+    def __call__(self, t, point_id):
+
+        from anuga.fit_interpolate.interpolate import Modeltime_too_early
+        from anuga.fit_interpolate.interpolate import Modeltime_too_late
+
+        time = self.time
+
+        msg = 'Model time %.16f' % t
+        msg += ' is not contained in function domain [%.16f:%.16f].\n' \
+               % (time[0], time[-1])
+        if t < time[0]: raise Modeltime_too_early(msg)
+        if t > time[-1]: raise Modeltime_too_late(msg)
+
+        index = num.searchsorted(time, t, side='right') - 1
+        Q0 = self.Q[:,index,point_id]
+        if t == time[index]:
+            return Q0
+
+        # Linear temporal interpolation
+        ratio = (t - time[index])/(time[index+1] - time[index])
+        Q1 = self.Q[:,index+1,point_id]
+
+        return num.where((Q0 == NAN) & (Q1 == NAN), Q0, Q0 + ratio*(Q1 - Q0))
+
+
+    def get_time(self):
+        """Return model time as a vector of timesteps
+        """
+
+        return self.time
+
+
+def _write_gauges_netcdf(filename, points, names, quantities, time, values):
+    """Create NetCDF file of columnar gauge time series and return it
+    open for appending further blocks with _append_gauges_netcdf.
+    """
+
+    from anuga.file.netcdf import NetCDFFile
+    from anuga.config import netcdf_mode_w, netcdf_float
+
+    fid = NetCDFFile(filename, netcdf_mode_w)
+
+    fid.institution = 'Geoscience Australia'
+    fid.description = 'Time series of quantities at gauges'
+    fid.gauge_names = ','.join(names)
+
+    fid.createDimension('number_of_gauges', len(points))
+    fid.createDimension('number_of_timesteps', None)
+
+    fid.createVariable('x', netcdf_float, ('number_of_gauges',))
+    fid.createVariable('y', netcdf_float, ('number_of_gauges',))
+    fid.variables['x'][:] = points[:,0]
+    fid.variables['y'][:] = points[:,1]
+
+    fid.createVariable('time', netcdf_float, ('number_of_timesteps',))
+    fid.createVariable('hours', netcdf_float, ('number_of_timesteps',))
+    for quantity in quantities:
+        fid.createVariable(quantity, netcdf_float,
+                           ('number_of_timesteps', 'number_of_gauges'))
+
+    _append_gauges_netcdf(fid, quantities, time, values)
+
+    return fid
+
+
+def _append_gauges_netcdf(fid, quantities, time, values):
+
+    start = len(fid.variables['time'])
+    stop = start + len(time)
+
+    fid.variables['time'][start:stop] = time
+    fid.variables['hours'][start:stop] = time/3600.
+    for quantity, value in zip(quantities, values):
+        fid.variables[quantity][start:stop,:] = value
 
-        if quantity == 'ycentroid':
-            points_list.append(centroids[point_i][1])
 
-    return points_list
-    
-    
 def sww2csv_gauges(sww_file,
                    gauge_file,
                    out_name='gauge_',
@@ -84,7 +390,9 @@ def sww2csv_gauges(sww_file,
                                'xmomentum', 'ymomentum'],
                    verbose=False,
                    use_cache=True,
-                   output_centroids=False):
+                   output_centroids=False,
+                   output_format='csv',
+                   frames_per_block=None):
     """
     
     Inputs: 
@@ -104,6 +412,17 @@ def sww2csv_gauges(sww_file,
         must be the same! ALL lowercaps!
 
         out_name: prefix for output file name (default is 'gauge_')
+
+        output_format: 'csv' (default) for one file per gauge, 'nc' or
+        'npz' for a single NetCDF or numpy file with one column per gauge.
+
+        frames_per_block: number of frames of the sww file read and
+        interpolated at a time (default fits in max_block_memory of
+        anuga.file.sww).
+
+        use_cache: ignored, kept for backward compatibility. All gauges
+        are interpolated in one pass over the sww file, so there is
+        nothing to cache.
         
     Outputs: 
         one file for each gauge/point location in the points file. They
@@ -113,6 +432,14 @@ def sww2csv_gauges(sww_file,
            myfile_2_point1.csv if <out_name> ='myfile_2_'
             
         They will all have a header
+
+        For output_format 'nc' or 'npz' one file
+            <out_name>.nc or <out_name>.npz
+        (without the trailing underscore of out_name) in the same directory
+        with variables x, y (gauge locations), time, hours and one time x
+        gauge array for each quantity. Gauges outside the mesh are given
+        NAN values. The gauge names are stored in attribute (nc) or
+        array (npz) gauge_names.
     
     Usage: sww2csv_gauges(sww_file='test1.sww',
                           quantities = ['stage', 'elevation','depth','bearing'],
@@ -122,23 +449,22 @@ def sww2csv_gauges(sww_file,
     an sww file.
     The results are written to a csv file.
 
-    In the future let points be a points file.
-    And the user choose the quantities.
-
-    This is currently quite specific.
-    If it needs to be more general, change things.
+    All gauges are located in one batched search of the mesh and each
+    sww file is read once, block of frames by block of frames, with one
+    sparse matrix multiplication per block.
 
     This is really returning speed, not velocity.
     """
     
     from csv import reader,writer
-    from anuga.utilities.numerical_tools import ensure_numeric, mean, NAN
-    import string
     from anuga.utilities.file_utils import get_all_swwfiles
-    from anuga.abstract_2d_finite_volumes.util import file_function    
 
     assert isinstance(gauge_file,str) or isinstance(gauge_file, unicode), 'Gauge filename must be a string or unicode'
     assert isinstance(out_name,str) or isinstance(out_name, unicode), 'Output filename prefix must be a string'
+
+    msg = 'output_format must be one of csv, nc or npz. I got %s' \
+          % output_format
+    assert output_format in ['csv', 'nc', 'npz'], msg
     
     try:
         point_reader = reader(file(gauge_file))
@@ -166,7 +492,6 @@ def sww2csv_gauges(sww_file,
             points.append([float(row[easting]),float(row[northing])])
             point_name.append(row[name])
         
-    #convert to array for file_function
     points_array = num.array(points,num.float)
         
     points_array = ensure_absolute(points_array)
@@ -196,61 +521,103 @@ def sww2csv_gauges(sww_file,
     if verbose:
         log.critical('sww files=%s' % sww_files)
     
-    #to make all the quantities lower case for file_function
+    #to make all the quantities lower case
     quantities = [quantity.lower() for quantity in quantities]
 
-    # what is quantities are needed from sww file to calculate output quantities
-    # also 
-
-    core_quantities = ['stage', 'elevation', 'xmomentum', 'ymomentum']
-
     gauge_file = out_name
 
     heading = [quantity for quantity in quantities]
     heading.insert(0,'time')
     heading.insert(1,'hours')
     
-    if verbose: log.critical('Writing csv files')
+    if verbose: log.critical('Writing %s files' % output_format)
 
     quake_offset_time = None
 
-    is_opened = [False]*len(points_array)
+    n = len(points_array)
+    is_opened = [False]*n
+    netcdf_fid = None
+    blocks = []
     for sww_file in sww_files:
         sww_file = join(dir_name, sww_file+'.sww')
-        callable_sww = file_function(sww_file,
-                                     quantities=core_quantities,
-                                     interpolation_points=points_array,
-                                     verbose=verbose,
-                                     use_cache=use_cache,
-                                     output_centroids = output_centroids)
 
-        if quake_offset_time is None:
-            quake_offset_time = callable_sww.starttime
-
-        for point_i, point in enumerate(points_array):
-            for time in callable_sww.get_time():
-                # add domain starttime to relative time.
-                quake_time = time + quake_offset_time
-                point_quantities = callable_sww(time, point_i) # __call__ is overridden
+        fid, starttime, read_quantities, A, inside, centroids = \
+            _open_gauges(sww_file, points_array, quantities,
+                         output_centroids, verbose=verbose)
 
+        if quake_offset_time is None:
+            quake_offset_time = starttime
 
-                if point_quantities[0] != NAN:
+        if verbose:
+            for i in num.setdiff1d(num.arange(n), inside):
+                msg = 'gauge' + point_name[i] + 'falls off the mesh in file ' + sww_file + '.'
+                log.warning(msg)
+
+        for time, values in _gauge_frame_blocks(fid, A, read_quantities,
+                                                frames_per_block=\
+                                                    frames_per_block):
+            # add domain starttime to relative time.
+            quake_time = time + quake_offset_time
+            values = _gauge_quantities(quantities, values, centroids)
+
+            if output_format == 'csv':
+                # Rows of all gauges inside the mesh
+                rows = num.zeros((len(time), len(heading), len(inside)),
+                                 num.float)
+                rows[:,0,:] = quake_time[:,num.newaxis]
+                rows[:,1,:] = quake_time[:,num.newaxis]/3600.
+                for j, value in enumerate(values):
+                    rows[:,j+2,:] = value
+
+                for j, point_i in enumerate(inside):
+                    filename = dir_name + sep + gauge_file \
+                               + point_name[point_i] + '.csv'
                     if is_opened[point_i] == False:
-                        points_writer = writer(file(dir_name + sep + gauge_file
-                                                    + point_name[point_i] + '.csv', "wb"))
+                        points_handle = open(filename, 'wb')
+                        points_writer = writer(points_handle)
                         points_writer.writerow(heading)
                         is_opened[point_i] = True
                     else:
-                        points_writer = writer(file(dir_name + sep + gauge_file
-                                                    + point_name[point_i] + '.csv', "ab"))
-
+                        points_handle = open(filename, 'ab')
+                        points_writer = writer(points_handle)
 
-                    points_list = [quake_time, quake_time/3600.] +  _quantities2csv(quantities, point_quantities, callable_sww.centroids, point_i)
-                    points_writer.writerow(points_list)
+                    points_writer.writerows(rows[:,:,j].tolist())
+                    points_handle.close()
+            else:
+                # Columns of all gauges, NAN if outside the mesh
+                columns = []
+                for value in values:
+                    column = NAN*num.ones((len(time), n), num.float)
+                    column[:,inside] = value
+                    columns.append(column)
+
+                if output_format == 'nc':
+                    if netcdf_fid is None:
+                        netcdf_fid = _write_gauges_netcdf(
+                            join(dir_name, out_name.rstrip('_') + '.nc'),
+                            points_array, point_name, quantities,
+                            quake_time, columns)
+                    else:
+                        _append_gauges_netcdf(netcdf_fid, quantities,
+                                              quake_time, columns)
                 else:
-                    if verbose:
-                        msg = 'gauge' + point_name[point_i] + 'falls off the mesh in file ' + sww_file + '.'
-                        log.warning(msg)
+                    blocks.append([quake_time] + columns)
+
+        fid.close()
+
+    if netcdf_fid is not None:
+        netcdf_fid.close()
+
+    if output_format == 'npz':
+        arrays = {'x': points_array[:,0],
+                  'y': points_array[:,1],
+                  'gauge_names': num.array(point_name)}
+        for j, name in enumerate(['time'] + quantities):
+            arrays[name] = num.concatenate([block[j] for block in blocks])
+        arrays['hours'] = arrays['time']/3600.
+
+        num.savez(join(dir_name, out_name.rstrip('_') + '.npz'), **arrays)
+
 
 def sww2timeseries(swwfiles,
                    gauge_filename,
@@ -334,6 +701,9 @@ def sww2timeseries(swwfiles,
     title_on        - if True, export standard graphics with title
                     - if False, export standard graphics without title
 
+    use_cache       - ignored, kept for backward compatibility. The gauges
+                      are interpolated in one pass over each sww file.
+
 
     Output:
     
@@ -462,13 +832,12 @@ def _sww2timeseries(swwfiles,
         
         leg_label.append(label)
 
-        f = file_function(swwfile,
-                          quantities = sww_quantity,
-                          interpolation_points = gauges,
-                          time_thinning = time_thinning,
-                          verbose = verbose,
-                          use_cache = use_cache,
-                          output_centroids = output_centroids)
+        f = Gauge_timeseries(swwfile,
+                             gauges,
+                             quantities = sww_quantity,
+                             output_centroids = output_centroids,
+                             time_thinning = time_thinning,
+                             verbose = verbose)
 
         # determine which gauges are contained in sww file
         count = 0
@@ -87,6 +87,65 @@ class Boundary:
                 Q.boundary_values[i] = q_evol[j]
 
 
+    def set_segment_values(self, domain, segment_edges, q_bdry):
+        """Vectorised counterpart to the loop in evaluate_segment.
+
+        q_bdry is either a vector with one value per quantity, applied to
+        all edges, or an array of shape (len(segment_edges), d) with one
+        row per edge. d must be the number of evolved or of conserved
+        quantities. In the latter case the remaining evolved quantities
+        are taken from the interior edge values.
+        """
+
+        ids = segment_edges
+        q_bdry = num.asarray(q_bdry, num.float)
+
+        if q_bdry.shape[-1] == len(domain.evolved_quantities):
+            quantities = domain.evolved_quantities
+        elif q_bdry.shape[-1] == len(domain.conserved_quantities):
+            quantities = domain.conserved_quantities
+
+            vol_ids  = domain.boundary_cells[ids]
+            edge_ids = domain.boundary_edges[ids]
+            for name in domain.evolved_quantities:
+                if name not in quantities:
+                    Q = domain.quantities[name]
+                    Q.boundary_values[ids] = Q.edge_values[vol_ids,edge_ids]
+        else:
+            msg = 'Boundary must return array of either conserved'
+            msg += ' or evolved quantities'
+            raise Exception(msg)
+
+        for j, name in enumerate(quantities):
+            Q = domain.quantities[name]
+            if q_bdry.ndim == 1:
+                Q.boundary_values[ids] = q_bdry[j]
+            else:
+                Q.boundary_values[ids] = q_bdry[:,j]
+
+
+    def evaluate_default_segment(self, domain, segment_edges, e):
+        """Pass control to default boundary for all edges in segment_edges
+        when model time has exceeded the time span of the boundary data.
+        """
+
+        if self.default_boundary is None:
+            raise Exception(e) # Reraise exception
+
+        self.default_boundary.evaluate_segment(domain, segment_edges)
+
+        if self.default_boundary_invoked is False:
+            if self.verbose:
+                # Issue warning the first time
+                msg = '%s' %str(e)
+                msg += 'Instead I will use the default boundary: %s\n'\
+                    %str(self.default_boundary)
+                msg += 'Note: Further warnings will be supressed'
+                log.critical(msg)
+
+            self.default_boundary_invoked = True
+
+
     def get_time(self):
 
         return self.domain.get_time()
@@ -470,6 +529,7 @@ class Time_space_boundary(Boundary):
 
         self.function = function
         self.domain = domain
+        self.vectorised = True # Try calling function with vectors x, y
 
     def __repr__(self):
         return 'Time space boundary'
@@ -512,6 +572,66 @@ class Time_space_boundary(Boundary):
 
         return res
 
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Evaluate function at the midpoints of all edges in segment_edges.
+
+        The function is first called with vectors x and y. If it can
+        not deal with vectors it is called once for each edge.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        E = domain.get_edge_midpoint_coordinates()[3*vol_ids+edge_ids]
+        x = E[:,0]
+        y = E[:,1]
+        t = self.domain.get_time()
+
+        try:
+            res = self.evaluate_function(t, x, y)
+        except Modeltime_too_early, e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late, e:
+            self.evaluate_default_segment(domain, ids, e)
+            return
+
+        self.set_segment_values(domain, ids, res)
+
+
+    def evaluate_function(self, t, x, y):
+        """Return array of shape (len(x), d) of function values at t, x, y
+        """
+
+        N = len(x)
+        res = num.zeros((N, len(self.domain.conserved_quantities)), num.float)
+
+        if self.vectorised:
+            try:
+                values = self.function(t, x, y)
+                assert len(values) == res.shape[1]
+                for j, value in enumerate(values):
+                    # Broadcast constant components
+                    res[:,j] = value
+                return res
+            except (Modeltime_too_early, Modeltime_too_late):
+                raise
+            except (TypeError, ValueError, AssertionError):
+                # Function only accepts scalar coordinates
+                self.vectorised = False
+
+        for k in range(N):
+            res[k,:] = self.function(t, x[k], y[k])
+
+        return res
+
+
 class File_boundary(Boundary):
     """The File_boundary reads values for the conserved
     quantities from an sww NetCDF file, and returns interpolated values
@@ -551,7 +671,7 @@ class File_boundary(Boundary):
                  verbose=False): 
 
         import time
-        from anuga.config import time_format
+        from anuga.config import time_format, file_boundary_window_size
         from anuga.abstract_2d_finite_volumes.util import file_function
 
         Boundary.__init__(self)
@@ -597,7 +717,8 @@ class File_boundary(Boundary):
                                time_limit=time_limit,
                                use_cache=use_cache, 
                                verbose=verbose,
-                               boundary_polygon=boundary_polygon)
+                               boundary_polygon=boundary_polygon,
+                               window_size=file_boundary_window_size)
                              
         # Check and store default_boundary
         msg = 'Keyword argument default_boundary must be either None '
@@ -686,34 +807,95 @@ class File_boundary(Boundary):
                         self.default_boundary_invoked = True
             
             if num.any(res == NAN):
-                x,y=self.midpoint_coordinates[i,:]
-                msg = 'NAN value found in file_boundary at '
-                msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
-
-                if hasattr(self.F, 'indices_outside_mesh') and\
-                       len(self.F.indices_outside_mesh) > 0:
-                    # Check if NAN point is due it being outside
-                    # boundary defined in sww file.
-
-                    if i in self.F.indices_outside_mesh:
-                        msg += 'This point refers to one outside the '
-                        msg += 'mesh defined by the file %s.\n'\
-                               %self.F.filename
-                        msg += 'Make sure that the file covers '
-                        msg += 'the boundary segment it is assigned to '
-                        msg += 'in set_boundary.'
-                    else:
-                        msg += 'This point is inside the mesh defined '
-                        msg += 'the file %s.\n' %self.F.filename
-                        msg += 'Check this file for NANs.'
-                raise Exception(msg)
+                check_nan_point(self, i)
             
-            return res 
+            return res
         else:
             msg = 'Boundary call without point_id not implemented.\n'
             msg += 'vol_id=%s, edge_id=%s' %(str(vol_id), str(edge_id))
             raise Exception(msg)
 
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Interpolate values at the midpoints of all edges in
+        segment_edges in one call to the underlying file function.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        point_ids = get_segment_point_ids(self, domain, ids)
+
+        # FIXME (Ole): I think this should be get_time(), see ticket:306
+        t = self.domain.time
+
+        try:
+            res = self.F(t, point_id=point_ids)
+        except Modeltime_too_early, e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late, e:
+            self.evaluate_default_segment(domain, ids, e)
+            return
+
+        nan_rows = num.any(num.atleast_2d(res) == NAN, axis=1)
+        if num.any(nan_rows):
+            i = point_ids[num.flatnonzero(nan_rows)[0]]
+            check_nan_point(self, i)
+
+        self.set_segment_values(domain, ids, res)
+
+
+def get_segment_point_ids(boundary, domain, segment_edges):
+    """Map segment_edges, indices into domain.boundary_cells and
+    domain.boundary_edges, to the indices of the interpolation
+    points of a File_boundary or AWI_boundary.
+    """
+
+    point_ids = getattr(boundary, 'segment_point_ids', None)
+    if point_ids is None:
+        # Computed the first time the boundary is evaluated, as
+        # boundary_indices are keyed by (vol_id, edge_id)
+        N = len(domain.boundary_cells)
+        point_ids = num.zeros(N, num.int)
+        for k in range(N):
+            key = (domain.boundary_cells[k], domain.boundary_edges[k])
+            point_ids[k] = boundary.boundary_indices[key]
+        boundary.segment_point_ids = point_ids
+
+    return point_ids[segment_edges]
+
+
+def check_nan_point(boundary, i):
+    """Raise exception explaining NAN value at interpolation point i
+    of a File_boundary or AWI_boundary.
+    """
+
+    x,y = boundary.midpoint_coordinates[i,:]
+    msg = 'NAN value found in file_boundary at '
+    msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
+
+    F = boundary.F
+    if hasattr(F, 'indices_outside_mesh') and\
+           len(F.indices_outside_mesh) > 0:
+        # Check if NAN point is due it being outside
+        # boundary defined in sww file.
+
+        if i in F.indices_outside_mesh:
+            msg += 'This point refers to one outside the '
+            msg += 'mesh defined by the file %s.\n' %F.filename
+            msg += 'Make sure that the file covers '
+            msg += 'the boundary segment it is assigned to '
+            msg += 'in set_boundary.'
+        else:
+            msg += 'This point is inside the mesh defined '
+            msg += 'the file %s.\n' %F.filename
+            msg += 'Check this file for NANs.'
+    raise Exception(msg)
+
+
 class AWI_boundary(Boundary):
     """The AWI_boundary reads values for the conserved
     quantities (only STAGE) from an sww NetCDF file, and returns interpolated values
@@ -740,7 +922,7 @@ class AWI_boundary(Boundary):
     def __init__(self, filename, domain, time_thinning=1, 
                  use_cache=False, verbose=False):
         import time
-        from anuga.config import time_format
+        from anuga.config import time_format, file_boundary_window_size
         from anuga.abstract_2d_finite_volumes.util import file_function
 
         Boundary.__init__(self)
@@ -793,7 +975,8 @@ class AWI_boundary(Boundary):
 	                           interpolation_points=self.midpoint_coordinates,
                                time_thinning=time_thinning,
                                use_cache=use_cache, 
-                               verbose=verbose)
+                               verbose=verbose,
+                               window_size=file_boundary_window_size)
         self.domain = domain
 
         # Test
@@ -841,27 +1024,8 @@ class AWI_boundary(Boundary):
             i = self.boundary_indices[vol_id, edge_id]
             res = self.F(t, point_id=i)
 
-            if res == NAN:
-                x,y = self.midpoint_coordinates[i,:]
-                msg = 'NAN value found in file_boundary at '
-                msg += 'point id #%d: (%.2f, %.2f).\n' % (i, x, y)
-
-                if (hasattr(self.F, 'indices_outside_mesh') and
-                       len(self.F.indices_outside_mesh) > 0):
-                    # Check if NAN point is due it being outside
-                    # boundary defined in sww file.
-
-                    if i in self.F.indices_outside_mesh:
-                        msg += 'This point refers to one outside the '
-                        msg += 'mesh defined by the file %s.\n' % self.F.filename
-                        msg += 'Make sure that the file covers '
-                        msg += 'the boundary segment it is assigned to '
-                        msg += 'in set_boundary.'
-                    else:
-                        msg += 'This point is inside the mesh defined '
-                        msg += 'the file %s.\n' % self.F.filename
-                        msg += 'Check this file for NANs.'
-                raise Exception(msg)
+            if num.any(res == NAN):
+                check_nan_point(self, i)
             
             q[0] = res[0] # Take stage, leave momentum alone
             return q
@@ -872,4 +1036,32 @@ class AWI_boundary(Boundary):
             return self.F(t)
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Set stage from the file for all edges in segment_edges and
+        leave the interior momentum values alone.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+        point_ids = get_segment_point_ids(self, domain, ids)
+
+        t = self.domain.time
+        res = num.atleast_2d(self.F(t, point_id=point_ids))
+
+        nan_rows = num.any(res == NAN, axis=1)
+        if num.any(nan_rows):
+            i = point_ids[num.flatnonzero(nan_rows)[0]]
+            check_nan_point(self, i)
+
+        q = num.zeros((len(ids), len(domain.conserved_quantities)), num.float)
+        for j, name in enumerate(domain.conserved_quantities):
+            q[:,j] = domain.quantities[name].edge_values[vol_ids,edge_ids]
+        q[:,0] = res[:,0] # Take stage, leave momentum alone
 
+        self.set_segment_values(domain, ids, q)
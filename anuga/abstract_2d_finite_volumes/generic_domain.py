@@ -19,6 +19,8 @@ from pmesh2domain import pmesh_to_domain
 from tag_region import Set_tag_region as region_set_tag_region
 from anuga.geometry.polygon import inside_polygon
 from anuga.abstract_2d_finite_volumes.util import get_textual_float
+from anuga.abstract_2d_finite_volumes.profiler import Profiler, \
+     get_operator_name
 from quantity import Quantity
 import anuga.utilities.log as log
 
@@ -53,7 +55,8 @@ class Generic_Domain:
                        numproc=1,
                        number_of_full_nodes=None,
                        number_of_full_triangles=None,
-                       ghost_layer_width=2):
+                       ghost_layer_width=2,
+                       reorder=None):
 
         """Instantiate generic computational Domain.
 
@@ -71,6 +74,10 @@ class Generic_Domain:
 
           tagged_elements:
           ...
+
+          reorder:   Renumber triangles and nodes for memory locality
+                     ('hilbert', 'morton' or 'rcm', see mesh_reordering.py).
+                     Default None keeps the given numbering.
         """
         
         if verbose: log.critical('Domain: Initialising')
@@ -102,6 +109,7 @@ class Generic_Domain:
                          tagged_elements=tagged_elements,
                          geo_reference=geo_reference,
                          use_inscribed_circle=use_inscribed_circle,
+                         reorder=reorder,
                          #number_of_full_nodes=number_of_full_nodes,
                          #number_of_full_triangles=number_of_full_triangles,
                          verbose=verbose)
@@ -167,6 +175,10 @@ class Generic_Domain:
             assert quantity == self.evolved_quantities[i], msg
             
 
+        # Memory lean storage of quantities, see set_compact_storage
+        self.compact_storage = False
+        self.single_precision_quantities = []
+
         if verbose: log.critical('Domain: Build Quantities')
         # Build dictionary of Quantity instances keyed by quantity names
         self.quantities = {}
@@ -335,6 +347,19 @@ class Generic_Domain:
         self.datadir = default_datadir
         self.simulation_name = 'domain'
         self.checkpoint = False
+
+        # Timers of the evolve loop (see enable_profiling)
+        self.profiler = None
+
+        # Timesteps taken in C between returns to python (see
+        # set_native_steps)
+        from anuga.config import evolve_native_steps
+        self.native_steps = evolve_native_steps
+
+        # Threads used by the multithreaded C kernels (see
+        # set_omp_num_threads)
+        from anuga.config import omp_num_threads
+        self.omp_num_threads = omp_num_threads
         
         # Early algorithms need elevation to remain continuous
         self.set_using_discontinuous_elevation(False)
@@ -358,6 +383,11 @@ class Generic_Domain:
             # If the mesh file passed any quantity values,
             # initialise with these values.
             if verbose: log.critical('Domain: Initialising quantity values')
+            if self.mesh.node_permutation is not None:
+                # Values are given at the original nodes
+                for name, values in vertex_quantity_dict.items():
+                    vertex_quantity_dict[name] = \
+                        num.asarray(values)[self.mesh.node_permutation]
             self.set_quantity_vertices_dict(vertex_quantity_dict)
 
         if verbose: log.critical('Domain: Done')
@@ -411,6 +441,21 @@ class Generic_Domain:
     def get_triangle_containing_point(self, *args, **kwargs):
         return self.mesh.get_triangle_containing_point(*args, **kwargs)
 
+    def get_triangles_containing_points(self, *args, **kwargs):
+        return self.mesh.get_triangles_containing_points(*args, **kwargs)
+
+    def get_original_triangle_ids(self, *args, **kwargs):
+        return self.mesh.get_original_triangle_ids(*args, **kwargs)
+
+    def get_reordered_triangle_ids(self, *args, **kwargs):
+        return self.mesh.get_reordered_triangle_ids(*args, **kwargs)
+
+    def get_original_ordering(self, *args, **kwargs):
+        return self.mesh.get_original_ordering(*args, **kwargs)
+
+    def get_original_triangles(self, *args, **kwargs):
+        return self.mesh.get_original_triangles(*args, **kwargs)
+
     def get_intersecting_segments(self, *args, **kwargs):
         return self.mesh.get_intersecting_segments(*args, **kwargs)
 
@@ -809,6 +854,96 @@ class Generic_Domain:
 
         return self.quantities[name] #.get_values( location, indices = indices)
 
+    def set_compact_storage(self, flag=True, single_precision_quantities=None):
+        """Store the quantities of this domain in a memory lean way.
+
+        With flag True:
+        - The auxiliary arrays (gradients, limiter, updates, backup and
+          boundary values) of quantities which are not evolved are
+          released. They are reallocated when used.
+        - Quantities registered later (e.g. by operators collecting
+          diagnostics) are stored in single precision and allocate their
+          auxiliary arrays on first use.
+        - The quantities named in single_precision_quantities are stored
+          in single precision. By default these are the registered
+          quantities which are neither evolved nor other quantities of
+          the domain, and those listed in
+          self.single_precision_quantities (derived quantities not read
+          by the flow algorithm).
+
+        With flag False all quantities are stored in double precision again.
+
+        Set compact storage before setting up operators, as arrays
+        referenced by them are not converted.
+        """
+
+        self.compact_storage = flag
+
+        if not flag:
+            for Q in self.quantities.values():
+                Q.set_precision(num.float)
+            return
+
+        if single_precision_quantities is None:
+            single_precision_quantities = \
+                [name for name in self.quantities
+                 if name not in self.evolved_quantities and
+                 name not in self.other_quantities]
+            single_precision_quantities += self.single_precision_quantities
+
+        for name in single_precision_quantities:
+            msg = 'Quantity %s is evolved and must be stored in double ' \
+                  'precision' % name
+            assert name not in self.evolved_quantities, msg
+            self.quantities[name].set_precision(num.float32)
+
+        for name, Q in self.quantities.items():
+            if name not in self.evolved_quantities:
+                Q.release_auxiliary_arrays()
+
+    def get_compact_storage(self):
+
+        return self.compact_storage
+
+    def get_memory_usage(self):
+        """Return dictionary keyed by quantity name of dictionaries with
+        the number of bytes used by each allocated array of the quantity
+        """
+
+        usage = {}
+        for name, Q in self.quantities.items():
+            usage[name] = Q.get_memory_usage()
+
+        return usage
+
+    def memory_statistics(self):
+        """Return string with memory used by the quantities, broken down
+        by quantity and array, for printing or logging
+        """
+
+        MB = 1024.0*1024.0
+        usage = self.get_memory_usage()
+
+        msg = 'Memory used by quantities (MB):\n'
+        total = 0
+        for name in sorted(usage.keys()):
+            arrays = usage[name]
+            quantity_total = sum(arrays.values())
+            total += quantity_total
+
+            msg += '    %s: %.3f (%s)\n' \
+                   % (name, quantity_total/MB,
+                      str(self.quantities[name].get_precision()))
+            for array in sorted(arrays.keys()):
+                msg += '        %s: %.3f\n' % (array, arrays[array]/MB)
+
+        msg += '    Total: %.3f\n' % (total/MB)
+
+        return msg
+
+    def print_memory_statistics(self):
+        print self.memory_statistics()
+
     def create_quantity_from_expression(self, expression):
         """Create new quantity from other quantities using arbitrary expression.
 
@@ -1676,6 +1811,9 @@ class Generic_Domain:
             #==========================================  
             self.distribute_to_vertices_and_edges()
             self.update_boundary()
+
+            if self.profiler is not None:
+                self.profiler.end_yieldstep(self.get_time())
             
             yield(self.get_time())      # Yield initial values
             
@@ -1683,41 +1821,14 @@ class Generic_Domain:
 
         while True:
 
-            initial_time = self.get_time()
-            
-            #==========================================
-            # Apply fluid flow fractional step
-            #==========================================
-            if self.get_timestepping_method() == 'euler':
-                self.evolve_one_euler_step(yieldstep, self.finaltime)
-
-            elif self.get_timestepping_method() == 'rk2':
-                self.evolve_one_rk2_step(yieldstep, self.finaltime)
-
-            elif self.get_timestepping_method() == 'rk3':
-                self.evolve_one_rk3_step(yieldstep, self.finaltime)
-
-            #==========================================
-            # Apply other fractional steps
-            #==========================================
-            self.apply_fractional_steps()
-
-            #==========================================
-            # Centroid Values of variables should be ok,
-            #==========================================
-
-            # Update time
-            self.set_time(initial_time + self.timestep)
-
-            self.update_ghosts()
-
-            # Update extrema (only uses centroid values)
-            self.update_extrema()            
-
-            self.number_of_steps += 1
-
-            if self._order_ == 1:
-                self.number_of_first_order_steps += 1
+            if self.native_steps > 0 and self.can_evolve_native():
+                #==========================================
+                # Take timesteps up to the next yield time
+                # in the C extension
+                #==========================================
+                self.evolve_steps_native(self.native_steps)
+            else:
+                self.evolve_one_step(yieldstep)
 
 
             # Yield results
@@ -1732,9 +1843,12 @@ class Generic_Domain:
 
                 # Distribute to vertices, Log and then Yield final time and stop
                 self.set_time(self.finaltime)
+                self.update_ghosts()
                 self.distribute_to_vertices_and_edges()
                 self.update_boundary()
                 self.log_operator_timestepping_statistics()
+                if self.profiler is not None:
+                    self.profiler.end_yieldstep(self.get_time())
                 yield(self.get_time())
                 break
 
@@ -1746,9 +1860,12 @@ class Generic_Domain:
                 #    self.delete_old_checkpoints()
 
                 # Log and then Pass control on to outer loop for more specific actions
+                self.update_ghosts()
                 self.distribute_to_vertices_and_edges()
                 self.update_boundary()
                 self.log_operator_timestepping_statistics()
+                if self.profiler is not None:
+                    self.profiler.end_yieldstep(self.get_time())
                 yield(self.get_time())
 
                 # Reinitialise
@@ -1760,6 +1877,110 @@ class Generic_Domain:
                 self.max_speed = num.zeros(N, num.float)
 
 
+    def evolve_one_step(self, yieldstep):
+        """Take one timestep of the evolve loop: the fluid flow step,
+        the other fractional steps and the bookkeeping of time and
+        extrema
+        """
+
+        initial_time = self.get_time()
+
+        #==========================================
+        # Apply fluid flow fractional step
+        #==========================================
+        if self.get_timestepping_method() == 'euler':
+            self.evolve_one_euler_step(yieldstep, self.finaltime)
+
+        elif self.get_timestepping_method() == 'rk2':
+            self.evolve_one_rk2_step(yieldstep, self.finaltime)
+
+        elif self.get_timestepping_method() == 'rk3':
+            self.evolve_one_rk3_step(yieldstep, self.finaltime)
+
+        #==========================================
+        # Apply other fractional steps
+        #==========================================
+        self.apply_fractional_steps()
+
+        #==========================================
+        # Centroid Values of variables should be ok,
+        #==========================================
+
+        # Update time
+        self.set_time(initial_time + self.timestep)
+
+        # The ghost cells are updated at the start of the next step (see
+        # update_ghosts_and_compute_fluxes) or before yielding, unless the
+        # extrema are needed now
+        if self.quantities_to_be_monitored is not None:
+            self.update_ghosts()
+
+        # Update extrema (only uses centroid values)
+        self.update_extrema()
+
+        self.number_of_steps += 1
+
+        if self._order_ == 1:
+            self.number_of_first_order_steps += 1
+
+
+    def set_native_steps(self, n=100):
+        """Let evolve take up to n timesteps at a time in the C extension
+        (see evolve_steps_native). n = 0 uses the Python evolve loop.
+
+        Domains which can not evolve natively (see can_evolve_native)
+        use the Python evolve loop regardless.
+        """
+
+        msg = 'Number of native steps must be a non-negative integer'
+        assert int(n) == n and n >= 0, msg
+
+        self.native_steps = int(n)
+
+
+    def get_native_steps(self):
+
+        return self.native_steps
+
+
+    def set_omp_num_threads(self, n=1):
+        """Set the number of threads used by the multithreaded C kernels
+        (flux computation, extrapolation and limiting).
+
+        Results are bitwise reproducible for a given number of threads.
+        Extensions built without OpenMP run serially regardless.
+        """
+
+        msg = 'Number of threads must be a positive integer'
+        assert int(n) == n and n >= 1, msg
+
+        self.omp_num_threads = int(n)
+
+
+    def get_omp_num_threads(self):
+
+        return self.omp_num_threads
+
+
+    def can_evolve_native(self):
+        """Return True if evolve_steps_native is supported for the
+        current setup of the domain. Needs to be overridden by Domain
+        subclass.
+        """
+
+        return False
+
+
+    def evolve_steps_native(self, n):
+        """Take up to n timesteps in the C extension, stopping at the
+        next yield time or final time. Needs to be overridden by Domain
+        subclass.
+        """
+
+        msg = 'Method evolve_steps_native must be overridden by Domain subclass'
+        raise Exception(msg)
+
+
     def evolve_one_euler_step(self, yieldstep, finaltime):
         """One Euler Time Step
         Q^{n+1} = E(h) Q^n
@@ -1767,14 +1988,9 @@ class Generic_Domain:
         Does not assume that centroid values have been extrapolated to vertices and edges
         """
 
-        # From centroid values calculate edge and vertex values
-        self.distribute_to_vertices_and_edges()
-            
-        # Apply boundary conditions
-        self.update_boundary()
-        
-        # Compute fluxes across each element edge
-        self.compute_fluxes()
+        # Update ghosts, calculate edge and vertex values, apply boundary
+        # conditions and compute fluxes across each element edge
+        self.update_ghosts_and_compute_fluxes()
 
         # Compute forcing terms
         self.compute_forcing_terms()
@@ -1808,14 +2024,9 @@ class Generic_Domain:
         # First euler step
         ######
         
-        # From centroid values calculate edge and vertex values
-        self.distribute_to_vertices_and_edges()
-            
-        # Apply boundary conditions
-        self.update_boundary()        
-
-        # Compute fluxes across each element edge
-        self.compute_fluxes()
+        # Update ghosts, calculate edge and vertex values, apply boundary
+        # conditions and compute fluxes across each element edge
+        self.update_ghosts_and_compute_fluxes()
 
         # Compute forcing terms
         self.compute_forcing_terms()
@@ -1833,16 +2044,6 @@ class Generic_Domain:
         # Update time
         self.set_time(self.get_time() + self.timestep)
 
-        # Update ghosts
-        if self.ghost_layer_width < 4:
-            self.update_ghosts()
-
-        # Update vertex and edge values
-        self.distribute_to_vertices_and_edges()
-
-        # Update boundary values
-        self.update_boundary()
-
         ######
         # Second Euler step using the same timestep
         # calculated in the first step. Might lead to
@@ -1850,8 +2051,19 @@ class Generic_Domain:
         # example.
         ######
 
-        # Compute fluxes across each element edge
-        self.compute_fluxes()
+        if self.ghost_layer_width < 4:
+            # Update ghosts, vertex and edge values and boundary values
+            # and compute fluxes across each element edge
+            self.update_ghosts_and_compute_fluxes()
+        else:
+            # Update vertex and edge values
+            self.distribute_to_vertices_and_edges()
+
+            # Update boundary values
+            self.update_boundary()
+
+            # Compute fluxes across each element edge
+            self.compute_fluxes()
 
         # Compute forcing terms
         self.compute_forcing_terms()
@@ -1891,14 +2103,9 @@ class Generic_Domain:
         # First euler step
         ######
 
-        # From centroid values calculate edge and vertex values
-        self.distribute_to_vertices_and_edges()
-            
-        # Apply boundary conditions
-        self.update_boundary() 
-
-        # Compute fluxes across each element edge
-        self.compute_fluxes()
+        # Update ghosts, calculate edge and vertex values, apply boundary
+        # conditions and compute fluxes across each element edge
+        self.update_ghosts_and_compute_fluxes()
 
         # Compute forcing terms
         self.compute_forcing_terms()
@@ -1915,15 +2122,6 @@ class Generic_Domain:
         # Update time
         self.set_time(self.time + self.timestep)
 
-        # Update ghosts
-        self.update_ghosts()
-
-        # Update vertex and edge values
-        self.distribute_to_vertices_and_edges()
-
-        # Update boundary values
-        self.update_boundary()
-
         ######
         # Second Euler step using the same timestep
         # calculated in the first step. Might lead to
@@ -1931,8 +2129,9 @@ class Generic_Domain:
         # example.
         ######
 
-        # Compute fluxes across each element edge
-        self.compute_fluxes()
+        # Update ghosts, vertex and edge values and boundary values
+        # and compute fluxes across each element edge
+        self.update_ghosts_and_compute_fluxes()
 
         # Compute forcing terms
         self.compute_forcing_terms()
@@ -1954,21 +2153,13 @@ class Generic_Domain:
         # Set substep time
         self.set_time(initial_time + self.timestep*0.5)
 
-        # Update ghosts
-        self.update_ghosts()
-
-        # Update vertex and edge values
-        self.distribute_to_vertices_and_edges()
-
-        # Update boundary values
-        self.update_boundary()
-
         ######
         # Third Euler step
         ######
 
-        # Compute fluxes across each element edge
-        self.compute_fluxes()
+        # Update ghosts, vertex and edge values and boundary values
+        # and compute fluxes across each element edge
+        self.update_ghosts_and_compute_fluxes()
 
         # Compute forcing terms
         self.compute_forcing_terms()
@@ -2010,6 +2201,59 @@ class Generic_Domain:
         for _ in self.evolve(yieldstep=None, finaltime=finaltime):
             pass
 
+
+    def enable_profiling(self, trace=False):
+        """Time the phases of the evolve loop, each fractional step operator
+        and each boundary tag.
+
+        Cumulative and per yieldstep wall and CPU times are kept in
+        self.profiler together with the time spent waiting for MPI
+        communication. If trace is True each timed call is recorded
+        for export as a Chrome trace.
+
+        See anuga.abstract_2d_finite_volumes.profiler
+        """
+
+        self.disable_profiling()
+
+        self.profiler = Profiler(self, trace=trace)
+        self.profiler.attach()
+
+        return self.profiler
+
+
+    def disable_profiling(self):
+        """Stop timing the evolve loop. Timings are kept in the
+        profiler returned by get_profiler.
+        """
+
+        if self.profiler is not None:
+            self.profiler.detach()
+            self.last_profiler = self.profiler
+            self.profiler = None
+
+
+    def get_profiler(self):
+        """Return profiler of the evolve loop (the last one if profiling
+        has been disabled) or None if profiling was never enabled.
+        """
+
+        if self.profiler is not None:
+            return self.profiler
+
+        return getattr(self, 'last_profiler', None)
+
+
+    def print_profile(self):
+        """Print cumulative timings of the evolve loop
+        """
+
+        profiler = self.get_profiler()
+        msg = 'Profiling has not been enabled (see enable_profiling)'
+        assert profiler is not None, msg
+
+        profiler.print_statistics()
+
     def backup_conserved_quantities(self):
 
         # Backup conserved_quantities centroid values
@@ -2122,16 +2366,22 @@ class Generic_Domain:
 
 
 
-    def update_boundary(self):
+    def update_boundary(self, tags=None):
         """Go through list of boundary objects and update boundary values
         for all conserved quantities on boundary.
         It is assumed that the ordering of conserved quantities is
         consistent between the domain and the boundary object, i.e.
         the jth element of vector q must correspond to the jth conserved
         quantity in domain.
+
+        If tags is specified only the boundaries with these tags are
+        updated.
         """
 
-        for tag in self.tag_boundary_cells:
+        if tags is None:
+            tags = self.tag_boundary_cells
+
+        for tag in tags:
 
             #print tag
             
@@ -2142,7 +2392,11 @@ class Generic_Domain:
 
             boundary_segment_edges = self.tag_boundary_cells[tag]
 
-            B.evaluate_segment(self, boundary_segment_edges)
+            if self.profiler is None:
+                B.evaluate_segment(self, boundary_segment_edges)
+            else:
+                self.profiler.call('boundary', tag, B.evaluate_segment,
+                                   self, boundary_segment_edges)
         
 
     def compute_fluxes(self):
@@ -2150,10 +2404,21 @@ class Generic_Domain:
         raise Exception(msg)
 
 
-    def apply_fractional_steps(self):
+    def apply_fractional_steps(self, operators=None):
+        """Apply the fractional step operators, or the given list
+        of operators
+        """
+
+        if operators is None:
+            operators = self.fractional_step_operators
 
-        for operator in self.fractional_step_operators:
-            operator()
+        if self.profiler is None:
+            for operator in operators:
+                operator()
+        else:
+            for operator in operators:
+                self.profiler.call('operator', get_operator_name(operator),
+                                   operator)
 
 
     def log_operator_timestepping_statistics(self):
@@ -2295,6 +2560,35 @@ class Generic_Domain:
                 Q_cv =  self.quantities[q].centroid_values
                 num.put(Q_cv, Idg, num.take(Q_cv, Idf, axis=0))
 
+    def update_ghosts_start(self, quantities=None):
+        """Start updating ghost cells. Parallel domains overlap the
+        communication with computation until update_ghosts_finish.
+        Sequential domains update their ghost cells immediately.
+        """
+
+        self.update_ghosts(quantities)
+
+    def update_ghosts_finish(self):
+        """Complete the ghost update started by update_ghosts_start
+        """
+
+        pass
+
+    def update_ghosts_and_compute_fluxes(self):
+        """Update the ghost cells, calculate edge and vertex values from
+        the centroid values, apply the boundary conditions and compute the
+        fluxes. Domain subclasses may override this to compute the fluxes
+        away from the ghost cells while the ghost cells are updated.
+        """
+
+        self.update_ghosts()
+
+        self.distribute_to_vertices_and_edges()
+
+        self.update_boundary()
+
+        self.compute_fluxes()
+
 #    def update_special_conditions(self):
 #        """There may be a need to change the values of the conserved
 #        quantities to satisfy special conditions at the very lowest level
@@ -0,0 +1,264 @@
+"""Renumbering of the triangles and nodes of a mesh for memory locality.
+
+Meshes from the mesh generator list triangles in no particular spatial
+order, so the neighbours of a triangle are usually stored far apart in
+memory. Renumbering the triangles along a space filling curve (Hilbert or
+Morton) or by reverse Cuthill-McKee keeps neighbouring triangles close
+together in all per-triangle arrays. Nodes are then numbered in the
+order they are first used by the renumbered triangles.
+
+The local vertex order of each triangle is kept so edge ids (e.g. in the
+boundary dictionary) remain valid.
+
+Permutations map new ids to original ids, i.e. the new triangle k is the
+original triangle triangle_permutation[k].
+"""
+
+from collections import deque
+
+import numpy as num
+
+from anuga.utilities.numerical_tools import ensure_numeric
+
+
+reordering_methods = ['hilbert', 'morton', 'rcm']
+
+
+def reorder_mesh(coordinates, triangles, boundary=None,
+                 tagged_elements=None, method='hilbert'):
+    """Renumber triangles and nodes of a mesh.
+
+    coordinates, triangles, boundary and tagged_elements are as for Mesh.
+    method is one of 'hilbert', 'morton' or 'rcm' (reverse Cuthill-McKee).
+
+    Return coordinates, triangles, boundary and tagged_elements of the
+    renumbered mesh together with the triangle and node permutations
+    (arrays mapping new ids to original ids).
+    """
+
+    coordinates = ensure_numeric(coordinates, num.float)
+    triangles = ensure_numeric(triangles, num.int)
+
+    triangle_permutation = get_triangle_ordering(coordinates, triangles,
+                                                 method)
+    node_permutation = get_node_ordering(triangles[triangle_permutation],
+                                         len(coordinates))
+
+    triangle_inverse = inverse_permutation(triangle_permutation)
+    node_inverse = inverse_permutation(node_permutation)
+
+    new_coordinates = coordinates[node_permutation]
+    new_triangles = node_inverse[triangles[triangle_permutation]]
+
+    new_boundary = None
+    if boundary is not None:
+        new_boundary = {}
+        for (vol_id, edge_id), tag in boundary.items():
+            new_boundary[(int(triangle_inverse[vol_id]), edge_id)] = tag
+
+    new_tagged_elements = None
+    if tagged_elements is not None:
+        new_tagged_elements = {}
+        for tag, elements in tagged_elements.items():
+            elements = ensure_numeric(elements, num.int)
+            new_tagged_elements[tag] = num.sort(triangle_inverse[elements])
+
+    return (new_coordinates, new_triangles, new_boundary,
+            new_tagged_elements, triangle_permutation, node_permutation)
+
+
+def get_triangle_ordering(coordinates, triangles, method='hilbert'):
+    """Return array of original triangle ids in their new order
+    """
+
+    msg = 'Unknown mesh reordering method %s. Use one of %s' \
+          % (method, reordering_methods)
+    assert method in reordering_methods, msg
+
+    if method == 'rcm':
+        return reverse_cuthill_mckee(get_triangle_adjacency(triangles))
+
+    centroids = num.sum(coordinates[triangles], axis=1)/3.0
+    if method == 'hilbert':
+        keys = hilbert_keys(centroids[:,0], centroids[:,1])
+    else:
+        keys = morton_keys(centroids[:,0], centroids[:,1])
+
+    return num.argsort(keys, kind='mergesort')
+
+
+def get_node_ordering(triangles, number_of_nodes):
+    """Return array of original node ids numbered in the order they are
+    first used by triangles. Nodes not used by any triangle go last.
+    """
+
+    nodes, first = num.unique(triangles.ravel(), return_index=True)
+    used = nodes[num.argsort(first, kind='mergesort')]
+
+    unused = num.ones(number_of_nodes, num.bool)
+    unused[used] = False
+
+    return num.concatenate((used, num.flatnonzero(unused))).astype(num.int)
+
+
+def inverse_permutation(permutation):
+    """Return array mapping original ids to new ids
+    """
+
+    inverse = num.empty(len(permutation), num.int)
+    inverse[permutation] = num.arange(len(permutation))
+
+    return inverse
+
+
+def _grid_coordinates(x, y, order):
+    """Scale x and y to integers on a 2**order x 2**order grid
+    """
+
+    x = ensure_numeric(x, num.float)
+    y = ensure_numeric(y, num.float)
+
+    n = 2**order
+    xmin = x.min()
+    ymin = y.min()
+    extent = max(x.max() - xmin, y.max() - ymin)
+    if extent == 0.0:
+        extent = 1.0
+
+    scale = (n - 1)/extent
+    i = ((x - xmin)*scale).astype(num.int64)
+    j = ((y - ymin)*scale).astype(num.int64)
+
+    return i, j
+
+
+def hilbert_keys(x, y, order=16):
+    """Return distance along a Hilbert curve on a 2**order grid covering
+    the points (x, y)
+    """
+
+    i, j = _grid_coordinates(x, y, order)
+    n = 2**order
+
+    keys = num.zeros(len(i), num.int64)
+    s = n//2
+    while s > 0:
+        ri = (i & s) > 0
+        rj = (j & s) > 0
+        keys += s*s*((3*ri) ^ rj)
+
+        # Rotate the quadrant
+        flip = (~rj) & ri
+        i[flip] = n - 1 - i[flip]
+        j[flip] = n - 1 - j[flip]
+
+        swap = ~rj
+        tmp = i[swap]
+        i[swap] = j[swap]
+        j[swap] = tmp
+
+        s = s//2
+
+    return keys
+
+
+def _spread_bits(i):
+    """Insert a zero bit between each of the lower 32 bits of i
+    """
+
+    i = i & 0x00000000FFFFFFFF
+    i = (i | (i << 16)) & 0x0000FFFF0000FFFF
+    i = (i | (i << 8)) & 0x00FF00FF00FF00FF
+    i = (i | (i << 4)) & 0x0F0F0F0F0F0F0F0F
+    i = (i | (i << 2)) & 0x3333333333333333
+    i = (i | (i << 1)) & 0x5555555555555555
+
+    return i
+
+
+def morton_keys(x, y, order=16):
+    """Return position along a Morton (Z order) curve on a 2**order grid
+    covering the points (x, y)
+    """
+
+    i, j = _grid_coordinates(x, y, order)
+
+    return _spread_bits(i) | (_spread_bits(j) << 1)
+
+
+def get_triangle_adjacency(triangles):
+    """Return Nx3 array of the triangles sharing edge i of each triangle
+    (-1 for boundary edges).
+
+    Edge i of a triangle is opposite its vertex i.
+    """
+
+    triangles = ensure_numeric(triangles, num.int)
+    N = len(triangles)
+
+    a = triangles[:, [1, 2, 0]].ravel()
+    b = triangles[:, [2, 0, 1]].ravel()
+    lo = num.minimum(a, b)
+    hi = num.maximum(a, b)
+
+    order = num.lexsort((hi, lo))
+    same = (lo[order][1:] == lo[order][:-1]) & \
+           (hi[order][1:] == hi[order][:-1])
+    first = order[:-1][same]
+    second = order[1:][same]
+
+    adjacency = -num.ones(3*N, num.int)
+    adjacency[first] = second//3
+    adjacency[second] = first//3
+
+    return adjacency.reshape((N, 3))
+
+
+def _breadth_first(start, adjacency, degree, visited):
+    """Return list of triangles connected to start in breadth first order
+    visiting neighbours of low degree first, and mark them as visited
+    """
+
+    order = []
+    queue = deque([start])
+    visited[start] = True
+    while queue:
+        k = queue.popleft()
+        order.append(k)
+
+        neighbours = [n for n in adjacency[k] if n >= 0 and not visited[n]]
+        neighbours.sort(key=lambda n: degree[n])
+        for n in neighbours:
+            visited[n] = True
+            queue.append(n)
+
+    return order
+
+
+def reverse_cuthill_mckee(adjacency):
+    """Return reverse Cuthill-McKee ordering of the triangles given their
+    adjacency (see get_triangle_adjacency).
+
+    Each connected part of the mesh is started from a pseudo-peripheral
+    triangle: the last triangle reached from a triangle of lowest degree.
+    """
+
+    N = len(adjacency)
+    degree = num.sum(adjacency >= 0, axis=1).tolist()
+    neighbours = adjacency.tolist()
+
+    visited = [False]*N
+    order = []
+    for start in num.argsort(degree, kind='mergesort'):
+        if visited[start]:
+            continue
+
+        # Find pseudo-peripheral triangle
+        component = _breadth_first(start, neighbours, degree, visited)
+        for k in component:
+            visited[k] = False
+
+        order.extend(_breadth_first(component[-1], neighbours, degree,
+                                    visited))
+
+    return num.array(order[::-1], num.int)
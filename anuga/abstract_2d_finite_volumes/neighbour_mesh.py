@@ -59,6 +59,12 @@ class Mesh(General_mesh):
     dictionary mapping from (element_id, edge_id) to boundary tag.
     The default value is None which will assign the default_boundary_tag
     as specified in config.py to all boundary edges.
+
+    If reorder is one of 'hilbert', 'morton' or 'rcm' the triangles and
+    nodes are renumbered for memory locality (see mesh_reordering.py)
+    before the mesh is built. Boundary and tagged elements are renumbered
+    accordingly. The permutations are kept in triangle_permutation and
+    node_permutation (new id -> original id) and are None otherwise.
     """
 
     #FIXME: Maybe rename coordinates to points (as in a poly file)
@@ -72,6 +78,7 @@ class Mesh(General_mesh):
                  tagged_elements=None,
                  geo_reference=None,
                  use_inscribed_circle=False,
+                 reorder=None,
                  verbose=False):
         """
         Build Mesh
@@ -80,7 +87,18 @@ class Mesh(General_mesh):
             triangles (sequence of 3-tuples or Nx3 numeric array of non-negative integers).
         """
 
+        self.triangle_permutation = None
+        self.node_permutation = None
+        if reorder is not None:
+            if verbose: log.critical('Mesh: Reordering (%s)' % reorder)
+            from mesh_reordering import reorder_mesh
 
+            coordinates, triangles, boundary, tagged_elements, \
+                         self.triangle_permutation, self.node_permutation = \
+                         reorder_mesh(coordinates, triangles,
+                                      boundary=boundary,
+                                      tagged_elements=tagged_elements,
+                                      method=reorder)
 
 
         General_mesh.__init__(self, coordinates, triangles,
@@ -99,6 +117,9 @@ class Mesh(General_mesh):
         self.number_of_boundaries = num.zeros(N, num.int)
         self.surrogate_neighbours = num.zeros((N, 3), num.int)
 
+        # Spatial index for point location, built when first needed
+        self.quadtree = None
+
         #Get x,y coordinates for all triangles and store
         V = self.vertex_coordinates # Relative coordinates
 
@@ -1108,38 +1129,140 @@ class Mesh(General_mesh):
         return str
 
 
-    def get_triangle_containing_point(self, point):
+    def get_quadtree(self):
+        """Return quad tree of the triangles of the mesh (see MeshQuadtree)
+
+        The tree is built on the first call and kept with the mesh.
+        """
+
+        if getattr(self, 'quadtree', None) is None:
+            from anuga.pmesh.mesh_quadtree import MeshQuadtree
+            self.quadtree = MeshQuadtree(self)
+
+        return self.quadtree
+
+
+    def get_triangle_containing_point(self, point, original_id=False):
         """Return triangle id for triangle containing specified point (x,y)
 
         If point isn't within mesh, raise exception
 
+        If original_id is True the id of the triangle before the mesh was
+        reordered is returned.
         """
 
-        # FIXME(Ole): This function is currently brute force
-        # because I needed it for diagnostics.
-        # We should make it fast - probably based on the
-        # quad tree structure.
-        from anuga.geometry.polygon import is_outside_polygon,\
-             is_inside_polygon
+        k = self.get_triangles_containing_points([point],
+                                                 original_id=original_id)[0]
+
+        if k < 0:
+            from anuga.geometry.polygon import is_outside_polygon
 
-        polygon = self.get_boundary_polygon()
+            polygon = self.get_boundary_polygon()
 
-        if is_outside_polygon(point, polygon):
-            msg = 'Point %s is outside mesh' %str(point)
+            if is_outside_polygon(point, polygon):
+                msg = 'Point %s is outside mesh' %str(point)
+                raise Exception(msg)
+
+            msg = 'Point %s not found within a triangle' %str(point)
             raise Exception(msg)
 
+        return int(k)
 
-        V = self.get_vertex_coordinates(absolute=True)
 
-        # FIXME: Horrible brute force
-        for i, triangle in enumerate(self.triangles):
-            poly = V[3*i:3*i+3]
+    def get_triangles_containing_points(self, points, original_id=False):
+        """Return array of ids of the triangles containing the specified
+        points (absolute x,y coordinates), -1 for points outside the mesh.
+
+        A point on an edge or vertex shared by several triangles is
+        assigned to one of them.
+
+        If original_id is True the ids of the triangles before the mesh was
+        reordered are returned.
+        """
+
+        from anuga.utilities.numerical_tools import ensure_numeric
+
+        points = ensure_numeric(points, num.float).reshape(-1, 2)
+
+        ids = self.get_quadtree().search_points(points)
+
+        if original_id and self.triangle_permutation is not None:
+            found = ids >= 0
+            ids[found] = self.triangle_permutation[ids[found]]
+
+        return ids
+
+
+    def get_original_triangle_ids(self, ids=None):
+        """Return the ids the triangles with given ids (default all) had
+        before the mesh was reordered
+        """
+
+        if ids is None:
+            ids = num.arange(len(self))
+
+        if self.triangle_permutation is None:
+            return ids
+
+        return self.triangle_permutation[ids]
+
+
+    def get_reordered_triangle_ids(self, original_ids):
+        """Return ids of the triangles with the given ids before the mesh
+        was reordered
+        """
+
+        if self.triangle_permutation is None:
+            return original_ids
+
+        from mesh_reordering import inverse_permutation
+
+        return inverse_permutation(self.triangle_permutation)[original_ids]
+
+
+    def get_original_ordering(self, values, location='triangles'):
+        """Return values in the ordering of the mesh before it was
+        reordered.
+
+        location is 'triangles' for arrays with one entry (or row) per
+        triangle, such as centroid or vertex values, or 'nodes' for arrays
+        with one entry per node. Flattened vertex values (three entries
+        per triangle) are accepted for location 'triangles'.
+        """
+
+        if self.triangle_permutation is None:
+            return values
+
+        from mesh_reordering import inverse_permutation
+
+        values = num.asarray(values)
+        if location == 'nodes':
+            return values[inverse_permutation(self.node_permutation)]
+
+        msg = 'Location must be "triangles" or "nodes", got %s' % location
+        assert location == 'triangles', msg
+
+        N = len(self)
+        inverse = inverse_permutation(self.triangle_permutation)
+        if values.shape[0] == 3*N:
+            # One entry per vertex of each triangle
+            shape = values.shape
+            values = values.reshape((N, 3) + shape[1:])
+            return values[inverse].reshape(shape)
+
+        return values[inverse]
+
+
+    def get_original_triangles(self):
+        """Return the triangles (Nx3 array of node ids) as they were
+        before the mesh was reordered
+        """
 
-            if is_inside_polygon(point, poly, closed=True):
-                return i
+        if self.triangle_permutation is None:
+            return self.triangles
 
-        msg = 'Point %s not found within a triangle' %str(point)
-        raise Exception(msg)
+        return self.get_original_ordering(
+                   self.node_permutation[self.triangles])
 
 
 
@@ -151,10 +151,13 @@ def build_tagged_elements_dictionary(mesh_dict):
     tagged_elements = {}
     if tri_atts is None:
        tagged_elements[''] = range(len(mesh_dict['triangles']))
-    else:
-        for tri_att_index in range(len(tri_atts)):
-            tagged_elements.setdefault(tri_atts[tri_att_index],
-                                       []).append(tri_att_index)
+    elif len(tri_atts) > 0:
+        # Group the triangles by tag, keeping their order
+        tags, tag_ids = num.unique(num.asarray(tri_atts), return_inverse=True)
+        order = num.argsort(tag_ids, kind='mergesort')
+        ends = num.cumsum(num.bincount(tag_ids))
+        for tag, elements in zip(tags.tolist(), num.split(order, ends[:-1])):
+            tagged_elements[tag] = elements
 
     return tagged_elements
 
@@ -196,6 +199,58 @@ def pmesh_dict_to_tag_dict_old(mesh_dict):
 def pmesh_dict_to_tag_dict(mesh_dict):
     """ Convert the pmesh dictionary (mesh_dict) description of boundary tags
     to a dictionary of tags, indexed with volume id and face number.
+
+    The sides of the triangles are sorted once and the segments looked
+    up in both directions by bisection.
+    """
+
+    triangles = num.array(mesh_dict['triangles'], num.int64).reshape(-1, 3)
+    segments = num.array(mesh_dict['segments'], num.int64).reshape(-1, 2)
+    segment_tags = mesh_dict['segment_tags']
+    if isinstance(segment_tags, num.ndarray):
+        segment_tags = segment_tags.tolist()
+
+    tag_dict = {}
+    if len(triangles) == 0 or len(segments) == 0:
+        return tag_dict
+
+    # Key of the side (i,j) is i*N + j. Side 0 of triangle (a,b,c) is
+    # (b,c), side 1 is (c,a) and side 2 is (a,b).
+    N = max(num.max(triangles), num.max(segments)) + 1
+    a = triangles[:,0]
+    b = triangles[:,1]
+    c = triangles[:,2]
+    sides = num.concatenate((b*N + c, c*N + a, a*N + b))
+
+    order = num.argsort(sides)
+    sides = sides[order]
+    if num.any(sides[1:] == sides[:-1]):
+        msg = 'pmesh2domain: build_boundary_dictionary Duplicate segments'
+        raise RuntimeError(msg)
+
+    # Both directions of each segment, in turn
+    keys = num.empty((len(segments), 2), num.int64)
+    keys[:,0] = segments[:,0]*N + segments[:,1]
+    keys[:,1] = segments[:,1]*N + segments[:,0]
+    keys = keys.reshape(-1)
+
+    index = num.minimum(num.searchsorted(sides, keys), len(sides) - 1)
+    tagged = num.array([len(tag) > 0 for tag in segment_tags], num.bool)
+    found = num.flatnonzero((sides[index] == keys) & num.repeat(tagged, 2))
+
+    M = len(triangles)
+    side_ids = order[index[found]]
+    for vol_id, edge_id, k in zip((side_ids % M).tolist(),
+                                  (side_ids // M).tolist(),
+                                  (found // 2).tolist()):
+        tag_dict[vol_id, edge_id] = segment_tags[k]
+
+    return tag_dict
+
+
+def pmesh_dict_to_tag_dict_c(mesh_dict):
+    """ Convert the pmesh dictionary (mesh_dict) description of boundary tags
+    to a dictionary of tags, indexed with volume id and face number.
     """
 
     triangles = mesh_dict['triangles']
@@ -204,6 +259,8 @@ def pmesh_dict_to_tag_dict(mesh_dict):
 
     triangles = num.array(triangles,num.int)
     segments = num.array(segments,num.int)
+    if isinstance(segment_tags, num.ndarray):
+        segment_tags = segment_tags.tolist()
     tag_dict = {}
 
     #print triangles
@@ -0,0 +1,352 @@
+"""Timers for the phases of the evolve loop.
+
+A Profiler is attached to a domain with domain.enable_profiling(). It
+replaces the phase methods of the domain (distribute_to_vertices_and_edges,
+update_boundary, compute_fluxes, ...) by timed versions and times each
+fractional step operator and each boundary tag separately. Wall and CPU
+times are accumulated for every yieldstep and for the whole run together
+with the time each processor spent waiting in MPI communication.
+
+Nothing is timed until profiling is enabled: the domain then only checks
+whether domain.profiler is None when evaluating boundaries and applying
+operators.
+
+Times are inclusive, e.g. the time for update_boundary includes the time
+of each boundary tag and evolve_one_euler_step includes the phases it calls.
+"""
+
+import os
+import json
+from time import time as walltime
+from time import clock as cputime
+
+
+# Phase methods of the domain which are timed if present
+phases = ['evolve_steps_native',
+          'evolve_one_step',
+          'evolve_one_euler_step',
+          'evolve_one_rk2_step',
+          'evolve_one_rk3_step',
+          'distribute_to_vertices_and_edges',
+          'update_boundary',
+          'compute_fluxes',
+          'compute_forcing_terms',
+          'update_timestep',
+          'compute_flux_update_frequency',
+          'update_conserved_quantities',
+          'backup_conserved_quantities',
+          'saxpy_conserved_quantities',
+          'apply_fractional_steps',
+          'update_ghosts',
+          'update_ghosts_start',
+          'update_ghosts_finish',
+          'update_ghosts_and_compute_fluxes',
+          'update_extrema',
+          'store_timestep']
+
+# Phases which time a whole evolve step (one is used, see evolve)
+evolve_phases = ['evolve_steps_native', 'evolve_one_step']
+
+# Domain counters of time spent in MPI communication
+mpi_counters = [('ghost', 'communication_time'),
+                ('reduce', 'communication_reduce_time'),
+                ('broadcast', 'communication_broadcast_time')]
+
+
+class Profiled_method:
+    """Timed replacement of the method name of domain.
+
+    The method is looked up on the class of the domain at each call so
+    the domain can still be pickled (e.g. for checkpointing).
+    """
+
+    def __init__(self, domain, name):
+
+        self.domain = domain
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+
+        method = getattr(self.domain.__class__, self.name)
+        return self.domain.profiler.call('phase', self.name,
+                                         method, self.domain, *args, **kwargs)
+
+
+class Profiler:
+    """Accumulate wall and CPU times of the evolve loop of a domain.
+
+    Timings are kept per (category, name) where category is 'phase',
+    'operator' or 'boundary'. Each entry holds the number of calls and the
+    wall and CPU time in seconds.
+
+    If trace is True every timed call is also recorded as an event so the
+    run can be viewed on a timeline (see write_chrome_trace).
+    """
+
+    def __init__(self, domain, trace=False):
+
+        self.domain = domain
+        self.trace = trace
+
+        self.totals = {}      # Timings of completed yieldsteps
+        self.current = {}     # Timings of the current yieldstep
+        self.yieldsteps = []  # List of (time, walltime, timings, mpi)
+        self.events = []      # List of (category, name, start, duration)
+
+        self.walltime0 = walltime()
+        self.mpi0 = self.get_mpi_times()
+        self.mpi_yieldstep = self.mpi0
+
+
+    def attach(self):
+        """Replace the phase methods of the domain by timed versions
+        """
+
+        for name in phases:
+            if hasattr(self.domain, name) and name not in self.domain.__dict__:
+                setattr(self.domain, name, Profiled_method(self.domain, name))
+
+
+    def detach(self):
+        """Restore the phase methods of the domain
+        """
+
+        for name in phases:
+            if isinstance(self.domain.__dict__.get(name), Profiled_method):
+                delattr(self.domain, name)
+
+
+    def call(self, category, name, func, *args, **kwargs):
+        """Call func(*args, **kwargs) and record its wall and CPU time
+        under category and name
+        """
+
+        w0 = walltime()
+        c0 = cputime()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            wall = walltime() - w0
+            cpu = cputime() - c0
+
+            key = (category, name)
+            try:
+                timing = self.current[key]
+            except KeyError:
+                timing = self.current[key] = [0, 0.0, 0.0]
+            timing[0] += 1
+            timing[1] += wall
+            timing[2] += cpu
+
+            if self.trace:
+                self.events.append((category, name, w0, wall))
+
+
+    def get_mpi_times(self):
+        """Return list of the MPI communication times of the domain so far
+        """
+
+        return [getattr(self.domain, attribute, 0.0)
+                for name, attribute in mpi_counters]
+
+
+    def end_yieldstep(self, time):
+        """Store the timings of the yieldstep ending at model time and
+        start timing the next one
+        """
+
+        mpi = self.get_mpi_times()
+        mpi_delta = [x - x0 for x, x0 in zip(mpi, self.mpi_yieldstep)]
+        self.mpi_yieldstep = mpi
+
+        self.yieldsteps.append((time, walltime(), self.current, mpi_delta))
+
+        merge_timings(self.totals, self.current)
+        self.current = {}
+
+
+    def get_totals(self):
+        """Return cumulative timings including the current yieldstep
+        """
+
+        totals = {}
+        merge_timings(totals, self.totals)
+        merge_timings(totals, self.current)
+
+        return totals
+
+
+    def get_mpi_wait(self):
+        """Return dictionary of cumulative time waiting for MPI
+        communication (ghost exchange, reductions and broadcasts)
+        """
+
+        mpi = self.get_mpi_times()
+        return dict((name, x - x0) for (name, attribute), x, x0
+                    in zip(mpi_counters, mpi, self.mpi0))
+
+
+    def get_compute_time(self):
+        """Return wall time of the evolve steps so far less the time
+        waiting for MPI communication, i.e. the computational load of
+        this processor
+        """
+
+        totals = self.get_totals()
+        wall = sum([totals[key][1] for key in totals
+                    if key[0] == 'phase' and key[1] in evolve_phases])
+
+        return max(wall - sum(self.get_mpi_wait().values()), 0.0)
+
+
+    def get_operator_times(self):
+        """Return dictionary of the cumulative wall time of each fractional
+        step operator keyed by its name (see get_operator_name)
+        """
+
+        totals = self.get_totals()
+        return dict((key[1], totals[key][1]) for key in totals
+                    if key[0] == 'operator')
+
+
+    def statistics(self):
+        """Return string with table of cumulative timings
+        """
+
+        totals = self.get_totals()
+        keys = sorted(totals.keys(), key=lambda k: -totals[k][1])
+
+        msg = 'Profile of processor %d over %d yieldsteps\n' \
+              % (self.domain.processor, len(self.yieldsteps))
+        msg += '%-10s %-40s %10s %12s %12s\n' % ('category', 'name', 'calls',
+                                                 'wall (s)', 'cpu (s)')
+        for key in keys:
+            count, wall, cpu = totals[key]
+            msg += '%-10s %-40s %10d %12.4f %12.4f\n' % (key[0], key[1],
+                                                         count, wall, cpu)
+
+        mpi_wait = self.get_mpi_wait()
+        for name, attribute in mpi_counters:
+            msg += '%-10s %-40s %10s %12.4f %12s\n' % ('mpi', name, '',
+                                                       mpi_wait[name], '')
+
+        return msg
+
+
+    def print_statistics(self):
+
+        print self.statistics()
+
+
+    def get_filename(self, filename, extension):
+
+        if filename is None:
+            filename = os.path.join(self.domain.get_datadir(),
+                                    self.domain.get_name() + '_profile')
+
+        if not filename.endswith(extension):
+            filename += extension
+
+        return filename
+
+
+    def write_csv(self, filename=None):
+        """Write timings of each yieldstep and the cumulative timings to
+        csv file (default <datadir>/<name>_profile.csv).
+
+        Columns are yieldstep, time, category, name, calls, wall and cpu.
+        The cumulative timings have yieldstep 'total'. MPI wait times have
+        category 'mpi'.
+        """
+
+        filename = self.get_filename(filename, '.csv')
+
+        fid = open(filename, 'w')
+        fid.write('yieldstep,time,category,name,calls,wall,cpu\n')
+
+        for i, (time, wall, timings, mpi) in enumerate(self.yieldsteps):
+            write_timings(fid, str(i), repr(time), timings, mpi)
+
+        mpi_wait = self.get_mpi_wait()
+        write_timings(fid, 'total', repr(self.domain.get_time()),
+                      self.get_totals(),
+                      [mpi_wait[name] for name, attribute in mpi_counters])
+
+        fid.close()
+
+        return filename
+
+
+    def write_chrome_trace(self, filename=None):
+        """Write recorded events to file (default
+        <datadir>/<name>_profile.json) in the Chrome trace event format,
+        which can be viewed with chrome://tracing or Perfetto.
+
+        Events are only recorded if profiling was enabled with trace=True.
+        The MPI wait of each yieldstep is written as counters.
+        """
+
+        filename = self.get_filename(filename, '.json')
+        pid = self.domain.processor
+
+        events = []
+        for category, name, start, duration in self.events:
+            events.append({'name': name,
+                           'cat': category,
+                           'ph': 'X',
+                           'ts': (start - self.walltime0)*1.0e6,
+                           'dur': duration*1.0e6,
+                           'pid': pid,
+                           'tid': 0})
+
+        for time, wall, timings, mpi in self.yieldsteps:
+            args = dict((name, x) for (name, attribute), x
+                        in zip(mpi_counters, mpi))
+            events.append({'name': 'mpi wait',
+                           'ph': 'C',
+                           'ts': (wall - self.walltime0)*1.0e6,
+                           'pid': pid,
+                           'args': args})
+
+        fid = open(filename, 'w')
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fid)
+        fid.close()
+
+        return filename
+
+
+def merge_timings(totals, timings):
+    """Add timings to totals
+    """
+
+    for key, (count, wall, cpu) in timings.items():
+        try:
+            total = totals[key]
+        except KeyError:
+            total = totals[key] = [0, 0.0, 0.0]
+        total[0] += count
+        total[1] += wall
+        total[2] += cpu
+
+
+def write_timings(fid, yieldstep, time, timings, mpi):
+
+    for key in sorted(timings.keys()):
+        count, wall, cpu = timings[key]
+        fid.write('%s,%s,%s,%s,%d,%r,%r\n' % (yieldstep, time, key[0], key[1],
+                                             count, wall, cpu))
+
+    for (name, attribute), x in zip(mpi_counters, mpi):
+        fid.write('%s,%s,mpi,%s,,%r,\n' % (yieldstep, time, name, x))
+
+
+def get_operator_name(operator):
+    """Return label of fractional step operator, or the name of its
+    function or class
+    """
+
+    label = getattr(operator, 'label', None)
+    if label is not None:
+        return label
+
+    return getattr(operator, '__name__', operator.__class__.__name__)
@@ -17,6 +17,11 @@ To create:
    For Quantities that need to be saved during checkpointing, set register=True. Registered
    Quantities can be found in the dictionary domain.quantities (note, other Quantities can 
    exist). 
+
+   With compact storage (see Generic_Domain.set_compact_storage) the
+   auxiliary arrays (gradients, limiter, updates, backup and boundary
+   values) are only allocated when first used and registered Quantities
+   are stored in single precision.
 """
 
 import types
@@ -27,6 +32,8 @@ from anuga.geometry.polygon import inside_polygon
 from anuga.geospatial_data.geospatial_data import Geospatial_data
 from anuga.fit_interpolate.fit import fit_to_mesh
 from anuga.config import points_file_block_line_size as default_block_line_size
+from anuga.config import raster_tile_size as default_raster_tile_size
+from anuga.config import raster_threads as default_raster_threads
 from anuga.config import epsilon
 from anuga.caching import cache
 import anuga.utilities.log as log
@@ -40,6 +47,15 @@ class Quantity:
 
     counter = 0
 
+    # Arrays holding the values of the quantity
+    value_arrays = ['vertex_values', 'centroid_values', 'edge_values']
+
+    # Work arrays only needed by evolved quantities or when limiting.
+    # They can be released and are then reallocated on first use.
+    auxiliary_arrays = ['x_gradient', 'y_gradient', 'phi',
+                        'boundary_values', 'explicit_update',
+                        'semi_implicit_update', 'centroid_backup_values']
+
     def __init__(self, domain, vertex_values=None, name=None, register=False):
         from anuga.abstract_2d_finite_volumes.generic_domain \
                             import Generic_Domain
@@ -63,33 +79,38 @@ class Quantity:
             assert N == len(domain), msg
 
         self.domain = domain
+        self.precision = num.dtype(num.float)
 
         # Allocate space for other quantities
         self.centroid_values = num.zeros(N, num.float)
         self.edge_values = num.zeros((N, 3), num.float)
 
-        # Allocate space for Gradient
-        self.x_gradient = num.zeros(N, num.float)
-        self.y_gradient = num.zeros(N, num.float)
+        #self.boundary_length = domain.boundary_length
+        self.boundary_length = L = self.domain.boundary_length
+
+        compact = domain.get_compact_storage()
+        if not compact:
+            # Allocate space for Gradient
+            self.x_gradient = num.zeros(N, num.float)
+            self.y_gradient = num.zeros(N, num.float)
 
-        # Allocate space for Limiter Phi
-        self.phi = num.zeros(N, num.float)
+            # Allocate space for Limiter Phi
+            self.phi = num.zeros(N, num.float)
 
         # Intialise centroid and edge_values
         self.interpolate()
 
-        # Allocate space for boundary values
-        #self.boundary_length = domain.boundary_length
-        self.boundary_length = L = self.domain.boundary_length
-        self.boundary_values = num.zeros(L, num.float)
+        if not compact:
+            # Allocate space for boundary values
+            self.boundary_values = num.zeros(L, num.float)
 
-        # Allocate space for updates of conserved quantities by
-        # flux calculations and forcing functions
+            # Allocate space for updates of conserved quantities by
+            # flux calculations and forcing functions
 
-        # Allocate space for update fields
-        self.explicit_update = num.zeros(N, num.float )
-        self.semi_implicit_update = num.zeros(N, num.float )
-        self.centroid_backup_values = num.zeros(N, num.float)
+            # Allocate space for update fields
+            self.explicit_update = num.zeros(N, num.float )
+            self.semi_implicit_update = num.zeros(N, num.float )
+            self.centroid_backup_values = num.zeros(N, num.float)
 
         self.set_beta(1.0)
 
@@ -102,6 +123,108 @@ class Quantity:
         if register:
             self.domain.quantities[self.name] = self
 
+            # Registered after the domain was set up, e.g. diagnostics
+            if compact:
+                self.set_precision(num.float32)
+
+    def __getattr__(self, name):
+        """Allocate auxiliary arrays on first use (see
+        release_auxiliary_arrays)
+        """
+
+        if name in Quantity.auxiliary_arrays and \
+               'centroid_values' in self.__dict__:
+            C = self.__dict__['centroid_values']
+            if name == 'boundary_values':
+                A = num.zeros(self.__dict__['boundary_length'], C.dtype)
+            else:
+                A = num.zeros(len(C), C.dtype)
+            self.__dict__[name] = A
+            return A
+
+        raise AttributeError(name)
+
+    ############################################################################
+    # Methods for memory management
+    ############################################################################
+
+    def release_auxiliary_arrays(self):
+        """Free the auxiliary arrays (gradients, limiter, updates, backup
+        and boundary values). They are reallocated, set to zero, when next
+        used. Useful for static quantities such as elevation or friction.
+        """
+
+        for name in Quantity.auxiliary_arrays:
+            if name in self.__dict__:
+                del self.__dict__[name]
+
+    def set_precision(self, precision=num.float):
+        """Store the values of this quantity with precision num.float or
+        num.float32.
+
+        Computations in the C extensions of this module are done in double
+        precision on temporary copies. Arrays referenced elsewhere before
+        the call are not updated, so set the precision before setting up
+        operators using the quantity. Quantities read by the flow
+        algorithm (e.g. stage, elevation, height) must stay in double
+        precision.
+        """
+
+        precision = num.dtype(precision)
+        msg = 'Precision must be num.float or num.float32, got %s' % precision
+        assert precision in [num.dtype(num.float), num.dtype(num.float32)], msg
+
+        self.precision = precision
+        self._convert_arrays(precision)
+
+    def get_precision(self):
+
+        return self.precision
+
+    def get_memory_usage(self):
+        """Return dictionary of the number of bytes used by each
+        allocated array of this quantity
+        """
+
+        usage = {}
+        for name in Quantity.value_arrays + Quantity.auxiliary_arrays:
+            A = self.__dict__.get(name)
+            if A is not None:
+                usage[name] = A.nbytes
+
+        return usage
+
+    def _convert_arrays(self, precision):
+        """Store the allocated arrays with the given precision
+
+        Return dictionary of the arrays which were converted.
+        """
+
+        previous = {}
+        for name in Quantity.value_arrays + Quantity.auxiliary_arrays:
+            A = self.__dict__.get(name)
+            if A is not None and A.dtype != precision:
+                previous[name] = A
+                self.__dict__[name] = A.astype(precision)
+
+        return previous
+
+    def _restore_arrays(self, previous):
+        """Copy the values back into the arrays converted by
+        _convert_arrays and reinstate them
+        """
+
+        for name in Quantity.value_arrays + Quantity.auxiliary_arrays:
+            A = self.__dict__.get(name)
+            if A is None:
+                continue
+            if name in previous:
+                previous[name][...] = A
+                self.__dict__[name] = previous[name]
+            elif A.dtype != self.precision:
+                # Allocated on first use while converted
+                self.__dict__[name] = A.astype(self.precision)
+
     ############################################################################
     # Methods for operator overloading
     ############################################################################
@@ -678,20 +801,17 @@ class Quantity:
         """Compute interpolated values at edges and centroid
         Pre-condition: vertex_values have been set
         """
-        from quantity_ext import interpolate
         interpolate(self)
 
 
     def interpolate_from_vertices_to_edges(self):
         # Call correct module function (either from this module or C-extension)
 
-        from quantity_ext import interpolate_from_vertices_to_edges
         interpolate_from_vertices_to_edges(self)
 
     def interpolate_from_edges_to_vertices(self):
         # Call correct module function (either from this module or C-extension)
 
-        from quantity_ext import interpolate_from_edges_to_vertices
         interpolate_from_edges_to_vertices(self)
 
     #---------------------------------------------
@@ -711,7 +831,8 @@ class Quantity:
                          indices=None,
                          smooth=False,
                          verbose=False,
-                         use_cache=False):
+                         use_cache=False,
+                         interpolation='bilinear'):
         """Set values for quantity based on different sources.
 
         numeric:
@@ -738,10 +859,13 @@ class Quantity:
 
         filename:
           Name of a points file or dem file (.asc or .grd or .dem) containing data points and attributes for
-          use with fit_interpolate.fit.
+          use with fit_interpolate.fit. ERMapper grids (.ers) are sampled
+          as rasters.
           
         raster:
-          A class or a tuple (x,y,Z)
+          A class or a tuple (x,y,Z), a Raster_grid or the name of a
+          grid file (.ers, .dem or .asc) sampled one tile at a time
+          (see set_values_from_utm_raster)
 
         attribute_name:
           If specified, any array matching that name
@@ -796,6 +920,8 @@ class Quantity:
         use_cache: True means that caching of intermediate results is
                    attempted for fit_interpolate.fit.
 
+        interpolation: Sampling of raster: 'pixel', 'bilinear' or
+                       'average' (location 'centroids' only)
 
 
 
@@ -913,7 +1039,7 @@ class Quantity:
                 max_read_lines = default_block_line_size
             filename_ext = os.path.splitext(filename)[1]
             # pts file in the format of .txt or .pts
-            if filename_ext in ['.txt', '.pts', '.csv']:
+            if filename_ext in ['.txt', '.pts', '.bpt', '.csv']:
                 self.set_values_from_file(filename, attribute_name, alpha, location,
                                       indices, verbose=verbose,
                                       max_read_lines=max_read_lines,
@@ -922,13 +1048,20 @@ class Quantity:
             elif filename_ext in ['.asc', '.grd', '.dem']:
                 self.set_values_from_utm_grid_file(filename, location,
                       indices, verbose=verbose)
+            elif filename_ext == '.ers':
+                self.set_values_from_utm_raster(filename,
+                                                location=location,
+                                                indices=indices,
+                                                interpolation=interpolation,
+                                                verbose=verbose)
             else:
-                raise Exception('Extension should be .pts .dem, .csv, .txt, .asc or .grd')
+                raise Exception('Extension should be .pts .dem, .csv, .txt, .asc, .grd or .ers')
 
         elif raster is not None:
             self.set_values_from_utm_raster(raster, 
                                             location=location, 
                                             indices=indices, 
+                                            interpolation=interpolation,
                                             verbose=verbose)
         else:
             raise Exception("This can't happen :-)")
@@ -1245,8 +1378,8 @@ class Quantity:
         msg = 'Filename must be a text string'
         assert isinstance(filename, basestring), msg
         
-        msg = 'Extension should be .pts .dem, .csv, or txt'
-        assert os.path.splitext(filename)[1] in ['.pts', '.dem', '.csv', '.txt'], msg
+        msg = 'Extension should be .pts, .bpt, .dem, .csv, or txt'
+        assert os.path.splitext(filename)[1] in ['.pts', '.bpt', '.dem', '.csv', '.txt'], msg
         
 
         if location != 'vertices':
@@ -1396,29 +1529,76 @@ class Quantity:
                              raster,
                              location='vertices',
                              indices=None,
+                             interpolation='bilinear',
                              verbose=False):
-        
+        """Set values from a raster in the coordinates of the domain.
 
-        
-        x,y,Z = raster
-        
-        
-        if location == 'centroids':
+        raster: A tuple (x,y,Z) of grid coordinates and values, with the
+                rows of Z running from north to south. Or a Raster_grid or
+                the name of a grid file (.ers, .dem or .asc), which is
+                sampled one tile at a time reading only the blocks of the
+                grid under the points (see fit_interpolate.raster_sampling).
+                The tile size and number of threads are taken from
+                domain.raster_tile_size and domain.raster_threads if set.
+
+        interpolation: 'pixel', 'bilinear' or 'average'. The average over
+                       each triangle is only available for grids and
+                       location 'centroids'.
+
+        Points outside the raster are set to NaN.
+        """
+
+        from anuga.geospatial_data.geospatial_data import ensure_absolute
+
+        if interpolation not in ['pixel', 'bilinear', 'average']:
+            msg = 'Invalid interpolation: %s' % interpolation
+            raise Exception(msg)
+
+        if interpolation == 'average' and location != 'centroids':
+            msg = 'Interpolation average is only available for centroids'
+            raise Exception(msg)
+
+        if location == 'centroids' and interpolation != 'average':
             points = self.domain.centroid_coordinates
-        
+            if indices is not None:
+                points = points[indices]
         else:
             points = self.domain.vertex_coordinates
-            
-        from anuga.geospatial_data.geospatial_data import ensure_absolute
-        
+            if indices is not None:
+                points = points.reshape((-1,3,2))[indices].reshape((-1,2))
+
         points = ensure_absolute(points, geo_reference=self.domain.geo_reference)        
-        
-        from  anuga.fit_interpolate.interpolate2d import interpolate_raster
-        
-        #print points 
-        values = interpolate_raster(x, y, Z, points, mode='linear', bounds_error=False)
-        
-        #print values
+
+        if isinstance(raster, tuple):
+            if interpolation == 'average':
+                msg = 'Interpolation average needs a grid, not (x,y,Z)'
+                raise Exception(msg)
+
+            from  anuga.fit_interpolate.interpolate2d import interpolate_raster
+
+            x,y,Z = raster
+            if interpolation == 'pixel':
+                mode = 'constant'
+            else:
+                mode = 'linear'
+            values = interpolate_raster(x, y, Z, points, mode=mode,
+                                        bounds_error=False)
+        else:
+            from anuga.fit_interpolate.raster_sampling import sample_raster
+
+            if hasattr(self.domain, 'raster_tile_size'):
+                tile_size = self.domain.raster_tile_size
+            else:
+                tile_size = default_raster_tile_size
+
+            if hasattr(self.domain, 'raster_threads'):
+                threads = self.domain.raster_threads
+            else:
+                threads = default_raster_threads
+
+            values = sample_raster(raster, points, mode=interpolation,
+                                   tile_size=tile_size, threads=threads,
+                                   verbose=verbose)
 
         # Call underlying method using array values
         if verbose:
@@ -1427,27 +1607,19 @@ class Quantity:
         
         if location == 'centroids':
             if indices is None:
-                msg = 'Number of values must match number of elements'
-                #assert values.shape[0] == N, msg
-
                 self.centroid_values[:] = values
             else:
                 msg = 'Number of values must match number of indices'
-                assert values.shape[0] == indices.shape[0], msg
+                assert values.shape[0] == len(indices), msg
 
                 # Brute force
                 self.centroid_values[indices] = values
         else:
             if indices is None:
-                msg = 'Number of values must match number of elements'
-                #assert values.shape[0] == N, msg
-
-                #print values.shape
-                #print self.vertex_values.shape 
                 self.vertex_values[:] = values.reshape((-1,3))
             else:
                 msg = 'Number of values must match number of indices'
-                assert values.shape[0] == indices.shape[0], msg
+                assert values.shape[0] == 3*len(indices), msg
 
                 # Brute force
                 self.vertex_values[indices] = values.reshape((-1,3))
@@ -2048,12 +2220,12 @@ class Quantity:
                 if self.domain.get_using_discontinuous_elevation():
                     average_centroid_values(ensure_numeric(self.domain.vertex_value_indices),
                                       ensure_numeric(self.domain.number_of_triangles_per_node),
-                                      ensure_numeric(self.centroid_values),
+                                      ensure_numeric(self.centroid_values, num.float),
                                       A)
                 else:
                     average_vertex_values(ensure_numeric(self.domain.vertex_value_indices),
                                       ensure_numeric(self.domain.number_of_triangles_per_node),
-                                      ensure_numeric(self.vertex_values),
+                                      ensure_numeric(self.vertex_values, num.float),
                                       A)
                 A = A.astype(precision)
             else:
@@ -2261,3 +2433,58 @@ from quantity_ext import \
          interpolate_from_edges_to_vertices,\
          set_vertex_values_c, \
          update
+
+from quantity_ext import interpolate
+
+
+def _in_double_precision(f):
+    """Wrap C extension function f, which reads the arrays of its
+    Quantity arguments as doubles, so that it can be used with Quantities
+    stored in single precision (see Quantity.set_precision).
+    """
+
+    def g(*args):
+        reduced = [q for q in args if isinstance(q, Quantity)
+                   and q.precision != num.float]
+
+        if len(reduced) == 0:
+            return f(*args)
+
+        previous = [q._convert_arrays(num.float) for q in reduced]
+        try:
+            return f(*args)
+        finally:
+            for q, arrays in zip(reduced, previous):
+                q._restore_arrays(arrays)
+
+    g.__name__ = f.__name__
+    g.__doc__ = f.__doc__
+    return g
+
+backup_centroid_values = _in_double_precision(backup_centroid_values)
+saxpy_centroid_values = _in_double_precision(saxpy_centroid_values)
+compute_gradients = _in_double_precision(compute_gradients)
+compute_local_gradients = _in_double_precision(compute_local_gradients)
+limit_old = _in_double_precision(limit_old)
+limit_vertices_by_all_neighbours = \
+         _in_double_precision(limit_vertices_by_all_neighbours)
+limit_edges_by_all_neighbours = \
+         _in_double_precision(limit_edges_by_all_neighbours)
+limit_edges_by_neighbour = _in_double_precision(limit_edges_by_neighbour)
+limit_gradient_by_neighbour = _in_double_precision(limit_gradient_by_neighbour)
+extrapolate_from_gradient = _in_double_precision(extrapolate_from_gradient)
+extrapolate_second_order_and_limit_by_edge = \
+         _in_double_precision(extrapolate_second_order_and_limit_by_edge)
+extrapolate_second_order_and_limit_by_vertex = \
+         _in_double_precision(extrapolate_second_order_and_limit_by_vertex)
+bound_vertices_below_by_constant = \
+         _in_double_precision(bound_vertices_below_by_constant)
+bound_vertices_below_by_quantity = \
+         _in_double_precision(bound_vertices_below_by_quantity)
+interpolate_from_vertices_to_edges = \
+         _in_double_precision(interpolate_from_vertices_to_edges)
+interpolate_from_edges_to_vertices = \
+         _in_double_precision(interpolate_from_edges_to_vertices)
+set_vertex_values_c = _in_double_precision(set_vertex_values_c)
+update = _in_double_precision(update)
+interpolate = _in_double_precision(interpolate)
@@ -21,18 +21,29 @@
 // Low level routines (called from wrappers)
 //------------------------------------------
 
+// Loops over triangles in the routines below are threaded with OpenMP
+// where the result for each triangle only depends on values which are
+// not updated in the loop. Results are therefore independent of the
+// number of threads.
+
+
 int _compute_gradients(int N,
 			double* centroids,
 			double* centroid_values,
 			long* number_of_boundaries,
 			long* surrogate_neighbours,
 			double* a,
-			double* b){
+			double* b,
+			int num_threads){
 
   int i, k, k0, k1, k2, index3;
   double x0, x1, x2, y0, y1, y2, q0, q1, q2; //, det;
+  int err = 0;
 
 
+  #pragma omp parallel for num_threads(num_threads) \
+      private(i, k0, k1, k2, index3, x0, x1, x2, y0, y1, y2, q0, q1, q2) \
+      reduction(min:err)
   for (k=0; k<N; k++) {
     index3 = 3*k;
     
@@ -47,7 +58,10 @@ int _compute_gradients(int N,
       k2 = surrogate_neighbours[index3 + 2];
 
       
-      if (k0 == k1 || k1 == k2) return -1;
+      if (k0 == k1 || k1 == k2) {
+        err = -1;
+        continue;
+      }
       
       // Get data
       q0 = centroid_values[k0];
@@ -70,7 +84,10 @@ int _compute_gradients(int N,
 	k0 = surrogate_neighbours[index3 + i];
 	i++;
       }
-      if (k0 == k) return -1;
+      if (k0 == k) {
+        err = -1;
+        continue;
+      }
       
       k1 = k; //self
 
@@ -89,7 +106,7 @@ int _compute_gradients(int N,
     //        #No true neighbours -
     //        #Fall back to first order scheme
   }
-  return 0;
+  return err;
 }
 
 
@@ -135,11 +152,14 @@ int _extrapolate_from_gradient(int N,
 			       double* vertex_values,
 			       double* edge_values,
 			       double* a,
-			       double* b) {
+			       double* b,
+			       int num_threads) {
 
   int k, k2, k3, k6;
   double x, y, x0, y0, x1, y1, x2, y2;
   
+  #pragma omp parallel for num_threads(num_threads) \
+      private(k2, k3, k6, x, y, x0, y0, x1, y1, x2, y2)
   for (k=0; k<N; k++){
     k6 = 6*k;
     k3 = 3*k;
@@ -302,7 +322,8 @@ int _limit_vertices_by_all_neighbours(int N, double beta,
 				      double* edge_values,
 				      long*   neighbours,
 				      double* x_gradient,
-				      double* y_gradient) {
+				      double* y_gradient,
+				      int num_threads) {
   
   
   int i, k, k2, k3, k6;
@@ -310,6 +331,8 @@ int _limit_vertices_by_all_neighbours(int N, double beta,
   double qmin, qmax, qn, qc;
   double dq, dqa[3], phi, r;
   
+  #pragma omp parallel for num_threads(num_threads) \
+      private(i, k2, k3, k6, n, qmin, qmax, qn, qc, dq, dqa, phi, r)
   for (k=0; k<N; k++){
     k6 = 6*k;
     k3 = 3*k;
@@ -369,13 +392,16 @@ int _limit_edges_by_all_neighbours(int N, double beta,
 				   double* edge_values,
 				   long*   neighbours,
 				   double* x_gradient,
-				   double* y_gradient) {
+				   double* y_gradient,
+				   int num_threads) {
 
   int i, k, k2, k3, k6;
   long n;
   double qmin, qmax, qn, qc, sign;
   double dq, dqa[3], phi, r;
   
+  #pragma omp parallel for num_threads(num_threads) \
+      private(i, k2, k3, k6, n, qmin, qmax, qn, qc, sign, dq, dqa, phi, r)
   for (k=0; k<N; k++){
     k6 = 6*k;
     k3 = 3*k;
@@ -453,13 +479,16 @@ int _limit_edges_by_neighbour(int N, double beta,
 		     double* centroid_values,
 		     double* vertex_values,
 		     double* edge_values,
-		     long*   neighbours) {
+		     long*   neighbours,
+		     int num_threads) {
 
 	int i, k, k2, k3, k6;
 	long n;
 	double qmin, qmax, qn, qc;
 	double dq, dqa[3], phi, r;
 
+	#pragma omp parallel for num_threads(num_threads) \
+	    private(i, k2, k3, k6, n, qmin, qmax, qn, qc, dq, dqa, phi, r)
 	for (k=0; k<N; k++){
 		k6 = 6*k;
 		k3 = 3*k;
@@ -510,13 +539,16 @@ int _limit_gradient_by_neighbour(int N, double beta,
 		     double* edge_values,
 		     double* x_gradient,
 		     double* y_gradient,
-		     long*   neighbours) {
+		     long*   neighbours,
+		     int num_threads) {
 
 	int i, k, k2, k3, k6;
 	long n;
 	double qmin, qmax, qn, qc;
 	double dq, dqa[3], phi, r;
 
+	#pragma omp parallel for num_threads(num_threads) \
+	    private(i, k2, k3, k6, n, qmin, qmax, qn, qc, dq, dqa, phi, r)
 	for (k=0; k<N; k++){
 		k6 = 6*k;
 		k3 = 3*k;
@@ -753,13 +785,15 @@ int _saxpy_centroid_values(int N,
 			   double a,
 			   double b,
 			   double* centroid_values,
-			   double* centroid_backup_values) {
+			   double* centroid_backup_values,
+			   int num_threads) {
     // Saxby centroid values
 
 
     int k;
 
 
+    #pragma omp parallel for num_threads(num_threads)
     for (k=0; k<N; k++) {
 	centroid_values[k] = a*centroid_values[k] + b*centroid_backup_values[k];
     }
@@ -773,44 +807,47 @@ int _update(int N,
 	    double timestep,
 	    double* centroid_values,
 	    double* explicit_update,
-	    double* semi_implicit_update) {
+	    double* semi_implicit_update,
+	    int num_threads) {
 	// Update centroid values based on values stored in
 	// explicit_update and semi_implicit_update as well as given timestep
 
 
 	int k;
 	double denominator, x;
+	int err = 0;
 
 
-	// Divide semi_implicit update by conserved quantity
+	// The updates of each triangle are independent so they are done
+	// in one loop
+	#pragma omp parallel for num_threads(num_threads) \
+	    private(denominator, x) reduction(min:err)
 	for (k=0; k<N; k++) {
+		// Divide semi_implicit update by conserved quantity
 		x = centroid_values[k];
 		if (x == 0.0) {
 			semi_implicit_update[k] = 0.0;
 		} else {
 			semi_implicit_update[k] /= x;
 		}
-	}
 
-
-	// Explicit updates
-	for (k=0; k<N; k++) {
+		// Explicit updates
 		centroid_values[k] += timestep*explicit_update[k];
-	}
-
 
-
-	// Semi implicit updates
-	for (k=0; k<N; k++) {
+		// Semi implicit updates
 		denominator = 1.0 - timestep*semi_implicit_update[k];
 		if (denominator <= 0.0) {
-			return -1;
+			err = -1;
 		} else {
 			//Update conserved_quantities from semi implicit updates
 			centroid_values[k] /= denominator;
 		}
 	}
 
+	if (err != 0) {
+		return err;
+	}
+
 
 
 	// Reset semi_implicit_update here ready for next time step
@@ -939,6 +976,28 @@ int _set_vertex_values_c(int num_verts,
 // Python method Wrappers 
 //-----------------------------------------------------
 
+int get_omp_num_threads(PyObject *quantity) {
+  // Number of threads set on the domain of quantity
+  // (see set_omp_num_threads). Defaults to 1.
+
+  PyObject *domain;
+  long num_threads = 1;
+
+  domain = PyObject_GetAttrString(quantity, "domain");
+  if (domain) {
+    if (PyObject_HasAttrString(domain, "omp_num_threads")) {
+      num_threads = get_python_integer(domain, "omp_num_threads");
+    }
+    Py_DECREF(domain);
+  }
+  PyErr_Clear();
+
+  if (num_threads < 1) num_threads = 1;
+
+  return (int) num_threads;
+}
+
+
 PyObject *update(PyObject *self, PyObject *args) {
   // FIXME (Ole): It would be great to turn this text into a Python DOC string
 
@@ -998,7 +1057,8 @@ PyObject *update(PyObject *self, PyObject *args) {
 	err = _update(N, timestep,
 		      (double*) centroid_values -> data,
 		      (double*) explicit_update -> data,
-		      (double*) semi_implicit_update -> data);
+		      (double*) semi_implicit_update -> data,
+		      get_omp_num_threads(quantity));
 
 
 	if (err != 0) {
@@ -1071,7 +1131,8 @@ PyObject *saxpy_centroid_values(PyObject *self, PyObject *args) {
 
 	err = _saxpy_centroid_values(N,a,b,
 		      (double*) centroid_values -> data,
-		      (double*) centroid_backup_values -> data);
+		      (double*) centroid_backup_values -> data,
+		      get_omp_num_threads(quantity));
 
 
 	// Release and return
@@ -1417,7 +1478,8 @@ PyObject *extrapolate_from_gradient(PyObject *self, PyObject *args) {
 			(double*) vertex_values -> data,
 			(double*) edge_values -> data,
 			(double*) x_gradient -> data,
-			(double*) y_gradient -> data);
+			(double*) y_gradient -> data,
+			get_omp_num_threads(quantity));
 
 
 	if (err != 0) {
@@ -1577,7 +1639,8 @@ PyObject *extrapolate_second_order_and_limit_by_edge(PyObject *self, PyObject *a
 			   (long*)   domain_number_of_boundaries -> data,
 			   (long*)   domain_surrogate_neighbours -> data,
 			   (double*) quantity_x_gradient -> data,
-			   (double*) quantity_y_gradient -> data);
+			   (double*) quantity_y_gradient -> data,
+			   get_omp_num_threads(quantity));
 
   if (err != 0) {
       PyErr_SetString(PyExc_RuntimeError,
@@ -1593,7 +1656,8 @@ PyObject *extrapolate_second_order_and_limit_by_edge(PyObject *self, PyObject *a
 				   (double*) quantity_vertex_values -> data,
 				   (double*) quantity_edge_values -> data,
 				   (double*) quantity_x_gradient -> data,
-				   (double*) quantity_y_gradient -> data);
+				   (double*) quantity_y_gradient -> data,
+				   get_omp_num_threads(quantity));
 
   if (err != 0) {
       PyErr_SetString(PyExc_RuntimeError,
@@ -1608,7 +1672,8 @@ PyObject *extrapolate_second_order_and_limit_by_edge(PyObject *self, PyObject *a
 				       (double*) quantity_edge_values -> data,
 				       (long*)   domain_neighbours -> data,
 				       (double*) quantity_x_gradient -> data,
-				       (double*) quantity_y_gradient -> data);
+				       (double*) quantity_y_gradient -> data,
+				       get_omp_num_threads(quantity));
 
   if (err != 0) {
       PyErr_SetString(PyExc_RuntimeError,
@@ -1704,7 +1769,8 @@ PyObject *extrapolate_second_order_and_limit_by_vertex(PyObject *self, PyObject
 			   (long*)   domain_number_of_boundaries -> data,
 			   (long*)   domain_surrogate_neighbours -> data,
 			   (double*) quantity_x_gradient -> data,
-			   (double*) quantity_y_gradient -> data);
+			   (double*) quantity_y_gradient -> data,
+			   get_omp_num_threads(quantity));
 
   if (err != 0) {
       PyErr_SetString(PyExc_RuntimeError,
@@ -1720,7 +1786,8 @@ PyObject *extrapolate_second_order_and_limit_by_vertex(PyObject *self, PyObject
 				   (double*) quantity_vertex_values -> data,
 				   (double*) quantity_edge_values -> data,
 				   (double*) quantity_x_gradient -> data,
-				   (double*) quantity_y_gradient -> data);
+				   (double*) quantity_y_gradient -> data,
+				   get_omp_num_threads(quantity));
 
   if (err != 0) {
       PyErr_SetString(PyExc_RuntimeError,
@@ -1735,7 +1802,8 @@ PyObject *extrapolate_second_order_and_limit_by_vertex(PyObject *self, PyObject
 				       (double*) quantity_edge_values -> data,
 				       (long*)   domain_neighbours -> data,
 				       (double*) quantity_x_gradient -> data,
-				       (double*) quantity_y_gradient -> data);
+				       (double*) quantity_y_gradient -> data,
+				       get_omp_num_threads(quantity));
 
   if (err != 0) {
       PyErr_SetString(PyExc_RuntimeError,
@@ -1818,7 +1886,8 @@ PyObject *compute_gradients(PyObject *self, PyObject *args) {
 			(long*) number_of_boundaries -> data,
 			(long*) surrogate_neighbours -> data,
 			(double*) x_gradient -> data,
-			(double*) y_gradient -> data);
+			(double*) y_gradient -> data,
+			get_omp_num_threads(quantity));
 
 	if (err != 0) {
 	  PyErr_SetString(PyExc_RuntimeError, "Gradient could not be computed");
@@ -2006,7 +2075,8 @@ PyObject *limit_vertices_by_all_neighbours(PyObject *self, PyObject *args) {
 						(double*) edge_values -> data,
 						(long*)   neighbours -> data,
 						(double*) x_gradient -> data,
-						(double*) y_gradient -> data);
+						(double*) y_gradient -> data,
+						get_omp_num_threads(quantity));
 
 
 	
@@ -2087,7 +2157,8 @@ PyObject *limit_edges_by_all_neighbours(PyObject *self, PyObject *args) {
 					     (double*) edge_values -> data,
 					     (long*)   neighbours -> data,
 					     (double*) x_gradient -> data,
-					     (double*) y_gradient -> data);
+					     (double*) y_gradient -> data,
+					     get_omp_num_threads(quantity));
 
 	if (err != 0) {
 	  PyErr_SetString(PyExc_RuntimeError,
@@ -2312,7 +2383,8 @@ PyObject *limit_edges_by_neighbour(PyObject *self, PyObject *args) {
 					(double*) centroid_values -> data,
 					(double*) vertex_values -> data,
 					(double*) edge_values -> data,
-					(long*)   neighbours -> data);
+					(long*)   neighbours -> data,
+					get_omp_num_threads(quantity));
 	
 	if (err != 0) {
 	  PyErr_SetString(PyExc_RuntimeError,
@@ -2404,7 +2476,8 @@ PyObject *limit_gradient_by_neighbour(PyObject *self, PyObject *args) {
 					(double*) edge_values -> data,
 					(double*) x_gradient -> data,
 					(double*) y_gradient -> data,
-					(long*)   neighbours -> data);
+					(long*)   neighbours -> data,
+					get_omp_num_threads(quantity));
 	
 	if (err != 0) {
 	  PyErr_SetString(PyExc_RuntimeError,
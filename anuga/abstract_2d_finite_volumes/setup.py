@@ -41,7 +41,9 @@ def configuration(parent_package='',top_path=None):
 
     config.add_extension('quantity_ext',
                          sources=['quantity_ext.c'],
-                         include_dirs=[util_dir])        
+                         include_dirs=[util_dir],
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
     
 
     return config
@@ -11,6 +11,7 @@ import numpy as num
 import anuga
 
 from anuga.abstract_2d_finite_volumes.gauge import sww2csv_gauges
+from anuga.abstract_2d_finite_volumes.util import calc_bearing
 from anuga.utilities.numerical_tools import mean
 from anuga.pmesh.mesh import Mesh
 from anuga.file.sww import SWW_file
@@ -550,6 +551,124 @@ point2, 0.5, 2.0\n")
         os.remove(basename+".sww")
         #os.remove(basename+str(time.time())+".sww")
 
+    def _create_sww_frames(self):
+        """Sww file with varying stage and momenta in 6 frames
+        """
+
+        domain = self.domain
+        self.sww = SWW_file(domain)
+        self.sww.store_connectivity()
+        for i in range(6):
+            domain.set_quantity('stage', lambda x,y: 1.0 + i*x/10 + y/20)
+            domain.set_quantity('xmomentum', lambda x,y: (i - 2)*y)
+            domain.set_quantity('ymomentum', lambda x,y: (3 - i)*x)
+            domain.set_time(i*1.5)
+            self.sww.store_timestep()
+
+    def test_calc_bearings(self):
+        from anuga.abstract_2d_finite_volumes.gauge import _calc_bearings
+
+        self.sww = None
+
+        uh = num.array([1.0, 0.0, -1.0, 0.0, 3.0, -2.0, 0.0, 0.5])
+        vh = num.array([0.0, 1.0, 0.0, -1.0, -4.0, -1.0, 0.0, 2.0])
+
+        bearings = _calc_bearings(uh, vh)
+        for i in range(len(uh)):
+            assert num.allclose(bearings[i], calc_bearing(uh[i], vh[i]))
+
+    def test_sww2csv_gauges_batched(self):
+        """Batched extraction gives the values of file_function in all
+        output formats and for any block size
+        """
+
+        from anuga.abstract_2d_finite_volumes.file_function import \
+             file_function
+        from anuga.abstract_2d_finite_volumes.gauge import Gauge_timeseries
+        from anuga.file.netcdf import NetCDFFile
+
+        self._create_sww_frames()
+
+        points = [[5.0, 1.0], [0.5, 2.0], [50.0, 1.0], [3.1, 4.7]]
+        names = ['point1', 'point2', 'offmesh', 'point3']
+
+        points_file = tempfile.mktemp(".csv")
+        file_id = open(points_file,"w")
+        file_id.write("name,easting,northing\n")
+        for name, point in zip(names, points):
+            file_id.write("%s, %f, %f\n" % (name, point[0], point[1]))
+        file_id.close()
+
+        quantities = ['stage', 'depth', 'speed', 'bearing', 'momentum',
+                      'xmomentum']
+        f = file_function(self.sww.filename,
+                          quantities=['stage', 'elevation',
+                                      'xmomentum', 'ymomentum'],
+                          interpolation_points=points,
+                          use_cache=False)
+        time = f.get_time()
+
+        # Gauge time series is callable like file_function
+        g = Gauge_timeseries(self.sww.filename, points)
+        assert num.allclose(g.get_time(), time)
+        for t in [0.0, 2.0, 7.5]:
+            for k in [0, 1, 3]:
+                assert num.allclose(g(t, k), f(t, k))
+        assert g(0.0, 2)[2] > 1.0e6
+
+        for frames_per_block in [None, 1, 4]:
+            sww2csv_gauges(self.sww.filename, points_file,
+                           quantities=quantities,
+                           frames_per_block=frames_per_block)
+            assert not os.path.exists('gauge_offmesh.csv')
+
+            for k in [0, 1, 3]:
+                handle = open('gauge_%s.csv' % names[k])
+                point_reader = reader(handle)
+                assert point_reader.next() == ['time', 'hours'] + quantities
+                rows = num.array([[float(x) for x in row]
+                                  for row in point_reader])
+                handle.close()
+                os.remove('gauge_%s.csv' % names[k])
+
+                assert num.allclose(rows[:,0], time)
+                for i, t in enumerate(time):
+                    w, z, uh, vh = f(t, k)
+                    assert num.allclose(rows[i,2:],
+                                        [w, w - z,
+                                         num.sqrt(uh**2 + vh**2)/(w - z),
+                                         rows[i,5], num.sqrt(uh**2 + vh**2),
+                                         uh])
+
+        # Columnar files
+        sww2csv_gauges(self.sww.filename, points_file,
+                       quantities=quantities, output_format='nc',
+                       frames_per_block=2)
+        sww2csv_gauges(self.sww.filename, points_file,
+                       quantities=quantities, output_format='npz')
+
+        fid = NetCDFFile('gauge.nc')
+        npz = num.load('gauge.npz')
+        assert fid.gauge_names.split(',') == names
+        assert list(npz['gauge_names']) == names
+        for name in ['x', 'y', 'time', 'hours'] + quantities:
+            assert num.allclose(fid.variables[name][:], npz[name])
+        assert num.allclose(npz['time'], time)
+        assert num.allclose(npz['x'], [p[0] for p in points])
+        assert num.alltrue(npz['stage'][:,2] > 1.0e6)
+        for i, t in enumerate(time):
+            for k in [0, 1, 3]:
+                assert num.allclose(npz['stage'][i,k], f(t, k)[0])
+                assert num.allclose(npz['bearing'][i,k],
+                                    calc_bearing(*f(t, k)[2:]))
+        fid.close()
+        npz.close()
+
+        os.remove('gauge.nc')
+        os.remove('gauge.npz')
+        os.remove(points_file)
+
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -193,6 +193,33 @@ class Test_Generic_Boundary_Conditions(unittest.TestCase):
         q = T.evaluate(1, 1)  #Vol=1, edge=1
         assert num.allclose(q, domain.get_edge_midpoint_coordinate(1,1))        
 
+        # Function of scalar coordinates only is evaluated edge by edge
+        import math
+        def function(t,x,y):
+            return [math.sqrt(x), y]
+
+        T = Time_space_boundary(domain, function)
+        x = num.array([1.0, 4.0])
+        y = num.array([2.0, 3.0])
+        q = T.evaluate_function(0.0, x, y)
+        assert num.allclose(q, [[1.0, 2.0], [2.0, 3.0]])
+        assert not T.vectorised
+
+        # Errors in the function are not hidden
+        levels = {'offset': 1.0}
+        def function(t,x,y):
+            return [x + levels['offset'], y]
+
+        T = Time_space_boundary(domain, function)
+        del levels['offset']
+        try:
+            T.evaluate_function(0.0, x, y)
+        except KeyError:
+            pass
+        else:
+            raise Exception('Should have raised exception')
+        assert T.vectorised
+
 
 
 
@@ -0,0 +1,210 @@
+"""Test renumbering of triangles and nodes for memory locality
+"""
+
+import unittest
+import os
+
+import numpy as num
+
+import anuga
+
+from anuga.abstract_2d_finite_volumes.mesh_reordering import *
+from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.file.netcdf import NetCDFFile
+
+
+def shuffled_mesh(m=8, n=6):
+    """Rectangular mesh with triangles in random order
+    """
+
+    points, vertices, boundary = rectangular_cross(m, n, len1=m, len2=n)
+
+    num.random.seed(17)
+    permutation = num.random.permutation(len(vertices))
+    inverse = inverse_permutation(permutation)
+
+    vertices = num.array(vertices)[permutation]
+    boundary = dict(((int(inverse[vol_id]), edge_id), tag)
+                    for (vol_id, edge_id), tag in boundary.items())
+
+    return points, vertices, boundary
+
+
+def mean_neighbour_distance(mesh):
+
+    k = num.arange(len(mesh))[:, None]
+    neighbours = mesh.neighbours
+
+    return num.abs(num.where(neighbours >= 0, neighbours - k, 0)).mean()
+
+
+class Test_mesh_reordering(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['reorder_None.sww', 'reorder_hilbert.sww']:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+    def test_inverse_permutation(self):
+
+        permutation = num.array([2, 0, 3, 1])
+        inverse = inverse_permutation(permutation)
+
+        assert num.all(inverse == [1, 3, 0, 2])
+        assert num.all(inverse[permutation] == num.arange(4))
+
+
+    def test_curve_keys(self):
+        """Consecutive cells of a grid are adjacent along the Hilbert curve
+        """
+
+        x, y = num.meshgrid(num.arange(8.0), num.arange(8.0))
+        x = x.ravel()
+        y = y.ravel()
+
+        order = num.argsort(hilbert_keys(x, y, order=3))
+        steps = num.abs(num.diff(x[order])) + num.abs(num.diff(y[order]))
+        assert num.all(steps == 1)
+
+        # Morton order visits 2x2 blocks in Z order
+        keys = morton_keys(x, y, order=3)
+        assert len(num.unique(keys)) == 64
+        order = num.argsort(keys)
+        assert num.allclose(x[order][:4], [0, 1, 0, 1])
+        assert num.allclose(y[order][:4], [0, 0, 1, 1])
+
+
+    def test_triangle_adjacency(self):
+
+        points, vertices, boundary = rectangular_cross(3, 2)
+        mesh = Mesh(points, vertices, boundary)
+
+        adjacency = get_triangle_adjacency(vertices)
+        assert num.all(adjacency == num.where(mesh.neighbours >= 0,
+                                              mesh.neighbours, -1))
+
+
+    def test_reorder_methods(self):
+
+        points, vertices, boundary = shuffled_mesh()
+        original = Mesh(points, vertices, boundary)
+
+        for method in reordering_methods:
+            mesh = Mesh(points, vertices, boundary, reorder=method)
+            mesh.check_integrity()
+
+            assert mean_neighbour_distance(mesh) < \
+                   mean_neighbour_distance(original)/4
+
+            # Permutations map new ids to original ids
+            tp = mesh.triangle_permutation
+            np = mesh.node_permutation
+            assert num.all(num.sort(tp) == num.arange(len(vertices)))
+            assert num.all(num.sort(np) == num.arange(len(points)))
+            assert num.allclose(mesh.nodes, original.nodes[np])
+            assert num.all(np[mesh.triangles] == original.triangles[tp])
+
+            assert num.allclose(mesh.get_original_ordering(mesh.areas),
+                                original.areas)
+            assert num.allclose(
+                mesh.get_original_ordering(mesh.vertex_coordinates),
+                original.vertex_coordinates)
+            assert num.allclose(
+                mesh.get_original_ordering(mesh.nodes, location='nodes'),
+                original.nodes)
+            assert num.all(mesh.get_original_triangles() == vertices)
+
+            for (vol_id, edge_id), tag in boundary.items():
+                new_id = mesh.get_reordered_triangle_ids([vol_id])[0]
+                assert mesh.boundary[(new_id, edge_id)] == tag
+
+            assert num.all(mesh.get_original_triangle_ids(
+                mesh.get_reordered_triangle_ids([3, 11])) == [3, 11])
+
+            # Point location reports either numbering
+            for point in [[0.3, 0.2], [4.1, 3.7], [7.9, 5.5]]:
+                k = original.get_triangle_containing_point(point)
+                assert mesh.get_triangle_containing_point(
+                    point, original_id=True) == k
+                assert mesh.get_triangle_containing_point(point) == \
+                       mesh.get_reordered_triangle_ids([k])[0]
+
+        try:
+            Mesh(points, vertices, boundary, reorder='peano')
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Expected AssertionError')
+
+
+    def test_tagged_elements(self):
+
+        points, vertices, boundary = rectangular_cross(2, 2)
+        tagged_elements = {'dry': [0, 1, 5], 'wet': [2, 3]}
+
+        coordinates, triangles, new_boundary, new_tagged, tp, np = \
+            reorder_mesh(points, vertices, boundary, tagged_elements,
+                         method='rcm')
+
+        for tag, elements in tagged_elements.items():
+            assert num.all(num.sort(tp[new_tagged[tag]]) == elements)
+            assert num.all(num.diff(new_tagged[tag]) > 0)
+
+        assert len(new_boundary) == len(boundary)
+
+
+    def test_evolve_reordered_domain(self):
+        """Reordered domain gives the same results and sww file as the
+        original domain
+        """
+
+        points, vertices, boundary = shuffled_mesh(6, 4)
+
+        results = {}
+        for method in [None, 'hilbert']:
+            domain = anuga.Domain(points, vertices, boundary, reorder=method)
+            domain.set_name('reorder_%s' % method)
+            domain.set_store_original_order(True)
+            domain.set_store_vertices_smoothly(False)
+            domain.set_quantities_to_be_stored({'stage': 2, 'elevation': 1})
+
+            domain.set_quantity('elevation', lambda x,y: -x/10)
+            domain.set_quantity('stage', lambda x,y: num.where(x < 2, 0.5, 0.))
+
+            Br = anuga.Reflective_boundary(domain)
+            Bd = anuga.Dirichlet_boundary([0.3, 0.0, 0.0])
+            domain.set_boundary({'left': Bd, 'right': Br,
+                                 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+                pass
+
+            stage = domain.quantities['stage'].centroid_values
+            results[method] = (domain.get_original_ordering(stage),
+                               domain.number_of_steps)
+
+        assert results[None][1] == results['hilbert'][1]
+        assert num.allclose(results[None][0], results['hilbert'][0])
+
+        fid = NetCDFFile('reorder_None.sww')
+        fid_reordered = NetCDFFile('reorder_hilbert.sww')
+        for name in ['x', 'y', 'volumes', 'elevation', 'stage', 'stage_c']:
+            assert num.allclose(fid.variables[name][:],
+                                fid_reordered.variables[name][:])
+        fid.close()
+        fid_reordered.close()
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_mesh_reordering, 'test')
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
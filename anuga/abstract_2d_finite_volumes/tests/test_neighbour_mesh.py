@@ -1230,7 +1230,46 @@ class Test_Mesh(unittest.TestCase):
 
         for i, point in enumerate(mesh.get_centroid_coordinates()):
             id = mesh.get_triangle_containing_point(point)
-            assert id == i        
+            assert id == i
+
+    def test_get_triangles_containing_points(self):
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+
+        points, vertices, boundary = rectangular_cross(6, 4, len1=6.0, len2=4.0)
+        geo = Geo_reference(56, 1000.0, 2000.0)
+        mesh = Mesh(points, vertices, boundary, geo_reference=geo)
+
+        # Spatial index is built when first needed and then kept
+        assert mesh.quadtree is None
+
+        centroids = mesh.get_centroid_coordinates(absolute=True)
+        ids = mesh.get_triangles_containing_points(centroids)
+        assert num.all(ids == num.arange(len(mesh)))
+
+        quadtree = mesh.get_quadtree()
+        assert quadtree is mesh.quadtree
+
+        test_points = [[1002.3, 2001.1], [995.0, 2001.0],
+                       [1005.9, 2003.2], [1003.0, 2005.0]]
+        ids = mesh.get_triangles_containing_points(test_points)
+        assert num.all(ids[[1, 3]] == -1)
+
+        V = mesh.get_vertex_coordinates(absolute=True)
+        for point, id in zip(test_points, ids):
+            if id >= 0:
+                assert is_inside_polygon(point, V[3*id:3*id+3], closed=True)
+                assert mesh.get_triangle_containing_point(point) == id
+
+        try:
+            mesh.get_triangle_containing_point([995.0, 2001.0])
+        except Exception:
+            pass
+        else:
+            msg = 'Should have caught point outside mesh'
+            raise Exception(msg)
+
+        assert mesh.get_quadtree() is quadtree
 
     def test_get_triangle_neighbours(self):
         a = [0.0, 0.0]
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import json
+import tempfile
+from csv import reader
+
+import numpy as num
+
+import anuga
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.abstract_2d_finite_volumes.profiler import Profiled_method
+
+
+def create_domain():
+
+    points, vertices, boundary = rectangular_cross(4, 4, len1=4.0, len2=4.0)
+
+    domain = anuga.Domain(points, vertices, boundary)
+    domain.set_name('test_profiler')
+    domain.set_datadir(tempfile.mkdtemp())
+    domain.set_store(False)
+    domain.set_quantity('elevation', lambda x,y: -x/4)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', 0.2)
+
+    Br = anuga.Reflective_boundary(domain)
+    Bd = anuga.Dirichlet_boundary([0.4, 0., 0.])
+    domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+class Test_Profiler(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def test_profile_evolve(self):
+
+        domain = create_domain()
+        op = anuga.Rate_operator(domain, rate=0.01, label='rain')
+
+        profiler = domain.enable_profiling(trace=True)
+        assert domain.get_profiler() is profiler
+        assert isinstance(domain.__dict__['compute_fluxes'], Profiled_method)
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        # Initial and two more yieldsteps
+        assert len(profiler.yieldsteps) == 3
+        assert num.allclose([y[0] for y in profiler.yieldsteps],
+                            [0.0, 0.5, 1.0])
+
+        totals = profiler.get_totals()
+        steps = totals[('phase', 'evolve_one_euler_step')][0]
+        assert steps > 0
+
+        for key in [('phase', 'compute_fluxes'),
+                    ('phase', 'distribute_to_vertices_and_edges'),
+                    ('phase', 'update_boundary'),
+                    ('phase', 'apply_fractional_steps'),
+                    ('phase', 'update_ghosts'),
+                    ('phase', 'update_extrema'),
+                    ('operator', op.label),
+                    ('boundary', 'left'),
+                    ('boundary', 'right'),
+                    ('boundary', 'top'),
+                    ('boundary', 'bottom')]:
+            assert key in totals, key
+
+        assert totals[('phase', 'compute_fluxes')][0] == steps
+        assert totals[('operator', op.label)][0] == steps
+        assert totals[('phase', 'update_boundary')][0] == \
+               totals[('boundary', 'left')][0]
+
+        # Inclusive times
+        for count, wall, cpu in totals.values():
+            assert wall >= 0.0 and cpu >= 0.0
+        assert totals[('phase', 'update_boundary')][1] >= \
+               totals[('boundary', 'left')][1]
+
+        # Per yieldstep timings add up to the totals
+        n = sum([y[2].get(('phase', 'compute_fluxes'), [0])[0]
+                 for y in profiler.yieldsteps])
+        assert n == steps
+
+        assert profiler.get_mpi_wait()['ghost'] == 0.0
+        assert 'compute_fluxes' in profiler.statistics()
+
+        # Export
+        filename = profiler.write_csv()
+        fid = open(filename)
+        rows = list(reader(fid))
+        fid.close()
+        os.remove(filename)
+
+        assert rows[0] == ['yieldstep', 'time', 'category', 'name',
+                           'calls', 'wall', 'cpu']
+        total_rows = [r for r in rows[1:] if r[0] == 'total']
+        assert ['total', '1.0', 'phase', 'compute_fluxes', str(steps)] in \
+               [r[:5] for r in total_rows]
+        assert 'ghost' in [r[3] for r in total_rows if r[2] == 'mpi']
+
+        filename = profiler.write_chrome_trace()
+        fid = open(filename)
+        trace = json.load(fid)
+        fid.close()
+        os.remove(filename)
+
+        events = trace['traceEvents']
+        fluxes = [e for e in events if e['name'] == 'compute_fluxes']
+        assert len(fluxes) == steps
+        assert fluxes[0]['ph'] == 'X'
+        assert fluxes[0]['cat'] == 'phase'
+        assert len([e for e in events if e['ph'] == 'C']) == 3
+
+        # Disabling restores the methods and stops timing
+        domain.disable_profiling()
+        assert domain.profiler is None
+        assert 'compute_fluxes' not in domain.__dict__
+        assert domain.get_profiler() is profiler
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.5):
+            pass
+
+        assert profiler.get_totals()[('phase', 'compute_fluxes')][0] == steps
+
+        os.rmdir(domain.get_datadir())
+
+
+    def test_profile_disabled(self):
+
+        domain = create_domain()
+        assert domain.profiler is None
+        assert domain.get_profiler() is None
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=0.5):
+            pass
+
+        for name in ['compute_fluxes', 'update_boundary']:
+            assert name not in domain.__dict__
+
+        os.rmdir(domain.get_datadir())
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_Profiler, 'test')
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
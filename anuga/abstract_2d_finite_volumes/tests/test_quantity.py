@@ -1683,6 +1683,83 @@ class Test_Quantity(unittest.TestCase):
             pass
 
 
+    def test_set_values_from_utm_raster(self):
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0, 0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0, 0.0]
+
+        points = [a, b, c, d, e, f]
+
+        #bac, bce, ecf, dbe
+        elements = [ [1,0,2], [1,2,4], [4,2,5], [3,1,4] ]
+
+        mesh4 = Generic_Domain(points, elements,
+                               geo_reference = Geo_reference(56, 100.0, 200.0))
+        quantity = Quantity(mesh4)
+
+        # Grid with cellsize 0.5 of the linear function
+        ncols = 21
+        nrows = 24
+        x = num.linspace(100.0, 100.0+(ncols-1)*0.5, ncols)
+        y = num.linspace(200.0, 200.0+(nrows-1)*0.5, nrows)
+        Z = linear_function(axes2points(x - 100.0, y - 200.0))
+        Z = Z.reshape(nrows, ncols)
+
+        root = tempfile.mktemp('_raster')
+        fid = open(root + '.asc', 'w')
+        fid.write('ncols %d\nnrows %d\nxllcorner 100.0\nyllcorner 200.0\n'
+                  'cellsize 0.5\nNODATA_value -9999\n' % (ncols, nrows))
+        for row in Z:
+            fid.write(' '.join([str(z) for z in row]) + '\n')
+        fid.close()
+
+        answer = [[  6.,   0.,   2.],
+                  [  6.,   2.,   8.],
+                  [  8.,  2.,   4.],
+                  [ 12.,   6.,   8.]]
+        centroid_answer = [ 2.66666667,  5.33333333,  4.66666667,  8.66666667]
+
+        # Tuple (x,y,Z), ASCII grid converted to ERMapper and ERMapper grid
+        for raster in [(x, y, Z), root + '.asc', root + '.ers']:
+            for interpolation in ['bilinear', 'pixel']:
+                quantity.set_values(0.0)
+                quantity.set_values(raster=raster,
+                                    interpolation=interpolation)
+                assert num.allclose(quantity.vertex_values, answer)
+
+                quantity.set_values(0.0)
+                quantity.set_values(raster=raster, location='centroids')
+                assert num.allclose(quantity.centroid_values, centroid_answer)
+
+        # ERMapper grid as filename, in tiles and threads
+        mesh4.raster_tile_size = 2
+        mesh4.raster_threads = 2
+        quantity.set_values(0.0)
+        quantity.set_values(filename=root + '.ers', indices=[1, 3])
+        assert num.allclose(quantity.vertex_values[[1, 3]], answer[1::2])
+        assert num.allclose(quantity.vertex_values[[0, 2]], 0.0)
+
+        # Average over the triangles of a linear function
+        quantity.set_values(0.0)
+        quantity.set_values(raster=root + '.ers', location='centroids',
+                            interpolation='average')
+        assert num.allclose(quantity.centroid_values, centroid_answer)
+
+        try:
+            quantity.set_values(raster=root + '.ers', interpolation='average')
+        except Exception:
+            pass
+        else:
+            raise Exception('Average at vertices not caught')
+
+        for extension in ['.asc', '.ers', '']:
+            os.remove(root + extension)
+
+
     def test_set_values_from_quantity(self):
 
         quantity1 = Quantity(self.mesh4)
@@ -2168,6 +2245,50 @@ class Test_Quantity(unittest.TestCase):
             assert num.allclose (quantity.centroid_values[k],
                                  num.sum(quantity.vertex_values[k,:])/3)
 
+
+    def test_extrapolate_and_limit_threaded(self):
+        """Threaded extrapolation and limiting gives the same results as
+        the serial computation
+        """
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory \
+             import rectangular_cross
+
+        points, vertices, boundary = rectangular_cross(10, 10)
+        domain = Generic_Domain(points, vertices, boundary)
+        domain.beta_w = 0.9
+
+        num.random.seed(17)
+        values = num.random.uniform(-1.0, 1.0, len(domain))
+
+        methods = ['extrapolate_second_order_and_limit_by_edge',
+                   'extrapolate_second_order_and_limit_by_vertex',
+                   'extrapolate_second_order',
+                   'limit_edges_by_neighbour']
+
+        for method in methods:
+            results = []
+            for n in [1, 4]:
+                domain.set_omp_num_threads(n)
+                quantity = Quantity(domain)
+                quantity.set_values(values, location='centroids')
+                getattr(quantity, method)()
+
+                quantity.semi_implicit_update[:] = 0.1*values
+                quantity.explicit_update[:] = values
+                quantity.update(0.1)
+
+                results.append(quantity)
+
+            Q1, Q4 = results
+            assert num.all(Q1.edge_values == Q4.edge_values), method
+            assert num.all(Q1.vertex_values == Q4.vertex_values), method
+            assert num.all(Q1.x_gradient == Q4.x_gradient), method
+            assert num.all(Q1.centroid_values == Q4.centroid_values), method
+
+        assert domain.get_omp_num_threads() == 4
+
+
     def test_limiter2(self):
         """Taken from test_shallow_water
         """
@@ -3005,6 +3126,77 @@ class Test_Quantity(unittest.TestCase):
         assert num.allclose(quantity.edge_values, exact_edge_values)
 
 
+    def test_release_auxiliary_arrays(self):
+        quantity = Quantity(self.mesh4)
+        quantity.set_values([[1,2,3], [5,5,5], [0,0,9], [-6, 3, 3]],
+                            location = 'vertices')
+
+        usage = quantity.get_memory_usage()
+        assert 'x_gradient' in usage
+        assert usage['centroid_values'] == 4*8
+
+        quantity.release_auxiliary_arrays()
+        usage = quantity.get_memory_usage()
+        for name in Quantity.auxiliary_arrays:
+            assert name not in usage
+        assert 'vertex_values' in usage
+
+        # Arrays are reallocated when used
+        quantity.extrapolate_second_order()
+        assert quantity.x_gradient.shape == (4,)
+        assert num.allclose(quantity.centroid_values, [2., 5., 3., 0.])
+        assert quantity.boundary_values.shape == \
+               (len(self.mesh4.boundary),)
+
+        try:
+            quantity.no_such_array
+        except AttributeError:
+            pass
+        else:
+            raise Exception('Should have raised AttributeError')
+
+    def test_set_precision(self):
+        quantity = Quantity(self.mesh4)
+        vertex_values = quantity.vertex_values
+
+        quantity.set_values([[1,2,3], [5,5,5], [0,0,9], [-6, 3, 3]],
+                            location = 'vertices')
+
+        quantity.set_precision(num.float32)
+        assert quantity.get_precision() == num.float32
+        assert quantity.centroid_values.dtype == num.float32
+        assert quantity.vertex_values.dtype == num.float32
+        assert quantity.get_memory_usage()['centroid_values'] == 4*4
+        assert num.allclose(quantity.centroid_values, [2., 5., 3., 0.])
+
+        # C routines work on single precision quantities
+        quantity.set_values([[1,2,3], [5,5,5], [0,0,9], [-4, 3, 3]],
+                            location = 'vertices')
+        assert quantity.vertex_values.dtype == num.float32
+        assert num.allclose(quantity.centroid_values, [2., 5., 3., 2./3])
+        assert num.allclose(quantity.edge_values, [[2.5, 2.0, 1.5],
+                                                   [5., 5., 5.],
+                                                   [4.5, 4.5, 0.],
+                                                   [3.0, -0.5, -0.5]])
+
+        reference = Quantity(self.mesh4)
+        for q in [quantity, reference]:
+            q.set_values(lambda x, y: x + 3*y, location = 'centroids')
+            q.extrapolate_second_order()
+        assert quantity.centroid_values.dtype == num.float32
+        assert num.allclose(quantity.vertex_values, reference.vertex_values,
+                            atol=1.0e-6)
+        assert num.allclose(quantity.edge_values, reference.edge_values,
+                            atol=1.0e-6)
+
+        # Back to double precision
+        quantity.set_precision(num.float)
+        assert quantity.centroid_values.dtype == num.float
+        assert quantity.get_memory_usage()['centroid_values'] == 4*8
+        assert num.allclose(quantity.vertex_values, reference.vertex_values,
+                            atol=1.0e-6)
+
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
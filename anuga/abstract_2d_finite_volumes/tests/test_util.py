@@ -580,7 +580,69 @@ class Test_Util(unittest.TestCase):
         import os
         os.remove(filename)
 
-        
+
+
+
+    def test_spatio_temporal_file_function_streaming(self):
+        """Test that the streaming file function gives the same values
+        as the one precomputing all timesteps
+        """
+
+        import cPickle
+        from anuga.fit_interpolate.interpolate import \
+             Streaming_interpolation_function
+
+        # Create sww file
+        points, vertices, boundary = rectangular(3, 3)
+        domain1 = Domain(points, vertices, boundary)
+        domain1.smooth = True
+        domain1.set_datadir('.')
+        domain1.set_name('spatio_temporal_streaming_%d' % id(self))
+
+        domain1.set_quantity('elevation', lambda x,y: -x/3)
+        domain1.set_quantity('stage', 0)
+
+        B0 = Dirichlet_boundary([0,0,0])
+        B6 = Dirichlet_boundary([0.6,0,0])
+        domain1.set_boundary({'left': B6, 'top': B6, 'right': B0, 'bottom': B0})
+
+        for t in domain1.evolve(yieldstep=0.1, finaltime=3):
+            pass
+
+        filename = domain1.get_name() + '.sww'
+        midpoints = [[0.2, 0.1], [0.5, 0.5], [0.9, 0.3], [0.1, 0.8]]
+
+        for time_thinning in [1, 3]:
+            f = file_function(filename, domain1,
+                              quantities=['stage', 'xmomentum', 'elevation'],
+                              interpolation_points=midpoints,
+                              time_thinning=time_thinning)
+            g = file_function(filename, domain1,
+                              quantities=['stage', 'xmomentum', 'elevation'],
+                              interpolation_points=midpoints,
+                              time_thinning=time_thinning,
+                              window_size=4)
+
+            assert isinstance(g, Streaming_interpolation_function)
+            assert num.allclose(f.get_time(), g.get_time())
+
+            # Forwards, crossing several windows, then backwards
+            times = list(num.arange(0, 3, 0.07)) + [3.0, 2.55, 0.31, 0.0]
+            for t in times:
+                for i in range(len(midpoints)):
+                    assert num.allclose(f(t, point_id=i), g(t, point_id=i))
+
+                assert num.allclose(g(t, point_id=num.arange(4)),
+                                    [f(t, point_id=i) for i in range(4)])
+
+            # Can be pickled (e.g. for checkpointing) and keeps reading
+            h = cPickle.loads(cPickle.dumps(g, cPickle.HIGHEST_PROTOCOL))
+            assert num.allclose(h(1.35, point_id=2), f(1.35, point_id=2))
+
+            g.close()
+            h.close()
+
+        os.remove(filename)
 
 
     def test_spatio_temporal_file_function_time(self):
@@ -94,8 +94,12 @@ options = {
   'bin': True,           # Use binary format (more efficient)
   'compression': True,   # Use zlib compression
   'bytecode': True,      # Recompute if bytecode has changed
-  'expire': False        # Automatically remove files that have been accessed
+  'expire': False,       # Automatically remove files that have been accessed
                          # least recently
+  'memsize': 2**28,      # Byte size of in-memory tier in front of the cache
+                         # files (0 disables it)
+  'npy': True            # Store numpy array results as .npy files which are
+                         # memory mapped when loaded
 }
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -264,6 +268,19 @@ def cache(my_F,
     New form of clear:
       cache(my_F,(arg1,...,argn), clear=True)
     clears cached data for particular combination my_F and args 
+
+  Memory tier:
+    Results are also kept in memory, keyed by a content digest of the
+    arguments (see mydigest), so repeated calls within the same process
+    neither read the cache files nor compare the stored arguments.
+    Each hit returns a fresh copy of the result. The total size of the
+    memory tier is capped by options['memsize'] (bytes) and the least
+    recently used results are dropped first. Set it to 0 to disable.
+
+  Numpy results:
+    If options['npy'] is set, numpy array results are stored as raw .npy
+    files, regardless of compression, and memory mapped (copy on write)
+    when loaded instead of being unpickled.
       
   """
 
@@ -323,9 +340,10 @@ def cache(my_F,
     return(FN)
 
   if clear:
+    clear_memory(CD, funcname, FN)
     for file_type in file_types:
       file_name = CD+FN+'_'+file_type
-      for fn in [file_name, file_name + '.z']:
+      for fn in [file_name, file_name + '.z', file_name + '.npy']:
         if os.access(fn, os.F_OK):              
           if unix:
             os.remove(fn)
@@ -341,18 +359,38 @@ def cache(my_F,
 
   #-------------------------------------------------------------------        
   
+  # Digest arguments for the memory tier
+  if options['memsize'] > 0:
+    argdigest = mydigest((args, kwargs))
+  else:
+    argdigest = None
+
   # Check if previous computation has been cached
   if evaluate is True:
     Retrieved = None  # Force evaluation of my_F regardless of caching status.
     reason = 5
   else:
-    T, FN, Retrieved, reason, comptime, loadtime, compressed = \
-        CacheLookup(CD, FN, my_F, 
-                    args, kwargs, 
-                    deps, 
-                    verbose, 
-                    compression,
-                    dependencies)
+    T, Retrieved, comptime, loadtime, compressed = \
+        MemoryLookup(CD, funcname, argdigest, my_F, deps, dependencies)
+
+    if Retrieved:
+      reason = 0
+      T = restore_results(T, verbose)
+      if verbose is True:
+        log.critical('Caching: retrieved result of %s from memory'
+                     % funcname)
+    else:
+      T, FN, Retrieved, reason, comptime, loadtime, compressed = \
+          CacheLookup(CD, FN, my_F, 
+                      args, kwargs, 
+                      deps, 
+                      verbose, 
+                      compression,
+                      dependencies)
+
+      if Retrieved:
+        save_results_to_memory(T, CD, FN, funcname, argdigest, my_F, deps,
+                               comptime, loadtime, compressed)
 
   if not Retrieved:
     if test:  # Do not attempt to evaluate function
@@ -384,6 +422,8 @@ def cache(my_F,
       # Save results and estimated loading time to cache
       loadtime = save_results_to_cache(T, CD, FN, my_F, deps, comptime, \
                                        funcname, dependencies, compression)
+      save_results_to_memory(T, CD, FN, funcname, argdigest, my_F, deps,
+                             comptime, loadtime, compression)
       if verbose is True:
         msg3(loadtime, CD, FN, deps, compression)
       compressed = compression
@@ -771,6 +811,13 @@ textwidth4 = 50             # Text width in logtestOK()
 statsfile  = '.cache_stat'  # Basefilename for cached statistics.
                             # It will reside in the chosen cache directory.
 
+# In-memory tier of most recently used results (see MemoryLookup)
+# and its total byte size
+#
+from collections import OrderedDict
+memory_cache = OrderedDict()
+memory_cache_size = [0]
+
 file_types = ['Result',     # File name extension for cached function results.
               'Args',       # File name extension for stored function args.
               'Admin']      # File name extension for administrative info.
@@ -933,7 +980,20 @@ def CacheLookup(CD, FN, my_F, args, kwargs, deps, verbose, compression,
       else:   
         reason = 3 # Arguments have changed 
         
-   # PADARN NOTE 17/12/12: Adding a special case to handle the existence of a 
+  T = restore_results(T, verbose)
+
+  return((T, FN, Retrieved, reason, comptime, loadtime, compressed))
+
+# -----------------------------------------------------------------------------
+
+def restore_results(T, verbose=None):
+  """Restore C structures of results loaded from the cache
+
+  USAGE:
+    T = restore_results(T, verbose)
+  """
+
+  # PADARN NOTE 17/12/12: Adding a special case to handle the existence of a 
   # FitInterpolate object. C Structures are serialised so they can be pickled.
   #---------------------------------------------------------------------------
   from anuga.fit_interpolate.general_fit_interpolate import FitInterpolate
@@ -967,7 +1027,7 @@ def CacheLookup(CD, FN, my_F, args, kwargs, deps, verbose, compression,
         T.build_quad_tree(verbose=verbose)
   #---------------------------------------------------------------------------
 
-  return((T, FN, Retrieved, reason, comptime, loadtime, compressed))
+  return T
 
 # -----------------------------------------------------------------------------
 
@@ -1000,6 +1060,7 @@ def clear_cache(CD, my_F=None, verbose=None):
 
   if my_F:
     funcname = get_funcname(my_F)
+    clear_memory(CD, funcname)
     if verbose:
       log.critical('Clearing %s' % CD+funcname+'*')
 
@@ -1014,6 +1075,7 @@ def clear_cache(CD, my_F=None, verbose=None):
           os.system('del '+CD+file_name)
           # FIXME: os.remove doesn't work under windows
   else:
+    clear_memory(CD)
     file_names = os.listdir(CD)
     if len(file_names) > 0:
       if verbose:
@@ -1145,7 +1207,12 @@ def save_results_to_cache(T, CD, FN, my_F, deps, comptime, funcname,
 
   t0 = time.time()
 
-  mysave(T,datafile,compression)  # Save data to cache
+  if options['npy'] and is_npy_array(T):
+    # Save array to its own file and a reference to it as data
+    save_npy(T, CD+FN+'_'+file_types[0]+'.npy')
+    mysave(Npy_reference(), datafile, compression)
+  else:  
+    mysave(T,datafile,compression)  # Save data to cache
   datafile.close()
   #savetime = round(time.time()-t0,2)
   savetime = time.time()-t0  
@@ -1183,14 +1250,195 @@ def load_from_cache(CD, FN, compression):
   (datafile, compressed) = myopen(CD+FN+'_'+file_types[0],"rb",compression)
   t0 = time.time()
   T, reason = myload(datafile,compressed)
+  datafile.close() 
+
+  if reason == 0 and isinstance(T, Npy_reference):
+    T, reason = load_npy(CD+FN+'_'+file_types[0]+'.npy')
 
   loadtime = time.time()-t0
-  datafile.close() 
 
   return T, loadtime, compressed, reason
 
 # -----------------------------------------------------------------------------
 
+class Npy_reference:
+  """Stored in place of numpy array results kept in separate .npy files
+  """
+  pass
+
+
+def is_npy_array(T):
+  """Determine if T can be stored as a .npy file and memory mapped
+
+  USAGE:
+    is_npy_array(T)
+  """
+
+  return (isinstance(T, num.ndarray) and not T.dtype.hasobject
+          and T.size > 0)
+
+
+def save_npy(T, FN):
+  """Save numpy array T as .npy file FN
+
+  USAGE:
+    save_npy(T, FN)
+
+  DESCRIPTION:
+    The array is written to a temporary file which is then renamed to FN.
+    Arrays already memory mapped from an earlier version of FN thereby
+    keep their own copy of the data.
+  """
+
+  tmpFN = FN + '.tmp%d' % os.getpid()
+  fid = open(tmpFN, 'wb')
+  try:
+    num.save(fid, num.asarray(T))
+  finally:
+    fid.close()
+
+  if not unix and os.access(FN, os.F_OK):
+    os.remove(FN)
+  os.rename(tmpFN, FN)
+  
+  if unix:
+    os.chmod(FN, 0666)
+
+
+def load_npy(FN):
+  """Memory map numpy array from .npy file FN
+
+  USAGE:
+    T, reason = load_npy(FN)
+
+  DESCRIPTION:
+    The array is mapped copy on write so it can be modified without
+    changing the cached data. Reason is 6 if the file could not be read.
+  """
+
+  try:
+    T = num.load(FN, mmap_mode='c')
+  except (IOError, ValueError):
+    return None, 6  # Unreadable file
+
+  return T, 0
+
+# -----------------------------------------------------------------------------
+
+def MemoryLookup(CD, funcname, argdigest, my_F, deps, dependencies):
+  """Look for result in the memory tier
+
+  USAGE:
+    (T, Retrieved, comptime, loadtime, compressed) = \
+    MemoryLookup(CD, funcname, argdigest, my_F, deps, dependencies)
+
+  DESCRIPTION:
+    Results in the memory tier are keyed by cache directory, function name
+    and the content digest of the arguments. A result is returned if
+    dependencies and bytecode are unchanged. The entry is then marked as
+    most recently used.
+  """
+
+  import time
+
+  if argdigest is None:
+    return(None, None, None, None, None)
+
+  key = (CD, funcname, argdigest)
+  if key not in memory_cache:
+    return(None, None, None, None, None)
+
+  entry = memory_cache.pop(key)
+  FN, depsref, coderef, comptime, compressed, data, size = entry
+
+  if dependencies and not compare(depsref, deps):
+    memory_cache_size[0] -= size
+    return(None, None, None, None, None)
+
+  if options['bytecode'] and not compare(get_bytecode(my_F), coderef):
+    memory_cache_size[0] -= size
+    return(None, None, None, None, None)
+
+  memory_cache[key] = entry  # Most recently used
+
+  t0 = time.time()
+  if isinstance(data, num.ndarray):
+    T = data.copy()
+  else:
+    T = pickler.loads(data)
+  loadtime = time.time()-t0
+
+  return(T, 1, comptime, loadtime, compressed)
+
+# -----------------------------------------------------------------------------
+
+def save_results_to_memory(T, CD, FN, funcname, argdigest, my_F, deps,
+                           comptime, loadtime, compressed):
+  """Keep results T in the memory tier
+
+  USAGE:
+    save_results_to_memory(T, CD, FN, funcname, argdigest, my_F, deps,
+                           comptime, loadtime, compressed)
+
+  DESCRIPTION:
+    Numpy arrays are copied, other results are kept pickled so each
+    retrieval creates new objects. Results that can not be pickled or are
+    larger than options['memsize'] are not kept. Least recently used
+    entries are dropped until the memory tier fits within options['memsize'].
+  """
+
+  maxsize = options['memsize']
+  if argdigest is None or maxsize <= 0:
+    return
+
+  if is_npy_array(T):
+    data = num.array(T)
+    size = data.nbytes
+  else:
+    try:
+      data = pickler.dumps(T, 2)
+    except Exception:
+      return  # E.g. results holding C structures
+    size = len(data)
+
+  if size > maxsize:
+    return
+
+  key = (CD, funcname, argdigest)
+  if key in memory_cache:
+    memory_cache_size[0] -= memory_cache.pop(key)[-1]
+
+  while memory_cache and memory_cache_size[0] + size > maxsize:
+    oldkey, oldentry = memory_cache.popitem(last=False)
+    memory_cache_size[0] -= oldentry[-1]
+
+  memory_cache[key] = (FN, deps, get_bytecode(my_F), comptime, compressed,
+                       data, size)
+  memory_cache_size[0] += size
+
+# -----------------------------------------------------------------------------
+
+def clear_memory(CD=None, funcname=None, FN=None):
+  """Remove results from the memory tier
+
+  USAGE:
+    clear_memory(CD, funcname, FN)
+
+  DESCRIPTION:
+    Remove results matching the given cache directory, function name and
+    cache file name. Arguments that are None match everything.
+  """
+
+  for key in memory_cache.keys():
+    entry = memory_cache[key]
+    if (CD is None or key[0] == CD) and \
+       (funcname is None or key[1] == funcname) and \
+       (FN is None or entry[0] == FN):
+      del memory_cache[key]
+      memory_cache_size[0] -= entry[-1]
+
+# -----------------------------------------------------------------------------
+
 def myopen(FN, mode, compression=True):
   """Open file FN using given mode
 
@@ -1439,10 +1687,8 @@ def myhash(T, ids=None):
       I.sort()    
       val = myhash(I, ids)
   elif isinstance(T, num.ndarray):
-      T = num.array(T) # Ensure array is contiguous
-
-      # Use mean value for efficiency
-      val = hash(num.average(T.flat))
+      # Use digest of the array contents
+      val = hash(mydigest(T))
   elif type(T) == InstanceType:
       # Use the attribute values 
       val = myhash(T.__dict__, ids)
@@ -1456,6 +1702,97 @@ def myhash(T, ids=None):
 
 
 
+
+def mydigest(T):
+  """Compute content digest of a range of inputs.
+
+  USAGE:
+    mydigest(T)
+
+  ARGUMENTS:
+    T -- Anything
+
+  DESCRIPTION:
+    Return hexadecimal digest of the contents of T, or None if T contains
+    objects such as functions or files whose contents can not be digested.
+    Numpy arrays are digested directly from their data buffers together
+    with their type and shape. Tuples, lists, dictionaries and instance
+    attributes are digested recursively. Circular references are digested
+    as references to the objects already encountered.
+  """
+
+  import hashlib
+
+  digest = hashlib.sha1()
+  try:
+    update_digest(digest, T, {})
+  except TypeError:
+    return None
+
+  return digest.hexdigest()
+
+
+def update_digest(digest, T, ids):
+  """Update hashlib object digest with the contents of T.
+
+  USAGE:
+    update_digest(digest, T, ids)
+
+  DESCRIPTION:
+    ids maps the id of each container already encountered to its order.
+    TypeError is raised if T can not be digested.
+  """
+
+  if T is None or isinstance(T, (bool, int, long, float, complex,
+                                 basestring)):
+    digest.update('%s:%r;' % (type(T).__name__, T))
+    return
+
+  if isinstance(T, num.generic):
+    digest.update('%s:%s;' % (T.dtype.str, T.tostring()))
+    return
+
+  if isinstance(T, (types.FunctionType, types.MethodType,
+                    types.BuiltinFunctionType, types.ModuleType,
+                    types.ClassType, type)):
+    raise TypeError
+
+  # Keep track of unique id's to protect against infinite recursion
+  i = id(T)
+  if i in ids:
+    digest.update('ref:%d;' % ids[i])
+    return
+  ids[i] = len(ids)
+
+  if isinstance(T, (tuple, list)):
+    digest.update('%s:%d;' % (type(T).__name__, len(T)))
+    for t in T:
+      update_digest(digest, t, ids)
+  elif isinstance(T, dict):
+    # Make dictionary ordering unique
+    I = T.items()
+    I.sort()
+    digest.update('dict:%d;' % len(I))
+    for key, value in I:
+      update_digest(digest, key, ids)
+      update_digest(digest, value, ids)
+  elif isinstance(T, num.ndarray):
+    if T.dtype.hasobject:
+      digest.update('object:%s;' % (T.shape,))
+      update_digest(digest, T.ravel().tolist(), ids)
+    else:
+      T = num.ascontiguousarray(T)
+      digest.update('ndarray:%s:%s;' % (T.dtype.str, T.shape))
+      digest.update(T.data)
+  elif hasattr(T, '__dict__'):
+    # Use the class and attribute values
+    digest.update('instance:%s.%s;' % (T.__class__.__module__,
+                                       T.__class__.__name__))
+    update_digest(digest, T.__dict__, ids)
+  else:
+    raise TypeError
+
+
 def compare(A, B, ids=None):
     """Safe comparison of general objects
 
@@ -1867,17 +2204,20 @@ def addstatsline(CD, funcname, FN, Retrieved, reason, comptime, loadtime,
     else:
       hit = '0'
 
-    # Get size of result file
+    # Get size of result file including numpy results stored separately.
+    # Results retrieved from memory may no longer have files.
     #    
     if compression:
-      stats = os.stat(CD+FN+'_'+file_types[0]+'.z')
-    else:
-      stats = os.stat(CD+FN+'_'+file_types[0])
-  
-    if stats: 
-      size = stats[6]
+      datafile = CD+FN+'_'+file_types[0]+'.z'
     else:
-      size = -1  # Error condition, but don't crash. This is just statistics  
+      datafile = CD+FN+'_'+file_types[0]
+
+    size = -1  # Error condition, but don't crash. This is just statistics  
+    if os.access(datafile, os.F_OK):
+      size = os.stat(datafile)[6]
+      npyfile = CD+FN+'_'+file_types[0]+'.npy'
+      if os.access(npyfile, os.F_OK):
+        size += os.stat(npyfile)[6]
 
     # Build entry
     #  
@@ -1,5 +1,6 @@
 
 import unittest
+import os
 
 from copy import deepcopy
         
@@ -168,11 +169,17 @@ class Test_Caching(unittest.TestCase):
         A0 = num.arange(5) * 1.0
         B = ('x', 15)
         
-        # Create different A that hashes to the same address (having the same average)
+        # Create different A with the same average. Arrays are hashed
+        # by their contents so make them hash to the same address.
         A1 = num.array([2.0, 2.0, 2.0, 2.0, 2.0])        
         
-        assert myhash(A0) == myhash(A1)
-            
+        assert myhash(A0) != myhash(A1)
+
+        import anuga.caching.caching as caching_module
+        myhash_ref = caching_module.myhash
+        caching_module.myhash = lambda T, ids=None: 0
+        memsize = options['memsize']
+        set_option('memsize', 0)
             
         # Test caching
         comprange = 2
@@ -203,6 +210,149 @@ class Test_Caching(unittest.TestCase):
             assert num.alltrue(T1 == T1_ref)
             assert num.alltrue(T2 == T2_ref)
 
+        caching_module.myhash = myhash_ref
+        set_option('memsize', memsize)
+
+
+    def test_digest(self):
+        """Test that content digests distinguish arrays and structures
+        """
+
+        A0 = num.arange(5) * 1.0
+        A1 = num.array([2.0, 2.0, 2.0, 2.0, 2.0])
+
+        assert mydigest(A0) != mydigest(A1)
+        assert mydigest(A0) == mydigest(A0.copy())
+        assert mydigest(A0) != mydigest(A0.astype(num.float32))
+        assert mydigest(A0) != mydigest(A0.reshape(5, 1))
+
+        # Non contiguous arrays
+        B = num.arange(12).reshape(3, 4)
+        assert mydigest(B.T) == mydigest(num.array(B.T))
+        assert mydigest(B.T) != mydigest(B)
+
+        # Structures, circular structures and instances
+        D = {'x': 10, 'A': A0, 'y': [1, 'a', None]}
+        DD = deepcopy(D)
+        assert mydigest(D) == mydigest(DD)
+        DD['y'][0] = 2
+        assert mydigest(D) != mydigest(DD)
+
+        A = Dummy(5, 7)
+        A.value = [A, 'x']
+        AA = Dummy(5, 7)
+        AA.value = [AA, 'x']
+        assert mydigest(A) == mydigest(AA)
+
+        # Functions can not be digested
+        assert mydigest((A0, f_numeric)) is None
+
+
+    def test_memory_tier(self):
+        """Test that results are retrieved from memory without the
+        cache files and that each retrieval is a separate copy
+        """
+
+        verbose = False
+
+        A = num.arange(10) * 1.0
+        B = num.ones(10)
+        D = {'a': A, 'b': [1, 2]}
+
+        for T in [A, D]:
+            cache(f_generic, T, clear=1, verbose=verbose)
+            T1 = cache(f_generic, T, verbose=verbose)
+
+            # Remove the cache files
+            cache(f_generic, T, clear=1, verbose=verbose)
+            T2 = cache(f_generic, T, test=1, verbose=verbose)
+            assert T2 is None
+
+            T1 = cache(f_generic, T, verbose=verbose)
+            FN = cache(f_generic, T, return_filename=1)
+            CD = checkdir(cachedir)
+            for file_type in file_types:
+                file_name = CD + FN + '_' + file_type
+                for fn in [file_name, file_name + '.z', file_name + '.npy']:
+                    if os.access(fn, os.F_OK):
+                        os.remove(fn)
+
+            T2 = cache(f_generic, T, test=1, verbose=verbose)
+            T3 = cache(f_generic, T, test=1, verbose=verbose)
+            assert T2 is not None
+            assert str(T2) == str(T1)
+            assert T2 is not T3
+
+        # Copies of arrays
+        T2[1] = 99.0
+        T3 = cache(f_generic, A, test=1, verbose=verbose)
+        assert T3[1] == 1.0
+
+        # Least recently used results are dropped to fit in memsize
+        memsize = options['memsize']
+        set_option('memsize', 2*A.nbytes)
+        try:
+            clear_memory()
+            cache(f_numeric, (A, B), verbose=verbose)
+            cache(f_numeric, (B, A), verbose=verbose)
+            cache(f_numeric, (A, A), verbose=verbose)
+            assert len(memory_cache) == 2
+            assert memory_cache_size[0] == 2*A.nbytes
+
+            keys = [key[2] for key in memory_cache.keys()]
+            assert mydigest(((A, B), {})) not in keys
+            assert mydigest(((B, A), {})) in keys
+            assert mydigest(((A, A), {})) in keys
+        finally:
+            set_option('memsize', memsize)
+
+
+    def test_npy_results(self):
+        """Test that array results are stored as .npy files and
+        memory mapped when loaded
+        """
+
+        verbose = False
+
+        A = num.arange(12).reshape(3, 4) * 1.5
+        B = num.ones(4)
+
+        memsize = options['memsize']
+        set_option('memsize', 0)
+        try:
+            for comp in [0, 1]:
+                cache(f_numeric, (A, B), clear=1, verbose=verbose)
+                T1 = cache(f_numeric, (A, B), compression=comp,
+                           verbose=verbose)
+
+                FN = cache(f_numeric, (A, B), return_filename=1)
+                CD = checkdir(cachedir)
+                assert os.access(CD + FN + '_' + file_types[0] + '.npy',
+                                 os.F_OK)
+
+                T2 = cache(f_numeric, (A, B), compression=comp,
+                           verbose=verbose)
+                assert isinstance(T2, num.memmap)
+                assert num.allclose(T2, f_numeric(A, B))
+                assert T2.shape == (3, 4)
+
+                # Copy on write leaves cached result unchanged
+                T2[0, 0] = -1.0
+                T3 = cache(f_numeric, (A, B), compression=comp,
+                           verbose=verbose)
+                assert num.allclose(T3, f_numeric(A, B))
+
+                # Evaluate again while T3 is mapped
+                T4 = cache(f_numeric, (A, B), compression=comp,
+                           evaluate=1, verbose=verbose)
+                assert num.allclose(T3, T4)
+
+                cache(f_numeric, (A, B), clear=1, verbose=verbose)
+                assert not os.access(CD + FN + '_' + file_types[0] + '.npy',
+                                     os.F_OK)
+        finally:
+            set_option('memsize', memsize)
+
 
     def test_caching_of_dictionaries(self):
         """test_caching_of_dictionaries
@@ -205,6 +205,23 @@ optimised_gradient_limiter = True # Use hardwired gradient limiter
 points_file_block_line_size = 1e6 # Number of lines read in from a points file
                                   # when blocking
 
+raster_tile_size = 1024 # Width in cells of the square tiles of a raster grid
+                        # sampled at a time by set_quantity. None samples
+                        # the window of all points at once
+raster_threads = 1      # Number of threads sampling raster tiles
+
+file_boundary_window_size = 100 # Number of timesteps File_boundary and
+                                # AWI_boundary read from file at a time.
+                                # None reads and interpolates all timesteps
+                                # up front
+
+evolve_native_steps = 0 # Maximal number of timesteps the DE algorithms take
+                        # in the C extension before returning to the Python
+                        # evolve loop. 0 uses the Python evolve loop
+
+omp_num_threads = 1 # Number of threads used by the multithreaded C kernels
+                    # (flux computation, extrapolation and limiting)
+
 ################################################################################
 # NetCDF-specific type constants.  Used when defining NetCDF file variables.
 ################################################################################
@@ -63,7 +63,12 @@ def create_domain_from_regions(bounding_polygon,
                                minimum_triangle_angle=28.0,
                                fail_if_polygons_outside=True,
                                use_cache=False,
-                               verbose=True):
+                               verbose=True,
+                               use_array_mesh=False,
+                               cut_polylines=None,
+                               number_of_pieces=None,
+                               processes=1,
+                               piece_cache_dir=None):
     
 
     """Create domain from bounding polygons and resolutions.
@@ -121,7 +126,12 @@ def create_domain_from_regions(bounding_polygon,
     fail_if_polygons_outside: If True (the default) Exception in thrown
     where interior polygons fall outside bounding polygon. If False, these
     will be ignored and execution continued.
-        
+
+    use_array_mesh: If True the mesh is generated with an Array_mesh,
+    see create_mesh_from_regions.
+
+    cut_polylines, number_of_pieces, processes, piece_cache_dir: generate
+    the mesh in pieces, see create_mesh_from_regions.
     
     """
 
@@ -141,7 +151,12 @@ def create_domain_from_regions(bounding_polygon,
               'regionPtArea' : regionPtArea,
               'minimum_triangle_angle': minimum_triangle_angle,
               'fail_if_polygons_outside': fail_if_polygons_outside,
-              'verbose': verbose} #FIXME (Ole): See ticket:14
+              'verbose': verbose,
+              'use_array_mesh': use_array_mesh,
+              'cut_polylines': cut_polylines,
+              'number_of_pieces': number_of_pieces,
+              'processes': processes,
+              'piece_cache_dir': piece_cache_dir} #FIXME (Ole): See ticket:14
 
     # Call underlying engine with or without caching
     if use_cache is True:
@@ -177,7 +192,12 @@ def _create_domain_from_regions(bounding_polygon,
                                 regionPtArea=None,
                                 minimum_triangle_angle=28.0,
                                 fail_if_polygons_outside=True,
-                                verbose=True):
+                                verbose=True,
+                                use_array_mesh=False,
+                                cut_polylines=None,
+                                number_of_pieces=None,
+                                processes=1,
+                                piece_cache_dir=None):
     """_create_domain_from_regions - internal function.
 
     See create_domain_from_regions for documentation.
@@ -200,7 +220,12 @@ def _create_domain_from_regions(bounding_polygon,
                              minimum_triangle_angle=minimum_triangle_angle,
                              fail_if_polygons_outside=fail_if_polygons_outside,
                              use_cache=False,
-                             verbose=verbose)
+                             verbose=verbose,
+                             use_array_mesh=use_array_mesh,
+                             cut_polylines=cut_polylines,
+                             number_of_pieces=number_of_pieces,
+                             processes=processes,
+                             piece_cache_dir=piece_cache_dir)
 
     domain = Domain(mesh_filename, use_cache=False, verbose=verbose)
 
@@ -8,6 +8,11 @@ class NewQuantity(exceptions.Exception): pass
 class DataDomainError(exceptions.Exception): pass
 class DataTimeError(exceptions.Exception): pass
 
+import sys
+import copy
+import threading
+import Queue
+
 import numpy
 from anuga.coordinate_transforms.geo_reference import Geo_reference
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
@@ -25,8 +30,14 @@ from anuga.coordinate_transforms.geo_reference import \
         ensure_geo_reference
 
 from anuga.utilities.file_utils import create_filename
+from anuga.abstract_2d_finite_volumes.quantity_ext import \
+        average_vertex_values, average_centroid_values
 import numpy as num
 
+# Default size in bytes of one block of frames of the dynamic quantities
+# read or written at a time (see get_frames_per_block)
+max_block_memory = 2**25
+
 class Data_format:
     """Generic interface to data formats
     """
@@ -194,6 +205,10 @@ class SWW_file(Data_format):
 
         # store the connectivity data
         points = num.concatenate((X[:,num.newaxis],Y[:,num.newaxis]), axis=1)
+        if self._use_original_order():
+            points = self._get_original_order(points, 'vertices')
+            if domain.smooth is True:
+                V = domain.get_original_triangles()
         self.writer.store_triangulation(fid,
                                         points,
                                         V.astype(num.float32),
@@ -218,14 +233,15 @@ class SWW_file(Data_format):
             Q = domain.quantities[name]
             A, _ = Q.get_vertex_values(xy=False, 
                                        precision=self.precision)
-            static_quantities[name] = A
+            static_quantities[name] = self._get_original_order(A, 'vertices')
 
         #print domain.quantities
         #print self.writer.static_c_quantities
 
         for name in self.writer.static_c_quantities:
             Q = domain.quantities[name[:-2]]  # rip off _c from name
-            static_quantities_centroid[name] = Q.centroid_values
+            static_quantities_centroid[name] = \
+                      self._get_original_order(Q.centroid_values, 'centroids')
         
         # Store static quantities        
         self.writer.store_static_quantities(fid, **static_quantities)
@@ -316,101 +332,393 @@ class SWW_file(Data_format):
             self.domain.set_name(old_domain_filename)
         else:
             self.recursion = False
-            domain = self.domain
 
-            # Get the variables
-            time = fid.variables['time'][:]
-            i = len(time)
-             
-            if 'stage' in self.writer.dynamic_quantities:            
-                # Select only those values for stage, 
-                # xmomentum and ymomentum (if stored) where 
-                # depth exceeds minimum_storable_height
-                #
-                # In this branch it is assumed that elevation
-                # is also available as a quantity
+            self._store_frame(fid, self._get_frame())
 
+            # Flush and close
+            #fid.sync()
+            fid.close()
 
-                # Smoothing for the get_vertex_values will be obtained
-                # from the smooth setting in domain
-            
-                Q = domain.quantities['stage']
-                w, _ = Q.get_vertex_values(xy=False)
-                
-                Q = domain.quantities['elevation']
-                z, _ = Q.get_vertex_values(xy=False)                
-                
-                storable_indices = num.array(w-z >= self.minimum_storable_height)
-                
-                #print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
+
+    def flush(self):
+        """Make sure all stored timesteps have reached the file.
+
+        The sww file is opened and closed on each call to store_timestep
+        so there is nothing to do here.
+        """
+
+        pass
+
+
+    def close(self):
+        """Release any resources held by the writer.
+
+        The sww file is opened and closed on each call to store_timestep
+        so there is nothing to do here.
+        """
+
+        pass
+
+
+    def _get_frame_quantity_names(self):
+        """Return names of the domain quantities needed to store a timestep
+        """
+
+        names = list(self.writer.dynamic_quantities)
+        if 'stage' in names:
+            names.append('elevation')
+
+        for name in self.writer.dynamic_c_quantities:
+            names.append(name[:-2])
+
+        # Remove duplicates but keep order
+        unique_names = []
+        for name in names:
+            if name not in unique_names:
+                unique_names.append(name)
+
+        return unique_names
+
+
+    def _use_original_order(self):
+        """Return True if the output is to be written in the ordering of
+        the mesh before it was reordered (see set_store_original_order)
+        """
+
+        domain = self.domain
+        return getattr(domain, 'store_original_order', False) and \
+               domain.mesh.triangle_permutation is not None
+
+
+    def _get_original_order(self, A, location):
+        """Return A in the original ordering of the mesh if requested.
+
+        location is 'vertices' for values as returned by get_vertex_values
+        (one per node if smoothing, else three per triangle) or
+        'centroids' for one value per triangle.
+        """
+
+        if not self._use_original_order():
+            return A
+
+        if location == 'vertices' and self.domain.smooth is True:
+            return self.domain.get_original_ordering(A, location='nodes')
+
+        return self.domain.get_original_ordering(A, location='triangles')
+
+
+    def _get_frame(self):
+        """Return a frame referencing the current state of the domain.
+
+        A frame is a dictionary holding the model time, the vertex and
+        centroid values of the quantities to be stored and the monitored
+        extrema. The arrays are not copied.
+        """
+
+        domain = self.domain
+
+        frame = {}
+        frame['time'] = domain.time
+        frame['vertex_values'] = {}
+        frame['centroid_values'] = {}
+        for name in self._get_frame_quantity_names():
+            Q = domain.quantities[name]
+            frame['vertex_values'][name] = Q.vertex_values
+            frame['centroid_values'][name] = Q.centroid_values
+
+        frame['extrema'] = domain.quantities_to_be_monitored
+
+        return frame
+
+
+    def _get_frame_vertex_values(self, frame, name, precision=None):
+        """Return vertex values of quantity name stored in frame.
+
+        This follows Quantity.get_vertex_values(xy=False), but uses
+        the arrays held by the frame rather than those of the domain.
+        """
+
+        domain = self.domain
+
+        if precision is None:
+            precision = num.float
+
+        if domain.smooth is True:
+            N = domain.number_of_full_nodes # Ignore ghost nodes if any
+            A = num.zeros(N, num.float)
+
+            if domain.get_using_discontinuous_elevation():
+                average_centroid_values(
+                    ensure_numeric(domain.vertex_value_indices),
+                    ensure_numeric(domain.number_of_triangles_per_node),
+                    ensure_numeric(frame['centroid_values'][name]),
+                    A)
             else:
-                # Very unlikely branch
-                storable_indices = None # This means take all
-            
-            # Now store dynamic quantities
-            dynamic_quantities = {}
-            dynamic_quantities_centroid = {}
-            
-            for name in self.writer.dynamic_quantities:
-                #netcdf_array = fid.variables[name]
-                
-                Q = domain.quantities[name]
-                A, _ = Q.get_vertex_values(xy=False,
-                                           precision=self.precision)
-                
-                if storable_indices is not None:
-                    if name == 'stage':
-                        A = num.choose(storable_indices, (z, A))
-
-                    if name in ['xmomentum', 'ymomentum']:
-                        # Get xmomentum where depth exceeds 
-                        # minimum_storable_height
-                        
-                        # Define a zero vector of same size and type as A
-                        # for use with momenta
-                        null = num.zeros(num.size(A), A.dtype.char)
-                        A = num.choose(storable_indices, (null, A))
-                
-                dynamic_quantities[name] = A
-                
-            for name in self.writer.dynamic_c_quantities:
-                Q = domain.quantities[name[:-2]]
-                dynamic_quantities_centroid[name] = Q.centroid_values
-                
-                                        
-            # Store dynamic quantities
-            slice_index = self.writer.store_quantities(fid,
-                                         time=self.domain.time,
-                                         sww_precision=self.precision,
-                                         **dynamic_quantities)
-            
-            # Store dynamic quantities
-            if self.store_centroids:
-                self.writer.store_quantities_centroid(fid,
-                                                      slice_index= slice_index,
-                                                      sww_precision=self.precision,
-                                                      **dynamic_quantities_centroid)            
+                average_vertex_values(
+                    ensure_numeric(domain.vertex_value_indices),
+                    ensure_numeric(domain.number_of_triangles_per_node),
+                    ensure_numeric(frame['vertex_values'][name]),
+                    A)
+            A = A.astype(precision)
+        else:
+            A = frame['vertex_values'][name].flatten().astype(precision)
 
+        return A
 
-            # Update extrema if requested
-            domain = self.domain
-            if domain.quantities_to_be_monitored is not None:
-                for q, info in domain.quantities_to_be_monitored.items():
-                    if info['min'] is not None:
-                        fid.variables[q + '.extrema'][0] = info['min']
-                        fid.variables[q + '.min_location'][:] = \
-                                        info['min_location']
-                        fid.variables[q + '.min_time'][0] = info['min_time']
-
-                    if info['max'] is not None:
-                        fid.variables[q + '.extrema'][1] = info['max']
-                        fid.variables[q + '.max_location'][:] = \
-                                        info['max_location']
-                        fid.variables[q + '.max_time'][0] = info['max_time']
 
-            # Flush and close
-            #fid.sync()
-            fid.close()
+    def _store_frame(self, fid, frame):
+        """Write time, time dependent quantities and extrema held in frame
+        to the open NetCDF file fid.
+        """
+
+        if 'stage' in self.writer.dynamic_quantities:
+            # Select only those values for stage,
+            # xmomentum and ymomentum (if stored) where
+            # depth exceeds minimum_storable_height
+            #
+            # In this branch it is assumed that elevation
+            # is also available as a quantity
+
+            # Smoothing for the vertex values will be obtained
+            # from the smooth setting in domain
+            w = self._get_frame_vertex_values(frame, 'stage')
+            z = self._get_frame_vertex_values(frame, 'elevation')
+
+            storable_indices = num.array(w-z >= self.minimum_storable_height)
+        else:
+            # Very unlikely branch
+            storable_indices = None # This means take all
+
+        # Now store dynamic quantities
+        dynamic_quantities = {}
+        dynamic_quantities_centroid = {}
+
+        for name in self.writer.dynamic_quantities:
+            A = self._get_frame_vertex_values(frame, name,
+                                              precision=self.precision)
+
+            if storable_indices is not None:
+                if name == 'stage':
+                    A = num.choose(storable_indices, (z, A))
+
+                if name in ['xmomentum', 'ymomentum']:
+                    # Get xmomentum where depth exceeds
+                    # minimum_storable_height
+
+                    # Define a zero vector of same size and type as A
+                    # for use with momenta
+                    null = num.zeros(num.size(A), A.dtype.char)
+                    A = num.choose(storable_indices, (null, A))
+
+            dynamic_quantities[name] = self._get_original_order(A, 'vertices')
+
+        for name in self.writer.dynamic_c_quantities:
+            dynamic_quantities_centroid[name] = self._get_original_order(
+                       frame['centroid_values'][name[:-2]], 'centroids')
+
+        # Store dynamic quantities
+        slice_index = self.writer.store_quantities(fid,
+                                     time=frame['time'],
+                                     sww_precision=self.precision,
+                                     **dynamic_quantities)
+
+        # Store dynamic quantities
+        if self.store_centroids:
+            self.writer.store_quantities_centroid(fid,
+                                                  slice_index= slice_index,
+                                                  sww_precision=self.precision,
+                                                  **dynamic_quantities_centroid)
+
+        # Update extrema if requested
+        extrema = frame['extrema']
+        if extrema is not None:
+            for q, info in extrema.items():
+                if info['min'] is not None:
+                    fid.variables[q + '.extrema'][0] = info['min']
+                    fid.variables[q + '.min_location'][:] = \
+                                    info['min_location']
+                    fid.variables[q + '.min_time'][0] = info['min_time']
+
+                if info['max'] is not None:
+                    fid.variables[q + '.extrema'][1] = info['max']
+                    fid.variables[q + '.max_location'][:] = \
+                                    info['max_location']
+                    fid.variables[q + '.max_time'][0] = info['max_time']
+
+
+
+class Buffered_SWW_file(SWW_file):
+    """Interface to native NetCDF format (.sww) for storing model output
+    which keeps the file open for the whole run.
+
+    Timesteps are copied into a bounded ring buffer of preallocated frames
+    and written to the file by a background thread, so store_timestep
+    only costs a copy of the vertex and centroid arrays. If all frames
+    of the buffer are waiting to be written store_timestep blocks until
+    the writer thread frees one.
+
+    Errors raised by the writer thread are re-raised by the next call to
+    store_timestep, flush or close.
+
+    The file is not split when it exceeds max_size.
+    """
+
+    def __init__(self, domain,
+                 mode=netcdf_mode_w, max_size=200000000000, recursion=False,
+                 buffer_size=4):
+
+        SWW_file.__init__(self, domain, mode=mode, max_size=max_size,
+                          recursion=recursion)
+
+        msg = 'buffer_size must be a positive integer, got %s' % buffer_size
+        assert int(buffer_size) == buffer_size and buffer_size > 0, msg
+
+        self.buffer_size = int(buffer_size)
+        self.fid = None
+        self.frames = None
+        self.free_frames = None
+        self.full_frames = None
+        self.thread = None
+        self.error = None
+
+
+    def __getstate__(self):
+        """Open file, thread and buffers can not be pickled (checkpointing)
+        """
+
+        state = self.__dict__.copy()
+        for key in ['fid', 'frames', 'free_frames', 'full_frames',
+                    'thread', 'error']:
+            state[key] = None
+
+        return state
+
+
+    def open(self):
+        """Open the sww file for appending and start the writer thread.
+
+        Does nothing if the file is already open.
+        """
+
+        if self.fid is not None:
+            return
+
+        self.fid = NetCDFFile(self.filename, netcdf_mode_a)
+
+        # Preallocate the ring buffer
+        self.frames = []
+        for i in range(self.buffer_size):
+            frame = {}
+            frame['time'] = None
+            frame['vertex_values'] = {}
+            frame['centroid_values'] = {}
+            frame['extrema'] = None
+            for name in self._get_frame_quantity_names():
+                Q = self.domain.quantities[name]
+                frame['vertex_values'][name] = num.empty_like(Q.vertex_values)
+                frame['centroid_values'][name] = \
+                                       num.empty_like(Q.centroid_values)
+            self.frames.append(frame)
+
+        self.free_frames = Queue.Queue()
+        self.full_frames = Queue.Queue()
+        for i in range(self.buffer_size):
+            self.free_frames.put(i)
+
+        self.thread = threading.Thread(target=self._drain,
+                                       name='SWW writer %s' % self.filename)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def store_timestep(self):
+        """Copy time and time dependent quantities into the ring buffer
+        to be written by the writer thread.
+        """
+
+        self._check_error()
+        self.open()
+
+        i = self.free_frames.get()
+        frame = self.frames[i]
+
+        domain = self.domain
+        frame['time'] = domain.time
+        for name in frame['vertex_values']:
+            Q = domain.quantities[name]
+            frame['vertex_values'][name][:] = Q.vertex_values
+            frame['centroid_values'][name][:] = Q.centroid_values
+
+        frame['extrema'] = copy.deepcopy(domain.quantities_to_be_monitored)
+
+        self.full_frames.put(i)
+
+
+    def flush(self):
+        """Wait until all buffered timesteps have been written to the file.
+        """
+
+        if self.fid is not None:
+            self.full_frames.join()
+            self.fid.sync()
+
+        self._check_error()
+
+
+    def close(self):
+        """Write all buffered timesteps, stop the writer thread and
+        close the file.
+
+        The file is reopened if store_timestep is called again.
+        """
+
+        if self.fid is not None:
+            self.full_frames.put(None)
+            self.thread.join()
+            self.fid.close()
+
+            self.fid = None
+            self.frames = None
+            self.free_frames = None
+            self.full_frames = None
+            self.thread = None
+
+        self._check_error()
+
+
+    def _drain(self):
+        """Writer thread: store frames from the ring buffer until a None
+        is received.
+        """
+
+        while True:
+            i = self.full_frames.get()
+            try:
+                if i is None:
+                    break
+
+                # Once an error has occurred frames are discarded so that
+                # store_timestep never blocks on a dead writer
+                if self.error is None:
+                    try:
+                        self._store_frame(self.fid, self.frames[i])
+                    except:
+                        self.error = sys.exc_info()
+
+                self.free_frames.put(i)
+            finally:
+                self.full_frames.task_done()
+
+
+    def _check_error(self):
+        """Re-raise an error raised by the writer thread
+        """
+
+        if self.error is not None:
+            error_type, error_value, error_traceback = self.error
+            self.error = None
+            raise error_type, error_value, error_traceback
+
 
 
 class Read_sww:
@@ -1563,3 +1871,13 @@ def weed(coordinates, volumes, boundary=None):
 
 
 
+
+def get_frames_per_block(number_of_values, block_memory=None):
+    """Return number of frames of number_of_values float32 values each
+    which fit in block_memory bytes (default max_block_memory)
+    """
+
+    if block_memory is None:
+        block_memory = max_block_memory
+
+    return max(1, int(block_memory//(4*max(1, number_of_values))))
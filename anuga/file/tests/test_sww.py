@@ -877,6 +877,91 @@ class Test_sww(unittest.TestCase):
 
 #################################################################################
 
+    def test_buffered_sww_file(self):
+        """Buffered writer should produce the same sww file as the
+        standard writer.
+        """
+
+        def run(name, buffered):
+            points, vertices, boundary = rectangular(6, 6)
+            domain = Domain(points, vertices, boundary)
+            domain.set_name(name)
+            domain.set_quantity('elevation', lambda x,y: -x/3)
+            domain.set_quantity('stage', 0.1)
+            domain.set_store_buffered(buffered, buffer_size=2)
+            domain.set_quantities_to_be_monitored('stage')
+
+            Br = Reflective_boundary(domain)
+            Bd = Dirichlet_boundary([0.2,0.,0.])
+            domain.set_boundary({'left': Bd, 'right': Br,
+                                 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.05, finaltime=0.5):
+                pass
+
+            return domain.get_name() + '.sww'
+
+        filename1 = run('test_sww_unbuffered', False)
+        filename2 = run('test_sww_buffered', True)
+
+        fid1 = NetCDFFile(filename1)
+        fid2 = NetCDFFile(filename2)
+
+        assert len(fid1.variables['time']) == 11
+        for name in ['time', 'stage', 'xmomentum', 'ymomentum',
+                     'stage_c', 'xmomentum_c', 'ymomentum_c',
+                     'stage_range', 'stage.extrema', 'stage.max_location']:
+            assert num.allclose(fid1.variables[name][:],
+                                fid2.variables[name][:]), name
+
+        fid1.close()
+        fid2.close()
+
+        os.remove(filename1)
+        os.remove(filename2)
+
+
+    def test_buffered_sww_file_flush_and_reopen(self):
+        """Timesteps should be on file after flush and storage should
+        reopen after the writer has been closed.
+        """
+
+        points, vertices, boundary = rectangular(4, 4)
+        domain = Domain(points, vertices, boundary)
+        domain.set_name('test_sww_buffered_reopen')
+        domain.set_store_buffered(True, buffer_size=1)
+        domain.set_boundary({'left': Reflective_boundary(domain),
+                             'right': Reflective_boundary(domain),
+                             'top': Reflective_boundary(domain),
+                             'bottom': Reflective_boundary(domain)})
+
+        domain.initialise_storage()
+        for i in range(3):
+            domain.set_time(float(i))
+            domain.store_timestep()
+
+        domain.writer.flush()
+
+        filename = domain.get_name() + '.sww'
+        fid = NetCDFFile(filename)
+        assert num.allclose(fid.variables['time'][:], [0.0, 1.0, 2.0])
+        fid.close()
+
+        # Closing and storing again reopens the file
+        domain.finalise_storage()
+        domain.set_time(3.0)
+        domain.store_timestep()
+        domain.finalise_storage()
+
+        assert domain.writer.fid is None
+
+        fid = NetCDFFile(filename)
+        assert num.allclose(fid.variables['time'][:], [0.0, 1.0, 2.0, 3.0])
+        fid.close()
+
+        os.remove(filename)
+
+
 if __name__ == "__main__":
     suite = unittest.makeSuite(Test_sww, 'test')
     runner = unittest.TextTestRunner(verbosity=1)
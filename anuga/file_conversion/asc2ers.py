@@ -0,0 +1,130 @@
+""" Convert an ESRI ASCII grid to an ERMapper grid, one block of lines at
+    a time, so that grids larger than memory can be memory mapped.
+"""
+
+import os
+import numpy as num
+
+import anuga.utilities.log as log
+from anuga.abstract_2d_finite_volumes.ermapper_grids import \
+     write_ermapper_header, create_default_header, celltype_map
+
+
+def asc2ers(name_in, name_out=None, celltype='IEEE4ByteReal',
+            block_lines=1000, verbose=False):
+    """Read Digital Elevation model from the following ASCII format (.asc)
+
+    Example:
+    ncols         3121
+    nrows         1800
+    xllcorner     722000
+    yllcorner     5893000
+    cellsize      25
+    NODATA_value  -9999
+    138.3698 137.4194 136.5062 135.5558 ..........
+
+    Convert name_in (.asc) to an ERMapper grid: a header file (.ers) and a
+    binary data file with the same basename and no extension. The rows are
+    stored north to south as in the ASCII file and the registration
+    coordinates are those of the south west grid point, see
+    ermapper_grids.write_ermapper_grid.
+
+    The values are read and written block_lines rows at a time. The rows
+    need not be one line each in the ASCII file.
+
+    If the accompanying .prj file exists its zone and datum are used for the
+    projection of the grid.
+
+    Return the name of the header file.
+    """
+
+    if name_in[-4:] != '.asc':
+        raise IOError('Input file %s should be of type .asc.' % name_in)
+
+    root = name_in[:-4]
+    if name_out is None:
+        name_out = root
+    elif name_out[-4:] == '.ers':
+        name_out = name_out[:-4]
+
+    datafile = open(name_in)
+
+    # Read the header
+    keys = {}
+    for i in range(6):
+        L = datafile.readline().split()
+        keys[L[0].strip().lower()] = L[1].strip()
+
+    ncols = int(keys['ncols'])
+    nrows = int(keys['nrows'])
+    cellsize = float(keys['cellsize'])
+
+    # Our internal representation of xllcorner and yllcorner is
+    # non-standard, as in asc2dem
+    for name in ['xllcorner', 'xllcenter']:
+        if keys.has_key(name):
+            xllcorner = float(keys[name])
+    for name in ['yllcorner', 'yllcenter']:
+        if keys.has_key(name):
+            yllcorner = float(keys[name])
+    NODATA_value = float(keys['nodata_value'])
+
+    header = {}
+    header['coordinatetype'] = 'EN'
+    header['eastings'] = repr(xllcorner)
+    header['northings'] = repr(yllcorner)
+    header['xdimension'] = repr(cellsize)
+    header['ydimension'] = repr(cellsize)
+    header['nullcellvalue'] = repr(NODATA_value)
+    header['celltype'] = celltype
+    header['nroflines'] = str(nrows)
+    header['nrofcellsperline'] = str(ncols)
+
+    if os.path.exists(root + '.prj'):
+        for line in open(root + '.prj'):
+            L = line.strip().split()
+            if len(L) < 2:
+                continue
+            if L[0].lower() == 'zone':
+                header['projection'] = '"UTM-%s"' % L[1]
+            elif L[0].lower() == 'datum':
+                header['datum'] = '"%s"' % L[1]
+
+    header = create_default_header(header)
+    write_ermapper_header(name_out + '.ers', header)
+
+    # Little endian, as written in the header
+    data_format = num.dtype(celltype_map[celltype]).newbyteorder('<')
+
+    if verbose: log.critical('Writing %d x %d grid from %s to %s'
+                             % (nrows, ncols, name_in, name_out))
+
+    # Copy the values, block_lines rows at a time
+    outfile = open(name_out, 'wb')
+    block = [num.zeros(0)]
+    count = 0
+    total = 0
+    for line in datafile:
+        values = num.fromstring(line, sep=' ')
+        block.append(values)
+        count += len(values)
+        if count >= block_lines*ncols:
+            values = num.concatenate(block)
+            n = (len(values)//ncols)*ncols
+            values[:n].astype(data_format).tofile(outfile)
+            total += n
+            block = [values[n:]]
+            count = len(block[0])
+
+    values = num.concatenate(block)
+    values.astype(data_format).tofile(outfile)
+    total += len(values)
+    outfile.close()
+    datafile.close()
+
+    if total != nrows*ncols:
+        msg = ('Expected %d values in %s but got %d'
+               % (nrows*ncols, name_in, total))
+        raise IOError(msg)
+
+    return name_out + '.ers'
@@ -291,9 +291,11 @@ void _calc_grid_values( double *x, double *y, double *norms,
 				 double cell_size,
 				 int nrow,
 				 int ncol,
+				 int first_row,
 				 double *vertex_val,
 				 double *grid_val )
 {
+	// grid_val holds the nrow rows of the grid starting at first_row
 	int i, j, k;
 	int x_min, x_max, y_min, y_max, point_index;
 	double x_dist, y_dist, x_base, y_base;
@@ -357,17 +359,17 @@ void _calc_grid_values( double *x, double *y, double *norms,
 
 		fraction = modf( (extent->y_min - y_base)/y_dist, &intpart );
 		y_min = intpart;
-		y_min = (y_min < 0 ) ? 0 : y_min;
+		y_min = (y_min < first_row ) ? first_row : y_min;
 
 		fraction = modf( ABS(extent->y_max - y_base)/y_dist, &intpart );
 		y_max = intpart;
-		y_max = (y_max > (nrow-1)) ? (nrow-1) : y_max;
+		y_max = (y_max > (first_row+nrow-1)) ? (first_row+nrow-1) : y_max;
 		
 		if ( x_max >= 0 && y_max >= 0 ) {
 		for ( j = y_min; j <= y_max; j++ ) {
 			for ( k = x_min; k <= x_max; k++ ) {
 				// iterate through points within a small region
-				point_index = j*ncol+k;
+				point_index = (j-first_row)*ncol+k;
 
                                 //printf("point_index %d %d %d\n",point_index, j, k);
 
@@ -409,6 +411,7 @@ void _calc_grid_values( double *x, double *y, double *norms,
 static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 {
 	int i, ok, num_tri, num_vert, ncol, nrow, num_norms, num_grid_val;
+	int first_row = 0;
 	long *volumes; 
 	double nodata_val;
     double cell_size;
@@ -423,7 +426,7 @@ static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 	PyObject *pyobj_result;
 	PyObject *pyobj_grid_val;
 
-	ok = PyArg_ParseTuple( args, "iiddOOOOOO",
+	ok = PyArg_ParseTuple( args, "iiddOOOOOO|i",
 				&nrow,
 				&ncol,
                 &cell_size,
@@ -433,7 +436,8 @@ static PyObject *calc_grid_values( PyObject *self, PyObject *args )
                 &pyobj_norms,
 				&pyobj_volumes, 
 				&pyobj_result,
-				&pyobj_grid_val );
+				&pyobj_grid_val,
+				&first_row );
 
 
 
@@ -472,7 +476,7 @@ static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 
 
 	_calc_grid_values( x,y, norms, num_vert, volumes, num_tri, \
-				    cell_size, nrow, ncol,   	\
+				    cell_size, nrow, ncol, first_row,	\
 				    result, grid_val );
 
 
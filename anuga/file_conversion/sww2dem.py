@@ -28,6 +28,12 @@ quantity_formula = {'momentum':'(xmomentum**2 + ymomentum**2)**0.5',
 # Default block size for sww2dem()
 DEFAULT_BLOCK_SIZE = 10000
 
+# Default maximal number of grid cells rasterised in one tile
+DEFAULT_TILE_CELLS = 2**22
+
+# Supported output formats
+dem_formats = ['asc', 'ers', 'flt']
+
 def sww2dem(name_in, name_out,
             quantity=None, # defaults to elevation
             reduction=None,
@@ -41,9 +47,11 @@ def sww2dem(name_in, name_out,
             verbose=False,
             origin=None,
             datum='WGS84',
-            block_size=None):
+            block_size=None,
+            processes=1,
+            tile_rows=None):
     """Read SWW file and convert to Digitial Elevation model format
-    (.asc or .ers)
+    (.asc, .ers or .flt)
 
     Example (ASC):
     ncols         3121
@@ -72,6 +80,10 @@ def sww2dem(name_in, name_out,
     Yshift        10000000.0000000000
     Parameters
 
+    The flt format is a binary grid of float32 values (rows from north to
+    south) with an accompanying .hdr file holding the fields of the asc
+    header and the byte order, and the .prj file.
+
     The parameter quantity must be the name of an existing quantity or
     an expression involving existing quantities. The default is
     'elevation'. Quantity is not a list of quantities.
@@ -83,39 +95,90 @@ def sww2dem(name_in, name_out,
 
     datum
 
-    format can be either 'asc' or 'ers'
+    format can be either 'asc', 'ers' or 'flt'
     block_size - sets the number of slices along the non-time axis to
                  process in one block.
+    processes - number of processes rasterising tiles of the grid
+    tile_rows - number of grid rows in a tile
+
+    See sww2dem_multiple to produce several grids in one pass.
     """
 
-    import sys
-    import types
+    return sww2dem_multiple(name_in,
+                            [(name_out, quantity, reduction)],
+                            cellsize=cellsize,
+                            number_of_decimal_places=number_of_decimal_places,
+                            NODATA_value=NODATA_value,
+                            easting_min=easting_min,
+                            easting_max=easting_max,
+                            northing_min=northing_min,
+                            northing_max=northing_max,
+                            verbose=verbose,
+                            origin=origin,
+                            datum=datum,
+                            block_size=block_size,
+                            processes=processes,
+                            tile_rows=tile_rows)[0]
+
+
+def sww2dem_multiple(name_in, outputs,
+                     cellsize=10,
+                     number_of_decimal_places=None,
+                     NODATA_value=-9999.0,
+                     easting_min=None,
+                     easting_max=None,
+                     northing_min=None,
+                     northing_max=None,
+                     verbose=False,
+                     origin=None,
+                     datum='WGS84',
+                     block_size=None,
+                     processes=1,
+                     tile_rows=None):
+    """Read SWW file once and convert it to several grids.
+
+    outputs is a list of tuples (name_out, quantity, reduction), one per
+    grid, with the meaning of these parameters in sww2dem. All grids
+    share the other parameters.
+
+    The sww file is read once, block_size points at a time, for all
+    quantities and reductions. The grids are then rasterised in tiles of
+    tile_rows rows, distributed over a pool of processes if processes
+    is larger than 1, and written to file as tiles arrive.
+
+    Return list with the basename of each output file (None for ers
+    files).
+    """
 
-    from anuga.geometry.polygon import inside_polygon, outside_polygon
-    from anuga.abstract_2d_finite_volumes.util import \
-         apply_expression_to_dictionary
+    import types
 
     basename_in, in_ext = os.path.splitext(name_in)
-    basename_out, out_ext = os.path.splitext(name_out)
-    out_ext = out_ext.lower()
 
     if in_ext != '.sww':
         raise IOError('Input format for %s must be .sww' % name_in)
 
-    if out_ext not in ['.asc', '.ers']:
-        raise IOError('Format for %s must be either asc or ers.' % name_out)
+    names_out = []
+    quantities = []
+    reductions = []
+    for name_out, quantity, reduction in outputs:
+        basename_out, out_ext = os.path.splitext(name_out)
 
-    false_easting = 500000
-    false_northing = 10000000
+        if out_ext.lower()[1:] not in dem_formats:
+            raise IOError('Format for %s must be either asc, ers or flt.'
+                          % name_out)
 
-    if quantity is None:
-        quantity = 'elevation'
-    
-    if reduction is None:
-        reduction = max
+        if quantity is None:
+            quantity = 'elevation'
 
-    if quantity_formula.has_key(quantity):
-        quantity = quantity_formula[quantity]
+        if reduction is None:
+            reduction = max
+
+        if quantity_formula.has_key(quantity):
+            quantity = quantity_formula[quantity]
+
+        names_out.append(name_out)
+        quantities.append(quantity)
+        reductions.append(reduction)
 
     if number_of_decimal_places is None:
         number_of_decimal_places = 3
@@ -124,11 +187,12 @@ def sww2dem(name_in, name_out,
         block_size = DEFAULT_BLOCK_SIZE
 
     assert(isinstance(block_size, (int, long, float)))
+    block_size = int(block_size)
 
     # Read sww file
     if verbose:
         log.critical('Reading from %s' % name_in)
-        log.critical('Output directory is %s' % name_out)
+        log.critical('Output directory is %s' % ', '.join(names_out))
 
     from anuga.file.netcdf import NetCDFFile
     fid = NetCDFFile(name_in)
@@ -137,10 +201,6 @@ def sww2dem(name_in, name_out,
     x = num.array(fid.variables['x'][:], num.float)
     y = num.array(fid.variables['y'][:], num.float)
     volumes = num.array(fid.variables['volumes'][:], num.int)
-    if type(reduction) is not types.BuiltinFunctionType:
-        times = fid.variables['time'][reduction]
-    else:
-        times = fid.variables['time'][:]
 
     try: # works with netcdf4
         number_of_timesteps = len(fid.dimensions['number_of_timesteps'])
@@ -149,7 +209,11 @@ def sww2dem(name_in, name_out,
         number_of_timesteps = fid.dimensions['number_of_timesteps']
         number_of_points = fid.dimensions['number_of_points']
 
-
+    # Time-step reductions as non negative indices
+    for i, reduction in enumerate(reductions):
+        if type(reduction) is not types.BuiltinFunctionType:
+            if reduction < 0:
+                reductions[i] = reduction + number_of_timesteps
 
     if origin is None:
         # Get geo_reference
@@ -167,103 +231,37 @@ def sww2dem(name_in, name_out,
         xllcorner = origin[1]
         yllcorner = origin[2]
 
-    # FIXME: Refactor using code from Interpolation_function.statistics
-    # (in interpolate.py)
-    # Something like print swwstats(swwname)
     if verbose:
-        log.critical('------------------------------------------------')
-        log.critical('Statistics of SWW file:')
-        log.critical('  Name: %s' % name_in)
-        log.critical('  Reference:')
-        log.critical('    Lower left corner: [%f, %f]' % (xllcorner, yllcorner))
-        if type(reduction) is not types.BuiltinFunctionType:
-            log.critical('    Time: %f' % times)
-        else:
-            log.critical('    Start time: %f' % fid.starttime)
-        log.critical('  Extent:')
-        log.critical('    x [m] in [%f, %f], len(x) == %d'
-                     %(num.min(x), num.max(x), len(x.flat)))
-        log.critical('    y [m] in [%f, %f], len(y) == %d'
-                     % (num.min(y), num.max(y), len(y.flat)))
-        if type(reduction) is not types.BuiltinFunctionType:
-            log.critical('    t [s] = %f, len(t) == %d' % (times, 1))
-        else:
-            log.critical('    t [s] in [%f, %f], len(t) == %d'
-                         % (min(times), max(times), len(times)))
-        log.critical('  Quantities [SI units]:')
-        
-        # Comment out for reduced memory consumption
-        for name in ['stage', 'xmomentum', 'ymomentum']:
-            q = fid.variables[name][:].flatten()
-            if type(reduction) is not types.BuiltinFunctionType:
-                q = q[reduction*len(x):(reduction+1)*len(x)]
-            if verbose: log.critical('    %s in [%f, %f]'
-                                     % (name, min(q), max(q)))
-        for name in ['elevation']:
-            q = fid.variables[name][:].flatten()
-            if verbose: log.critical('    %s in [%f, %f]'
-                                     % (name, min(q), max(q)))
-
-    # Get the variables in the supplied expression.
+        _log_statistics(fid, name_in, x, y, xllcorner, yllcorner, reductions)
+
+    # Get the variables in the supplied expressions.
     # This may throw a SyntaxError exception.
-    var_list = get_vars_in_expression(quantity)
+    var_lists = [get_vars_in_expression(quantity) for quantity in quantities]
 
     # Check that we have the required variables in the SWW file.
-    missing_vars = []
-    for name in var_list:
-        try:
-            _ = fid.variables[name]
-        except KeyError:
-            missing_vars.append(name)
-    if missing_vars:
-        msg = ("In expression '%s', variables %s are not in the SWW file '%s'"
-               % (quantity, str(missing_vars), name_in))
-        raise Exception, msg
-
-    # Create result array and start filling, block by block.
-
-
-    result = num.zeros(number_of_points, num.float)
-
-    if verbose:
-        msg = 'Slicing sww file, num points: ' + str(number_of_points)
-        msg += ', block size: ' + str(block_size)
-        log.critical(msg)
-
-    for start_slice in xrange(0, number_of_points, block_size):
-        # Limit slice size to array end if at last block
-        end_slice = min(start_slice + block_size, number_of_points)
-        
-        # Get slices of all required variables
-        q_dict = {}
+    for quantity, var_list in zip(quantities, var_lists):
+        missing_vars = []
         for name in var_list:
-            # check if variable has time axis
-            if len(fid.variables[name].shape) == 2:
-                q_dict[name] = fid.variables[name][:,start_slice:end_slice]
-            else:       # no time axis
-                q_dict[name] = fid.variables[name][start_slice:end_slice]
-
-        # Evaluate expression with quantities found in SWW file
-        res = apply_expression_to_dictionary(quantity, q_dict)
-
-        if len(res.shape) == 2:
-            new_res = num.zeros(res.shape[1], num.float)
-            for k in xrange(res.shape[1]):
-                if type(reduction) is not types.BuiltinFunctionType:
-                    new_res[k] = res[reduction,k]
-                else:
-                    new_res[k] = reduction(res[:,k])
-            res = new_res
-
-        result[start_slice:end_slice] = res
-                                    
-    # Post condition: Now q has dimension: number_of_points
-    assert len(result.shape) == 1
-    assert result.shape[0] == number_of_points
+            try:
+                _ = fid.variables[name]
+            except KeyError:
+                missing_vars.append(name)
+        if missing_vars:
+            msg = ("In expression '%s', variables %s are not in the SWW file '%s'"
+                   % (quantity, str(missing_vars), name_in))
+            raise Exception, msg
+
+    # Create result arrays and start filling, block by block.
+    results = _get_point_values(fid, quantities, reductions, var_lists,
+                                number_of_points, block_size,
+                                verbose=verbose)
+
+    fid.close()
 
     if verbose:
-        log.critical('Processed values for %s are in [%f, %f]'
-                     % (quantity, min(result), max(result)))
+        for quantity, result in zip(quantities, results):
+            log.critical('Processed values for %s are in [%f, %f]'
+                         % (quantity, min(result), max(result)))
 
     # Create grid and update xll/yll corner and x,y
     # Relative extent
@@ -306,82 +304,294 @@ def sww2dem(name_in, name_out,
     x = x + xllcorner - newxllcorner
     y = y + yllcorner - newyllcorner
 
+    if tile_rows is None:
+        tile_rows = max(1, min(DEFAULT_TILE_CELLS//ncols,
+                               -(-nrows//(4*processes))))
+        if processes == 1:
+            tile_rows = max(1, DEFAULT_TILE_CELLS//ncols)
+    tile_rows = min(int(tile_rows), nrows)
 
-    grid_values = num.zeros( (nrows*ncols, ), num.float)
-    #print '---',grid_values.shape
+    # Rasterise tiles from the top (north) so that rows are written in
+    # the order of the files
+    tiles = [(max(0, stop - tile_rows), stop)
+             for stop in range(nrows, 0, -tile_rows)]
 
-    #-------------------------------------------------------
-    # Calculate grid values using the "standard" interpolation
-    # method (ie quad trees and such)
-    #-------------------------------------------------------
-    def calc_grid_values(nrows, ncols, cellsize, NODATA_value,
-                         x,y, norms, volumes, result, grid_values):
+    if verbose:
+        log.critical('Rasterising %d tiles of %d rows with %d processes'
+                     % (len(tiles), tile_rows, processes))
 
-        grid_points = num.zeros ((ncols*nrows, 2), num.float)
-        vertex_points = num.concatenate ((x[:,num.newaxis], y[:,num.newaxis]), axis=1)
-        assert len(vertex_points.shape) == 2
+    # Open output files and write headers
+    grids = []
+    for name_out, quantity in zip(names_out, quantities):
+        grids.append(_open_grid(name_out, quantity, ncols, nrows,
+                                newxllcorner, newyllcorner, cellsize,
+                                NODATA_value, zone, datum, verbose))
 
-        for i in xrange(nrows):
-            yg = i * cellsize
-#            if out_ext == '.asc':
-#                yg = i * cellsize
-#            else:
-#                # this will flip the order of the y values for ers
-#                yg = (nrows-i) * cellsize
+    # Extent of the triangles in y to select those of each tile
+    ys = y[volumes]
+    tile_data = (x, y, volumes, num.min(ys, axis=1), num.max(ys, axis=1),
+                 results, ncols, cellsize, NODATA_value)
 
-            for j in xrange(ncols):
-                xg = j * cellsize
-                k = i*ncols + j
+    format = '%.'+'%g' % number_of_decimal_places +'e'
 
-                grid_points[k, 0] = xg
-                grid_points[k, 1] = yg
+    if processes > 1:
+        from multiprocessing import Pool
 
-        # Interpolate
-        from anuga.fit_interpolate.interpolate import Interpolate
+        pool = Pool(processes, initializer=_init_tile_worker,
+                    initargs=tile_data)
+        tile_values = pool.imap(_rasterise_tile, tiles)
+    else:
+        pool = None
+        _init_tile_worker(*tile_data)
+        tile_values = (_rasterise_tile(tile) for tile in tiles)
+
+    try:
+        for i, values in enumerate(tile_values):
+            start, stop = tiles[i]
+            for grid, grid_values in zip(grids, values):
+                _write_tile(grid, start, grid_values, format, verbose)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _init_tile_worker(*([None]*len(tile_data)))
 
-        # Remove loners from vertex_points, volumes here
-        vertex_points, volumes = remove_lone_verts(vertex_points, volumes)
-        # export_mesh_file('monkey.tsh',{'vertices':vertex_points, 'triangles':volumes})
+    if verbose:
+        for grid in grids:
+            log.critical('Interpolated values are in [%f, %f]'
+                         % (grid['min'], grid['max']))
 
+    return [_close_grid(grid, verbose) for grid in grids]
 
-        interp = Interpolate(vertex_points, volumes, verbose = verbose)
 
-        # Interpolate using quantity values
-        if verbose: log.critical('Interpolating')
-        grid_values[:] = interp.interpolate(result, grid_points,
-                                         NODATA_value= NODATA_value,
-                                         verbose=verbose).flatten()
-        #print grid_values.shape
+def _log_statistics(fid, name_in, x, y, xllcorner, yllcorner, reductions):
+    """Log statistics of sww file, at the time-step of the reductions if
+    they all are the same index
+    """
 
-        return
+    import types
 
-    num_tri =  len(volumes)
-    norms = num.zeros(6*num_tri, num.float)
+    # FIXME: Refactor using code from Interpolation_function.statistics
+    # (in interpolate.py)
+    # Something like print swwstats(swwname)
+    times = fid.variables['time'][:]
+
+    index = reductions[0]
+    for reduction in reductions:
+        if type(reduction) is types.BuiltinFunctionType or \
+               reduction != index:
+            index = None
+
+    log.critical('------------------------------------------------')
+    log.critical('Statistics of SWW file:')
+    log.critical('  Name: %s' % name_in)
+    log.critical('  Reference:')
+    log.critical('    Lower left corner: [%f, %f]' % (xllcorner, yllcorner))
+    if index is not None:
+        log.critical('    Time: %f' % times[index])
+    else:
+        log.critical('    Start time: %f' % fid.starttime)
+    log.critical('  Extent:')
+    log.critical('    x [m] in [%f, %f], len(x) == %d'
+                 %(num.min(x), num.max(x), len(x.flat)))
+    log.critical('    y [m] in [%f, %f], len(y) == %d'
+                 % (num.min(y), num.max(y), len(y.flat)))
+    if index is not None:
+        log.critical('    t [s] = %f, len(t) == %d' % (times[index], 1))
+    else:
+        log.critical('    t [s] in [%f, %f], len(t) == %d'
+                     % (min(times), max(times), len(times)))
+    log.critical('  Quantities [SI units]:')
+
+    # Comment out for reduced memory consumption
+    for name in ['stage', 'xmomentum', 'ymomentum']:
+        q = fid.variables[name][:].flatten()
+        if index is not None:
+            q = q[index*len(x):(index+1)*len(x)]
+        log.critical('    %s in [%f, %f]' % (name, min(q), max(q)))
+    for name in ['elevation']:
+        q = fid.variables[name][:].flatten()
+        log.critical('    %s in [%f, %f]' % (name, min(q), max(q)))
+
+
+def _reduce(res, reduction):
+    """Reduce values res of an expression over time
+    """
 
-    #print norms
-    from calc_grid_values_ext import calc_grid_values
+    import types
+
+    if len(res.shape) < 2:
+        return res
+
+    if type(reduction) is not types.BuiltinFunctionType:
+        return res[reduction]
 
-    calc_grid_values(nrows, ncols, cellsize, NODATA_value,
-                     x,y, norms, volumes, result, grid_values)
+    if reduction is max:
+        return num.max(res, axis=0)
+    if reduction is min:
+        return num.min(res, axis=0)
 
+    new_res = num.zeros(res.shape[1], num.float)
+    for k in xrange(res.shape[1]):
+        new_res[k] = reduction(res[:,k])
+    return new_res
 
 
-    #print outside_indices
+def _get_point_values(fid, quantities, reductions, var_lists,
+                      number_of_points, block_size, verbose=False):
+    """Return list of arrays of the reduced values of each quantity at
+    the points of the sww file.
+
+    Each variable needed is read once per block of points, over all
+    time-steps if any reduction is a function and else only at the
+    time-steps of the reductions.
+    """
+
+    import types
+
+    from anuga.abstract_2d_finite_volumes.util import \
+         apply_expression_to_dictionary
+
+    all_frames = False
+    for reduction in reductions:
+        if type(reduction) is types.BuiltinFunctionType:
+            all_frames = True
+
+    results = [num.zeros(number_of_points, num.float) for q in quantities]
 
     if verbose:
-        log.critical('Interpolated values are in [%f, %f]'
-                     % (num.min(grid_values), num.max(grid_values)))
+        msg = 'Slicing sww file, num points: ' + str(number_of_points)
+        msg += ', block size: ' + str(block_size)
+        log.critical(msg)
 
-    # Assign NODATA_value to all points outside bounding polygon (from interpolation mesh)
-    
-#    P = interp.mesh.get_boundary_polygon()
-#    outside_indices = outside_polygon(grid_points, P, closed=True)
+    for start_slice in xrange(0, number_of_points, block_size):
+        # Limit slice size to array end if at last block
+        end_slice = min(start_slice + block_size, number_of_points)
+
+        # Slices of the variables read so far, keyed by name and frame
+        # (None for all frames)
+        slices = {}
+        def get_slice(name, frame):
+            variable = fid.variables[name]
+            if len(variable.shape) < 2:
+                # no time axis
+                frame = None
+            if not slices.has_key((name, frame)):
+                if len(variable.shape) < 2:
+                    slices[(name, frame)] = variable[start_slice:end_slice]
+                elif frame is None:
+                    slices[(name, frame)] = \
+                        variable[:,start_slice:end_slice]
+                else:
+                    slices[(name, frame)] = \
+                        variable[frame,start_slice:end_slice]
+            return slices[(name, frame)]
+
+        for quantity, reduction, var_list, result in \
+                zip(quantities, reductions, var_lists, results):
+            if all_frames:
+                frame = None
+            else:
+                frame = reduction
+
+            q_dict = {}
+            for name in var_list:
+                q_dict[name] = get_slice(name, frame)
+
+            # Evaluate expression with quantities found in SWW file
+            res = apply_expression_to_dictionary(quantity, q_dict)
+
+            result[start_slice:end_slice] = _reduce(res, reduction)
+
+    return results
+
+
+#-------------------------------------------------------
+# Rasterisation of tiles of the grid (in worker processes)
+#-------------------------------------------------------
+_tile_data = None
+
+def _init_tile_worker(*args):
+    """Set mesh, values and grid shared by all tiles
+    """
+
+    global _tile_data
+    _tile_data = args
+
+
+def _rasterise_tile(tile):
+    """Return list of grid values of each result on the rows start to
+    stop-1 of the grid given by tile = (start, stop)
+    """
+
+    from calc_grid_values_ext import calc_grid_values
+
+    x, y, volumes, ymin, ymax, results, ncols, cellsize, NODATA_value = \
+        _tile_data
+    start, stop = tile
+
+    # Triangles which can contain grid points of the tile, in their
+    # original order so that points on shared edges get the same values
+    # as for the whole grid
+    mask = (ymax >= (start - 1)*cellsize) & (ymin <= stop*cellsize)
+    tile_volumes = num.ascontiguousarray(volumes[mask])
+
+    norms = num.zeros(6*len(tile_volumes), num.float)
+
+    tile_values = []
+    for result in results:
+        grid_values = num.zeros(((stop - start)*ncols,), num.float)
+        calc_grid_values(stop - start, ncols, cellsize, NODATA_value,
+                         x, y, norms, tile_volumes, result, grid_values,
+                         start)
+        tile_values.append(grid_values)
+
+    return tile_values
+
+
+#-------------------------------------------------------
+# Grid output files
+#-------------------------------------------------------
+def _write_prj(basename_out, zone, datum, verbose=False):
+
+    false_easting = 500000
+    false_northing = 10000000
+
+    prjfile = basename_out + '.prj'
+
+    if verbose: log.critical('Writing %s' % prjfile)
+    prjid = open(prjfile, 'w')
+    prjid.write('Projection    %s\n' %'UTM')
+    prjid.write('Zone          %d\n' %zone)
+    prjid.write('Datum         %s\n' %datum)
+    prjid.write('Zunits        NO\n')
+    prjid.write('Units         METERS\n')
+    prjid.write('Spheroid      %s\n' %datum)
+    prjid.write('Xshift        %d\n' %false_easting)
+    prjid.write('Yshift        %d\n' %false_northing)
+    prjid.write('Parameters\n')
+    prjid.close()
 
 
+def _open_grid(name_out, quantity, ncols, nrows, xllcorner, yllcorner,
+               cellsize, NODATA_value, zone, datum, verbose=False):
+    """Open grid file and write its header.
+
+    Return dictionary describing the grid, with the open file or, for
+    ers files which are written at once, the array of all values.
+    """
+
+    import sys
+
+    basename_out, out_ext = os.path.splitext(name_out)
+    out_ext = out_ext.lower()
+
+    grid = {'name': name_out, 'basename': basename_out, 'ext': out_ext,
+            'ncols': ncols, 'nrows': nrows, 'fid': None, 'values': None,
+            'rows_written': 0, 'min': num.inf, 'max': -num.inf}
 
     if out_ext == '.ers':
         # setup ERS header information
-        grid_values = num.reshape(grid_values, (nrows, ncols))
         header = {}
         header['datum'] = '"' + datum + '"'
         # FIXME The use of hardwired UTM and zone number needs to be made optional
@@ -389,84 +599,113 @@ def sww2dem(name_in, name_out,
         header['projection'] = '"UTM-' + str(zone) + '"'
         header['coordinatetype'] = 'EN'
         if header['coordinatetype'] == 'LL':
-            header['longitude'] = str(newxllcorner)
-            header['latitude'] = str(newyllcorner)
+            header['longitude'] = str(xllcorner)
+            header['latitude'] = str(yllcorner)
         elif header['coordinatetype'] == 'EN':
-            header['eastings'] = str(newxllcorner)
-            header['northings'] = str(newyllcorner)
+            header['eastings'] = str(xllcorner)
+            header['northings'] = str(yllcorner)
         header['nullcellvalue'] = str(NODATA_value)
         header['xdimension'] = str(cellsize)
         header['ydimension'] = str(cellsize)
         header['value'] = '"' + quantity + '"'
         #header['celltype'] = 'IEEE8ByteReal'  #FIXME: Breaks unit test
 
-        #Write
-        if verbose:
-            log.critical('Writing %s' % name_out)
+        grid['header'] = header
+        grid['values'] = num.zeros((nrows, ncols), num.float)
+        return grid
+
+    #Write prj file
+    _write_prj(basename_out, zone, datum, verbose)
+
+    if out_ext == '.flt':
+        hdrfile = basename_out + '.hdr'
+
+        if verbose: log.critical('Writing %s' % hdrfile)
+        hdrid = open(hdrfile, 'w')
+        hdrid.write('ncols         %d\n' %ncols)
+        hdrid.write('nrows         %d\n' %nrows)
+        hdrid.write('xllcorner     %f\n' %xllcorner)
+        hdrid.write('yllcorner     %f\n' %yllcorner)
+        hdrid.write('cellsize      %f\n' %cellsize)
+        hdrid.write('NODATA_value  %f\n' %NODATA_value)
+        if sys.byteorder == 'little':
+            hdrid.write('byteorder     LSBFIRST\n')
+        else:
+            hdrid.write('byteorder     MSBFIRST\n')
+        hdrid.close()
 
-        import anuga.abstract_2d_finite_volumes.ermapper_grids as ermapper_grids
+        if verbose: log.critical('Writing %s' % name_out)
+        grid['fid'] = open(name_out, 'wb')
+        return grid
 
-        # convert grid_values to ers ordering
-        reordered_grid_values = grid_values[::-1,:]
+    #Write to Ascii format
+    if verbose: log.critical('Writing %s' % name_out)
+
+    ascid = open(name_out, 'w')
+
+    ascid.write('ncols         %d\n' %ncols)
+    ascid.write('nrows         %d\n' %nrows)
+    ascid.write('xllcorner     %d\n' %xllcorner)
+    ascid.write('yllcorner     %d\n' %yllcorner)
+    ascid.write('cellsize      %f\n' %cellsize)
+    ascid.write('NODATA_value  %d\n' %NODATA_value)
+
+    grid['fid'] = ascid
+    return grid
+
+
+def _write_tile(grid, start, grid_values, format, verbose=False):
+    """Write values of the tile of the grid starting at row start.
+
+    Tiles must be written from the top of the grid.
+    """
+
+    ncols = grid['ncols']
+    nrows = grid['nrows']
+    grid_values = num.reshape(grid_values, (-1, ncols))
 
-        ermapper_grids.write_ermapper_grid(name_out, reordered_grid_values, header)
+    grid['min'] = min(grid['min'], num.min(grid_values))
+    grid['max'] = max(grid['max'], num.max(grid_values))
 
-        fid.close()
+    if grid['ext'] == '.ers':
+        grid['values'][start:start+len(grid_values)] = grid_values
+    elif grid['ext'] == '.flt':
+        grid_values[::-1].astype(num.float32).tofile(grid['fid'])
     else:
-        #Write to Ascii format
-        #Write prj file
-        prjfile = basename_out + '.prj'
-
-        if verbose: log.critical('Writing %s' % prjfile)
-        prjid = open(prjfile, 'w')
-        prjid.write('Projection    %s\n' %'UTM')
-        prjid.write('Zone          %d\n' %zone)
-        prjid.write('Datum         %s\n' %datum)
-        prjid.write('Zunits        NO\n')
-        prjid.write('Units         METERS\n')
-        prjid.write('Spheroid      %s\n' %datum)
-        prjid.write('Xshift        %d\n' %false_easting)
-        prjid.write('Yshift        %d\n' %false_northing)
-        prjid.write('Parameters\n')
-        prjid.close()
+        if verbose:
+            for i in range(grid['rows_written'],
+                           grid['rows_written'] + len(grid_values)):
+                if i % ((nrows+10)/10) == 0:
+                    log.critical('Doing row %d of %d' % (i, nrows))
 
-        if verbose: log.critical('Writing %s' % name_out)
+        num.savetxt(grid['fid'], grid_values[::-1], format, ' ')
 
-        ascid = open(name_out, 'w')
+    grid['rows_written'] += len(grid_values)
 
-        ascid.write('ncols         %d\n' %ncols)
-        ascid.write('nrows         %d\n' %nrows)
-        ascid.write('xllcorner     %d\n' %newxllcorner)
-        ascid.write('yllcorner     %d\n' %newyllcorner)
-        ascid.write('cellsize      %f\n' %cellsize)
-        ascid.write('NODATA_value  %d\n' %NODATA_value)
 
-        #Get bounding polygon from mesh
-        #P = interp.mesh.get_boundary_polygon()
-        #inside_indices = inside_polygon(grid_points, P)
+def _close_grid(grid, verbose=False):
+    """Finish writing grid and return basename of asc and flt files
+    """
 
-        # change printoptions so that a long string of zeros in not
-        # summarized as [0.0, 0.0, 0.0, ... 0.0, 0.0, 0.0]
-        #printoptions = num.get_printoptions()
-        #num.set_printoptions(threshold=sys.maxint)
+    if grid['ext'] == '.ers':
+        #Write
+        if verbose:
+            log.critical('Writing %s' % grid['name'])
 
-        format = '%.'+'%g' % number_of_decimal_places +'e'
-        for i in range(nrows):
-            if verbose and i % ((nrows+10)/10) == 0:
-                log.critical('Doing row %d of %d' % (i, nrows))
+        import anuga.abstract_2d_finite_volumes.ermapper_grids as ermapper_grids
 
-            base_index = (nrows-i-1)*ncols
+        # convert grid_values to ers ordering
+        reordered_grid_values = grid['values'][::-1,:]
 
-            slice = grid_values[base_index:base_index+ncols]
+        ermapper_grids.write_ermapper_grid(grid['name'],
+                                           reordered_grid_values,
+                                           grid['header'])
+        return None
 
-            num.savetxt(ascid, slice.reshape(1,ncols), format, ' ' )
-            
-        
-        #Close
-        ascid.close()
-        fid.close()
+    #Close
+    grid['fid'].close()
 
-        return basename_out
+    return grid['basename']
 
 
 
@@ -483,7 +722,8 @@ def sww2dem_batch(basename_in, extra_name_out=None,
                 verbose=False,
                 origin=None,
                 datum='WGS84',
-                format='ers'):
+                format='ers',
+                processes=1):
     """Wrapper for sww2dem.
     See sww2dem to find out what most of the parameters do. Note that since this
     is a batch command, the normal filename naming conventions do not apply.
@@ -494,6 +734,13 @@ def sww2dem_batch(basename_in, extra_name_out=None,
     Quantities is a list of quantities.  Each quantity will be
     calculated for each sww file.
 
+    reduction may also be a list of reductions (functions or time-step
+    indices). Each quantity is then computed for each reduction and the
+    name of the reduction (e.g. max) or the index is added to the output
+    filename after the quantity.
+
+    Each sww file is read once for all quantities and reductions.
+
     This returns the basenames of the files returned, which is made up
     of the dir and all of the file name, except the extension.
 
@@ -508,6 +755,12 @@ def sww2dem_batch(basename_in, extra_name_out=None,
     if type(quantities) is str:
             quantities = [quantities]
 
+    if isinstance(reduction, (list, tuple)):
+        reductions = [(r, '_' + str(getattr(r, '__name__', r)))
+                      for r in reduction]
+    else:
+        reductions = [(reduction, '')]
+
     # How many sww files are there?
     dir, base = os.path.split(basename_in)
 
@@ -518,33 +771,34 @@ def sww2dem_batch(basename_in, extra_name_out=None,
 
     files_out = []
     for sww_file in iterate_over:
+        outputs = []
         for quantity in quantities:
-            if extra_name_out is None:
-                basename_out = sww_file + '_' + quantity
-            else:
-                basename_out = sww_file + '_' + quantity + '_' + extra_name_out
-
-            swwin = dir+os.sep+sww_file+'.sww'
-            demout = dir+os.sep+basename_out+'.'+format
-
-            if verbose:
-                log.critical('sww2dem: %s => %s' % (swwin, demout))
-
-            file_out = sww2dem(swwin,
-                               demout,
-                               quantity,
-                               reduction,
-                               cellsize,
-                               number_of_decimal_places,
-                               NODATA_value,
-                               easting_min,
-                               easting_max,
-                               northing_min,
-                               northing_max,
-                               verbose,
-                               origin,
-                               datum)
-                               
-            files_out.append(file_out)
-    return files_out
+            for r, reduction_name in reductions:
+                basename_out = sww_file + '_' + quantity + reduction_name
+                if extra_name_out is not None:
+                    basename_out += '_' + extra_name_out
 
+                demout = dir+os.sep+basename_out+'.'+format
+                outputs.append((demout, quantity, r))
+
+        swwin = dir+os.sep+sww_file+'.sww'
+
+        if verbose:
+            log.critical('sww2dem: %s => %s'
+                         % (swwin, ', '.join([o[0] for o in outputs])))
+
+        files_out += sww2dem_multiple(swwin,
+                                      outputs,
+                                      cellsize=cellsize,
+                                      number_of_decimal_places=\
+                                          number_of_decimal_places,
+                                      NODATA_value=NODATA_value,
+                                      easting_min=easting_min,
+                                      easting_max=easting_max,
+                                      northing_min=northing_min,
+                                      northing_max=northing_max,
+                                      verbose=verbose,
+                                      origin=origin,
+                                      datum=datum,
+                                      processes=processes)
+    return files_out
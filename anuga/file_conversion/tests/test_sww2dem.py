@@ -2237,14 +2237,15 @@ Statistics of SWW file:
 Slicing sww file, num points: 9, block size: 10000
 Processed values for elevation are in [-2.000000, 0.000000]
 Creating grid
-Interpolated values are in [-2.000000, 0.000000]
+Rasterising 1 tiles of 5 rows with 1 processes
 Writing datatest_elevation.prj
 Writing datatest_elevation.asc
 Doing row 0 of 5
 Doing row 1 of 5
 Doing row 2 of 5
 Doing row 3 of 5
-Doing row 4 of 5'''
+Doing row 4 of 5
+Interpolated values are in [-2.000000, 0.000000]'''
 
         output_verbose_True = output_verbose_True.split('\n')
         
@@ -2274,6 +2275,114 @@ Doing row 4 of 5'''
         
         
 
+    def test_sww2dem_multiple(self):
+        """Several grids produced in one pass, in tiles and in parallel,
+        are those of separate calls to sww2dem
+        """
+
+        from anuga.file_conversion.sww2dem import sww2dem_multiple
+
+        self.domain.set_name('datatest_multiple')
+        swwfile = self.domain.get_name() + '.sww'
+
+        self.domain.set_datadir('.')
+        self.domain.smooth = True
+        self.domain.set_quantity('elevation', lambda x, y:-x - y)
+        self.domain.geo_reference = Geo_reference(56, 308500, 6189000)
+
+        sww = SWW_file(self.domain)
+        sww.store_connectivity()
+        sww.store_timestep()
+        self.domain.evolve_to_end(finaltime=0.01)
+        sww.store_timestep()
+
+        cellsize = 0.1
+        grids = [('stage', max, 'asc'), ('depth', min, 'asc'),
+                 ('momentum', 1, 'ers'), ('elevation', None, 'flt')]
+
+        expected = {}
+        for quantity, reduction, format in grids:
+            name = 'single_%s.%s' % (quantity, format)
+            sww2dem(swwfile, name, quantity=quantity, reduction=reduction,
+                    cellsize=cellsize, number_of_decimal_places=9)
+            expected[name] = open(name, 'rb').read()
+
+        for processes, tile_rows in [(1, None), (1, 3), (2, 2)]:
+            outputs = [('multi_%s.%s' % (quantity, format), quantity,
+                        reduction)
+                       for quantity, reduction, format in grids]
+            files = sww2dem_multiple(swwfile, outputs, cellsize=cellsize,
+                                     number_of_decimal_places=9,
+                                     processes=processes,
+                                     tile_rows=tile_rows)
+
+            assert files == ['multi_stage', 'multi_depth', None,
+                             'multi_elevation']
+            for quantity, reduction, format in grids:
+                assert open('multi_%s.%s' % (quantity, format), 'rb').read() \
+                       == expected['single_%s.%s' % (quantity, format)]
+
+        # Binary grid has the values of the asc grid
+        sww2dem(swwfile, 'single_elevation.asc', quantity='elevation',
+                cellsize=cellsize, number_of_decimal_places=9)
+        lines = open('single_elevation.asc').readlines()
+        asc_values = num.array([[float(v) for v in line.split()]
+                                for line in lines[6:]])
+        flt_values = num.fromfile('single_elevation.flt', num.float32)
+        assert num.allclose(flt_values.reshape(asc_values.shape), asc_values)
+
+        header = open('single_elevation.hdr').readlines()
+        assert header[0].split() == ['ncols', str(asc_values.shape[1])]
+        assert header[1].split() == ['nrows', str(asc_values.shape[0])]
+        assert header[6].split()[0] == 'byteorder'
+
+        for prefix in ['single', 'multi']:
+            for quantity, reduction, format in grids:
+                os.remove('%s_%s.%s' % (prefix, quantity, format))
+                if format == 'ers':
+                    os.remove('%s_%s' % (prefix, quantity))
+                else:
+                    os.remove('%s_%s.prj' % (prefix, quantity))
+            os.remove('%s_elevation.hdr' % prefix)
+        os.remove('single_elevation.asc')
+        os.remove(swwfile)
+
+
+    def test_sww2dem_batch_reductions(self):
+        """Batch export of several quantities and reductions
+        """
+
+        self.domain.set_name('datatest_batch')
+        swwfile = self.domain.get_name() + '.sww'
+
+        self.domain.set_datadir('.')
+        self.domain.set_quantity('elevation', lambda x, y:-x - y)
+
+        sww = SWW_file(self.domain)
+        sww.store_connectivity()
+        sww.store_timestep()
+        self.domain.evolve_to_end(finaltime=0.01)
+        sww.store_timestep()
+
+        files = sww2dem_batch('datatest_batch', quantities=['stage', 'depth'],
+                              reduction=[max, 0], cellsize=0.25,
+                              format='asc')
+
+        names = ['datatest_batch_stage_max', 'datatest_batch_stage_0',
+                 'datatest_batch_depth_max', 'datatest_batch_depth_0']
+        assert files == ['.' + os.sep + name for name in names]
+
+        sww2dem(swwfile, 'single.asc', quantity='depth', reduction=0,
+                cellsize=0.25)
+        assert open('single.asc').read() == \
+               open('datatest_batch_depth_0.asc').read()
+
+        for name in names + ['single']:
+            os.remove(name + '.asc')
+            os.remove(name + '.prj')
+        os.remove(swwfile)
+
+
 #################################################################################
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""
+Time the conjugate gradient solve of the fitting system B x = Atz with
+the available preconditioners, using the meshes and points of
+benchmark_least_squares.py.
+
+Usage: python benchmark_cg_solve.py [num_of_points [maxArea ...]]
+
+For each mesh (given by maxArea, default 0.001, 0.0001 and 0.00001) and
+each smoothing parameter alpha the system is solved with the c and the
+python solvers without preconditioner, with the Jacobi preconditioner
+and with the incomplete Cholesky preconditioner ('IC'). The number of
+iterations and the time of the solve are reported. The time to build the
+incomplete Cholesky factor is included in the IC solve.
+
+The last column solves again from the solution of the previous alpha
+(warm start) as done when refitting with slightly different data.
+Set OMP_NUM_THREADS to choose the number of threads of the c solver.
+"""
+
+import sys
+import time
+
+import numpy as num
+
+from anuga.fit_interpolate.fit import Fit
+from anuga.fit_interpolate.benchmark_least_squares import \
+     BenchmarkLeastSquares
+from anuga.utilities.cg_solve import conjugate_gradient
+
+
+def build_fit(num_of_points, maxArea, alpha):
+    """Fit object with the coefficient matrix B and Atz built"""
+
+    bench = BenchmarkLeastSquares()
+    mesh_dict = bench._build_regular_mesh_dict(maxArea=maxArea)
+    points_dict = bench._build_points_dict(num_of_points=num_of_points,
+                                           gridded=False)
+
+    points = num.array(points_dict['points'], num.float)
+    z = num.sin(4*points[:,0]) + points[:,1]**2
+
+    fit = Fit(vertex_coordinates=mesh_dict['vertices'],
+              triangles=mesh_dict['triangles'],
+              alpha=alpha)
+    fit._build_matrix_AtA_Atz(points, z)
+    fit._build_coefficient_matrix_B()
+
+    return fit
+
+
+def time_solve(fit, use_c_cg, precon, x0=None):
+
+    t0 = time.time()
+    x, stats = conjugate_gradient(fit.B, fit.Atz, x0,
+                                  imax=2*len(fit.Atz)+1000,
+                                  use_c_cg=use_c_cg, precon=precon,
+                                  output_stats=True)
+
+    return x, stats.iter, time.time() - t0
+
+
+def benchmark(num_of_points=20000, maxAreas=[0.001, 0.0001, 0.00001],
+              alphas=[1.0e-4, 1.0e-3, 1.0e-2]):
+
+    print '%8s %8s %4s %7s %6s %10s %10s' % ('vertices', 'alpha', 'c',
+           'precon', 'iter', 'time (s)', 'warm iter')
+
+    for maxArea in maxAreas:
+        previous = {}
+        for alpha in alphas:
+            fit = build_fit(num_of_points, maxArea, alpha)
+
+            for use_c_cg in [True, False]:
+                for precon in ['None', 'Jacobi', 'IC']:
+                    # Start from Atz like Fit.fit
+                    x, iter, t = time_solve(fit, use_c_cg, precon,
+                                            fit.Atz)
+
+                    key = (use_c_cg, precon)
+                    if key in previous:
+                        _, warm_iter, _ = time_solve(fit, use_c_cg, precon,
+                                                     previous[key])
+                    else:
+                        warm_iter = '-'
+                    previous[key] = x
+
+                    print '%8d %8g %4s %7s %6d %10.4f %10s' % \
+                          (fit.mesh.number_of_nodes, alpha, use_c_cg,
+                           precon, iter, t, warm_iter)
+
+
+if __name__ == '__main__':
+
+    num_of_points = 20000
+    maxAreas = [0.001, 0.0001, 0.00001]
+
+    if len(sys.argv) > 1:
+        num_of_points = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        maxAreas = [float(a) for a in sys.argv[2:]]
+
+    benchmark(num_of_points, maxAreas)
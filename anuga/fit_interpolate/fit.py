@@ -89,6 +89,9 @@ class Fit(FitInterpolate):
           Note: Don't supply a vertex coords as a geospatial object and
               a mesh origin, since geospatial has its own mesh origin.
 
+          cg_precon: Preconditioner of the conjugate gradient solver,
+              'None', 'Jacobi' or 'IC' (incomplete Cholesky).
+
 
         Usage,
         To use this in a blocking way, call  build_fit_subset, with z info,
@@ -125,6 +128,7 @@ class Fit(FitInterpolate):
 
         self.cg_precon=cg_precon
         self.use_c_cg=use_c_cg
+        self.cg_stats=None
 
     def _build_coefficient_matrix_B(self,
                                   verbose=False):
@@ -253,6 +257,14 @@ class Fit(FitInterpolate):
         if verbose and output == 'dot':
             print '\b.',
             sys.stdout.flush()
+
+        self._combine_partial_AtA_Atz(AtA, Atz, zdim)
+
+    def _combine_partial_AtA_Atz(self, AtA, Atz, zdim):
+        """Add AtA and Atz as returned by build_matrix_AtA_Atz_points
+        for a subset of the points to self.AtA and self.Atz
+        """
+
         if zdim == 1:
             Atz = num.array(Atz[0])
         else:
@@ -265,11 +277,59 @@ class Fit(FitInterpolate):
             fitsmooth.combine_partial_AtA_Atz(self.AtA, AtA, \
                     self.Atz, Atz, zdim, self.mesh.number_of_nodes)
 
+    def _build_matrix_AtA_Atz_parallel(self, blocks, processes,
+                                       verbose=False):
+        """Build AtA and Atz like _build_matrix_AtA_Atz using a pool
+        of processes.
+
+        blocks: Iterable of (point_coordinates, z) pairs of absolute point
+        coordinates and data, each of which is done by one process.
+
+        The partial matrices are combined in the order of the blocks, as
+        they come back, so the result is the same as when the blocks are
+        done one after the other. At most two blocks per process are in
+        flight so that blocks read from a file are not all held in memory.
+        """
+
+        from multiprocessing import Pool
+
+        mesh = self.mesh
+        pool = Pool(processes, _init_fit_worker,
+                    (mesh.nodes, mesh.triangles, mesh.geo_reference))
+
+        try:
+            pending = []
+            for point_coordinates, z in blocks:
+                pending.append(pool.apply_async(_build_partial_AtA_Atz,
+                                                (point_coordinates, z)))
+
+                while len(pending) >= 2*processes:
+                    self._combine_partial_entries(*pending.pop(0).get())
+
+                    if verbose:
+                        print '\b.',
+                        sys.stdout.flush()
+
+            for result in pending:
+                self._combine_partial_entries(*result.get())
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _combine_partial_entries(self, AtA_entries, Atz, zdim, npts):
+        """Add AtA and Atz as returned by _build_partial_AtA_Atz"""
+
+        AtA = fitsmooth.build_dok_from_entries(*AtA_entries)
+
+        self.point_count += npts
+        self._combine_partial_AtA_Atz(AtA, Atz, zdim)
+
     def fit(self, point_coordinates_or_filename=None, z=None,
             verbose=False,
             point_origin=None,
             attribute_name=None,
-            max_read_lines=1e7):
+            max_read_lines=1e7,
+            processes=1):
         """Fit a smooth surface to given 1d array of data points z.
 
         The smooth surface is computed at each vertex in the underlying
@@ -282,6 +342,10 @@ class Fit(FitInterpolate):
               data points or an nx2 numeric array or a Geospatial_data object
               or points file filename
           z: Single 1d vector or array of data at the point_coordinates.
+          processes: Number of processes building AtA and Atz. If larger
+              than 1, the blocks read from the file, or the points split
+              into blocks of at most max_read_lines points, are shared
+              between a pool of processes.
 
         """
         if isinstance(point_coordinates_or_filename, basestring):
@@ -306,13 +370,22 @@ class Fit(FitInterpolate):
                                      load_file_now=False,
                                      verbose=verbose)
 
-            for i, geo_block in enumerate(G_data):
+            if processes > 1:
+                blocks = ((geo_block.get_data_points(absolute=True),
+                           geo_block.get_attributes(attribute_name=
+                                                    attribute_name))
+                          for geo_block in G_data)
+                self._build_matrix_AtA_Atz_parallel(blocks, processes,
+                                                    verbose)
+            else:
+                for i, geo_block in enumerate(G_data):
 
-               # Build the array
-                points = geo_block.get_data_points(absolute=True)
-                z = geo_block.get_attributes(attribute_name=attribute_name)
+                   # Build the array
+                    points = geo_block.get_data_points(absolute=True)
+                    z = geo_block.get_attributes(attribute_name=attribute_name)
 
-                self._build_matrix_AtA_Atz(points, z, attribute_name, verbose)
+                    self._build_matrix_AtA_Atz(points, z, attribute_name,
+                                               verbose)
 
             point_coordinates = None
 
@@ -338,7 +411,22 @@ class Fit(FitInterpolate):
             # if isinstance(point_coordinates,Geospatial_data) and z is None:
             # z will come from the geo-ref
 
-            self._build_matrix_AtA_Atz(point_coordinates, z, verbose=verbose, output='counter')
+            if processes > 1:
+                z = ensure_numeric(z, num.float)
+
+            # Without points there is nothing to share between processes
+            if processes > 1 and len(z) > 0:
+                block_size = -(-len(z)//processes)
+                if max_read_lines is not None:
+                    block_size = int(min(max_read_lines, block_size))
+                blocks = ((point_coordinates[i:i+block_size],
+                           z[i:i+block_size])
+                          for i in xrange(0, len(z), block_size))
+                self._build_matrix_AtA_Atz_parallel(blocks, processes,
+                                                    verbose)
+            else:
+                self._build_matrix_AtA_Atz(point_coordinates, z,
+                                           verbose=verbose, output='counter')
 
         # Check sanity
         m = self.mesh.number_of_nodes  # Nbr of basis functions (1/vertex)
@@ -365,9 +453,56 @@ class Fit(FitInterpolate):
             log.critical(msg)
 
             #raise VertsWithNoTrianglesError(msg)
-        return conjugate_gradient(self.B, self.Atz, self.Atz,
+        x, self.cg_stats = conjugate_gradient(self.B, self.Atz, self.Atz,
                                   imax=2 * len(self.Atz)+1000, use_c_cg=self.use_c_cg,
-                                  precon=self.cg_precon)
+                                  precon=self.cg_precon, output_stats=True)
+
+        if verbose:
+            log.critical('Conjugate gradient (precon %s):%s'
+                         % (self.cg_precon, str(self.cg_stats)))
+
+        return x
+
+
+#----------------------------------------------
+# Pool workers building AtA and Atz for blocks
+# of points (see _build_matrix_AtA_Atz_parallel)
+#----------------------------------------------
+_fit_worker = None
+
+def _init_fit_worker(nodes, triangles, geo_reference):
+    """Pool initializer: build the mesh and its quad tree once per
+    process
+    """
+
+    global _fit_worker
+
+    mesh = Mesh(nodes, triangles, geo_reference=geo_reference)
+    _fit_worker = FitInterpolate(mesh=mesh)
+
+
+def _build_partial_AtA_Atz(point_coordinates, z):
+    """Pool worker: build AtA and Atz for a block of points.
+
+    AtA is returned as its entries, as the sparse matrix itself can not
+    be pickled.
+    """
+
+    mesh = _fit_worker.mesh
+
+    point_coordinates = num.array(point_coordinates, num.float)
+    z = num.array(z, num.float)
+
+    zdim = 1
+    if len(z.shape) != 1:
+        zdim = z.shape[1]
+
+    [AtA, Atz] = fitsmooth.build_matrix_AtA_Atz_points(_fit_worker.root.root,
+               mesh.number_of_nodes,
+               mesh.triangles,
+               point_coordinates, z, zdim, len(z))
+
+    return fitsmooth.return_dok_entries(AtA), Atz, zdim, len(z)
 
 
 #poin_coordiantes can also be a points file name
@@ -385,7 +520,8 @@ def fit_to_mesh(point_coordinates,
                 attribute_name=None,
                 use_cache=False,
                 cg_precon='Jacobi',
-                use_c_cg=True):
+                use_c_cg=True,
+                processes=1):
     """Wrapper around internal function _fit_to_mesh for use with caching.
     """
 
@@ -401,7 +537,8 @@ def fit_to_mesh(point_coordinates,
               'max_read_lines': max_read_lines,
               'attribute_name': attribute_name,
               'cg_precon': cg_precon,
-              'use_c_cg': use_c_cg
+              'use_c_cg': use_c_cg,
+              'processes': processes
               }
 
     if use_cache is True:
@@ -439,7 +576,8 @@ def _fit_to_mesh(point_coordinates,
                  max_read_lines=None,
                  attribute_name=None,
                  cg_precon='Jacobi',
-                 use_c_cg=True):
+                 use_c_cg=True,
+                 processes=1):
     """
     Fit a smooth surface to a triangulation,
     given data points with attributes.
@@ -469,6 +607,9 @@ def _fit_to_mesh(point_coordinates,
           point_attributes: Vector or array of data at the
                             point_coordinates.
 
+          processes: Number of processes building the fitting matrices
+                     (see Fit.fit).
+
     """
 
     if mesh is None:
@@ -498,6 +639,7 @@ def _fit_to_mesh(point_coordinates,
                                    point_origin=data_origin,
                                    max_read_lines=max_read_lines,
                                    attribute_name=attribute_name,
+                                   processes=processes,
                                    verbose=verbose)
 
     # Add the value checking stuff that's in least squares.
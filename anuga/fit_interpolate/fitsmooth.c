@@ -615,6 +615,52 @@ PyObject *individual_tree_search(PyObject *self, PyObject *args) {
     return retlist;
 }
 
+// Searches quad_tree for each of the points in an N x 2 array and
+// returns an array of the indices of the triangles containing them
+// (-1 for points not found).
+PyObject *tree_search_points(PyObject *self, PyObject *args) {
+
+    // Setting up variables to parse input
+    PyObject *tree;
+    PyArrayObject *points;
+    PyArrayObject *indices;
+
+    // Convert Python arguments to C
+    if (!PyArg_ParseTuple(args, "OO",&tree, &points
+                                            )) {
+      PyErr_SetString(PyExc_RuntimeError,
+              "fitsmooth.c: could not parse input");
+      return NULL;
+    }
+
+    CHECK_C_CONTIG(points);
+
+    #ifdef PYVERSION273
+    quad_tree * quadtree = (quad_tree*) PyCapsule_GetPointer(tree,"quad tree");
+    #else
+    quad_tree * quadtree = (quad_tree*) PyCObject_AsVoidPtr(tree);
+    #endif
+
+    npy_intp n = points->dimensions[0];
+    double *pointd = (double*)points->data;
+
+    indices = (PyArrayObject*) PyArray_SimpleNew(1, &n, NPY_LONG);
+    if (indices == NULL) return NULL;
+    long *index = (long*)indices->data;
+
+    npy_intp i;
+    for(i=0; i<n; i++){
+        triangle * T = search(quadtree,pointd[2*i],pointd[2*i+1]);
+        if(T!=NULL){
+            index[i] = (long)T->index;
+        }else{
+            index[i] = -1;
+        }
+    }
+
+    return PyArray_Return(indices);
+}
+
 // Returns the total number of triangles stored in quad_tree.
 // Takes a capsule object holding a pointer to the quad_tree as input.
 //
@@ -718,6 +764,102 @@ PyObject *combine_partial_AtA_Atz(PyObject *self, PyObject *args) {
     return Py_BuildValue("");
 }
 
+// Returns the entries of a sparse_dok matrix wrapped in a capsule as a list
+// of three numpy arrays: row indices, column indices and values. Used to
+// send partial AtA matrices between processes, as capsules can not be
+// pickled.
+PyObject *return_dok_entries(PyObject *self, PyObject *args) {
+
+    // Setting up variables to parse input
+    PyObject *dok_cap; // capsule object holding sparse_dok pointer
+
+    // Convert Python arguments to C
+    if (!PyArg_ParseTuple(args, "O", &dok_cap)) {
+      PyErr_SetString(PyExc_RuntimeError,
+              "fitsmooth.return_dok_entries: could not parse input");
+      return NULL;
+    }
+
+    // Get pointer to sparse_dok struct
+    #ifdef PYVERSION273
+    sparse_dok * dok = (sparse_dok*) PyCapsule_GetPointer(dok_cap,"sparse dok");
+    #else
+    sparse_dok * dok = (sparse_dok*) PyCObject_AsVoidPtr(dok_cap);
+    #endif
+
+    npy_intp num_entries = HASH_COUNT(dok->edgetable);
+
+    PyArrayObject *rows = (PyArrayObject *)
+                          PyArray_SimpleNew(1, &num_entries, NPY_INT);
+    PyArrayObject *cols = (PyArrayObject *)
+                          PyArray_SimpleNew(1, &num_entries, NPY_INT);
+    PyArrayObject *values = (PyArrayObject *)
+                            PyArray_SimpleNew(1, &num_entries, NPY_DOUBLE);
+
+    int *row_data = (int *) rows->data;
+    int *col_data = (int *) cols->data;
+    double *value_data = (double *) values->data;
+
+    edge_t *s;
+    int k = 0;
+    for (s = dok->edgetable; s != NULL; s = (edge_t*) (s->hh.next)) {
+        row_data[k] = s->key.i;
+        col_data[k] = s->key.j;
+        value_data[k] = s->entry;
+        k++;
+    }
+
+    PyObject *lst = PyList_New(3);
+    PyList_SET_ITEM(lst, 0, (PyObject *) rows);
+    PyList_SET_ITEM(lst, 1, (PyObject *) cols);
+    PyList_SET_ITEM(lst, 2, (PyObject *) values);
+    return lst;
+}
+
+// Builds a sparse_dok matrix from numpy arrays of row indices, column
+// indices and values as returned by return_dok_entries. Returns a capsule
+// object wrapping a pointer to the new sparse_dok.
+PyObject *build_dok_from_entries(PyObject *self, PyObject *args) {
+
+    // Setting up variables to parse input
+    PyArrayObject *rows, *cols, *values;
+
+    // Convert Python arguments to C
+    if (!PyArg_ParseTuple(args, "OOO", &rows, &cols, &values)) {
+      PyErr_SetString(PyExc_RuntimeError,
+              "fitsmooth.build_dok_from_entries: could not parse input");
+      return NULL;
+    }
+
+    CHECK_C_CONTIG(rows);
+    CHECK_C_CONTIG(cols);
+    CHECK_C_CONTIG(values);
+
+    int *row_data = (int *) rows->data;
+    int *col_data = (int *) cols->data;
+    double *value_data = (double *) values->data;
+
+    sparse_dok * dok = make_dok();
+
+    edge_key_t key;
+    int k;
+    int num_entries = values->dimensions[0];
+    for (k = 0; k < num_entries; k++) {
+        key.i = row_data[k];
+        key.j = col_data[k];
+        add_dok_entry(dok, key, value_data[k]);
+    }
+
+    #ifdef PYVERSION273
+    return  PyCapsule_New((void*) dok,
+                  "sparse dok",
+                  &delete_dok_cap);
+    #else
+    return  PyCObject_FromVoidPtr((void*) dok,
+                  &delete_dok_cobj);
+    #endif
+}
+
 // Converts a sparse_dok matrix to a full non-compressed matrix expressed
 // as a list of lists (python). Takes as input a capsule object containing a pointer to the
 // sparse_dok object. Also takes an integer n as input, specifying the (n x n) size of the 
@@ -860,7 +1002,10 @@ static struct PyMethodDef MethodTable[] = {
     {"build_smoothing_matrix",build_smoothing_matrix, METH_VARARGS, "Print out"},
     {"build_matrix_AtA_Atz_points",build_matrix_AtA_Atz_points, METH_VARARGS, "Print out"},
     {"combine_partial_AtA_Atz",combine_partial_AtA_Atz, METH_VARARGS, "Print out"},
+    {"return_dok_entries",return_dok_entries, METH_VARARGS, "Print out"},
+    {"build_dok_from_entries",build_dok_from_entries, METH_VARARGS, "Print out"},
     {"individual_tree_search",individual_tree_search, METH_VARARGS, "Print out"},
+    {"tree_search_points",tree_search_points, METH_VARARGS, "Print out"},
 	{NULL, NULL, 0, NULL}   // sentinel
 };
 
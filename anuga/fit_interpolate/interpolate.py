@@ -27,6 +27,7 @@ interpolate_block
 import time
 import os
 import sys
+import threading
 from warnings import warn
 from math import sqrt
 from csv import writer, DictWriter
@@ -955,7 +956,9 @@ class Interpolation_function:
 
         Inputs:
           t:        time - Model time. Must lie within existing timesteps
-          point_id: index of one of the preprocessed points.
+          point_id: index of one of the preprocessed points or an
+                    array of such indices. In the latter case an array
+                    with one row of values per point is returned.
 
           If spatial info is present and all of point_id
           are None an exception is raised
@@ -1003,26 +1006,35 @@ class Interpolation_function:
             ratio = ((t - self.time[self.index]) /
                          (self.time[self.index+1] - self.time[self.index]))
 
+        # Values at timesteps index and index+1
+        precomputed_values, index = self._get_precomputed_values(ratio)
+
+        if self.spatial is True and point_id is not None and \
+               not num.isscalar(point_id):
+            # Vector of point ids
+            return self._interpolate_points(precomputed_values, index,
+                                            num.asarray(point_id), ratio)
+
         # Compute interpolated values
         q = num.zeros(len(self.quantity_names), num.float)
         for i, name in enumerate(self.quantity_names):
-            Q = self.precomputed_values[name]
+            Q = precomputed_values[name]
 
             if self.spatial is False:
                 # If there is no spatial info
                 assert len(Q.shape) == 1
 
-                Q0 = Q[self.index]
-                if ratio > 0: Q1 = Q[self.index+1]
+                Q0 = Q[index]
+                if ratio > 0: Q1 = Q[index+1]
             else:
                 if x is not None and y is not None:
                     # Interpolate to x, y
                     raise Exception('x,y interpolation not yet implemented')
                 else:
                     # Use precomputed point
-                    Q0 = Q[self.index, point_id]
+                    Q0 = Q[index, point_id]
                     if ratio > 0:
-                        Q1 = Q[self.index+1, point_id]
+                        Q1 = Q[index+1, point_id]
 
             # Linear temporal interpolation
             if ratio > 0:
@@ -1057,6 +1069,32 @@ class Interpolation_function:
 
                 return res
 
+    def _get_precomputed_values(self, ratio):
+        """Return dictionary of precomputed values and the row of the
+        current time index in them.
+        """
+
+        return self.precomputed_values, self.index
+
+    def _interpolate_points(self, precomputed_values, index, point_id, ratio):
+        """Return array of shape (len(point_id), number of quantities)
+        of values at time index and ratio
+        """
+
+        q = num.zeros((len(point_id), len(self.quantity_names)), num.float)
+        for i, name in enumerate(self.quantity_names):
+            Q = precomputed_values[name]
+
+            Q0 = Q[index, point_id]
+            if ratio > 0:
+                Q1 = Q[index+1, point_id]
+                q[:,i] = num.where((Q0 == NAN) & (Q1 == NAN),
+                                   Q0, Q0 + ratio*(Q1 - Q0))
+            else:
+                q[:,i] = Q0
+
+        return q
+
     def get_time(self):
         """Return model time as a vector of timesteps
         """
@@ -1113,6 +1151,305 @@ class Interpolation_function:
         return msg
 
 
+class Streaming_interpolation_function(Interpolation_function):
+    """Interpolation function reading a sliding window of timesteps from
+    an sww or sts file as model time advances.
+
+    Unlike Interpolation_function, which reads all timesteps and
+    interpolates them to the interpolation points up front, values are
+    read and interpolated for window_size timesteps at a time. Once a
+    window is in use the following one (overlapping by one timestep)
+    is read by a background thread.
+
+    Input
+        filename:             Name of sww or sts file
+        time:                 px1 array of times of the timesteps used
+                              (after thinning and relative to the model
+                              starttime)
+        time_index:           px1 array of the indices of these timesteps
+                              in the file
+        quantity_names:       List of quantities to read from the file
+        vertex_coordinates:   mx2 array of coordinates in the file
+                              (relative to the file origin)
+        triangles:            nx3 array of triangles (sww) or None (sts)
+        interpolation_points: Nx2 array of coordinates (relative to the
+                              file origin) to be interpolated to
+        gauge_id:             Indices of the points of an sts file to be
+                              used or None to use all points
+        gauge_neighbour_id:   See interpolate_polyline (sts only)
+        window_size:          Number of timesteps read at a time
+
+    Errors raised while prefetching are re-raised when the window
+    is needed.
+    """
+
+    def __init__(self,
+                 filename,
+                 time,
+                 time_index,
+                 quantity_names,
+                 vertex_coordinates,
+                 triangles,
+                 interpolation_points,
+                 gauge_id=None,
+                 gauge_neighbour_id=None,
+                 window_size=100,
+                 verbose=False):
+
+        time = ensure_numeric(time, num.float)
+
+        if not num.alltrue(time[1:] - time[:-1] >= 0):
+            msg = 'Time must be a monotonuosly increasing sequence %s' % time
+            raise Exception(msg)
+
+        msg = 'window_size must be an integer larger than 1, got %s' \
+              % str(window_size)
+        assert int(window_size) == window_size and window_size > 1, msg
+
+        self.filename = filename
+        self.time = time
+        self.time_index = ensure_numeric(time_index, num.int)
+        self.quantity_names = quantity_names
+        self.vertex_coordinates = ensure_numeric(vertex_coordinates, num.float)
+        self.interpolation_points = ensure_numeric(interpolation_points,
+                                                   num.float)
+        self.gauge_id = gauge_id
+        self.gauge_neighbour_id = gauge_neighbour_id
+        self.window_size = int(window_size)
+        self.verbose = verbose
+
+        self.spatial = True
+        self.index = 0    # Initial time index
+        self.centroids = []
+        self.static_values = {}
+
+        self.fid = None
+        self.window = None
+        self.prefetch_thread = None
+        self.prefetch_result = None
+
+        self.interpolator = None
+        if triangles is not None:
+            from anuga.geometry.polygon import outside_polygon
+
+            triangles = ensure_numeric(triangles)
+
+            mesh = Mesh(self.vertex_coordinates, triangles)
+            indices = outside_polygon(self.interpolation_points,
+                                      mesh.get_boundary_polygon())
+            self.indices_outside_mesh = indices
+
+            if len(indices) > 0 and verbose:
+                msg = 'Interpolation points in Interpolation function fall '
+                msg += 'outside specified mesh. Offending points:\n'
+                for i in indices:
+                    msg += '%d: %s\n' % (i, self.interpolation_points[i])
+                log.critical(msg)
+
+            # Build interpolation matrix once for all timesteps
+            self.interpolator = Interpolate(self.vertex_coordinates,
+                                            triangles,
+                                            verbose=verbose)
+            self.interpolator.interpolate_block(
+                                    num.zeros(len(self.vertex_coordinates)),
+                                    self.interpolation_points,
+                                    verbose=verbose)
+
+
+    def __getstate__(self):
+        """Open file, window and prefetch thread can not be pickled
+        (caching and checkpointing)
+        """
+
+        self._join_prefetch()
+
+        state = self.__dict__.copy()
+        for key in ['fid', 'window', 'prefetch_thread', 'prefetch_result']:
+            state[key] = None
+
+        return state
+
+
+    def close(self):
+        """Wait for the prefetch thread and close the file.
+
+        The file is reopened if another window is needed.
+        """
+
+        self._join_prefetch()
+
+        if self.fid is not None:
+            self.fid.close()
+            self.fid = None
+
+
+    def _get_precomputed_values(self, ratio):
+        """Return values of the window containing timesteps index and
+        index+1 and the row of index in them.
+        """
+
+        index = self.index
+        if ratio > 0:
+            last = index + 1
+        else:
+            last = index
+
+        window = self.window
+        if window is None or index < window[0] or last >= window[1]:
+            window = self._load_window(index)
+
+        start, stop, values = window
+        return values, index - start
+
+
+    def _load_window(self, start):
+        """Make the window starting at timestep start the current one
+        and prefetch the next.
+        """
+
+        result = self._join_prefetch()
+
+        window = None
+        if result is not None and result[0] == start:
+            window, error = result[1:]
+            if error is not None:
+                error_type, error_value, error_traceback = error
+                raise error_type, error_value, error_traceback
+
+        if window is None:
+            window = self._read_window(start)
+
+        self.window = window
+
+        # Prefetch next window, overlapping by one timestep
+        stop = window[1]
+        if stop < len(self.time):
+            self.prefetch_thread = threading.Thread(target=self._prefetch,
+                                                    args=(stop-1,),
+                                                    name='Prefetch %s'
+                                                    % self.filename)
+            self.prefetch_thread.daemon = True
+            self.prefetch_thread.start()
+
+        return window
+
+
+    def _prefetch(self, start):
+        """Prefetch thread: read window starting at timestep start
+        """
+
+        try:
+            self.prefetch_result = (start, self._read_window(start), None)
+        except:
+            self.prefetch_result = (start, None, sys.exc_info())
+
+
+    def _join_prefetch(self):
+        """Wait for the prefetch thread and return its result
+        """
+
+        if self.prefetch_thread is None:
+            return None
+
+        self.prefetch_thread.join()
+        result = self.prefetch_result
+
+        self.prefetch_thread = None
+        self.prefetch_result = None
+
+        return result
+
+
+    def _read_window(self, start):
+        """Read and interpolate timesteps start to start + window_size.
+
+        Return tuple (start, stop, values) where values is a dictionary
+        of (stop-start) x N arrays of values at the interpolation points.
+        """
+
+        from anuga.file.netcdf import NetCDFFile
+
+        stop = min(start + self.window_size, len(self.time))
+        index = self.time_index[start:stop]
+        if len(index) > 1:
+            step = index[1] - index[0]
+        else:
+            step = 1
+
+        if self.fid is None:
+            self.fid = NetCDFFile(self.filename, netcdf_mode_r)
+
+        values = {}
+        for name in self.quantity_names:
+            variable = self.fid.variables[name]
+
+            if len(variable.shape) == 1:
+                # No time dependency
+                if name not in self.static_values:
+                    Q = num.array(variable[:], num.float)
+                    self.static_values[name] = \
+                                    self._interpolate(Q[num.newaxis,:])[0]
+                values[name] = num.resize(self.static_values[name],
+                                          (stop-start,
+                                           len(self.interpolation_points)))
+            else:
+                Q = num.array(variable[index[0]:index[-1]+1:step,:], num.float)
+                values[name] = self._interpolate(Q)
+
+        return start, stop, values
+
+
+    def _interpolate(self, Q):
+        """Interpolate k x m array of values at the file points
+        to k x N array of values at the interpolation points
+        """
+
+        if self.gauge_id is not None:
+            # Remove sts points that do not lie on boundary
+            Q = num.take(Q, self.gauge_id, axis=1)
+
+        if self.interpolator is not None:
+            z = self.interpolator._get_point_data_z(num.transpose(Q))
+            return num.array(num.transpose(z))
+        else:
+            z = num.zeros((Q.shape[0], len(self.interpolation_points)),
+                          num.float)
+            for i in range(Q.shape[0]):
+                z[i,:] = interpolate_polyline(Q[i,:],
+                                              self.vertex_coordinates,
+                                              self.gauge_neighbour_id,
+                                              interpolation_points=\
+                                                  self.interpolation_points)
+            return z
+
+
+    def statistics(self):
+        """Output statistics about interpolation_function
+        """
+
+        x = self.vertex_coordinates[:,0]
+        y = self.vertex_coordinates[:,1]
+        points = self.interpolation_points
+
+        msg =  '------------------------------------------------\n'
+        msg += 'Streaming_interpolation_function statistics:\n'
+        msg += '  File: %s\n' % self.filename
+        msg += '  Extent:\n'
+        msg += '    x in [%f, %f], len(x) == %d\n' % (min(x), max(x), len(x))
+        msg += '    y in [%f, %f], len(y) == %d\n' % (min(y), max(y), len(y))
+        msg += '    t in [%f, %f], len(t) == %d\n'\
+               % (min(self.time), max(self.time), len(self.time))
+        msg += '  Quantities: %s\n' % ', '.join(self.quantity_names)
+        msg += '  Interpolation points (xi, eta):'\
+               ' number of points == %d\n' % points.shape[0]
+        msg += '    xi in [%f, %f]\n' % (min(points[:,0]), max(points[:,0]))
+        msg += '    eta in [%f, %f]\n' % (min(points[:,1]), max(points[:,1]))
+        msg += '  Timesteps read per window: %d\n' % self.window_size
+        msg += '------------------------------------------------\n'
+
+        return msg
+
+
 def interpolate_sww(sww_file, time, interpolation_points,
                     quantity_names=None, verbose=False):
     """
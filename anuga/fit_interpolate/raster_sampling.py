@@ -0,0 +1,445 @@
+"""Windowed sampling of large raster grids.
+
+* Grids are opened without reading their values: ERMapper grids (.ers) and
+  ESRI ASCII grids (.asc, converted once to ERMapper) are memory mapped and
+  NetCDF grids (.dem) are sliced by window.
+* Points are sorted into square tiles of the grid and each tile reads only
+  the block of the grid covering its points, so memory use is bounded by
+  the tile size rather than the size of the grid.
+* Tiles may be sampled concurrently by a pool of threads.
+
+Values are located at the grid points xllcorner + j*cellsize,
+yllcorner + i*cellsize, as in grd2array and dem2array, and NODATA values
+are returned as NaN. The sampling modes are
+
+* 'pixel' - the value of the nearest grid point, i.e. of the cell centred
+            on it
+* 'bilinear' - bilinear interpolation between the four surrounding grid
+               points, as interpolate2d with mode 'linear'
+* 'average' - the mean of the grid points inside each triangle. Triangles
+              containing no grid point take the bilinear value at their
+              centroid.
+"""
+
+import os
+import threading
+import itertools
+
+import numpy as num
+
+import anuga.utilities.log as log
+from anuga.anuga_exceptions import ANUGAError
+
+
+class Raster_grid:
+    """A regular grid of values held in a 2D array like object, for
+    example a numpy memmap or a NetCDF variable, that is read block by
+    block.
+
+    The rows of values run from north to south as in ESRI ASCII grids, so
+    the grid point (i, j) counted from the south west is values[nrows-1-i, j].
+    """
+
+    def __init__(self, values, xllcorner, yllcorner, cellsize,
+                 NODATA_value=None, lock=False, source=None):
+        """Create grid from values of dimension nrows x ncols
+
+        lock: True means that reads are serialised, as needed for file
+              libraries that are not thread safe
+        source: An open file to be closed with the grid
+        """
+
+        self.values = values
+        self.nrows, self.ncols = values.shape
+        self.xllcorner = float(xllcorner)
+        self.yllcorner = float(yllcorner)
+        self.cellsize = float(cellsize)
+        self.NODATA_value = NODATA_value
+
+        if lock:
+            self.lock = threading.Lock()
+        else:
+            self.lock = None
+        self.source = source
+
+    def __repr__(self):
+        return ('Raster_grid(%d x %d, xllcorner=%s, yllcorner=%s, '
+                'cellsize=%s)' % (self.nrows, self.ncols, self.xllcorner,
+                                  self.yllcorner, self.cellsize))
+
+    def get_extent(self):
+        """Return [xmin, xmax, ymin, ymax] of the grid points"""
+
+        return [self.xllcorner,
+                self.xllcorner + (self.ncols - 1)*self.cellsize,
+                self.yllcorner,
+                self.yllcorner + (self.nrows - 1)*self.cellsize]
+
+    def read_block(self, i0, i1, j0, j1):
+        """Return values of grid points i0 <= i < i1 (counted from the south)
+        and j0 <= j < j1 as a float array with first index i.
+
+        NODATA values are replaced by NaN.
+        """
+
+        rows = slice(self.nrows - i1, self.nrows - i0)
+        columns = slice(j0, j1)
+        if self.lock is None:
+            Z = self.values[rows, columns]
+        else:
+            self.lock.acquire()
+            try:
+                Z = self.values[rows, columns]
+            finally:
+                self.lock.release()
+
+        Z = num.array(Z[::-1], num.float)
+        if self.NODATA_value is not None:
+            Z[Z == self.NODATA_value] = num.nan
+
+        return Z
+
+    def close(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+
+def open_raster(filename, verbose=False):
+    """Open grid file as a Raster_grid without reading its values.
+
+    filename: ERMapper grid (.ers, or the data file next to it), NetCDF DEM
+              (.dem) or ESRI ASCII grid (.asc). ASCII grids are converted to
+              ERMapper grids next to them with asc2ers, unless a newer
+              conversion exists.
+    """
+
+    root, ext = os.path.splitext(filename)
+
+    if ext == '.asc':
+        if (not os.path.exists(root + '.ers') or
+            os.path.getmtime(root + '.ers') < os.path.getmtime(filename)):
+            from anuga.file_conversion.asc2ers import asc2ers
+            asc2ers(filename, verbose=verbose)
+        return open_ermapper_grid(root + '.ers', verbose=verbose)
+    elif ext == '.dem':
+        return open_dem(filename, verbose=verbose)
+    elif ext == '.ers' or os.path.exists(filename + '.ers'):
+        return open_ermapper_grid(filename, verbose=verbose)
+    else:
+        msg = 'Extension should be .ers, .dem or .asc. I got %s' % filename
+        raise IOError(msg)
+
+
+def open_ermapper_grid(filename, verbose=False):
+    """Memory map ERMapper grid, see ermapper_grids.write_ermapper_grid"""
+
+    from anuga.abstract_2d_finite_volumes.ermapper_grids import \
+         read_ermapper_header, celltype_map
+
+    if filename.endswith('.ers'):
+        data_file = filename[:-4]
+        header_file = filename
+    else:
+        data_file = filename
+        header_file = filename + '.ers'
+
+    header = read_ermapper_header(header_file)
+
+    nrows = int(header['nroflines'])
+    ncols = int(header['nrofcellsperline'])
+    cellsize = float(header['xdimension'])
+    msg = ('Only square cells are supported, but %s has cells of %s x %s'
+           % (header_file, header['xdimension'], header['ydimension']))
+    if float(header['ydimension']) != cellsize:
+        raise ANUGAError(msg)
+
+    if header.has_key('eastings'):
+        x = header['eastings']
+        y = header['northings']
+    else:
+        x = header['longitude']
+        y = header['latitude']
+    try:
+        x = float(x)
+        y = float(y)
+    except ValueError:
+        msg = ('Registration coordinates %s, %s in %s must be numbers'
+               % (x, y, header_file))
+        raise ANUGAError(msg)
+
+    # Registration coordinates are those of a grid point, counted from
+    # the north west
+    registration_column = float(header.get('registrationcellx', 0))
+    registration_row = float(header.get('registrationcelly', nrows - 1))
+    xllcorner = x - registration_column*cellsize
+    yllcorner = y - (nrows - 1 - registration_row)*cellsize
+
+    dtype = num.dtype(celltype_map[header.get('celltype', 'IEEE4ByteReal')])
+    if header.get('byteorder', 'LSBFirst') == 'MSBFirst':
+        dtype = dtype.newbyteorder('>')
+    else:
+        dtype = dtype.newbyteorder('<')
+
+    if header.has_key('nullcellvalue'):
+        NODATA_value = float(header['nullcellvalue'])
+    else:
+        NODATA_value = None
+
+    if verbose: log.critical('Mapping %d x %d grid from %s'
+                             % (nrows, ncols, data_file))
+
+    values = num.memmap(data_file, dtype=dtype, mode='r',
+                        offset=int(header.get('headeroffset', 0)),
+                        shape=(nrows, ncols))
+
+    return Raster_grid(values, xllcorner, yllcorner, cellsize,
+                       NODATA_value=NODATA_value)
+
+
+def open_dem(filename, variable_name='elevation', verbose=False):
+    """Open NetCDF DEM (.dem), as written by asc2dem, for windowed reads"""
+
+    from anuga.file.netcdf import NetCDFFile
+    from anuga.config import netcdf_mode_r
+
+    infile = NetCDFFile(filename, netcdf_mode_r)
+
+    if verbose: log.critical('Opening DEM %s' % filename)
+
+    values = infile.variables[variable_name]
+    nrows = int(infile.nrows)
+    ncols = int(infile.ncols)
+    if values.shape != (nrows, ncols):
+        msg = ('Variable %s in %s has shape %s, expected (%d, %d)'
+               % (variable_name, filename, values.shape, nrows, ncols))
+        raise ANUGAError(msg)
+
+    return Raster_grid(values,
+                       float(infile.xllcorner),
+                       float(infile.yllcorner),
+                       float(infile.cellsize),
+                       NODATA_value=float(infile.NODATA_value),
+                       lock=True, source=infile)
+
+
+def sample_raster(raster, points, mode='bilinear', tile_size=1024,
+                  threads=1, bounds_error=False, verbose=False):
+    """Sample grid at points or over triangles, one tile at a time.
+
+    Input
+        raster: Raster_grid or name of grid file (see open_raster)
+        points: Nx2 array of absolute coordinates. For mode 'average' the
+                3Mx2 array of vertex coordinates of M triangles, three rows
+                per triangle as domain.vertex_coordinates.
+        mode: 'pixel', 'bilinear' or 'average' (see module docstring)
+        tile_size: Width in grid cells of the square tiles sampled at a
+                   time. None samples all points from one window of the grid.
+        threads: Number of threads sampling tiles concurrently
+        bounds_error: True means that ANUGAError is raised for points
+                      outside the grid. Otherwise NaN is returned for them.
+
+    Output
+        1D array of length N (or M for mode 'average') with sampled values
+    """
+
+    if mode not in ['pixel', 'bilinear', 'average']:
+        msg = ('Mode must be "pixel", "bilinear" or "average". '
+               'I got "%s"' % mode)
+        raise ANUGAError(msg)
+
+    if isinstance(raster, basestring):
+        grid = open_raster(raster, verbose=verbose)
+    else:
+        grid = raster
+
+    points = num.array(points, num.float).reshape(-1, 2)
+
+    # Coordinates in grid cells from the south west grid point
+    u = (points[:,0] - grid.xllcorner)/grid.cellsize
+    v = (points[:,1] - grid.yllcorner)/grid.cellsize
+    if mode == 'average':
+        u = u.reshape(-1, 3)
+        v = v.reshape(-1, 3)
+        u_centre = num.mean(u, axis=1)
+        v_centre = num.mean(v, axis=1)
+    else:
+        u_centre = u
+        v_centre = v
+
+    N = len(u_centre)
+    result = num.empty(N, num.float)
+    result[:] = num.nan
+
+    # Points (or centroids) that can be sampled
+    oldset = num.seterr(invalid='ignore')
+    if mode == 'pixel':
+        inside = ((u_centre >= -0.5) & (u_centre < grid.ncols - 0.5) &
+                  (v_centre >= -0.5) & (v_centre < grid.nrows - 0.5))
+    else:
+        inside = ((u_centre >= 0.0) & (u_centre <= grid.ncols - 1) &
+                  (v_centre >= 0.0) & (v_centre <= grid.nrows - 1))
+    num.seterr(**oldset)
+
+    if bounds_error and not num.all(inside):
+        k = num.flatnonzero(~inside)[0]
+        msg = ('Point (%f, %f) is outside the grid %s and bounds_error '
+               'was requested' % (grid.xllcorner + u_centre[k]*grid.cellsize,
+                                  grid.yllcorner + v_centre[k]*grid.cellsize,
+                                  grid.get_extent()))
+        raise ANUGAError(msg)
+
+    # Sort the points into tiles
+    indices = num.flatnonzero(inside)
+    if tile_size is None:
+        tiles = [indices]
+    else:
+        column = num.maximum(u_centre[indices], 0)//tile_size
+        row = num.maximum(v_centre[indices], 0)//tile_size
+        keys = row*(grid.ncols//tile_size + 1) + column
+        order = num.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        ends = num.flatnonzero(keys[1:] != keys[:-1]) + 1
+        tiles = num.split(indices[order], ends)
+    tiles = [tile for tile in tiles if len(tile) > 0]
+
+    if verbose: log.critical('Sampling %d points from %s in %d tiles'
+                             % (len(indices), grid, len(tiles)))
+
+    def task(tile):
+        if mode == 'average':
+            return tile, _average_tile(grid, u[tile], v[tile])
+        else:
+            return tile, _sample_tile(grid, u[tile], v[tile], mode)
+
+    imap = itertools.imap
+    pool = None
+    try:
+        if threads > 1 and len(tiles) > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(threads, len(tiles)))
+            imap = pool.imap
+
+        for tile, values in imap(task, tiles):
+            result[tile] = values
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if grid is not raster:
+        grid.close()
+
+    return result
+
+
+#------------------------
+# Auxiliary functionality
+#------------------------
+def _sample_tile(grid, u, v, mode):
+    """Sample grid at points (u, v) in grid cells, reading the block
+    covering them.
+    """
+
+    if mode == 'pixel':
+        i = num.floor(v + 0.5).astype(num.int64)
+        j = num.floor(u + 0.5).astype(num.int64)
+        i0 = i.min(); j0 = j.min()
+        Z = grid.read_block(i0, i.max() + 1, j0, j.max() + 1)
+        return Z[i - i0, j - j0]
+
+    # Lower left grid point of the cell containing each point
+    i = num.clip(num.floor(v).astype(num.int64), 0, max(grid.nrows - 2, 0))
+    j = num.clip(num.floor(u).astype(num.int64), 0, max(grid.ncols - 2, 0))
+    i1 = num.minimum(i + 1, grid.nrows - 1)
+    j1 = num.minimum(j + 1, grid.ncols - 1)
+    alpha = u - j
+    beta = v - i
+
+    i0 = i.min(); j0 = j.min()
+    Z = grid.read_block(i0, i1.max() + 1, j0, j1.max() + 1)
+    z00 = Z[i - i0, j - j0]
+    z10 = Z[i - i0, j1 - j0]
+    z01 = Z[i1 - i0, j - j0]
+    z11 = Z[i1 - i0, j1 - j0]
+
+    # Bilinear interpolation as in interpolate2d
+    dx = z10 - z00
+    dy = z01 - z00
+    return z00 + alpha*dx + beta*dy + alpha*beta*(z11 - dx - dy - z00)
+
+
+def _average_tile(grid, u, v, max_candidates=2**22):
+    """Mean of the grid points inside triangles with vertices (u, v) in
+    grid cells, each Mx3. Grid points on the sides count as inside.
+    """
+
+    M = len(u)
+
+    # Grid points in the bounding box of each triangle
+    i0 = num.maximum(num.ceil(v.min(axis=1)), 0).astype(num.int64)
+    i1 = num.minimum(num.floor(v.max(axis=1)), grid.nrows - 1).astype(num.int64)
+    j0 = num.maximum(num.ceil(u.min(axis=1)), 0).astype(num.int64)
+    j1 = num.minimum(num.floor(u.max(axis=1)), grid.ncols - 1).astype(num.int64)
+    rows = num.maximum(i1 - i0 + 1, 0)
+    columns = num.maximum(j1 - j0 + 1, 0)
+    counts = rows*columns
+
+    total = num.zeros(M, num.float)
+    number = num.zeros(M, num.int64)
+
+    if num.sum(counts) > 0:
+        nonempty = counts > 0
+        Z = grid.read_block(i0[nonempty].min(), i1[nonempty].max() + 1,
+                            j0[nonempty].min(), j1[nonempty].max() + 1)
+        ib = i0[nonempty].min()
+        jb = j0[nonempty].min()
+
+        # Orientation of each triangle
+        area = ((u[:,1] - u[:,0])*(v[:,2] - v[:,0]) -
+                (u[:,2] - u[:,0])*(v[:,1] - v[:,0]))
+        sign = num.where(area < 0, -1.0, 1.0)
+        tolerance = 1.0e-12*num.abs(area)
+
+        # Expand the bounding boxes into grid points, in chunks of at most
+        # max_candidates points
+        ends = num.cumsum(counts)
+        start = 0
+        while start < M:
+            offset = ends[start] - counts[start]
+            stop = max(num.searchsorted(ends, offset + max_candidates,
+                                        side='right'), start + 1)
+            stop = min(stop, M)
+
+            k = num.repeat(num.arange(start, stop), counts[start:stop])
+            local = num.arange(len(k)) - (ends[k] - counts[k] - offset)
+            i = i0[k] + local // columns[k]
+            j = j0[k] + local % columns[k]
+
+            # Grid points on the inner side of all three sides
+            inside = num.ones(len(k), num.bool)
+            for a, b in [(0, 1), (1, 2), (2, 0)]:
+                cross = ((u[k,b] - u[k,a])*(i - v[k,a]) -
+                         (v[k,b] - v[k,a])*(j - u[k,a]))
+                inside &= sign[k]*cross >= -tolerance[k]
+
+            z = Z[i - ib, j - jb]
+            inside &= ~num.isnan(z)
+            total += num.bincount(k[inside], weights=z[inside], minlength=M)
+            number += num.bincount(k[inside], minlength=M)
+
+            start = stop
+
+    result = num.empty(M, num.float)
+    found = number > 0
+    result[found] = total[found]/number[found]
+
+    # Small triangles take the value at their centroid
+    if not num.all(found):
+        missing = ~found
+        result[missing] = _sample_tile(grid,
+                                       num.mean(u[missing], axis=1),
+                                       num.mean(v[missing], axis=1),
+                                       'bilinear')
+
+    return result
@@ -526,10 +526,51 @@ class Test_Fit(unittest.TestCase):
         assert num.allclose(f, answer)
         os.remove(fileName)
 
+    def test_fit_to_mesh_processes(self):
+        """Blocks of points shared between processes give the same
+        fit as when done one after the other
+        """
 
+        a = [-1.0, 0.0]
+        b = [3.0, 4.0]
+        c = [4.0,1.0]
+        d = [-3.0, 2.0] #3
+        e = [-1.0,-2.0]
+        f = [1.0, -2.0] #5
 
+        vertices = [a, b, c, d,e,f]
+        triangles = [[0,1,3], [1,0,2], [0,4,5], [0,5,2]] #abd bac aef afc
+
+        points = [[-2.0, 2.0], [-1.0, 1.0], [0.0, 2.0], [1.0, 1.0],
+                  [2.0, 1.0], [0.0, 0.0], [1.0, 0.0], [0.0, -1.0],
+                  [-0.2, -0.5], [-0.9, -1.5], [0.5, -1.9], [3.0, 1.0]]
+        z = linear_function(points)
+        answer = linear_function(vertices)
+
+        # Points in memory, 2 attributes
+        z2 = num.array([z, 10*z]).transpose()
+        f = fit_to_mesh(points, vertices, triangles,
+                        point_attributes=z2, alpha=0.0, processes=2)
+        assert num.allclose(f[:,0], answer)
+        assert num.allclose(f[:,1], 10*answer)
+
+        # Blocks read from a file
+        fileName = tempfile.mktemp(".csv")
+        Geospatial_data(points, z).export_points_file(fileName)
+
+        f1 = fit_to_mesh(fileName, vertices, triangles,
+                         alpha=0.0, max_read_lines=5)
+        f = fit_to_mesh(fileName, vertices, triangles,
+                        alpha=0.0, max_read_lines=5, processes=2)
+        assert num.allclose(f, answer)
+        assert num.allclose(f, f1, rtol=0.0, atol=1.0e-14)
+        os.remove(fileName)
+
+        # No points, as when done one after the other
+        f = fit_to_mesh(num.zeros((0, 2)), vertices, triangles,
+                        point_attributes=num.zeros(0), alpha=0.1, processes=2)
+        assert num.allclose(f, 0.0)
 
-        
     def test_fit_and_interpolation(self):
 
         a = [0.0, 0.0]
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+import tempfile
+import unittest
+import shutil
+import os
+
+import numpy as num
+
+from anuga.fit_interpolate.raster_sampling import Raster_grid, open_raster, \
+     sample_raster
+from anuga.fit_interpolate.interpolate2d import interpolate_raster
+from anuga.file_conversion.asc2ers import asc2ers
+from anuga.file_conversion.asc2dem import asc2dem
+from anuga.file_conversion.grd2array import grd2array
+from anuga.anuga_exceptions import ANUGAError
+
+
+def write_asc(filename, Z, xllcorner, yllcorner, cellsize,
+              NODATA_value=-9999, values_per_line=None):
+    """Write rows of Z (north to south) as ESRI ASCII grid with .prj file"""
+
+    fid = open(filename, 'w')
+    fid.write('ncols %d\n' % Z.shape[1])
+    fid.write('nrows %d\n' % Z.shape[0])
+    fid.write('xllcorner %s\n' % repr(xllcorner))
+    fid.write('yllcorner %s\n' % repr(yllcorner))
+    fid.write('cellsize %s\n' % repr(cellsize))
+    fid.write('NODATA_value %d\n' % NODATA_value)
+    if values_per_line is None:
+        values_per_line = Z.shape[1]
+    values = Z.reshape(-1)
+    for k in range(0, len(values), values_per_line):
+        fid.write(' '.join(['%g' % z for z in values[k:k+values_per_line]]))
+        fid.write('\n')
+    fid.close()
+
+    fid = open(filename[:-4] + '.prj', 'w')
+    fid.write("""Projection UTM
+Zone 56
+Datum WGS84
+Zunits NO
+Units METERS
+Spheroid WGS84
+Xshift 0.0000000000
+Yshift 10000000.0000000000
+Parameters
+""")
+    fid.close()
+
+
+class Test_raster_sampling(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp('_raster')
+
+        num.random.seed(17)
+        self.Z = num.round(100*num.random.rand(60, 80))
+        self.Z[5, 7] = -9999
+        self.x = 1000.0 + 2.0*num.arange(80)
+        self.y = 5000.0 + 2.0*num.arange(60)
+
+        self.points = (num.random.rand(2000, 2)*[170.0, 130.0] +
+                       [995.0, 4995.0])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def test_same_as_interpolate_raster(self):
+
+        Z = num.where(self.Z == -9999, num.nan, self.Z)
+        grid = Raster_grid(self.Z, 1000.0, 5000.0, 2.0, NODATA_value=-9999)
+
+        for mode, other in [('bilinear', 'linear'), ('pixel', 'constant')]:
+            expected = interpolate_raster(self.x, self.y, Z, self.points,
+                                          mode=other)
+
+            for tile_size, threads in [(None, 1), (7, 1), (16, 3)]:
+                values = sample_raster(grid, self.points, mode=mode,
+                                       tile_size=tile_size, threads=threads)
+
+                inside = ~num.isnan(expected)
+                assert num.allclose(values[inside], expected[inside])
+
+                # Pixel also covers half a cell around the outer grid points
+                if mode == 'bilinear':
+                    assert num.alltrue(num.isnan(values) ==
+                                       num.isnan(expected))
+
+
+    def test_pixel(self):
+
+        grid = Raster_grid(num.array([[1.0, 2.0], [3.0, 4.0]]), 0.0, 0.0, 1.0)
+        values = sample_raster(grid, [[-0.4, -0.4], [0.6, 0.2], [0.2, 0.7],
+                                      [1.4, 1.4], [1.6, 0.0], [0.0, -0.6]],
+                               mode='pixel')
+
+        assert num.allclose(values[:4], [3.0, 4.0, 1.0, 2.0])
+        assert num.alltrue(num.isnan(values[4:]))
+
+        try:
+            sample_raster(grid, [[1.6, 0.0]], mode='pixel', bounds_error=True)
+        except ANUGAError:
+            pass
+        else:
+            raise Exception('Point outside grid not caught')
+
+
+    def test_average(self):
+
+        # Linear function, so the average is the value at the centroid
+        i, j = num.mgrid[0:40, 0:50]
+        Z = (10.0 + 2.0*j + 3.0*i)[::-1]
+        grid = Raster_grid(Z, 100.0, 200.0, 0.5)
+
+        triangles = num.array([[[101, 201], [110, 201], [101, 210]],
+                               [[110, 201], [110, 210], [101, 210]],
+                               [[105.1, 205.1], [105.3, 205.1],
+                                [105.1, 205.3]],
+                               [[101, 201], [101, 210], [110, 201]],
+                               [[101, 201], [130, 201], [101, 210]]])
+        centroids = num.mean(triangles, axis=1)
+        expected = (10.0 + 2.0*(centroids[:,0] - 100)/0.5 +
+                    3.0*(centroids[:,1] - 200)/0.5)
+
+        for tile_size in [None, 4]:
+            values = sample_raster(grid, triangles.reshape(-1, 2),
+                                   mode='average', tile_size=tile_size,
+                                   threads=2)
+
+            assert num.allclose(values[:4], expected[:4], rtol=0.01)
+            # Clockwise triangles are the same
+            assert num.allclose(values[3], values[0])
+            # Only the grid points inside the grid are averaged
+            assert values[4] < expected[4]
+
+        # No data values are ignored
+        Z[Z == 10.0 + 2.0*10 + 3.0*10] = -9999
+        grid = Raster_grid(Z, 100.0, 200.0, 0.5, NODATA_value=-9999)
+        values = sample_raster(grid, triangles[:1].reshape(-1, 2),
+                               mode='average')
+        assert num.allclose(values, expected[:1], rtol=0.01)
+        assert not num.isnan(values[0])
+
+
+    def test_asc2ers(self):
+
+        filename = os.path.join(self.dir, 'grid.asc')
+        write_asc(filename, self.Z, 1000.0, 5000.0, 2.0, values_per_line=13)
+
+        header = asc2ers(filename, block_lines=7)
+        assert header == os.path.join(self.dir, 'grid.ers')
+
+        grid = open_raster(header)
+        assert grid.nrows == 60 and grid.ncols == 80
+        assert num.allclose(grid.get_extent(), [1000.0, 1158.0,
+                                                5000.0, 5118.0])
+
+        Z = grid.read_block(0, 60, 0, 80)
+        assert num.isnan(Z[54, 7])
+        Z[54, 7] = -9999
+        assert num.allclose(Z[::-1], self.Z)
+
+        # Same as the ASCII grid, written one row per line for grd2array
+        filename = os.path.join(self.dir, 'rows.asc')
+        write_asc(filename, self.Z, 1000.0, 5000.0, 2.0)
+        x, y, Z = grd2array(filename)
+        assert num.allclose(grid.read_block(10, 20, 30, 45),
+                            Z[30:45, 10:20].T)
+
+
+    def test_open_raster(self):
+
+        filename = os.path.join(self.dir, 'grid.asc')
+        write_asc(filename, self.Z, 1000.0, 5000.0, 2.0)
+        asc2dem(filename, name_out=os.path.join(self.dir, 'grid'))
+
+        expected = sample_raster(Raster_grid(self.Z, 1000.0, 5000.0, 2.0,
+                                             NODATA_value=-9999),
+                                 self.points)
+
+        # The ASCII grid is converted to ERMapper on first use
+        assert not os.path.exists(os.path.join(self.dir, 'grid.ers'))
+        for name in ['grid.asc', 'grid.ers', 'grid', 'grid.dem']:
+            values = sample_raster(os.path.join(self.dir, name),
+                                   self.points, tile_size=10, threads=2)
+            assert num.alltrue(num.isnan(values) == num.isnan(expected))
+            inside = ~num.isnan(expected)
+            assert num.allclose(values[inside], expected[inside])
+        assert os.path.exists(os.path.join(self.dir, 'grid.ers'))
+
+        try:
+            open_raster(os.path.join(self.dir, 'grid.prj'))
+        except IOError:
+            pass
+        else:
+            raise Exception('Unknown grid format not caught')
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_raster_sampling, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -3,6 +3,8 @@
 Manipulation of locations on the planet and associated attributes.
 """
 
+import sys
+import threading
 from sys import maxint
 from os import access, F_OK, R_OK,remove
 from types import DictType
@@ -51,7 +53,7 @@ class Geospatial_data:
 
         data_points: x,y coordinates in meters. Type must be either a
         sequence of 2-tuples or an Mx2 numeric array of floats.  A file name
-        with extension .txt, .cvs or .pts can also be passed in here.
+        with extension .txt, .cvs, .pts or .bpt can also be passed in here.
 
         attributes: Associated values for each data point. The type
         must be either a list or an array of length M or a dictionary
@@ -85,6 +87,8 @@ class Geospatial_data:
         have dimensions "points" etc.
         .txt file is a comma seperated file with x, y and attribute
         data.
+        .bpt file is a binary points file (see _write_binary_points_file)
+        which is memory mapped, so that reading it does not copy the data.
 
         The first line has the titles of the columns.  The first two
         column titles are checked to see if they start with lat or
@@ -460,7 +464,7 @@ class Geospatial_data:
 ################################################################################
 
     def import_points_file(self, file_name, delimiter=None, verbose=False):
-        """ load an .txt, .csv or .pts file
+        """ load an .txt, .csv, .pts or .bpt file
 
         Note: will throw an IOError/SyntaxError if it can't load the file.
         Catch these!
@@ -480,6 +484,9 @@ class Geospatial_data:
             except IOError, e:
                 msg = 'Could not open file %s ' % file_name
                 raise IOError(msg)
+        elif file_name[-4:] == ".bpt":
+            data_points, attributes, geo_reference = \
+                         _read_binary_points_file(file_name, verbose)
         elif file_name[-4:] == ".txt" or file_name[-4:]== ".csv":
             try:
                 data_points, attributes, geo_reference = \
@@ -504,7 +511,8 @@ class Geospatial_data:
 
     def export_points_file(self, file_name, absolute=True,
                            as_lat_long=False, isSouthHemisphere=True):
-        """write a points file as a text (.csv) or binary (.pts) file
+        """write a points file as a text (.csv), NetCDF (.pts) or binary
+        (.bpt) file
 
         file_name is the file name, including the extension
         The point_dict is defined at the top of this file.
@@ -520,20 +528,25 @@ class Geospatial_data:
         longs valid for the Northern Hemisphere.
         """
 
-        if (file_name[-4:] == ".pts"):
+        if (file_name[-4:] == ".pts" or file_name[-4:] == ".bpt"):
+            if file_name[-4:] == ".pts":
+                write_points_file = _write_pts_file
+            else:
+                write_points_file = _write_binary_points_file
+
             if absolute is True:
                 geo_ref = deepcopy(self.geo_reference)
                 geo_ref.xllcorner = 0
                 geo_ref.yllcorner = 0
-                _write_pts_file(file_name,
-                                self.get_data_points(absolute),
-                                self.get_all_attributes(),
-                                geo_ref)
+                write_points_file(file_name,
+                                  self.get_data_points(absolute),
+                                  self.get_all_attributes(),
+                                  geo_ref)
             else:
-                _write_pts_file(file_name,
-                                self.get_data_points(absolute),
-                                self.get_all_attributes(),
-                                self.get_geo_reference())
+                write_points_file(file_name,
+                                  self.get_data_points(absolute),
+                                  self.get_all_attributes(),
+                                  self.get_geo_reference())
         elif file_name[-4:] == ".txt" or file_name[-4:] == ".csv":
             msg = "ERROR: trying to write a .txt file with relative data."
             assert absolute, msg
@@ -685,13 +698,16 @@ class Geospatial_data:
         if self.max_read_lines is None:
             self.max_read_lines = int(MAX_READ_LINES)
 
-        if self.file_name[-4:] == ".pts":
+        if self.file_name[-4:] == ".pts" or self.file_name[-4:] == ".bpt":
             # See if the file is there.  Throw a QUIET IO error if it isn't
             fd = open(self.file_name,'r')
             fd.close()
 
-            # Throws prints to screen if file not present
-            self.fid = NetCDFFile(self.file_name, netcdf_mode_r)
+            # Blocks are slices of the memory mapped file
+            if self.file_name[-4:] == ".pts":
+                self.fid = _open_pts_file(self.file_name)
+            else:
+                self.fid = _Binary_points_file(self.file_name)
 
             (self.blocking_georef,
              self.blocking_keys,
@@ -718,12 +734,55 @@ class Geospatial_data:
             self.header, self.file_pointer = _read_csv_file_header(file_pointer)
             self.blocking_georef = None # Used for reconciling zones
 
+            # Parse the first block while the caller gets ready
+            self._start_prefetch()
+
         return self
 
+    def _start_prefetch(self):
+        """Start a thread reading the next block of a csv file"""
+
+        self.prefetch_result = None
+        self.prefetch_thread = threading.Thread(target=self._prefetch,
+                                                name='Prefetch %s'
+                                                % self.file_name)
+        self.prefetch_thread.daemon = True
+        self.prefetch_thread.start()
+
+    def _prefetch(self):
+        """Prefetch thread: read the next block of a csv file"""
+
+        try:
+            block = _read_csv_file_blocking(self.file_pointer,
+                                            self.header[:],
+                                            max_read_lines=self.max_read_lines,
+                                            verbose=self.verbose)
+            self.prefetch_result = (block, None)
+        except:
+            self.prefetch_result = (None, sys.exc_info())
+
+    def _next_csv_block(self):
+        """Return the prefetched block of a csv file and start reading
+        the next one. Errors raised while prefetching are re-raised here.
+        """
+
+        self.prefetch_thread.join()
+        block, error = self.prefetch_result
+        self.prefetch_thread = None
+        self.prefetch_result = None
+
+        if error is not None:
+            error_type, error_value, error_traceback = error
+            raise error_type, error_value, error_traceback
+
+        self._start_prefetch()
+
+        return block
+
     def next(self):
         """read a block, instanciate a new geospatial and return it"""
 
-        if self.file_name[-4:] == ".pts":
+        if self.file_name[-4:] == ".pts" or self.file_name[-4:] == ".bpt":
             if self.start_row == self.last_row:
                 # Read the end of the file last iteration
                 # Remove blocking attributes
@@ -767,12 +826,7 @@ class Geospatial_data:
                 (pointlist,
                  att_dict,
                  geo_ref,
-                 self.file_pointer) = _read_csv_file_blocking(self.file_pointer,
-                                                              self.header[:],
-                                                              max_read_lines=
-                                                           self.max_read_lines,
-                                                              verbose=
-                                                                  self.verbose)
+                 self.file_pointer) = self._next_csv_block()
 
                 # Check that the zones haven't changed.
                 if geo_ref is not None:
@@ -877,9 +931,9 @@ def _read_pts_file(file_name, verbose=False):
     fd.close()
 
     # Throws prints to screen if file not present
-    fid = NetCDFFile(file_name, netcdf_mode_r)
+    fid = _open_pts_file(file_name)
 
-    pointlist = fid.variables['points'][:]
+    pointlist = num.array(fid.variables['points'][:], num.float)
     keys = fid.variables.keys()
 
     if verbose: log.critical('Geospatial_data: Got %d variables: %s' % (len(keys), keys))
@@ -896,7 +950,137 @@ def _read_pts_file(file_name, verbose=False):
         if verbose: log.critical("Geospatial_data: Reading attribute '%s'" % key)
 
         if not (key == 'points'):
-            attributes[key] = fid.variables[key][:]
+            attributes[key] = num.array(fid.variables[key][:], num.float)
+
+    try:
+        geo_reference = Geo_reference(NetCDFObject=fid)
+    except AttributeError, e:
+        geo_reference = None
+
+    fid.close()
+
+    if verbose: log.critical("Geospatial_data: %g data points" % len(pointlist))
+
+    return pointlist, attributes, geo_reference
+
+
+def _open_pts_file(file_name):
+    """Open .pts NetCDF file for reading.
+
+    NetCDF classic and 64 bit offset files are memory mapped with scipy
+    if available, so that slicing a variable only reads that part of the
+    file. The values are big endian and are converted to native floats
+    when a block is read (see _read_pts_file_blocking).
+    """
+
+    try:
+        from scipy.io.netcdf import netcdf_file
+    except ImportError:
+        return NetCDFFile(file_name, netcdf_mode_r)
+
+    try:
+        return netcdf_file(file_name, 'r', mmap=True)
+    except (TypeError, ValueError):
+        # Not a NetCDF 3 file, e.g. NetCDF 4 (HDF5)
+        return NetCDFFile(file_name, netcdf_mode_r)
+
+
+BINARY_POINTS_TITLE = 'ANUGA binary points file'
+BINARY_POINTS_ALIGNMENT = 16
+
+class _Binary_points_file:
+    """Memory mapped .bpt binary points file.
+
+    The file is a text header followed by the data as little endian
+    float64 values: the points (number_of_points x 2) followed by each
+    attribute in turn (number_of_points values each).  The header is
+
+        ANUGA binary points file
+        number_of_points <N>
+        attributes <comma separated attribute names>
+        <georeference attribute> <value>
+        ...
+        end_header
+
+    padded with spaces so that the data starts at a multiple of
+    BINARY_POINTS_ALIGNMENT bytes.
+
+    Like a NetCDF file object the points and attributes are available in
+    variables, the number of points in dimensions and the georeference as
+    attributes, so .pts and .bpt files are read in the same way. The
+    variables are views of the file, so reading them does not copy the
+    data.  Arrays are mapped copy-on-write: changes are never written to
+    the file.
+    """
+
+    def __init__(self, file_name):
+
+        fd = open(file_name, 'rb')
+        try:
+            title = fd.readline().strip()
+            if title != BINARY_POINTS_TITLE:
+                msg = ('File %s is not a binary points file. Expected '
+                       'title "%s", got "%s"'
+                       % (file_name, BINARY_POINTS_TITLE, title))
+                raise IOError(msg)
+
+            header = {}
+            while True:
+                line = fd.readline()
+                if line == '':
+                    msg = 'Unexpected end of header in file %s' % file_name
+                    raise IOError(msg)
+                line = line.strip()
+                if line == 'end_header':
+                    break
+                key, _, value = line.partition(' ')
+                header[key] = value
+
+            offset = fd.tell()
+        finally:
+            fd.close()
+
+        offset = -(-offset//BINARY_POINTS_ALIGNMENT)*BINARY_POINTS_ALIGNMENT
+
+        number_of_points = int(header.pop('number_of_points'))
+        keys = [key for key in header.pop('attributes').split(',') if key]
+
+        # Remaining entries are the georeference
+        for key, value in header.items():
+            setattr(self, key, value)
+
+        self.dimensions = {'number_of_points': number_of_points}
+
+        N = number_of_points
+        if N > 0:
+            values = num.memmap(file_name, dtype='<f8', mode='c',
+                                offset=offset, shape=((len(keys)+2)*N,))
+        else:
+            values = num.zeros(0, num.float)
+
+        self.variables = {'points': values[:2*N].reshape(N, 2)}
+        for i, key in enumerate(keys):
+            self.variables[key] = values[(i+2)*N:(i+3)*N]
+
+    def close(self):
+        """Release the memory map once all views of it are gone"""
+
+        self.variables = {}
+
+
+def _read_binary_points_file(file_name, verbose=False):
+    """Read .bpt binary points file
+
+    Return (pointlist, dict_attribute, geo_ref) like _read_pts_file.
+    The arrays are views of the memory mapped file.
+    """
+
+    if verbose: log.critical('Geospatial_data: Reading %s' % file_name)
+
+    fid = _Binary_points_file(file_name)
+
+    attributes = fid.variables.copy()
+    pointlist = attributes.pop('points')
 
     try:
         geo_reference = Geo_reference(NetCDFObject=fid)
@@ -960,11 +1144,11 @@ def _read_csv_file_blocking(file_pointer,
                             verbose=False):
     """Read the body of a .csv file.
     header: The list header of the csv file, with the x and y labels.
-    """
 
-    points = []
-    pointattributes = []
-    att_dict = {}
+    Up to max_read_lines lines are read and parsed by numpy in one go.
+    Blocks with comments, blank lines or anything but numbers are parsed
+    line by line instead (see _parse_csv_lines).
+    """
 
     # This is to remove the x and y headers.
     header = header[:]
@@ -976,11 +1160,137 @@ def _read_csv_file_blocking(file_pointer,
         # eg if it is a space seperated file
         raise SyntaxError
 
+    if max_read_lines >= maxint:
+        lines = file_pointer.readlines()
+    else:
+        readline = file_pointer.readline
+        lines = []
+        for i in xrange(int(max_read_lines)):
+            line = readline()
+            if line == '':
+                break
+            lines.append(line)
+
+    values = _parse_csv_block(lines, len(header) + 2, delimiter)
+
+    if values is not None:
+        if len(values) == 0:
+            raise StopIteration
+
+        pointlist = num.array(values[:,:2])
+        att_dict = {}
+        for i, key in enumerate(header):
+            att_dict[key] = num.array(values[:,i+2])
+    else:
+        pointlist, att_dict = _parse_csv_lines(file_pointer, lines, header,
+                                               delimiter, max_read_lines)
+
+    # Do stuff here so the info is in lat's and longs
+    geo_ref = None
+    x_header = lower(x_header[:3])
+    y_header = lower(y_header[:3])
+    if (x_header == 'lon' or  x_header == 'lat') \
+       and (y_header == 'lon' or  y_header == 'lat'):
+        if x_header == 'lon':
+            longitudes = num.ravel(pointlist[:,0:1])
+            latitudes = num.ravel(pointlist[:,1:])
+        else:
+            latitudes = num.ravel(pointlist[:,0:1])
+            longitudes = num.ravel(pointlist[:,1:])
+
+        pointlist, geo_ref = _set_using_lat_long(latitudes,
+                                                 longitudes,
+                                                 geo_reference=None,
+                                                 data_points=None,
+                                                 points_are_lats_longs=False)
+
+    return pointlist, att_dict, geo_ref, file_pointer
+
+
+def _parse_csv_block(lines, number_of_columns, delimiter=CSV_DELIMITER):
+    """Parse lines of number_of_columns numbers separated by delimiter.
+
+    Return a len(lines) x number_of_columns array or None if the lines
+    are not all plain numbers, e.g. comments, blank lines, empty fields,
+    nan or a wrong number of fields, in which case the lines are parsed
+    one by one by _parse_csv_lines.
+    """
+
+    if len(delimiter) != 1:
+        return None
+
+    text = ''.join(lines)
+    if text == '':
+        return num.zeros((0, number_of_columns), num.float)
+    chars = num.frombuffer(text, num.uint8)
+
+    # Ignore white space around the numbers
+    white_space = num.zeros(256, num.bool)
+    white_space[[ord(c) for c in ' \t\r']] = True
+    chars = chars[~white_space[chars]]
+    if len(chars) == 0:
+        return num.zeros((0, number_of_columns), num.float)
+
+    delimiters = (chars == ord(delimiter))
+    newlines = (chars == ord('\n'))
+
+    allowed = num.zeros(256, num.bool)
+    allowed[[ord(c) for c in '0123456789.eE+-\n' + delimiter]] = True
+    if not num.alltrue(allowed[chars]):
+        return None
+
+    # Empty fields or lines
+    separators = delimiters | newlines
+    if (separators[0] or delimiters[-1]
+        or num.sometrue(separators[1:] & separators[:-1])):
+        return None
+
+    # Number of delimiters on each line
+    line_ends = num.flatnonzero(newlines)
+    if not newlines[-1]:
+        line_ends = num.append(line_ends, len(chars) - 1)
+    if len(line_ends) != len(lines):
+        return None
+
+    delimiter_count = num.cumsum(delimiters)[line_ends]
+    delimiter_count[1:] -= delimiter_count[:-1].copy()
+    if not num.alltrue(delimiter_count == number_of_columns - 1):
+        return None
+
+    values = num.fromstring(text.replace('\n', delimiter), sep=delimiter)
+    if len(values) != len(lines)*number_of_columns:
+        return None
+
+    return values.reshape(len(lines), number_of_columns)
+
+
+def _parse_csv_lines(file_pointer, lines, header, delimiter=CSV_DELIMITER,
+                     max_read_lines=MAX_READ_LINES):
+    """Parse lines of a .csv file one by one.
+
+    header: The attribute names of the csv file.
+
+    Comment lines don't count as read lines, so more lines may be read
+    from file_pointer. A line with less than two fields ends the block;
+    the lines after it are returned to file_pointer for the next block.
+    """
+
+    points = []
+    att_dict = {}
+
+    lines = iter(lines)
     read_lines = 0
     while read_lines < max_read_lines:
-        line = file_pointer.readline()
+        line = next(lines, None)
+        if line is None:
+            line = file_pointer.readline()
+
         numbers = clean_line(line, delimiter)
         if len(numbers) <= 1:
+            # Unread the remaining lines
+            unread = sum([len(rest) for rest in lines])
+            if unread > 0:
+                file_pointer.seek(-unread, 1)
             break
         if line[0] == '#':
             continue
@@ -1012,26 +1322,7 @@ def _read_csv_file_blocking(file_pointer,
     for key in att_dict.keys():
         att_dict[key] = num.array(att_dict[key], num.float)
 
-    # Do stuff here so the info is in lat's and longs
-    geo_ref = None
-    x_header = lower(x_header[:3])
-    y_header = lower(y_header[:3])
-    if (x_header == 'lon' or  x_header == 'lat') \
-       and (y_header == 'lon' or  y_header == 'lat'):
-        if x_header == 'lon':
-            longitudes = num.ravel(pointlist[:,0:1])
-            latitudes = num.ravel(pointlist[:,1:])
-        else:
-            latitudes = num.ravel(pointlist[:,0:1])
-            longitudes = num.ravel(pointlist[:,1:])
-
-        pointlist, geo_ref = _set_using_lat_long(latitudes,
-                                                 longitudes,
-                                                 geo_reference=None,
-                                                 data_points=None,
-                                                 points_are_lats_longs=False)
-
-    return pointlist, att_dict, geo_ref, file_pointer
+    return pointlist, att_dict
 
 
 def _read_pts_file_header(fid, verbose=False):
@@ -1061,13 +1352,18 @@ def _read_pts_file_header(fid, verbose=False):
 
 
 def _read_pts_file_blocking(fid, start_row, fin_row, keys):
-    '''Read the body of a .pts file.'''
+    '''Read the body of a .pts or .bpt file.
 
-    pointlist = num.array(fid.variables['points'][start_row:fin_row])
+    Values are only copied if they are not native floats.
+    '''
+
+    pointlist = num.asarray(fid.variables['points'][start_row:fin_row],
+                            num.float)
 
     attributes = {}
     for key in keys:
-        attributes[key] = num.array(fid.variables[key][start_row:fin_row])
+        attributes[key] = num.asarray(fid.variables[key][start_row:fin_row],
+                                      num.float)
 
     return pointlist, attributes
 
@@ -1124,6 +1420,58 @@ def _write_pts_file(file_name,
     outfile.close()
 
 
+def _write_binary_points_file(file_name,
+                              write_data_points,
+                              write_attributes=None,
+                              write_geo_reference=None):
+    """Write .bpt binary points file
+
+    See _Binary_points_file for the format.
+    """
+
+    points = num.asarray(write_data_points, '<f8')
+    number_of_points = points.shape[0]
+
+    if write_attributes is None:
+        write_attributes = {}
+    keys = write_attributes.keys()
+
+    for key in keys:
+        msg = 'Attribute name %s can not contain commas or spaces' % key
+        assert ',' not in key and len(key.split()) == 1, msg
+
+    header = [BINARY_POINTS_TITLE,
+              'number_of_points %d' % number_of_points,
+              'attributes %s' % ','.join(keys)]
+
+    if write_geo_reference is not None:
+        # Georeference attributes as they would be stored in NetCDF
+        class Georeference_attributes: pass
+        georef = Georeference_attributes()
+        write_geo_reference = ensure_geo_reference(write_geo_reference)
+        write_geo_reference.write_NetCDF(georef)
+        for key in sorted(georef.__dict__.keys()):
+            value = georef.__dict__[key]
+            if isinstance(value, float):
+                value = repr(value)
+            header.append('%s %s' % (key, value))
+
+    header.append('end_header')
+    header = '\n'.join(header) + '\n'
+    padding = -len(header) % BINARY_POINTS_ALIGNMENT
+
+    fd = open(file_name, 'wb')
+    fd.write(header + ' '*padding)
+    points.tofile(fd)
+    for key in keys:
+        values = num.asarray(write_attributes[key], '<f8')
+        msg = ('Attribute %s has %d values, expected %d'
+               % (key, len(values), number_of_points))
+        assert len(values) == number_of_points, msg
+        values.tofile(fd)
+    fd.close()
+
+
 def _write_csv_file(file_name,
                     write_data_points,
                     write_attributes=None,
@@ -1843,6 +1843,90 @@ class Test_Geospatial_data(unittest.TestCase):
         else:
             self.fail('Error not thrown error!')
 
+    def test_load_bpt(self):
+        """Binary points files are read as views of the memory mapped file
+        """
+
+        points = [[1.0, 2.1], [3.0, 5.3], [-1.0, 4.0], [2.4, 3.3]]
+        attributes = {'elevation': [2.0, 4.0, 6.0, 8.0],
+                      'friction': [0.01, 0.02, 0.03, 0.04]}
+        G = Geospatial_data(points, attributes,
+                            geo_reference=Geo_reference(56, 100.5, 200.25))
+
+        FN = tempfile.mktemp('.bpt')
+        G.export_points_file(FN, absolute=False)
+
+        G1 = Geospatial_data(FN)
+        assert num.allclose(G1.get_data_points(absolute=False), points)
+        assert num.allclose(G1.get_attributes('friction'),
+                            attributes['friction'])
+        assert G1.get_geo_reference() == G.get_geo_reference()
+        assert not G1.get_data_points(absolute=False).flags.owndata
+
+        # Blocking
+        G2 = Geospatial_data(FN, max_read_lines=3, load_file_now=False)
+        blocks = [block for block in G2]
+        assert [len(block) for block in blocks] == [3, 1]
+        assert num.allclose(blocks[1].get_data_points(absolute=True),
+                            [[102.9, 203.55]])
+        assert num.allclose(blocks[0].get_attributes('elevation'),
+                            [2.0, 4.0, 6.0])
+
+        # Absolute values
+        G.export_points_file(FN)
+        G3 = Geospatial_data(FN)
+        assert num.allclose(G3.get_data_points(absolute=False),
+                            G.get_data_points(absolute=True))
+
+        os.remove(FN)
+
+    def test_parse_csv_block(self):
+        """Lines are parsed in bulk unless they are not plain numbers
+        """
+
+        from anuga.geospatial_data.geospatial_data import _parse_csv_block
+
+        values = _parse_csv_block(['1.0, 0.0 ,10.4\r\n', '-2e3,3,4'], 3)
+        assert num.allclose(values, [[1.0, 0.0, 10.4], [-2000.0, 3.0, 4.0]])
+
+        assert _parse_csv_block([], 3).shape == (0, 3)
+        for lines in [['1,2,3\n', '# comment\n'],
+                      ['1,2,3\n', '\n', '4,5,6\n'],
+                      ['1,2, ,3\n'],
+                      ['1,2\n', '3,4,5,6\n'],
+                      ['1,2,3,\n'],
+                      ['1,2,nan\n'],
+                      ['1.0.0,2,3\n']]:
+            assert _parse_csv_block(lines, 3) is None, lines
+
+    def test_load_csv_blocking_line_by_line(self):
+        """Blocks with comments and blank lines are parsed line by line:
+        comments don't count as lines and a blank line ends the block
+        """
+
+        fileName = tempfile.mktemp('.csv')
+        file = open(fileName, 'w')
+        file.write('x,y,elevation\n\
+1.0,0.0,10.0\n\
+# comment, ignored\n\
+0.0,1.0,0.0\n\
+1.0,0.0,10.4\n\
+2.0,2.0,5.0\n\
+\n\
+3.0,3.0,6.0\n\
+4.0,4.0,7.0\n\
+5.0,5.0,8.0\n')
+        file.close()
+
+        G = Geospatial_data(fileName, max_read_lines=3, load_file_now=False)
+        blocks = [block.get_attributes() for block in G]
+        os.remove(fileName)
+
+        assert len(blocks) == 3
+        assert num.allclose(blocks[0], [10.0, 0.0, 10.4])
+        assert num.allclose(blocks[1], [5.0])
+        assert num.allclose(blocks[2], [6.0, 7.0, 8.0])
+
 ################################################################################
 
 if __name__ == "__main__":
@@ -390,6 +390,8 @@ def _write_ASCII_triangulation(fd, gen_dict):
 
     triangles = gen_dict['triangles']
     triangles_attributes = gen_dict['triangle_tags']
+    if isinstance(triangles_attributes, num.ndarray):
+        triangles_attributes = triangles_attributes.tolist()
     triangle_neighbors = gen_dict['triangle_neighbors']
 
     segments = gen_dict['segments']
@@ -596,7 +598,7 @@ def _write_msh_file(file_name, mesh):
     #the triangulation
     mesh['vertices'] = num.array(mesh['vertices'], num.float)
     mesh['vertex_attribute_titles'] = \
-        num.array(string_to_char(mesh['vertex_attribute_titles']), num.character)
+        _tags_to_char(mesh['vertex_attribute_titles'])
 
     num_attributes = len(mesh['vertex_attribute_titles'])
     num_vertices = mesh['vertices'].shape[0]
@@ -612,11 +614,9 @@ def _write_msh_file(file_name, mesh):
 
 
     mesh['segments'] = num.array(mesh['segments'], IntType)
-    mesh['segment_tags'] = num.array(string_to_char(mesh['segment_tags']),
-                                     num.character)
+    mesh['segment_tags'] = _tags_to_char(mesh['segment_tags'])
     mesh['triangles'] = num.array(mesh['triangles'], IntType)
-    mesh['triangle_tags'] = num.array(string_to_char(mesh['triangle_tags']),
-                                      num.character)
+    mesh['triangle_tags'] = _tags_to_char(mesh['triangle_tags'])
     mesh['triangle_neighbors'] = \
         num.array(mesh['triangle_neighbors'], IntType)
 
@@ -624,11 +624,10 @@ def _write_msh_file(file_name, mesh):
     mesh['points'] = num.array(mesh['points'], num.float)
     mesh['point_attributes'] = num.array(mesh['point_attributes'], num.float)
     mesh['outline_segments'] = num.array(mesh['outline_segments'], IntType)
-    mesh['outline_segment_tags'] = \
-        num.array(string_to_char(mesh['outline_segment_tags']), num.character)
+    mesh['outline_segment_tags'] = _tags_to_char(mesh['outline_segment_tags'])
     mesh['holes'] = num.array(mesh['holes'], num.float)
     mesh['regions'] = num.array(mesh['regions'], num.float)
-    mesh['region_tags'] = num.array(string_to_char(mesh['region_tags']), num.character)
+    mesh['region_tags'] = _tags_to_char(mesh['region_tags'])
     mesh['region_max_areas'] = num.array(mesh['region_max_areas'], num.float)
 
     # NetCDF file definition
@@ -803,7 +802,7 @@ def _read_msh_file(file_name):
     mesh['vertex_attribute_titles'] = []
     try:
         titles = fid.variables['vertex_attribute_titles'][:]
-        mesh['vertex_attribute_titles'] = [x.tostring().strip() for x in titles]
+        mesh['vertex_attribute_titles'] = _char_to_tags(titles)
     except KeyError:
         pass
 
@@ -812,13 +811,11 @@ def _read_msh_file(file_name):
     except KeyError:
         mesh['segments'] = num.array([], num.int)      #array default#
 
-    mesh['segment_tags'] = []
     try:
         tags = fid.variables['segment_tags'][:]
-        mesh['segment_tags'] = [x.tostring().strip() for x in tags]
+        mesh['segment_tags'] = _char_to_tags(tags)
     except KeyError:
-        for ob in mesh['segments']:
-            mesh['segment_tags'].append('')
+        mesh['segment_tags'] = [''] * len(mesh['segments'])
 
     try:
         mesh['triangles'] = fid.variables['triangles'][:]
@@ -827,13 +824,11 @@ def _read_msh_file(file_name):
         mesh['triangles'] = num.array([], num.int)              #array default#
         mesh['triangle_neighbors'] = num.array([], num.int)     #array default#
 
-    mesh['triangle_tags'] = []
     try:
         tags = fid.variables['triangle_tags'][:]
-        mesh['triangle_tags'] = [x.tostring().strip() for x in tags]
+        mesh['triangle_tags'] = _char_to_tags(tags)
     except KeyError:
-        for ob in mesh['triangles']:
-            mesh['triangle_tags'].append('')
+        mesh['triangle_tags'] = [''] * len(mesh['triangles'])
 
     #the outline
     try:
@@ -856,8 +851,7 @@ def _read_msh_file(file_name):
     mesh['outline_segment_tags'] =[]
     try:
         tags = fid.variables['outline_segment_tags'][:]
-        for i, tag in enumerate(tags):
-            mesh['outline_segment_tags'].append(tags[i].tostring().strip())
+        mesh['outline_segment_tags'] = _char_to_tags(tags)
     except KeyError:
         for ob in mesh['outline_segments']:
             mesh['outline_segment_tags'].append('')
@@ -875,8 +869,7 @@ def _read_msh_file(file_name):
     mesh['region_tags'] =[]
     try:
         tags = fid.variables['region_tags'][:]
-        for i, tag in enumerate(tags):
-            mesh['region_tags'].append(tags[i].tostring().strip())
+        mesh['region_tags'] = _char_to_tags(tags)
     except KeyError:
         for ob in mesh['regions']:
             mesh['region_tags'].append('')
@@ -898,6 +891,40 @@ def _read_msh_file(file_name):
     return mesh
 
 
+def _tags_to_char(tags):
+    """Convert list or array of strings to 2-D array of chars, padded
+    with blanks (as string_to_char).
+    """
+
+    tags = num.array(tags, num.str)
+    if tags.shape[0] == 0:
+        return num.array([], num.character)
+
+    maxlen = num.max(num.char.str_len(tags))
+    if maxlen == 0 and tags.shape[0] == 1:
+        tags = num.array([' '])
+        maxlen = 1
+
+    chars = tags.astype('S%d' % max(maxlen, 1)).view('S1')
+    chars = num.reshape(chars, (tags.shape[0], -1))[:, :maxlen].copy()
+    chars[chars == ''] = ' '
+
+    return chars
+
+
+def _char_to_tags(chars):
+    """Convert 2-D array of chars, as read from a NetCDF file, to list
+    of stripped strings.
+    """
+
+    chars = num.ascontiguousarray(num.ma.getdata(chars))
+    if len(chars.shape) < 2 or chars.shape[1] == 0:
+        return [''] * len(chars)
+
+    strings = chars.view('S%d' % chars.shape[1]).reshape(-1)
+    return [x.strip() for x in strings.tolist()]
+
+
 def export_boundary_file(file_name, points, title, delimiter=','):
     """Export a boundary file.
 
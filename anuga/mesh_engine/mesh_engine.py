@@ -54,8 +54,8 @@ def generate_mesh(points=None,
         raise ANUGAError(msg)
 
     # This is after points is numeric
-    if pointatts is None or pointatts == []:
-        pointatts = [[] for x in range(points.shape[0])]
+    if pointatts is None or len(pointatts) == 0:
+        pointatts = num.zeros((points.shape[0], 0), num.float)
         
     try:
         # If num.int is used, instead of num.int32, it fails in Linux
@@ -66,8 +66,8 @@ def generate_mesh(points=None,
         raise ANUGAError(msg)
     
     # This is after segments is numeric
-    if segatts is None or segatts == []:
-        segatts = [0 for x in range(segments.shape[0])]
+    if segatts is None or len(segatts) == 0:
+        segatts = num.zeros(segments.shape[0], num.int32)
         
     try:
         holes = ensure_numeric(holes, num.float)
@@ -122,30 +122,24 @@ def generate_mesh(points=None,
     # GD (June 2014): We get segfaults in some cases with breakLines, unless
     # we remove repeated values in 'points', and adjust segments accordingly
     # 
-    pts_complex=points[:,0]+1j*points[:,1] # Use to match points
-    i=0 # Use this as a counter, since the length of 'points' changes as we go
-    while (i < len(pts_complex)-1):
-        i=i+1 # Maximum i = len(pts_complex)-1 = largest index of points
-        #
-        # Check if points[i,] is the same as a previous point
-        if(any(pts_complex[i]==pts_complex[0:i])):
-            # Get index of previous occurrence
-            earlierInd=(pts_complex[i]==pts_complex[0:i]).nonzero()[0][0]
-            # Remove the ith point, and adjust the segments
-            for ii in range(len(segments)):
-                for j in range(2):
-                    if(segments[ii,j] == i):
-                        # Segment will use previous occurrence of this point
-                        segments[ii,j]=earlierInd
-                    if(segments[ii,j]>i):
-                        # Decrement the index (since we will remove point[i,])
-                        segments[ii,j] = segments[ii,j]-1
-            # Remove ith point
-            points=num.delete(points, i, 0)
-            pointatts=num.delete(pointatts,i,0)
-            # Recompute the complex number points for matching
-            pts_complex=points[:,0]+1j*points[:,1]
-            i=i-1 # Repeat for the last value of i = next point
+    # Each point is replaced by its first occurrence, found by sorting
+    # the points, and the segments renumbered accordingly
+    N = points.shape[0]
+    if N > 1:
+        order = num.lexsort((points[:,1], points[:,0])) # Stable
+        sorted_points = points[order]
+        new_point = num.ones(N, num.bool)
+        new_point[1:] = num.any(sorted_points[1:] != sorted_points[:-1],
+                                axis=1)
+        first = num.empty(N, num.int)
+        first[order] = order[new_point][num.cumsum(new_point) - 1]
+
+        keep = first == num.arange(N)
+        if not num.all(keep):
+            new_index = num.cumsum(keep) - 1
+            segments = num.array(new_index[first][segments], num.int32)
+            points = points[keep]
+            pointatts = pointatts[keep]
 
     trianglelist, pointlist, pointmarkerlist, pointattributelist, triangleattributelist, segmentlist, segmentmarkerlist, neighborlist = triang.genMesh(points,segments,holes,regions,
                           pointatts,segatts, mode)
@@ -0,0 +1,89 @@
+"""
+Cost of building the submeshes of a parallel run: build_submesh, which
+builds the submeshes of all processors on processor 0, against
+build_partition followed by extract_local_submesh, with which each
+processor builds its own submesh.
+
+Usage: python benchmark_distribute.py [n [numprocs ...]]
+
+The mesh is a rectangular_cross mesh of 4*n*n triangles (default n=300)
+partitioned with metis for each numprocs (default 16, 64 and 256). This
+runs sequentially: for the per processor build the total and the
+largest time of a single processor are reported, the latter being the
+time distribute takes when a partition_dir is given. The time to write
+and read the partition with dump_partition and load_partition is
+reported as well.
+"""
+
+import sys
+import time
+import shutil
+import tempfile
+
+import anuga
+from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+from anuga.parallel.distribute_mesh import build_submesh, extract_submesh
+from anuga.parallel.distribute_mesh import build_partition
+from anuga.parallel.distribute_mesh import extract_local_submesh
+from anuga.parallel.distribute_mesh import reorder_neighbours
+from anuga.parallel.distribute_mesh import dump_partition, load_partition
+
+
+def benchmark(n=300, numprocs_list=[16, 64, 256]):
+
+    domain = anuga.rectangular_cross_domain(n, n)
+    domain.set_quantity('elevation', lambda x, y: -x)
+
+    print 'Triangles: %d' % domain.number_of_triangles
+    print '%8s %14s %14s %14s %14s' % ('numprocs', 'build_submesh',
+                                       'local total', 'local max',
+                                       'dump+load')
+
+    for numprocs in numprocs_list:
+        nodes, triangles, boundary, triangles_per_proc, quantities, \
+               s2p_map, p2s_map = pmesh_divide_metis_with_map(domain, numprocs)
+
+        t0 = time.time()
+        submesh = build_submesh(nodes, triangles, boundary, quantities,
+                                triangles_per_proc)
+        for p in range(numprocs):
+            extract_submesh(submesh, triangles_per_proc, p2s_map, p)
+        t_submesh = time.time() - t0
+        submesh = None
+
+        t0 = time.time()
+        neighbours = reorder_neighbours(domain.neighbours, p2s_map)
+        partition = build_partition(nodes, triangles, boundary, quantities,
+                                    triangles_per_proc, neighbours)
+        t_partition = time.time() - t0
+
+        partition_dir = tempfile.mkdtemp()
+        t0 = time.time()
+        dump_partition(partition, partition_dir)
+        partition, attributes = load_partition(partition_dir)
+        t_dump = time.time() - t0
+
+        times = []
+        for p in range(numprocs):
+            t0 = time.time()
+            extract_local_submesh(partition, p, p2s_map)
+            times.append(time.time() - t0)
+
+        partition = None
+        shutil.rmtree(partition_dir)
+
+        print '%8d %14.3f %14.3f %14.3f %14.3f' % (numprocs, t_submesh,
+               t_partition + sum(times), t_partition + max(times), t_dump)
+
+
+if __name__ == '__main__':
+
+    n = 300
+    numprocs_list = [16, 64, 256]
+
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        numprocs_list = [int(a) for a in sys.argv[2:]]
+
+    benchmark(n, numprocs_list)
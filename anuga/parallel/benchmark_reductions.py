@@ -0,0 +1,110 @@
+"""
+Cost of the global reductions of a parallel run: the loops of sends and
+receives through processor 0 previously used by get_water_volume,
+get_boundary_flux_integral, collect_value and the checkpoint decision
+against the collective operations allreduce and bcast.
+
+Usage: mpirun -np <numprocs> python benchmark_reductions.py [calls]
+
+Run with 32, 64 and 128 processors to see the scaling: the send/receive
+loops take O(numprocs) messages through processor 0 whereas the
+collectives take O(log numprocs) steps. Each operation is called
+calls times (default 1000) and the mean time per call on processor 0
+is reported.
+"""
+
+import sys
+import time
+
+from anuga.utilities.parallel_abstraction import size, rank, barrier
+from anuga.utilities.parallel_abstraction import send, receive, finalize
+from anuga.utilities.parallel_abstraction import allreduce, bcast, SUM
+
+
+def sum_send_receive(value):
+    """Sum of value over all processors as formerly done by
+    get_water_volume
+    """
+
+    myid = rank()
+    numprocs = size()
+
+    if myid == 0:
+        for i in range(1, numprocs):
+            value = value + receive(i)
+    else:
+        send(value, 0)
+
+    if myid == 0:
+        for i in range(1, numprocs):
+            send(value, i)
+    else:
+        value = receive(0)
+
+    return value
+
+
+def bcast_send_receive(value):
+    """Value of processor 0 on all processors as formerly done for the
+    checkpoint decision in evolve
+    """
+
+    if rank() == 0:
+        for cpu in range(size()):
+            if cpu != rank():
+                send(value, cpu)
+    else:
+        value = receive(0)
+
+    return value
+
+
+def time_calls(f, value, calls):
+
+    barrier()
+    t0 = time.time()
+    for i in xrange(calls):
+        result = f(value)
+    barrier()
+
+    return (time.time() - t0)/calls, result
+
+
+def benchmark(calls=1000):
+
+    myid = rank()
+    numprocs = size()
+
+    volume = float(myid + 1)
+    expected = numprocs*(numprocs + 1)/2.0
+
+    operations = [('sum: send/receive', sum_send_receive, volume),
+                  ('sum: allreduce', lambda x: allreduce(x, SUM), volume),
+                  ('bcast: send/receive', bcast_send_receive, myid == 0),
+                  ('bcast: bcast', lambda x: bcast(x, 0), myid == 0)]
+
+    if myid == 0:
+        print 'Processors: %d, calls: %d' % (numprocs, calls)
+        print '%-22s %16s' % ('operation', 'time/call (us)')
+
+    for name, f, value in operations:
+        t, result = time_calls(f, value, calls)
+
+        if name.startswith('sum'):
+            assert result == expected
+        else:
+            assert result == True
+
+        if myid == 0:
+            print '%-22s %16.2f' % (name, t*1.0e6)
+
+
+if __name__ == '__main__':
+
+    calls = 1000
+    if len(sys.argv) > 1:
+        calls = int(sys.argv[1])
+
+    benchmark(calls)
+
+    finalize()
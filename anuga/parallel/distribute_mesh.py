@@ -123,6 +123,7 @@ def reorder_new(quantities, epart_order, proc_sum):
 
 try:
     from anuga.pymetis.metis_ext import partMeshNodal
+    from anuga.pymetis.metis_ext import partGraphKway, partGraphRecursive
 except ImportError:
     print "***************************************************"
     print "         Metis is probably not compiled."
@@ -130,17 +131,17 @@ except ImportError:
     print "***************************************************"
     raise ImportError
 
-def pmesh_divide_metis(domain, n_procs):
+def pmesh_divide_metis(domain, n_procs, weights=None):
     # Wrapper for old pmesh_divide_metis which does not return tri_index or r_tri_index
-    nodes, ttriangles, boundary, triangles_per_proc, quantities, tri_index, r_tri_index = pmesh_divide_metis_helper(domain, n_procs)
+    nodes, ttriangles, boundary, triangles_per_proc, quantities, tri_index, r_tri_index = pmesh_divide_metis_helper(domain, n_procs, weights)
 
     return nodes, ttriangles, boundary, triangles_per_proc, quantities
 
-def pmesh_divide_metis_with_map(domain, n_procs):
+def pmesh_divide_metis_with_map(domain, n_procs, weights=None):
 
-    return pmesh_divide_metis_helper(domain, n_procs)
+    return pmesh_divide_metis_helper(domain, n_procs, weights)
 
-def pmesh_divide_metis_helper(domain, n_procs):
+def pmesh_divide_metis_helper(domain, n_procs, weights=None):
     
     # Initialise the lists
     # List, indexed by processor of # triangles.
@@ -164,14 +165,16 @@ def pmesh_divide_metis_helper(domain, n_procs):
         t_list = domain.triangles.copy()
         t_list = num.reshape(t_list, (-1,))
     
-        # The 1 here is for triangular mesh elements.
-        # FIXME: Should update to Metis 5
-        edgecut, epart, npart = partMeshNodal(n_tri, n_vert, t_list, 1, n_procs)
+        if weights is None:
+            # The 1 here is for triangular mesh elements.
+            # FIXME: Should update to Metis 5
+            edgecut, epart, npart = partMeshNodal(n_tri, n_vert, t_list, 1, n_procs)
+            del npart
+        else:
+            epart = metis_partition_weighted(domain.neighbours, weights,
+                                             n_procs)
         # print edgecut
-        # print npart
         #print epart
-        del edgecut
-        del npart
 
         # Sometimes (usu. on x86_64), partMeshNodal returns an array of zero
         # dimensional arrays. Correct this.
@@ -184,7 +187,7 @@ def pmesh_divide_metis_helper(domain, n_procs):
             del epart_new
 
 
-        triangles_per_proc = num.bincount(epart)
+        triangles_per_proc = num.bincount(epart, minlength=n_procs)
 
         msg =  "Metis created a partition where at least one submesh has no triangles. "
         msg += "Try using a smaller number of mpi processes."
@@ -198,17 +201,11 @@ def pmesh_divide_metis_helper(domain, n_procs):
         epart_order = num.argsort(epart, kind='mergesort')
         new_triangles = domain.triangles[epart_order]
 
-        #new_r_tri_index_flat = num.zeros((n_tri,3), num.int)
+        # new_tri_index[i] = [processor, local number] of triangle i
         new_tri_index = num.zeros((n_tri,2), num.int)
-        for i in xrange(n_procs):
-            ids = num.arange(proc_sum[i],proc_sum[i+1])
-            eids = epart_order[ids]
-            nrange = num.reshape(num.arange(triangles_per_proc[i]), (-1,1))
-            nones = num.ones_like(nrange)
-            #print ids.shape
-            #print nrange.shape
-            new_tri_index[eids] = num.concatenate((i*nones, nrange), axis = 1)
-            #new_r_tri_index_flat[ids] = num.concatenate((i*nones, nrange, num.reshape(eids, (-1,1))), axis = 1)
+        procs = epart[epart_order]
+        new_tri_index[epart_order, 0] = procs
+        new_tri_index[epart_order, 1] = num.arange(n_tri) - proc_sum[procs]
 
 
         if verbose:
@@ -240,9 +237,8 @@ def pmesh_divide_metis_helper(domain, n_procs):
         
         new_quantities = {}
         for k in domain.quantities:
-            new_quantities[k] = num.zeros((n_tri, 3), num.float)
-            for i in range(n_tri):
-                new_quantities[k][i] = domain.quantities[k].vertex_values[i]
+            new_quantities[k] = num.array(domain.quantities[k].vertex_values,
+                                          num.float)
         
     # Extract the node list
     new_nodes = domain.get_nodes().copy()
@@ -250,6 +246,82 @@ def pmesh_divide_metis_helper(domain, n_procs):
 
     return new_nodes, new_triangles, new_boundary, triangles_per_proc, new_quantities, new_tri_index, epart_order
 
+#########################################################
+#
+# Divide the mesh with per triangle weights
+#
+#  *) The dual graph of the mesh (the triangles connected
+# across their edges, given by the neighbours of the
+# mesh) is partitioned with metis so that the sum of the
+# weights of the triangles in each partition is balanced
+# and few edges are cut.
+#
+#  *) weights are non negative numbers, e.g. the expected
+# cost of computing each triangle. They are scaled to the
+# positive integers metis uses, resolving differences of
+# 1/1000 of the largest weight.
+#
+#  *) Recursive bisection is used for fewer than 8
+# partitions, k-way partitioning otherwise, as
+# recommended in the metis manual.
+#
+# -------------------------------------------------------
+#
+#  *) The partition of each triangle is returned.
+#
+#########################################################
+
+def metis_partition_weighted(neighbours, weights, n_procs):
+
+    xadj, adjncy = mesh_dual_graph(neighbours)
+    vwgt = metis_weights(weights)
+
+    msg = 'There must be one weight per triangle'
+    assert len(vwgt) == len(xadj) - 1, msg
+
+    if n_procs < 8:
+        edgecut, epart = partGraphRecursive(len(vwgt), xadj, adjncy, vwgt,
+                                            n_procs)
+    else:
+        edgecut, epart = partGraphKway(len(vwgt), xadj, adjncy, vwgt,
+                                       n_procs)
+
+    return num.array(epart, num.int)
+
+
+def mesh_dual_graph(neighbours):
+    """Return the dual graph of a mesh with the given neighbours in
+    compressed storage format: the triangles adjacent to triangle i are
+    adjncy[xadj[i]:xadj[i+1]]
+    """
+
+    neighbours = num.asarray(neighbours)
+    mask = neighbours >= 0
+
+    xadj = num.zeros(len(neighbours)+1, num.int)
+    xadj[1:] = num.cumsum(num.sum(mask, axis=1))
+    adjncy = num.array(neighbours[mask], num.int)
+
+    return xadj, adjncy
+
+
+def metis_weights(weights):
+    """Return the weights scaled to positive integers for metis
+    """
+
+    weights = num.array(weights, num.float)
+
+    msg = 'Partition weights must be non negative and not all zero'
+    assert num.all(weights >= 0.0) and num.max(weights) > 0.0, msg
+
+    scale = 1000.0/num.max(weights)
+
+    # Keep the total weight within the integer range of metis
+    scale = min(scale, (2.0**30 - len(weights))/num.sum(weights))
+
+    return num.maximum(1, num.round(weights*scale)).astype(num.int)
+
+
 #########################################################
 #
 # Subdivide the domain. This module is primarily
@@ -308,6 +380,14 @@ def submesh_full(mesh, triangles_per_proc):
     boundary_list = []
     submesh = {}
 
+    # Sort the boundary edges by triangle so that the edges of
+    # each processor form a contiguous range
+
+    boundary_keys = boundary.keys()
+    boundary_tri = num.array([k[0] for k in boundary_keys], num.int)
+    boundary_order = num.argsort(boundary_tri, kind='mergesort')
+    boundary_tri = boundary_tri[boundary_order]
+
 #    node_range = num.reshape(num.arange(nnodes),(nnodes,1))
 #
 #    #print node_range
@@ -328,9 +408,10 @@ def submesh_full(mesh, triangles_per_proc):
         # Find the boundary edges on processor p
 
         subboundary = {}
-        for k in boundary:
-            if (k[0] >=tlower and k[0] < tupper):
-                subboundary[k]=boundary[k]
+        blower, bupper = num.searchsorted(boundary_tri, [tlower, tupper])
+        for i in boundary_order[blower:bupper]:
+            k = boundary_keys[i]
+            subboundary[k]=boundary[k]
         boundary_list.append(subboundary)
 
         # Find nodes in processor p
@@ -496,18 +577,46 @@ def ghost_layer_old(submesh, mesh, p, tupper, tlower, parameters = None):
 
 def ghost_layer(submesh, mesh, p, tupper, tlower, parameters = None):
 
-    ncoord = mesh.number_of_nodes
-    ntriangles = mesh.number_of_triangles
-
     if parameters is None:
         layer_width  = 2
     else:
         layer_width = parameters['ghost_layer_width']
 
+    new_trianglemap = ghost_layer_ids(mesh.neighbours, tlower, tupper,
+                                      layer_width)
+
+    new_subtriangles = num.concatenate((num.reshape(new_trianglemap, (-1,1)), mesh.triangles[new_trianglemap]), 1)
+
+    fullnodes = submesh["full_nodes"][p]
+    full_nodes_ids = num.array(fullnodes[:,0],num.int)
+
+    new_nodes = num.unique(mesh.triangles[new_trianglemap].flat)
+    new_nodes = numset.setdiff1d(new_nodes,full_nodes_ids)
+
+    new_subnodes = num.concatenate((num.reshape(new_nodes, (-1,1)), mesh.nodes[new_nodes]), 1)
+
+    # Return the triangles and vertices sitting on the boundary layer
+
+    return new_subnodes, new_subtriangles, layer_width
+
+
+#########################################################
+#
+# Find the ids of the ghost triangles
+#
+#  *) The ghost triangles of the triangles tlower to
+# tupper-1 are the other triangles within layer_width
+# neighbours of them.
+#
+# -------------------------------------------------------
+#
+#  *) The sorted array of ghost triangle ids is returned
+#
+#########################################################
 
-    full_ids = num.arange(tlower, tupper)
+def ghost_layer_ids(neighbours, tlower, tupper, layer_width):
 
-    n0 = mesh.neighbours[full_ids, :]
+    n0 = neighbours[tlower:tupper, :]
     n0 = num.unique(n0.flat)
     n0 = num.extract(n0>=0,n0)
     n0 = num.extract(num.logical_or(n0<tlower, tupper<= n0), n0)
@@ -520,7 +629,7 @@ def ghost_layer(submesh, mesh, p, tupper, tlower, parameters = None):
     for i in range(layer_width-1):
 
         # use previous layer as a start
-        n0 = mesh.neighbours[n0, :]
+        n0 = neighbours[n0, :]
         n0 = num.unique(n0.flat)
         n0 = num.extract(n0>=0,n0)
         n0 = num.extract(num.logical_or(n0<tlower, tupper<= n0), n0)
@@ -531,34 +640,12 @@ def ghost_layer(submesh, mesh, p, tupper, tlower, parameters = None):
         layer_cells[i+1] = n0
 
 
-    # Build the triangle list and make note of the vertices
+    # Build the triangle list
     new_trianglemap = layer_cells[0]
     for i in range(layer_width-1):
         new_trianglemap = numset.union1d(new_trianglemap,layer_cells[i+1])
 
-    new_subtriangles = num.concatenate((num.reshape(new_trianglemap, (-1,1)), mesh.triangles[new_trianglemap]), 1)
-
-
-
-
-    fullnodes = submesh["full_nodes"][p]
-    full_nodes_ids = num.array(fullnodes[:,0],num.int)
-
-    new_nodes = num.unique(mesh.triangles[new_trianglemap].flat)
-    new_nodes = numset.setdiff1d(new_nodes,full_nodes_ids)
-
-    new_subnodes = num.concatenate((num.reshape(new_nodes, (-1,1)), mesh.nodes[new_nodes]), 1)
-
-    # Clean up before exiting
-
-    del (new_nodes)
-    del (layer_cells)
-    del (n0)
-    del (new_trianglemap)
-
-    # Return the triangles and vertices sitting on the boundary layer
-
-    return new_subnodes, new_subtriangles, layer_width
+    return new_trianglemap
 
 #########################################################
 #
@@ -637,21 +724,22 @@ def ghost_bnd_layer_old(ghosttri, tlower, tupper, mesh, p):
 
 def ghost_bnd_layer(ghosttri, tlower, tupper, mesh, p):
 
-
-    boundary = mesh.boundary
-
-    ghost_list = []
-    subboundary = {}
+    return ghost_boundary(ghosttri[:,0], tlower, tupper, mesh.neighbours,
+                          mesh.boundary)
 
 
-    new_ghost_list = ghosttri[:,0]
+def ghost_boundary(new_ghost_list, tlower, tupper, neighbours, boundary):
+    """Return the boundary dictionary of the ghost triangles new_ghost_list
+    of the processor with full triangles tlower to tupper-1. boundary
+    needs to contain the boundary edges of the ghost triangles.
+    """
 
     #print new_ghost_list
 
     # 0 edge boundaries
-    nghb0 = mesh.neighbours[new_ghost_list,0]
+    nghb0 = neighbours[new_ghost_list,0]
     gl0 = num.extract(num.logical_or(nghb0 < tlower, nghb0 >= tupper), new_ghost_list)
-    nghb0 = mesh.neighbours[gl0,0]
+    nghb0 = neighbours[gl0,0]
     flag = numset.in1d(nghb0,new_ghost_list)
     gl0 = num.extract(num.logical_not(flag),gl0)
     edge0 = 0*num.ones_like(gl0)
@@ -659,9 +747,9 @@ def ghost_bnd_layer(ghosttri, tlower, tupper, mesh, p):
     values0 = ['ghost']*n0
 
     # 1 edge boundary
-    nghb1 = mesh.neighbours[new_ghost_list,1]
+    nghb1 = neighbours[new_ghost_list,1]
     gl1 = num.extract(num.logical_or(nghb1 < tlower, nghb1 >= tupper), new_ghost_list)
-    nghb1 = mesh.neighbours[gl1,1]
+    nghb1 = neighbours[gl1,1]
     flag = numset.in1d(nghb1,new_ghost_list)
     gl1 = num.extract(num.logical_not(flag),gl1)
     edge1 = 1*num.ones_like(gl1)
@@ -669,9 +757,9 @@ def ghost_bnd_layer(ghosttri, tlower, tupper, mesh, p):
     values1 = ['ghost']*n1
 
     # 2 edge boundary
-    nghb2 = mesh.neighbours[new_ghost_list,2]
+    nghb2 = neighbours[new_ghost_list,2]
     gl2 = num.extract(num.logical_or(nghb2 < tlower, nghb2 >= tupper), new_ghost_list)
-    nghb2 = mesh.neighbours[gl2,2]
+    nghb2 = neighbours[gl2,2]
     flag = numset.in1d(nghb2,new_ghost_list)
     gl2 = num.extract(num.logical_not(flag),gl2)
     edge2 = 2*num.ones_like(gl2)
@@ -687,10 +775,12 @@ def ghost_bnd_layer(ghosttri, tlower, tupper, mesh, p):
 #    print values
 
     subboundary = dict(zip(zip(gl,edge),values))
-    #intersect with boundary 
 
-    # FIXME SR: these keys should be viewkeys but need python 2.7
-    subboundary.update( (k,boundary[k]) for k in set(subboundary.keys()) & set(boundary.keys()) )
+    # Edges on the boundary of the whole mesh keep their tag (only
+    # look up the ghost edges, the boundary can be much larger)
+    for k in subboundary:
+        if k in boundary:
+            subboundary[k] = boundary[k]
 
     #print subboundary
 
@@ -808,25 +898,28 @@ def full_commun_pattern(submesh, tri_per_proc):
         # Loop over the full triangles in the current processor
         # and build an empty dictionary
 
-        fcommun = {}
         tupper = tri_per_proc[p]+tlower
-        for i in xrange(tlower, tupper):
-            fcommun[i] = []
-        full_commun.append(fcommun)
+        full_commun.append(dict((i, []) for i in xrange(tlower, tupper)))
         tlower = tupper
 
-    # Loop over the processor again
+    # Collect the [global id, neighbour processor, ghost processor]
+    # of all ghost triangles, sorted by global id and ghost processor,
+    # and note that the neighbour processor must send updates to the
+    # ghost processor
 
-    for p in xrange(nproc):
+    ghost_commun = [g for g in submesh["ghost_commun"] if len(g) > 0]
+    if len(ghost_commun) == 0:
+        return full_commun
 
-        # Loop over the ghost triangles in the current processor,
-        # find which processor contains the corresponding full copy
-        # and note that the processor must send updates to this
-        # processor
+    ghost_procs = [p*num.ones(len(g), num.int) for p, g in
+                   enumerate(submesh["ghost_commun"]) if len(g) > 0]
+    ghost_commun = num.concatenate(ghost_commun)
+    ghost_procs = num.concatenate(ghost_procs)
 
-        for g in submesh["ghost_commun"][p]:
-            neigh = g[1]
-            full_commun[neigh][g[0]].append(p)
+    order = num.lexsort((ghost_procs, ghost_commun[:,0]))
+    for i in order:
+        global_id, neigh = ghost_commun[i]
+        full_commun[neigh][global_id].append(ghost_procs[i])
 
     return full_commun
 
@@ -956,20 +1049,16 @@ def submesh_quantities(submesh, quantities, triangles_per_proc):
 
         # Find the global ID of the ghost triangles
 
-        global_id = []
-        M = len(submesh["ghost_triangles"][p])
-        for j in xrange(M):
-            global_id.append(submesh["ghost_triangles"][p][j][0])
+        global_id = num.array(submesh["ghost_triangles"][p], num.int)
+        global_id = global_id.reshape((-1, 4))[:,0]
 
         # Use the global ID to extract the quantites information from
         # the full domain
 
         for k in quantities:
             submesh["full_quan"][k].append(quantities[k][lower:upper])
-            submesh["ghost_quan"][k].append(num.zeros( (M,3) , num.float))
-            for j in range(M):
-                submesh["ghost_quan"][k][p][j] = \
-                                               quantities[k][global_id[j]]
+            submesh["ghost_quan"][k].append(
+                num.array(quantities[k][global_id], num.float))
 
         lower = upper
 
@@ -1067,9 +1156,8 @@ def build_local_GA(nodes, triangles, boundaries, tri_map):
     # Build a global ID to local ID mapping
 
     NGlobal = 0
-    for i in xrange(Nnodes):
-        if nodes[i][0] > NGlobal:
-            NGlobal = nodes[i][0]
+    if Nnodes > 0:
+        NGlobal = max(NGlobal, num.max(nodes[:,0]))
 
     node_map = -1*num.ones(int(NGlobal)+1, num.int)
 
@@ -1140,23 +1228,23 @@ def build_local_commun(tri_map, ghostc, fullc, nproc):
     # (this version allows the information to be stored
     # by the global numbering)
 
-    tmp_send = {}
+    global_ids = []
+    neighs = []
     for global_id in fullc:
-        for i in xrange(len(fullc[global_id])):
-            neigh = fullc[global_id][i]
-            if not tmp_send.has_key(neigh):
-                tmp_send[neigh] = []
-            tmp_send[neigh].append([global_id, \
-                                    tri_map[global_id]])
+        if len(fullc[global_id]) > 0:
+            global_ids.extend([global_id]*len(fullc[global_id]))
+            neighs.extend(fullc[global_id])
 
     # Extract the full send information and put it in the form
     # required for the full_send dictionary
 
-    for neigh in tmp_send:
-        neigh_commun = num.sort(tmp_send[neigh], 0)
+    global_ids = num.array(global_ids, num.int)
+    neighs = num.array(neighs, num.int)
+    for neigh in num.unique(neighs):
+        d = num.sort(num.compress(num.equal(neighs, neigh), global_ids))
         full_send[neigh] = [0, 0]
-        full_send[neigh][0] = neigh_commun[:,1]
-        full_send[neigh][1] = neigh_commun[:,0]
+        full_send[neigh][0] = num.take(tri_map, d)
+        full_send[neigh][1] = d
 
     return ghost_recv, full_send
 
@@ -1196,23 +1284,22 @@ def build_local_mesh(submesh, lower_t, upper_t, nproc):
 
     # Combine the full boundaries and ghost boundaries
 
-    boundaries = submesh["full_boundary"]
+    boundaries = submesh["full_boundary"].copy()
     for b in submesh["ghost_boundary"]:
         boundaries[b]=submesh["ghost_boundary"][b]
 
     # Make note of the new triangle numbers, including the ghost
     # triangles
 
+    ghost_ids = num.array(submesh["ghost_triangles"], num.int)
+    ghost_ids = ghost_ids.reshape((-1, 4))[:,0]
+
     NGlobal = upper_t
-    for i in xrange(len(submesh["ghost_triangles"])):
-        id = submesh["ghost_triangles"][i][0]
-        if id > NGlobal:
-            NGlobal = id
-    #index = num.zeros(int(NGlobal)+1, num.int)
+    if len(ghost_ids) > 0:
+        NGlobal = max(NGlobal, num.max(ghost_ids))
     tri_map = -1*num.ones(int(NGlobal)+1, num.int)
     tri_map[lower_t:upper_t]=num.arange(upper_t-lower_t)
-    for i in xrange(len(submesh["ghost_triangles"])):
-        tri_map[submesh["ghost_triangles"][i][0]] = i+upper_t-lower_t
+    tri_map[ghost_ids] = num.arange(len(ghost_ids)) + upper_t-lower_t
     
     # Change the node numbering (and update the numbering in the
     # triangles)
@@ -1680,3 +1767,452 @@ def extract_l2g_map(map):
 
 
 
+
+
+#########################################################
+#
+# Build the submesh of a single processor.
+#
+#  *) build_submesh builds the submeshes of all of the
+# processors on the host, which needs memory proportional
+# to the whole mesh times the ghost overhead, and then
+# each submesh has to be sent from the host.
+#
+#  *) Instead the partitioned mesh can be stored in a
+# partition description (a dictionary of arrays) from
+# which each processor builds its own submesh, looking
+# only at its own triangles and those of its neighbouring
+# processors. The description can be written to a
+# directory with dump_partition and memory mapped by all
+# processors with load_partition.
+#
+#  *) The submesh built by build_local_submesh is the same
+# as that extracted from build_submesh.
+#
+#########################################################
+
+
+#########################################################
+#
+# Reorder the neighbour structure of a mesh
+#
+#  *) neighbours is the neighbour array of the mesh in
+# the original triangle order and p2s_map maps the
+# new (parallel) triangle number to the original one.
+#
+# -------------------------------------------------------
+#
+#  *) The neighbour array in the new triangle order is
+# returned. Negative entries (boundary edges) are kept.
+#
+#########################################################
+
+def reorder_neighbours(neighbours, p2s_map):
+
+    neighbours = num.array(neighbours, num.int)
+    if len(p2s_map) == 0:
+        return neighbours
+
+    s2p_map = num.zeros(len(p2s_map), num.int)
+    s2p_map[p2s_map] = num.arange(len(p2s_map))
+
+    new_neighbours = neighbours[p2s_map]
+    mask = new_neighbours >= 0
+    new_neighbours[mask] = s2p_map[new_neighbours[mask]]
+
+    return new_neighbours
+
+
+#########################################################
+#
+# Build the partition description
+#
+#  *) nodes, triangles, boundary, quantities and
+# triangles_per_proc are as returned by
+# pmesh_divide_metis. If the neighbours of the
+# partitioned mesh are not given (see reorder_neighbours)
+# they are computed.
+#
+# -------------------------------------------------------
+#
+#  *) A dictionary with the nodes, triangles, neighbours,
+# quantities (a dictionary of the vertex values) and
+# triangles_per_proc is returned. The boundary is stored
+# as the sorted array boundary_ids of 3*triangle+edge with
+# the corresponding boundary_tags, indices into the list
+# tags.
+#
+#########################################################
+
+def build_partition(nodes, triangles, boundary, quantities,
+                    triangles_per_proc, neighbours=None):
+
+    if neighbours is None:
+        mesh = Mesh(nodes, triangles, boundary)
+        neighbours = mesh.neighbours
+
+    tags = []
+    tag_index = {}
+    boundary_ids = num.zeros(len(boundary), num.int)
+    boundary_tags = num.zeros(len(boundary), num.int)
+    for i, k in enumerate(boundary):
+        tag = boundary[k]
+        if tag not in tag_index:
+            tag_index[tag] = len(tags)
+            tags.append(tag)
+        boundary_ids[i] = 3*k[0] + k[1]
+        boundary_tags[i] = tag_index[tag]
+
+    order = num.argsort(boundary_ids)
+
+    partition = {}
+    partition['nodes'] = num.array(nodes, num.float)
+    partition['triangles'] = num.array(triangles, num.int)
+    partition['neighbours'] = num.array(neighbours, num.int)
+    partition['boundary_ids'] = boundary_ids[order]
+    partition['boundary_tags'] = boundary_tags[order]
+    partition['tags'] = tags
+    partition['triangles_per_proc'] = num.array(triangles_per_proc, num.int)
+    partition['quantities'] = {}
+    for k in quantities:
+        partition['quantities'][k] = num.array(quantities[k], num.float)
+
+    return partition
+
+
+#########################################################
+#
+# Write the partition description to partition_dir as
+# numpy binary files (with the tags and the names of the
+# quantities and attributes, any picklable objects, in a
+# pickle file).
+#
+#########################################################
+
+def dump_partition(partition, partition_dir, attributes=None):
+
+    import os
+    import errno
+    import cPickle
+
+    try:
+        os.makedirs(partition_dir)
+    except OSError as exception:
+        if exception.errno != errno.EEXIST:
+            raise
+
+    for name in partition_arrays:
+        num.save(os.path.join(partition_dir, name + '.npy'), partition[name])
+
+    names = partition['quantities'].keys()
+    for i, k in enumerate(names):
+        num.save(os.path.join(partition_dir, 'quantity_%d.npy' % i),
+                 partition['quantities'][k])
+
+    info = {'tags': partition['tags'],
+            'quantities': names,
+            'attributes': attributes}
+
+    fid = open(os.path.join(partition_dir, 'partition.pickle'), 'wb')
+    cPickle.dump(info, fid, protocol=cPickle.HIGHEST_PROTOCOL)
+    fid.close()
+
+
+#########################################################
+#
+# Read the partition description written by
+# dump_partition. By default the arrays are memory mapped
+# so that only the parts used by this processor are read.
+#
+# -------------------------------------------------------
+#
+#  *) The partition description and the attributes given
+# to dump_partition are returned.
+#
+#########################################################
+
+def load_partition(partition_dir, mmap_mode='r'):
+
+    import os
+    import cPickle
+
+    fid = open(os.path.join(partition_dir, 'partition.pickle'), 'rb')
+    info = cPickle.load(fid)
+    fid.close()
+
+    partition = {}
+    for name in partition_arrays:
+        partition[name] = num.load(os.path.join(partition_dir, name + '.npy'),
+                                   mmap_mode=mmap_mode)
+
+    partition['tags'] = info['tags']
+    partition['quantities'] = {}
+    for i, k in enumerate(info['quantities']):
+        partition['quantities'][k] = \
+            num.load(os.path.join(partition_dir, 'quantity_%d.npy' % i),
+                     mmap_mode=mmap_mode)
+
+    return partition, info['attributes']
+
+
+partition_arrays = ['nodes', 'triangles', 'neighbours', 'boundary_ids',
+                    'boundary_tags', 'triangles_per_proc']
+
+
+#########################################################
+#
+# Return the boundary dictionary of the triangles ids
+# (a sorted array) from the partition description.
+#
+#########################################################
+
+def partition_boundary(partition, ids):
+
+    boundary_ids = partition['boundary_ids']
+    boundary_tags = partition['boundary_tags']
+    tags = partition['tags']
+
+    boundary = {}
+    if len(boundary_ids) == 0:
+        return boundary
+
+    for edge in range(3):
+        keys = 3*ids + edge
+        pos = num.searchsorted(boundary_ids, keys)
+        pos = num.minimum(pos, len(boundary_ids)-1)
+        found = num.flatnonzero(boundary_ids[pos] == keys)
+        for i in found:
+            boundary[int(ids[i]), edge] = tags[boundary_tags[pos[i]]]
+
+    return boundary
+
+
+#########################################################
+#
+# Build the submesh of processor p from the partition
+# description.
+#
+#  *) The ghost triangles of p are found from the
+# neighbours of the triangles of p.
+#
+#  *) The full triangles of p which are ghost triangles of
+# another processor q lie in the ghost layer of p, so the
+# full communication pattern of p only needs the ghost
+# layers of the processors owning the ghost triangles of p.
+#
+# -------------------------------------------------------
+#
+#  *) A dictionary with the full_nodes, ghost_nodes,
+# full_triangles, ghost_triangles, full_boundary,
+# ghost_boundary, ghost_commun, full_commun, full_quan,
+# ghost_quan and ghost_layer_width of processor p (the
+# form used by build_local_mesh) is returned.
+#
+#########################################################
+
+def build_local_submesh(partition, p, parameters=None):
+
+    if parameters is None:
+        layer_width  = 2
+    else:
+        layer_width = parameters['ghost_layer_width']
+
+    nodes = partition['nodes']
+    triangles = partition['triangles']
+    neighbours = partition['neighbours']
+    triangles_per_proc = num.array(partition['triangles_per_proc'], num.int)
+
+    tri_ranges = num.zeros(len(triangles_per_proc)+1, num.int)
+    tri_ranges[1:] = num.cumsum(triangles_per_proc)
+    tlower = tri_ranges[p]
+    tupper = tri_ranges[p+1]
+
+    submesh = {}
+    submesh["ghost_layer_width"] = layer_width
+
+    # Full triangles, nodes and boundary
+
+    full_triangles = num.array(triangles[tlower:tupper], num.int)
+    full_ids = num.unique(full_triangles.flat)
+    submesh["full_triangles"] = full_triangles
+    submesh["full_nodes"] = \
+        num.concatenate((num.reshape(full_ids, (-1,1)), nodes[full_ids]), 1)
+    submesh["full_boundary"] = \
+        partition_boundary(partition, num.arange(tlower, tupper))
+
+    # Ghost triangles, nodes and boundary
+
+    ghost_ids = ghost_layer_ids(neighbours, tlower, tupper, layer_width)
+    submesh["ghost_triangles"] = \
+        num.concatenate((num.reshape(ghost_ids, (-1,1)),
+                         triangles[ghost_ids]), 1)
+
+    ghost_node_ids = num.unique(triangles[ghost_ids].flat)
+    ghost_node_ids = numset.setdiff1d(ghost_node_ids, full_ids)
+    submesh["ghost_nodes"] = \
+        num.concatenate((num.reshape(ghost_node_ids, (-1,1)),
+                         nodes[ghost_node_ids]), 1)
+
+    submesh["ghost_boundary"] = \
+        ghost_boundary(ghost_ids, tlower, tupper, neighbours,
+                       partition_boundary(partition, ghost_ids))
+
+    # Communication patterns
+
+    ghost_commun = ghost_commun_pattern(submesh["ghost_triangles"], p,
+                                        tri_ranges[1:] - 1)
+    submesh["ghost_commun"] = ghost_commun
+
+    full_commun = dict((i, []) for i in xrange(tlower, tupper))
+    for q in num.unique(ghost_commun[:,1]):
+        ids = ghost_layer_ids(neighbours, tri_ranges[q], tri_ranges[q+1],
+                              layer_width)
+        ids = num.extract(num.logical_and(ids >= tlower, ids < tupper), ids)
+        for i in ids:
+            full_commun[i].append(q)
+    submesh["full_commun"] = full_commun
+
+    # Quantities
+
+    submesh["full_quan"] = {}
+    submesh["ghost_quan"] = {}
+    for k in partition['quantities']:
+        quantity = partition['quantities'][k]
+        submesh["full_quan"][k] = num.array(quantity[tlower:tupper], num.float)
+        submesh["ghost_quan"][k] = num.array(quantity[ghost_ids], num.float)
+
+    return submesh
+
+
+#########################################################
+#
+# Extract the local mesh of processor p from the
+# partition description, as extract_submesh does from
+# the submesh built by build_submesh.
+#
+#########################################################
+
+def extract_local_submesh(partition, p=0, p2s_map=None, parameters=None):
+
+    submesh_cell = build_local_submesh(partition, p, parameters)
+
+    triangles_per_proc = partition['triangles_per_proc']
+    lower_t = int(num.sum(triangles_per_proc[:p]))
+    upper_t = lower_t + int(triangles_per_proc[p])
+
+    numprocs = len(triangles_per_proc)
+    points, vertices, boundary, quantities, ghost_recv_dict, \
+            full_send_dict, tri_map, node_map, tri_l2g, node_l2g, \
+            ghost_layer_width = \
+            build_local_mesh(submesh_cell, lower_t, upper_t, numprocs)
+
+    if p2s_map is None:
+        pass
+    else:
+        try:
+            tri_l2g = p2s_map[tri_l2g]
+        except:
+            tri_l2g = p2s_map
+
+    return  points, vertices, boundary, quantities, ghost_recv_dict, \
+           full_send_dict, tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width
+
+
+#########################################################
+#
+# Quality of a partition
+#
+#  *) For each processor of the partition description:
+# the number of full triangles, their total weight, the
+# number of ghost triangles, the number of edges cut
+# (edges between its triangles and those of another
+# processor) and the number of neighbouring processors.
+# weights are in the order of the partition (the
+# triangle order of the partitioned mesh) and default to
+# one per triangle.
+#
+# -------------------------------------------------------
+#
+#  *) A dictionary of the arrays triangles, weight,
+# ghost_triangles, edge_cut and neighbour_procs (indexed
+# by processor) is returned together with the total
+# edge_cut (each cut edge counted once) and the
+# imbalance, the largest weight of a processor divided by
+# the mean weight.
+#
+#########################################################
+
+def get_partition_statistics(partition, weights=None, parameters=None):
+
+    if parameters is None:
+        layer_width  = 2
+    else:
+        layer_width = parameters['ghost_layer_width']
+
+    neighbours = partition['neighbours']
+    triangles_per_proc = num.array(partition['triangles_per_proc'], num.int)
+    nproc = len(triangles_per_proc)
+
+    tri_ranges = num.zeros(nproc+1, num.int)
+    tri_ranges[1:] = num.cumsum(triangles_per_proc)
+
+    if weights is None:
+        weights = num.ones(tri_ranges[-1], num.float)
+    else:
+        weights = num.array(weights, num.float)
+
+    stats = {}
+    stats['triangles'] = triangles_per_proc
+    stats['weight'] = num.zeros(nproc, num.float)
+    stats['ghost_triangles'] = num.zeros(nproc, num.int)
+    stats['edge_cut'] = num.zeros(nproc, num.int)
+    stats['neighbour_procs'] = num.zeros(nproc, num.int)
+
+    for p in xrange(nproc):
+        tlower = tri_ranges[p]
+        tupper = tri_ranges[p+1]
+
+        stats['weight'][p] = num.sum(weights[tlower:tupper])
+
+        ghost_ids = ghost_layer_ids(neighbours, tlower, tupper, layer_width)
+        stats['ghost_triangles'][p] = len(ghost_ids)
+
+        n = num.array(neighbours[tlower:tupper], num.int).flat
+        n = num.extract(n >= 0, n)
+        n = num.extract(num.logical_or(n < tlower, n >= tupper), n)
+        stats['edge_cut'][p] = len(n)
+
+        procs = num.searchsorted(tri_ranges, n, side='right') - 1
+        stats['neighbour_procs'][p] = len(num.unique(procs))
+
+    stats['total_edge_cut'] = num.sum(stats['edge_cut'])/2
+    stats['imbalance'] = num.max(stats['weight'])/num.mean(stats['weight'])
+
+    return stats
+
+
+#########################################################
+#
+# Return a string reporting the statistics of
+# get_partition_statistics, one line per processor.
+#
+#########################################################
+
+def partition_statistics(partition, weights=None, parameters=None):
+
+    stats = get_partition_statistics(partition, weights, parameters)
+
+    msg = 'Partition statistics:\n'
+    msg += '%6s %10s %12s %10s %10s %10s\n' % ('proc', 'triangles',
+                                              'weight', 'ghosts',
+                                              'edge cut', 'neighbours')
+    for p in range(len(stats['triangles'])):
+        msg += '%6d %10d %12.4g %10d %10d %10d\n' \
+               % (p, stats['triangles'][p], stats['weight'][p],
+                  stats['ghost_triangles'][p], stats['edge_cut'][p],
+                  stats['neighbour_procs'][p])
+
+    msg += 'Total edge cut: %d\n' % stats['total_edge_cut']
+    msg += 'Imbalance (max/mean weight): %.4f\n' % stats['imbalance']
+
+    return msg
@@ -0,0 +1,152 @@
+"""Weights for a load balanced partition of a domain
+
+distribute (and sequential_distribute_dump) accept one weight per
+triangle of the domain, the relative cost of computing that triangle,
+and partition the mesh so that the processors get about the same total
+weight rather than the same number of triangles. This module provides
+such weights:
+
+wet_weights: dry triangles are cheaper than wet ones, from the current
+    depth or an expected wet fraction of each triangle.
+
+measured_weights: from the compute time of each processor and of the
+    fractional step operators, measured with domain.enable_profiling()
+    during a warm up run.
+
+rebalance_from_checkpoint: copies the checkpoint of a parallel run into
+    the sequential domain and returns weights from the compute time each
+    processor recorded in the checkpoint, to continue the run with a
+    balanced partition:
+
+        domain = create_domain()   # the sequential domain, on processor 0
+        weights = rebalance_from_checkpoint(domain, name, checkpoint_dir)
+        time = domain.get_time()
+        domain = distribute(domain, weights=weights)
+        domain.set_time(time)      # on all processors (e.g. with bcast)
+
+The quality of a partition is reported by Sequential_distribute.statistics
+(printed by distribute when verbose).
+"""
+
+import numpy as num
+
+from anuga.utilities.numerical_tools import ensure_numeric
+from anuga.utilities.parallel_abstraction import allreduce, SUM
+from anuga.abstract_2d_finite_volumes.profiler import get_operator_name
+
+
+def wet_weights(domain, wet_fraction=None, dry_cost=0.2):
+    """Return weights of the triangles of domain: 1 for wet triangles
+    and dry_cost for dry triangles.
+
+    wet_fraction: expected fraction of the time each triangle is wet
+    (scalar or one value per triangle). If None the triangles with a
+    depth above the minimum allowed height are wet.
+    """
+
+    N = len(domain)
+
+    if wet_fraction is None:
+        stage = domain.quantities['stage'].centroid_values
+        elevation = domain.quantities['elevation'].centroid_values
+        wet = stage - elevation > domain.get_minimum_allowed_height()
+        wet_fraction = num.where(wet, 1.0, 0.0)
+
+    wet_fraction = ensure_numeric(wet_fraction, num.float)*num.ones(N)
+
+    msg = 'Wet fraction must be between 0 and 1'
+    assert num.all(wet_fraction >= 0.0) and num.all(wet_fraction <= 1.0), msg
+
+    return dry_cost + (1.0 - dry_cost)*wet_fraction
+
+
+def measured_weights(domain, dry_cost=None):
+    """Return weights of the triangles from the compute time measured
+    while evolving domain with profiling enabled (see enable_profiling).
+
+    The time of each fractional step operator acting on given triangles
+    (with attribute indices) is spread over those triangles and the
+    rest of the compute time of the processor over all of its full
+    triangles, evenly or, if dry_cost is given, as wet_weights.
+
+    For a parallel domain the weights of the triangles of all processors
+    are returned, in the order of the sequential domain (this is a
+    collective operation).
+    """
+
+    profiler = domain.get_profiler()
+    msg = 'Enable profiling (domain.enable_profiling()) and evolve the '
+    msg += 'domain to measure the compute time'
+    assert profiler is not None, msg
+
+    full = domain.number_of_full_triangles
+    weights = num.zeros(full, num.float)
+
+    operator_times = profiler.get_operator_times()
+    names = [get_operator_name(operator)
+             for operator in domain.fractional_step_operators]
+
+    # Operators acting on some triangles. The time of operators
+    # sharing a name is shared equally.
+    remaining = profiler.get_compute_time()
+    for name, operator in zip(names, domain.fractional_step_operators):
+        indices = getattr(operator, 'indices', None)
+        if indices is None or name not in operator_times:
+            continue
+
+        indices = num.array(indices, num.int).reshape(-1)
+        indices = indices[indices < full]
+        if len(indices) == 0:
+            continue
+
+        time = operator_times[name]/names.count(name)
+        weights[indices] += time/len(indices)
+        remaining -= time
+
+    # The rest of the compute time
+    if dry_cost is None:
+        base = num.ones(full, num.float)
+    else:
+        base = wet_weights(domain, dry_cost=dry_cost)[:full]
+    weights += max(remaining, 0.0)*base/num.sum(base)
+
+    tri_l2g = getattr(domain, 'tri_l2g', None)
+    if tri_l2g is None or domain.numproc == 1:
+        return weights
+
+    global_weights = num.zeros(domain.number_of_global_triangles, num.float)
+    global_weights[tri_l2g[:full]] = weights
+
+    return allreduce(global_weights, SUM)
+
+
+def rebalance_from_checkpoint(domain, domain_name='domain',
+                              checkpoint_dir='.', time=None, dry_cost=None):
+    """Copy the checkpoint of a (parallel) run into the sequential domain
+    and return weights for distributing it from the compute time of each
+    processor of that run recorded in the checkpoint.
+
+    The compute time of each processor is spread over its triangles,
+    evenly or, if dry_cost is given, as wet_weights. The processors of
+    the run need to have been profiled (see enable_profiling); if not,
+    the weights are those with equal compute times. See
+    checkpoint.load_checkpoint_sequential for the other arguments.
+    """
+
+    from anuga.shallow_water.checkpoint import load_checkpoint_sequential
+
+    processors = load_checkpoint_sequential(domain, domain_name,
+                                            checkpoint_dir, time)
+
+    if dry_cost is None:
+        base = num.ones(len(domain), num.float)
+    else:
+        base = wet_weights(domain, dry_cost=dry_cost)
+
+    weights = base.copy()
+    for ids, compute_time in processors:
+        if compute_time is None:
+            compute_time = 1.0
+        weights[ids] = compute_time*base[ids]/num.sum(base[ids])
+
+    return weights
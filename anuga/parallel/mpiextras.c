@@ -354,6 +354,65 @@ static PyObject *allreduce_array(PyObject *self, PyObject *args) {
 }
 
 
+/*************************************************************/
+/* allgather_array                                           */
+/* Allgather Numpy array of type float, double, int, or long */
+/* into buffer holding numprocs times as many elements       */
+/*                                                           */
+/*************************************************************/
+static PyObject *allgather_array(PyObject *self, PyObject *args) {
+  PyArrayObject *x;
+  PyArrayObject *d;
+  int error, count, count1, myid, numprocs;
+  MPI_Datatype mpi_type, buffer_type;
+
+  /* process the parameters */
+  if (!PyArg_ParseTuple(args, "OO", &x, &d)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiext.c (allgather_array): could not parse input");
+    return NULL;
+  }
+
+  /* Input check and determination of MPI type */
+  mpi_type = type_map(x, &count);
+  if (!mpi_type) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiext.c (allgather_array): could not determine mpi_type");
+    return NULL;
+  }
+
+  buffer_type = type_map(d, &count1);
+  if (mpi_type != buffer_type) {
+    sprintf(errmsg, "mpiext.c (allgather_array): Input array and buffer must be of the same type.");
+    PyErr_SetString(PyExc_RuntimeError, errmsg);
+
+    return NULL;
+  }
+
+  MPI_Comm_size(MPI_COMM_WORLD, &numprocs);
+  if (count*numprocs != count1) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiext.c (allgather_array): Buffer must be numprocs times as long as input array");
+    return NULL;
+  }
+
+  /* call the MPI routine */
+  error =  MPI_Allgather(x->data, count, mpi_type, d->data, count, mpi_type, \
+			MPI_COMM_WORLD);
+
+  if (error != 0) {
+    MPI_Comm_rank(MPI_COMM_WORLD, &myid);
+    sprintf(errmsg, "Proc %d: MPI_Allgather failed with error code %d\n",
+	    myid, error);
+    PyErr_SetString(PyExc_RuntimeError, errmsg);
+    return NULL;
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
 /*************************************************************/
 /* do multiple isends and irecv of Numpy array buffers        */
 /* of type float, double, int, or long                       */
@@ -599,6 +658,421 @@ static PyObject *send_recv_via_dicts(PyObject *self, PyObject *args) {
 
 
  
+/*************************************************************/
+/* Packed ghost exchange                                     */
+/*                                                           */
+/* The values of several quantities are gathered into one    */
+/* contiguous buffer per neighbour (quantity major, ie the   */
+/* values of quantity q are X[q*n:(q+1)*n]). The exchange is */
+/* split into a start, which posts non-blocking receives and */
+/* sends, and a wait, which returns the receives as they     */
+/* complete so that they can be unpacked while other         */
+/* messages are still in flight.                             */
+/*                                                           */
+/* The MPI requests of an exchange are kept in a byte array  */
+/* made by ghost_exchange_requests, one per exchange plan,   */
+/* receives first. Finished and cancelled requests are       */
+/* MPI_REQUEST_NULL.                                         */
+/*************************************************************/
+
+#define GHOST_EXCHANGE_TAG 124
+
+
+/* Return the MPI requests held by the array R, or NULL and set  */
+/* a Python exception if R does not hold at least n requests     */
+static MPI_Request *get_requests(char *name, PyObject *R, int n) {
+
+  PyArrayObject *A = (PyArrayObject *) R;
+
+  if (!PyArray_Check(R) || !PyArray_ISCARRAY(A) ||
+      A->descr->type_num != NPY_UBYTE ||
+      PyArray_NBYTES(A) < n*sizeof(MPI_Request)) {
+    sprintf(errmsg, "mpiextras.c (%s): requests must be made by ghost_exchange_requests", name);
+    PyErr_SetString(PyExc_ValueError, errmsg);
+    return NULL;
+  }
+
+  return (MPI_Request *) A->data;
+}
+
+
+/* Cancel and free the outstanding requests of an exchange */
+static void cancel_requests(MPI_Request *requests, int n) {
+
+  int k;
+
+  for (k = 0; k < n; k++) {
+    if (requests[k] != MPI_REQUEST_NULL) {
+      MPI_Cancel(&requests[k]);
+      MPI_Request_free(&requests[k]);
+    }
+  }
+}
+
+
+/* Return a byte array holding n requests for ghost_exchange_start */
+static PyObject *ghost_exchange_requests(PyObject *self, PyObject *args) {
+
+  PyArrayObject *R;
+  MPI_Request *requests;
+  npy_intp dims[1];
+  int k, n;
+
+  if (!PyArg_ParseTuple(args, "i", &n) || n < 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (ghost_exchange_requests): could not parse input");
+    return NULL;
+  }
+
+  dims[0] = n*sizeof(MPI_Request);
+  R = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_UBYTE);
+  if (R == NULL) {
+    return NULL;
+  }
+
+  requests = (MPI_Request *) R->data;
+  for (k = 0; k < n; k++) {
+    requests[k] = MPI_REQUEST_NULL;
+  }
+
+  return PyArray_Return(R);
+}
+
+
+/* Check the arguments of pack_quantities and unpack_quantities:  */
+/* X and the quantities must be C contiguous double arrays, Id a   */
+/* C contiguous long array of valid indices into each quantity and */
+/* X large enough for all the quantities. Returns 0 and sets a     */
+/* Python exception otherwise.                                     */
+static int check_quantities(char *name, PyArrayObject *X, PyArrayObject *Id,
+                            PyObject *quantities) {
+
+  PyArrayObject *Q;
+  long *iddata;
+  long n, j, size;
+  int q, nq;
+  char msg[256];
+
+  if (!PyArray_Check(X) || PyArray_TYPE(X) != NPY_DOUBLE ||
+      !PyArray_ISCARRAY(X)) {
+    sprintf(msg, "mpiextras.c (%s): buffer must be a contiguous float array", name);
+    PyErr_SetString(PyExc_TypeError, msg);
+    return 0;
+  }
+
+  if (!PyArray_Check(Id) || PyArray_TYPE(Id) != NPY_LONG ||
+      !PyArray_ISCARRAY(Id) || PyArray_NDIM(Id) != 1) {
+    sprintf(msg, "mpiextras.c (%s): ids must be a contiguous 1d int array", name);
+    PyErr_SetString(PyExc_TypeError, msg);
+    return 0;
+  }
+
+  if (!PyList_Check(quantities)) {
+    sprintf(msg, "mpiextras.c (%s): quantities must be a list", name);
+    PyErr_SetString(PyExc_TypeError, msg);
+    return 0;
+  }
+
+  n = PyArray_DIM(Id, 0);
+  nq = PyList_Size(quantities);
+
+  if (PyArray_SIZE(X) < n*nq) {
+    sprintf(msg, "mpiextras.c (%s): buffer too small", name);
+    PyErr_SetString(PyExc_ValueError, msg);
+    return 0;
+  }
+
+  iddata = (long *) PyArray_DATA(Id);
+
+  for (q = 0; q < nq; q++) {
+    Q = (PyArrayObject *) PyList_GetItem(quantities, q);
+    if (!PyArray_Check(Q) || PyArray_TYPE(Q) != NPY_DOUBLE ||
+        !PyArray_ISCARRAY(Q)) {
+      sprintf(msg, "mpiextras.c (%s): quantity %d must be a contiguous float array",
+              name, q);
+      PyErr_SetString(PyExc_TypeError, msg);
+      return 0;
+    }
+
+    size = PyArray_SIZE(Q);
+    for (j = 0; j < n; j++) {
+      if (iddata[j] < 0 || iddata[j] >= size) {
+        sprintf(msg, "mpiextras.c (%s): id %ld out of bounds for quantity %d",
+                name, iddata[j], q);
+        PyErr_SetString(PyExc_IndexError, msg);
+        return 0;
+      }
+    }
+  }
+
+  return 1;
+}
+
+
+/* Gather centroid values of a list of quantities into buffer X */
+static PyObject *pack_quantities(PyObject *self, PyObject *args) {
+
+  PyArrayObject *X, *Id, *Q;
+  PyObject *quantities;
+  double *xdata, *qdata;
+  long *iddata;
+  long n, j;
+  int q, nq;
+
+  if (!PyArg_ParseTuple(args, "OOO", &X, &Id, &quantities)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (pack_quantities): could not parse input");
+    return NULL;
+  }
+
+  if (!check_quantities("pack_quantities", X, Id, quantities)) {
+    return NULL;
+  }
+
+  n = Id->dimensions[0];
+  nq = PyList_Size(quantities);
+
+  xdata = (double *) X->data;
+  iddata = (long *) Id->data;
+
+  for (q = 0; q < nq; q++) {
+    Q = (PyArrayObject *) PyList_GetItem(quantities, q);
+    qdata = (double *) Q->data;
+    for (j = 0; j < n; j++) {
+      xdata[q*n + j] = qdata[iddata[j]];
+    }
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+/* Scatter buffer X into centroid values of a list of quantities */
+static PyObject *unpack_quantities(PyObject *self, PyObject *args) {
+
+  PyArrayObject *X, *Id, *Q;
+  PyObject *quantities;
+  double *xdata, *qdata;
+  long *iddata;
+  long n, j;
+  int q, nq;
+
+  if (!PyArg_ParseTuple(args, "OOO", &X, &Id, &quantities)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (unpack_quantities): could not parse input");
+    return NULL;
+  }
+
+  if (!check_quantities("unpack_quantities", X, Id, quantities)) {
+    return NULL;
+  }
+
+  n = Id->dimensions[0];
+  nq = PyList_Size(quantities);
+
+  xdata = (double *) X->data;
+  iddata = (long *) Id->data;
+
+  for (q = 0; q < nq; q++) {
+    Q = (PyArrayObject *) PyList_GetItem(quantities, q);
+    qdata = (double *) Q->data;
+    for (j = 0; j < n; j++) {
+      qdata[iddata[j]] = xdata[q*n + j];
+    }
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+/* Check that item is a (proc, X) tuple of a processor and a    */
+/* C contiguous double array and return X, or NULL and set a     */
+/* Python exception otherwise                                    */
+static PyArrayObject *get_exchange_buffer(PyObject *item, int *proc) {
+
+  PyArrayObject *X;
+
+  if (!PyTuple_Check(item) || PyTuple_Size(item) != 2 ||
+      !PyArray_Check(PyTuple_GetItem(item, 1))) {
+    PyErr_SetString(PyExc_ValueError,
+		    "mpiextras.c (ghost_exchange_start): buffers must be (proc, X) tuples");
+    return NULL;
+  }
+
+  *proc = (int) PyInt_AsLong(PyTuple_GetItem(item, 0));
+  if (*proc == -1 && PyErr_Occurred()) {
+    return NULL;
+  }
+
+  X = (PyArrayObject *) PyTuple_GetItem(item, 1);
+  if (X->descr->type_num != NPY_DOUBLE || !PyArray_ISCARRAY(X)) {
+    PyErr_SetString(PyExc_ValueError,
+		    "mpiextras.c (ghost_exchange_start): buffers must be C contiguous double arrays");
+    return NULL;
+  }
+
+  return X;
+}
+
+
+/* Post irecv for each (proc, X) in recv_list and isend for  */
+/* each (proc, X) in send_list, keeping the requests in R    */
+static PyObject *ghost_exchange_start(PyObject *self, PyObject *args) {
+
+  PyObject *send_list, *recv_list, *R;
+  PyArrayObject *X;
+  MPI_Request *requests;
+  int k, proc, ierr, lenx, num_recv, num_send;
+
+  if (!PyArg_ParseTuple(args, "OOO", &send_list, &recv_list, &R) ||
+      !PyList_Check(send_list) || !PyList_Check(recv_list)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (ghost_exchange_start): could not parse input");
+    return NULL;
+  }
+
+  num_recv = PyList_Size(recv_list);
+  num_send = PyList_Size(send_list);
+
+  requests = get_requests("ghost_exchange_start", R, num_recv + num_send);
+  if (requests == NULL) {
+    return NULL;
+  }
+
+  for (k = 0; k < num_recv + num_send; k++) {
+    if (requests[k] != MPI_REQUEST_NULL) {
+      PyErr_SetString(PyExc_RuntimeError,
+		      "mpiextras.c (ghost_exchange_start): previous exchange not finished");
+      return NULL;
+    }
+  }
+
+  //----------------------------------------------------------------------------
+  // Do the recv first
+  //----------------------------------------------------------------------------
+  for (k = 0; k < num_recv; k++) {
+    X = get_exchange_buffer(PyList_GetItem(recv_list, k), &proc);
+    if (X == NULL) {
+      cancel_requests(requests, k);
+      return NULL;
+    }
+    lenx = (int) PyArray_SIZE(X);
+
+    ierr = MPI_Irecv(X->data, lenx, MPI_DOUBLE, proc, GHOST_EXCHANGE_TAG,
+                     MPI_COMM_WORLD, &requests[k]);
+    if (ierr != MPI_SUCCESS) {
+      cancel_requests(requests, k);
+      PyErr_SetString(PyExc_RuntimeError,
+		      "mpiextras.c (ghost_exchange_start): error from MPI_Irecv");
+      return NULL;
+    }
+  }
+
+  //----------------------------------------------------------------------------
+  // Do the sends second
+  //----------------------------------------------------------------------------
+  for (k = 0; k < num_send; k++) {
+    X = get_exchange_buffer(PyList_GetItem(send_list, k), &proc);
+    if (X == NULL) {
+      cancel_requests(requests, num_recv + k);
+      return NULL;
+    }
+    lenx = (int) PyArray_SIZE(X);
+
+    ierr = MPI_Isend(X->data, lenx, MPI_DOUBLE, proc, GHOST_EXCHANGE_TAG,
+                     MPI_COMM_WORLD, &requests[num_recv + k]);
+    if (ierr != MPI_SUCCESS) {
+      cancel_requests(requests, num_recv + k);
+      PyErr_SetString(PyExc_RuntimeError,
+		      "mpiextras.c (ghost_exchange_start): error from MPI_Isend");
+      return NULL;
+    }
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+/* Wait for the next of the num_recv receives in R to complete and */
+/* return its index in recv_list, or -1 if all receives have       */
+/* completed. On error the whole exchange of n requests is         */
+/* cancelled.                                                      */
+static PyObject *ghost_exchange_waitany(PyObject *self, PyObject *args) {
+
+  PyObject *R;
+  MPI_Request *requests;
+  int index, ierr, num_recv, n;
+  MPI_Status status;
+
+  if (!PyArg_ParseTuple(args, "Oii", &R, &num_recv, &n) ||
+      num_recv < 0 || num_recv > n) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (ghost_exchange_waitany): could not parse input");
+    return NULL;
+  }
+
+  requests = get_requests("ghost_exchange_waitany", R, n);
+  if (requests == NULL) {
+    return NULL;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  ierr = MPI_Waitany(num_recv, requests, &index, &status);
+  Py_END_ALLOW_THREADS
+
+  if (ierr != MPI_SUCCESS) {
+    cancel_requests(requests, n);
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (ghost_exchange_waitany): error from MPI_Waitany");
+    return NULL;
+  }
+
+  if (index == MPI_UNDEFINED) {
+    index = -1;
+  }
+
+  return Py_BuildValue("i", index);
+}
+
+
+/* Complete all outstanding receives and sends of the n requests */
+/* in R, cancelling the rest on error                            */
+static PyObject *ghost_exchange_finish(PyObject *self, PyObject *args) {
+
+  PyObject *R;
+  MPI_Request *requests;
+  int ierr, n;
+
+  if (!PyArg_ParseTuple(args, "Oi", &R, &n) || n < 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (ghost_exchange_finish): could not parse input");
+    return NULL;
+  }
+
+  requests = get_requests("ghost_exchange_finish", R, n);
+  if (requests == NULL) {
+    return NULL;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  ierr = MPI_Waitall(n, requests, MPI_STATUSES_IGNORE);
+  Py_END_ALLOW_THREADS
+
+  if (ierr != MPI_SUCCESS) {
+    cancel_requests(requests, n);
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (ghost_exchange_finish): error from MPI_Waitall");
+    return NULL;
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
 /**********************************/
 /* Method table for python module */
 /**********************************/
@@ -606,8 +1080,15 @@ static struct PyMethodDef MethodTable[] = {
   {"isend_array", isend_array, METH_VARARGS},
   {"ireceive_array", ireceive_array, METH_VARARGS},
   {"allreduce_array", allreduce_array, METH_VARARGS},
+  {"allgather_array", allgather_array, METH_VARARGS},
   {"sendrecv_array", sendrecv_array, METH_VARARGS},
   {"send_recv_via_dicts", send_recv_via_dicts, METH_VARARGS},
+  {"pack_quantities", pack_quantities, METH_VARARGS},
+  {"unpack_quantities", unpack_quantities, METH_VARARGS},
+  {"ghost_exchange_requests", ghost_exchange_requests, METH_VARARGS},
+  {"ghost_exchange_start", ghost_exchange_start, METH_VARARGS},
+  {"ghost_exchange_waitany", ghost_exchange_waitany, METH_VARARGS},
+  {"ghost_exchange_finish", ghost_exchange_finish, METH_VARARGS},
   {NULL, NULL}
 };
 
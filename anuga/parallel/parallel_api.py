@@ -9,6 +9,8 @@ import numpy as num
 from anuga.utilities.parallel_abstraction import size, rank, get_processor_name
 from anuga.utilities.parallel_abstraction import finalize, send, receive
 from anuga.utilities.parallel_abstraction import pypar_available, barrier
+from anuga.utilities.parallel_abstraction import allreduce, allgather, bcast
+from anuga.utilities.parallel_abstraction import SUM, MIN, MAX
 
 
 
@@ -43,57 +45,81 @@ processor_name = get_processor_name()
 
 
 def collect_value(value):
-    
-    value = value
+    """Return value summed over all processors
+    """
 
-    if myid == 0:
-        for i in range(numprocs):
-            if i == 0: continue
-            val = receive(i)
-            value = value + val
-    else:
-        send(value, 0)
-        
-    
-    if myid == 0:
-        for i in range(1,numprocs):
-            send(value,i)
-    else:
-        value = receive(0)
-   
+    return allreduce(value, SUM)
 
-    return value   
-    
 
 
 
-def distribute(domain, verbose=False, debug=False, parameters = None):
+def distribute(domain, verbose=False, debug=False, parameters = None,
+               partition_dir = None, weights = None):
     """ Distribute the domain to all processes
 
     parameters allows user to change size of ghost layer
+
+    weights (one per triangle of domain, only needed on processor 0)
+    are the relative costs of the triangles which the partition balances,
+    e.g. from anuga.parallel.load_balance. By default each processor
+    gets about the same number of triangles.
+
+    Processor 0 partitions the mesh. By default it then builds the
+    submesh of each processor in turn and sends it. If partition_dir
+    (a directory visible to all processors) is given the partition is
+    written there instead and each processor builds its own submesh from
+    the memory mapped files, in parallel.
     """
 
     if not pypar_available or numprocs == 1 : return domain # Bypass
 
-        
+    from sequential_distribute import Sequential_distribute
+
     if myid == 0:
-        from sequential_distribute import Sequential_distribute
-        partition = Sequential_distribute(domain, verbose, debug, parameters)
+        partition = Sequential_distribute(domain, verbose, debug, parameters,
+                                          weights)
 
         partition.distribute(numprocs)
 
+        if partition_dir is not None:
+            partition.dump_partition(partition_dir)
+
+    if partition_dir is not None:
+
+        barrier()
+
+        if myid != 0:
+            partition = Sequential_distribute(None, verbose, debug,
+                                              parameters)
+            partition.load_partition(partition_dir)
+
+        kwargs, points, vertices, boundary, quantities, boundary_map, \
+            domain_name, domain_dir, domain_store, domain_store_centroids, \
+            domain_minimum_storable_height, domain_minimum_allowed_height, \
+            domain_flow_algorithm, domain_georef, \
+            domain_quantities_to_be_stored, domain_smooth \
+             = partition.extract_submesh(myid)
+
+        partition = None
+
+    elif myid == 0:
+
+        for p in range(1, numprocs):
+
+            tostore = partition.extract_submesh(p)
+
+            send(tostore,p)
+
+            tostore = None
+
         kwargs, points, vertices, boundary, quantities, boundary_map, \
                 domain_name, domain_dir, domain_store, domain_store_centroids, \
                 domain_minimum_storable_height, domain_minimum_allowed_height, \
                 domain_flow_algorithm, domain_georef, \
                 domain_quantities_to_be_stored, domain_smooth \
                  = partition.extract_submesh(0)
-        
-        for p in range(1, numprocs):
-
-            tostore = partition.extract_submesh(p)
 
-            send(tostore,p)
+        partition = None
 
     else:
 
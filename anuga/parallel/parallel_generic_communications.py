@@ -27,6 +27,11 @@ def setup_buffers(domain):
     domain.communication_reduce_time = 0.0
     domain.communication_broadcast_time = 0.0
 
+    # Ghost exchange plans for each set of quantities and the plan of the
+    # exchange between communicate_ghosts_start and communicate_ghosts_finish
+    domain.ghost_exchange_plans = {}
+    domain.ghost_exchange_pending = None
+
 
 def communicate_flux_timestep(domain, yieldstep, finaltime):
     """Calculate local timestep
@@ -133,70 +138,145 @@ def communicate_ghosts_blocking(domain):
 
 
 
-def communicate_ghosts_asynchronous(domain, quantities=None):
+def get_ghost_exchange_plan(domain, quantities):
+    """Return gather/scatter plan for exchanging the centroid values of
+    quantities with the neighbouring processors.
 
-    # We must send the information from the full cells and
-    # receive the information for the ghost cells
-    # We have a dictionary of lists with ghosts expecting updates from
-    # the separate processors
-    # Using isend and irecv
+    The plan is computed once for each set of quantities and stored
+    on the domain. For each neighbour it holds the local ids of the
+    full (send) or ghost (receive) cells and one contiguous buffer
+    for the values of all the quantities, and it holds the MPI requests
+    of the exchange.
+    """
+
+    from anuga.parallel import mpiextras
+
+    key = tuple(quantities)
+    try:
+        return domain.ghost_exchange_plans[key]
+    except KeyError:
+        pass
+
+    nq = len(quantities)
+    myid = domain.processor
+
+    plan = {}
+    plan['quantities'] = list(quantities)
+    plan['send'] = []
+    plan['recv'] = []
+    plan['local'] = None
+
+    for send_proc in sorted(domain.full_send_dict):
+        Idf = num.array(domain.full_send_dict[send_proc][0], num.int)
+        if send_proc == myid:
+            Idg = num.array(domain.ghost_recv_dict[myid][0], num.int)
+            plan['local'] = (Idf, Idg)
+        else:
+            Xout = num.zeros((nq, len(Idf)), num.float)
+            plan['send'].append((int(send_proc), Idf, Xout))
+
+    for recv_proc in sorted(domain.ghost_recv_dict):
+        if recv_proc == myid:
+            continue
+        Idg = num.array(domain.ghost_recv_dict[recv_proc][0], num.int)
+        X = num.zeros((nq, len(Idg)), num.float)
+        plan['recv'].append((int(recv_proc), Idg, X))
+
+    # Arguments for mpiextras.ghost_exchange_start
+    plan['send_buffers'] = [(proc, X) for proc, _, X in plan['send']]
+    plan['recv_buffers'] = [(proc, X) for proc, _, X in plan['recv']]
+    plan['num_requests'] = len(plan['send']) + len(plan['recv'])
+    plan['requests'] = mpiextras.ghost_exchange_requests(plan['num_requests'])
+
+    domain.ghost_exchange_plans[key] = plan
+
+    return plan
+
+
+def communicate_ghosts_start(domain, quantities=None):
+    """Start updating the ghost cells of quantities (default conserved
+    quantities) using a packed non-blocking exchange.
+
+    Updates the ghost cells which are copies of full cells on this
+    processor, packs the centroid values of the full cells into one
+    buffer per neighbour and posts non-blocking sends and receives.
+    Computation not involving the ghost cells can proceed until
+    communicate_ghosts_finish, which must be called even if that
+    computation fails.
+    """
 
-    import numpy as num
     import time
+    from anuga.parallel import mpiextras
+
     t0 = time.time()
-    
-    if quantities is None:
-        quantities = domain.conserved_quantities
 
-    # update of non-local ghost cells by copying full cell data into the
-    # Xout buffer arrays
+    if domain.ghost_exchange_pending is not None:
+        raise Exception('Previous ghost exchange not finished')
 
-    #iproc == domain.processor
+    if quantities is None:
+        quantities = domain.conserved_quantities
 
-    #Setup send buffer arrays for sending full data to other processors
-    for send_proc in domain.full_send_dict:
-        Idf  = domain.full_send_dict[send_proc][0]
-        Xout = domain.full_send_dict[send_proc][2]
+    plan = get_ghost_exchange_plan(domain, quantities)
+    centroid_values = [domain.quantities[q].centroid_values
+                       for q in plan['quantities']]
 
-        for i, q in enumerate(quantities):
-            #print 'Store send data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            Xout[:,i] = num.take(Q_cv, Idf)
+    for send_proc, Idf, Xout in plan['send']:
+        mpiextras.pack_quantities(Xout, Idf, centroid_values)
 
+    # Local update of ghost cells
+    if plan['local'] is not None:
+        Idf, Idg = plan['local']
+        for Q_cv in centroid_values:
+            num.put(Q_cv, Idg, num.take(Q_cv, Idf))
 
+    mpiextras.ghost_exchange_start(plan['send_buffers'], plan['recv_buffers'],
+                                   plan['requests'])
+    domain.ghost_exchange_pending = plan
 
+    domain.communication_time += time.time()-t0
 
 
+def communicate_ghosts_finish(domain):
+    """Complete the ghost update started by communicate_ghosts_start,
+    unpacking the receive buffers in the order the messages arrive.
+    """
 
-    # Do all the comuunication using isend/irecv via the buffers in the
-    # full_send_dict and ghost_recv_dict
+    import time
     from anuga.parallel import mpiextras
 
-    mpiextras.send_recv_via_dicts(domain.full_send_dict,domain.ghost_recv_dict)
+    t0 = time.time()
 
-#
-#    if pypar.rank() == 0:
-#        print 'After commun 0'
-#        pprint(domain.ghost_recv_dict)
-#
-#    if pypar.rank() == 1:
-#        print 'After commun 1'
-#        pprint(domain.ghost_recv_dict)
+    plan = domain.ghost_exchange_pending
+    if plan is None:
+        return
 
-    # Now copy data from receive buffers to the domain
-    for recv_proc in domain.ghost_recv_dict:
-        Idg  = domain.ghost_recv_dict[recv_proc][0]
-        X    = domain.ghost_recv_dict[recv_proc][2]
+    try:
+        centroid_values = [domain.quantities[q].centroid_values
+                           for q in plan['quantities']]
 
-        #print recv_proc
-        #print X
+        while True:
+            k = mpiextras.ghost_exchange_waitany(plan['requests'],
+                                                 len(plan['recv']),
+                                                 plan['num_requests'])
+            if k < 0:
+                break
 
-        for i, q in enumerate(quantities):
-            #print 'Read receive data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            num.put(Q_cv, Idg, X[:,i])
+            recv_proc, Idg, X = plan['recv'][k]
+            mpiextras.unpack_quantities(X, Idg, centroid_values)
+    finally:
+        # Wait for the sends so the send buffers can be reused, also
+        # when unpacking failed, so the next exchange can start
+        domain.ghost_exchange_pending = None
+        mpiextras.ghost_exchange_finish(plan['requests'],
+                                        plan['num_requests'])
 
+        domain.communication_time += time.time()-t0
 
-    domain.communication_time += time.time()-t0
 
+def communicate_ghosts_asynchronous(domain, quantities=None):
+    """Update the ghost cells of quantities (default conserved quantities)
+    using a packed non-blocking exchange, see communicate_ghosts_start.
+    """
 
+    communicate_ghosts_start(domain, quantities)
+    communicate_ghosts_finish(domain)
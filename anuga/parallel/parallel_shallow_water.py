@@ -143,10 +143,24 @@ class Parallel_domain(Domain):
         generic_comms.communicate_ghosts_asynchronous(self, quantities)
         #generic_comms.communicate_ghosts_blocking(self)
 
-    def apply_fractional_steps(self):
+    def update_ghosts_start(self, quantities=None):
+        """Start sending full cell values to the neighbouring processors.
 
-        for operator in self.fractional_step_operators:
-            operator()
+        Computation not involving the ghost cells can proceed until
+        update_ghosts_finish is called, see update_ghosts_and_compute_fluxes.
+        """
+
+        generic_comms.communicate_ghosts_start(self, quantities)
+
+    def update_ghosts_finish(self):
+        """Wait for the ghost cell values started by update_ghosts_start
+        """
+
+        generic_comms.communicate_ghosts_finish(self)
+
+    def apply_fractional_steps(self, operators=None):
+
+        Domain.apply_fractional_steps(self, operators)
 
         # PETE: Make sure that there are no deadlocks here
 
@@ -154,7 +168,7 @@ class Parallel_domain(Domain):
 
 
 
-    def sww_merge(self, verbose=False, delete_old=False):
+    def sww_merge(self, verbose=False, delete_old=False, jobs=1):
 
         # make sure all the computations have finished
 
@@ -166,7 +180,7 @@ class Parallel_domain(Domain):
 
             global_name = join(self.get_datadir(),self.get_global_name())
             
-            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old)
+            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old,jobs)
 
         # make sure all the merge completes on processor 0 before other
         # processors complete (like when finalize is forgotten in main script)
@@ -35,6 +35,7 @@ Public functions:
 isend() -- Asyncronous send (arrays)
 receive() --  Asyncronous receive (arrays)
 allreduce() -- wrapper for MPI_Allreduce (array)
+allgather() -- wrapper for MPI_Allgather (array)
 
 
 See doc strings of individual functions for detailed documentation.
@@ -264,6 +265,43 @@ def allreduce(x, op, buffer=None, vanilla=0, bypass=False):
 
 
 
+def allgather(x, buffer=None, bypass=False):
+    """Allgather the arrays x of all processors into buffer, which
+       has numproc times as many elements as x. The result is stacked
+       along a new first axis (processor id).
+
+       If bypass is True, all admin and error checks
+       get bypassed to reduce the latency.
+       The buffer must be specified explicitly in this case.
+    """
+
+    if bypass:
+        allgather_array(x, buffer)
+        return
+
+    from pypar import size
+    numproc = size()
+
+    # Create metadata about object
+    protocol, typecode, size, shape = create_control_info(x)
+
+    if protocol == 'array':
+        if buffer is None:
+            buffer = zeros([numproc] + list(shape), typecode)
+
+        msg = 'Data array and buffer must have same type '
+        msg = 'in allgather. I got types "%s" and "%s"' % (x.dtype.char,
+                                                        buffer.dtype.char)
+        assert x.dtype.char == buffer.dtype.char, msg
+        allgather_array(x, buffer)
+
+    elif (protocol == 'vanilla' or protocol == 'string'):
+        raise 'Protocol: %s unsupported for allgather' % protocol
+    else:
+        raise 'Unknown protocol: %s' % protocol
+
+    return buffer
+
 
 #---------------------------------------------------------
 # INTERNAL FUNCTIONS
@@ -510,7 +548,8 @@ else:
     from mpiextras import \
          isend_array, \
          ireceive_array, \
-         allreduce_array
+         allreduce_array, \
+         allgather_array
 
     # Work around bug in OpenMPI (December 2009):
     # https://bugs.launchpad.net/ubuntu/+source/petsc4py/+bug/232036
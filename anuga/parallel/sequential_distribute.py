@@ -16,13 +16,46 @@ from anuga.parallel.distribute_mesh  import extract_submesh
 from anuga.parallel.distribute_mesh import build_submesh
 from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
 
+# Partition description from which each submesh is built on its own
+from anuga.parallel.distribute_mesh import reorder_neighbours
+from anuga.parallel.distribute_mesh import build_partition
+from anuga.parallel.distribute_mesh import extract_local_submesh
+from anuga.parallel.distribute_mesh import dump_partition
+from anuga.parallel.distribute_mesh import load_partition
+from anuga.parallel.distribute_mesh import partition_statistics
+
 from anuga.parallel.parallel_shallow_water import Parallel_domain
 
 
 
 class Sequential_distribute(object):
+    """Partition a domain and extract the submesh of each processor.
+
+    distribute builds the partition description (see
+    distribute_mesh.build_partition) and extract_submesh builds the
+    submesh of one processor from it, so only one submesh is held at a
+    time. The partition can be written with dump_partition and read,
+    memory mapped, with load_partition by an instance created without a
+    domain, so that each processor can extract its own submesh.
+
+    weights (one per triangle of the domain) are the relative costs of
+    the triangles which the partition balances, see
+    distribute_mesh.metis_partition_weighted. By default the triangles
+    are balanced in number.
+    """
+
+    # Domain attributes transferred to the submeshes
+    attribute_names = ['numprocs', 'domain_name', 'domain_dir',
+                       'domain_store', 'domain_store_centroids',
+                       'domain_minimum_storable_height',
+                       'domain_flow_algorithm',
+                       'domain_minimum_allowed_height', 'domain_georef',
+                       'domain_quantities_to_be_stored', 'domain_smooth',
+                       'number_of_global_triangles',
+                       'number_of_global_nodes', 'boundary_map', 'p2s_map']
 
-    def __init__(self, domain, verbose=False, debug=False, parameters=None):
+    def __init__(self, domain=None, verbose=False, debug=False,
+                 parameters=None, weights=None):
 
         if debug:
             verbose = True
@@ -31,6 +64,7 @@ class Sequential_distribute(object):
         self.verbose = verbose
         self.debug = debug
         self.parameters = parameters
+        self.weights = weights
 
 
     def distribute(self, numprocs=1):
@@ -71,35 +105,66 @@ class Sequential_distribute(object):
 
         new_nodes, new_triangles, new_boundary, triangles_per_proc, quantities, \
                s2p_map, p2s_map = \
-               pmesh_divide_metis_with_map(domain, numprocs)
+               pmesh_divide_metis_with_map(domain, numprocs, self.weights)
 
 
-        # Build the mesh that should be assigned to each processor,
-        # this includes ghost nodes and the communication pattern
-        if verbose: print 'sequential_distribute: Build submeshes'
+        # Store the partitioned mesh from which the mesh that should be
+        # assigned to each processor, including ghost nodes and the
+        # communication pattern, is built by extract_submesh
+        if verbose: print 'sequential_distribute: Build partition'
         if verbose: print 'sequential_distribute: parameters = ',parameters
 
-        submesh = build_submesh(new_nodes, new_triangles, new_boundary, \
-                                quantities, triangles_per_proc, parameters=parameters)
-
-        if verbose:
-            for p in range(numprocs):
-                N = len(submesh['ghost_nodes'][p])
-                M = len(submesh['ghost_triangles'][p])
-                print 'There are %d ghost nodes and %d ghost triangles on proc %d'\
-                      %(N, M, p)
-
+        neighbours = reorder_neighbours(domain.neighbours, p2s_map)
 
-        self.submesh = submesh
+        self.partition = build_partition(new_nodes, new_triangles,
+                                         new_boundary, quantities,
+                                         triangles_per_proc, neighbours)
         self.triangles_per_proc = triangles_per_proc
         self.p2s_map =  p2s_map
 
+        if verbose: print self.statistics()
+
+
+    def statistics(self):
+        """Return string with the number of triangles, weight, ghost
+        triangles, edge cut and neighbours of each processor and the
+        imbalance of the partition
+        """
+
+        weights = self.weights
+        if weights is not None and len(self.p2s_map) > 0:
+            weights = num.asarray(weights)[self.p2s_map]
+
+        return partition_statistics(self.partition, weights, self.parameters)
+
+
+    def dump_partition(self, partition_dir):
+        """Write the partition and the domain attributes to partition_dir
+        """
+
+        attributes = {}
+        for name in self.attribute_names:
+            attributes[name] = getattr(self, name)
+
+        dump_partition(self.partition, partition_dir, attributes)
+
+
+    def load_partition(self, partition_dir):
+        """Read (memory mapped) the partition and domain attributes
+        written by dump_partition
+        """
+
+        self.partition, attributes = load_partition(partition_dir)
+
+        for name in attributes:
+            setattr(self, name, attributes[name])
+        self.triangles_per_proc = self.partition['triangles_per_proc']
+
 
     def extract_submesh(self, p=0):
         """Build the local mesh for processor p
         """
 
-        submesh = self.submesh
         triangles_per_proc = self.triangles_per_proc 
         p2s_map = self.p2s_map
         verbose = self.verbose
@@ -112,11 +177,18 @@ class Sequential_distribute(object):
         points, vertices, boundary, quantities, \
             ghost_recv_dict, full_send_dict, \
             tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
-              extract_submesh(submesh, triangles_per_proc, p2s_map, p)
+              extract_local_submesh(self.partition, p, p2s_map,
+                                    self.parameters)
               
 
-        number_of_full_nodes = len(submesh['full_nodes'][p])
-        number_of_full_triangles = len(submesh['full_triangles'][p])
+        # The nodes of the full triangles are numbered first
+        number_of_full_triangles = int(triangles_per_proc[p])
+        number_of_full_nodes = \
+            len(num.unique(vertices[:number_of_full_triangles].flat))
+
+        if verbose:
+            M = len(vertices) - number_of_full_triangles
+            print 'There are %d ghost triangles on proc %d' %(M, p)
 
 
         if debug:
@@ -212,13 +284,14 @@ class Sequential_distribute(object):
                        
 
     
-def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir='.', debug=False, parameters = None):
+def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir='.', debug=False, parameters = None, weights = None):
     """ Distribute the domain, create parallel domain and pickle result
     """
 
     from os.path import join
     
-    partition = Sequential_distribute(domain, verbose, debug, parameters)
+    partition = Sequential_distribute(domain, verbose, debug, parameters,
+                                      weights)
 
     partition.distribute(numprocs)
 
@@ -1510,6 +1510,232 @@ class Test_Distribute_Mesh(unittest.TestCase):
 
         #pprint(submesh_cell_1)
 
+    def test_build_local_submesh(self):
+        """
+        Test that the submesh built by each processor from the
+        partition description is the one extracted from build_submesh
+        """
+
+        from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+        from anuga.parallel.distribute_mesh import build_partition
+        from anuga.parallel.distribute_mesh import build_local_submesh
+        from anuga.parallel.distribute_mesh import extract_local_submesh
+        from anuga.parallel.distribute_mesh import reorder_neighbours
+
+        points, vertices, boundary = rectangular_cross(6, 5)
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity('elevation', topography)
+        domain.set_quantity('xmomentum', xcoord)
+
+        nodes, triangles, boundary, triangles_per_proc, quantities, \
+               s2p_map, p2s_map = pmesh_divide_metis_with_map(domain, 4)
+
+        for width in [1, 2, 3]:
+            parameters = {'ghost_layer_width': width}
+
+            submesh = build_submesh(nodes, triangles, boundary, quantities,
+                                    triangles_per_proc, parameters)
+
+            # Neighbours computed or reordered from the domain
+            for neighbours in [None,
+                               reorder_neighbours(domain.neighbours, p2s_map)]:
+                partition = build_partition(nodes, triangles, boundary,
+                                            quantities, triangles_per_proc,
+                                            neighbours)
+
+                for p in range(4):
+                    cell = build_local_submesh(partition, p, parameters)
+
+                    assert cell['ghost_layer_width'] == width
+                    for key in ['full_nodes', 'ghost_nodes', 'full_triangles',
+                                'ghost_triangles', 'ghost_commun']:
+                        assert num.allclose(cell[key], submesh[key][p])
+                    for key in ['full_boundary', 'ghost_boundary',
+                                'full_commun']:
+                        assert cell[key] == submesh[key][p]
+                    for k in quantities:
+                        assert num.allclose(cell['full_quan'][k],
+                                            submesh['full_quan'][k][p])
+                        assert num.allclose(cell['ghost_quan'][k],
+                                            submesh['ghost_quan'][k][p])
+
+                    local = extract_local_submesh(partition, p, p2s_map,
+                                                  parameters)
+                    true_local = extract_submesh(submesh, triangles_per_proc,
+                                                 p2s_map, p)
+
+                    points, vertices, boundary_l, quantities_l, \
+                            ghost_recv, full_send = local[:6]
+                    assert num.allclose(points, true_local[0])
+                    assert num.allclose(vertices, true_local[1])
+                    assert boundary_l == true_local[2]
+                    for k in quantities:
+                        assert num.allclose(quantities_l[k], true_local[3][k])
+                    for recv, true_recv in [(ghost_recv, true_local[4]),
+                                            (full_send, true_local[5])]:
+                        assert sorted(recv.keys()) == sorted(true_recv.keys())
+                        for q in recv:
+                            assert num.allclose(recv[q][0], true_recv[q][0])
+                            assert num.allclose(recv[q][1], true_recv[q][1])
+                    for i in range(6, 10):
+                        assert num.allclose(local[i], true_local[i])
+
+
+    def test_dump_load_partition(self):
+        """
+        Test writing the partition description and reading it memory
+        mapped
+        """
+
+        import tempfile
+        import shutil
+        from anuga.parallel.distribute_mesh import build_partition
+        from anuga.parallel.distribute_mesh import dump_partition
+        from anuga.parallel.distribute_mesh import load_partition
+        from anuga.parallel.distribute_mesh import extract_local_submesh
+
+        points, vertices, boundary = rectangular_cross(4, 4)
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity('elevation', topography)
+
+        nodes, triangles, boundary, triangles_per_proc, quantities = \
+               pmesh_divide_metis(domain, 3)
+
+        partition = build_partition(nodes, triangles, boundary, quantities,
+                                    triangles_per_proc)
+
+        partition_dir = tempfile.mkdtemp()
+        try:
+            dump_partition(partition, partition_dir, {'name': 'test'})
+            loaded, attributes = load_partition(partition_dir)
+
+            assert attributes == {'name': 'test'}
+            assert loaded['tags'] == partition['tags']
+            assert isinstance(loaded['triangles'], num.memmap)
+            for key in ['nodes', 'triangles', 'neighbours', 'boundary_ids',
+                        'boundary_tags', 'triangles_per_proc']:
+                assert num.all(loaded[key] == partition[key])
+            for k in quantities:
+                assert num.all(loaded['quantities'][k] ==
+                               partition['quantities'][k])
+
+            for p in range(3):
+                local = extract_local_submesh(loaded, p)
+                true_local = extract_local_submesh(partition, p)
+                assert num.allclose(local[0], true_local[0])
+                assert num.allclose(local[1], true_local[1])
+                assert local[2] == true_local[2]
+            loaded = None
+        finally:
+            shutil.rmtree(partition_dir)
+
+
+    def test_pmesh_divide_metis_weights(self):
+        """
+        Test that a weighted partition balances the weight rather
+        than the number of triangles
+        """
+
+        from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+
+        points, vertices, boundary = rectangular_cross(10, 10)
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity('elevation', topography)
+
+        N = len(domain)
+        centroids = domain.centroid_coordinates
+        weights = num.where(centroids[:,0] < 0.5, 3.0, 1.0)
+
+        for numprocs in [2, 3, 4]:
+            nodes, triangles, boundary, triangles_per_proc, quantities, \
+                   s2p_map, p2s_map = \
+                   pmesh_divide_metis_with_map(domain, numprocs, weights)
+
+            assert num.sum(triangles_per_proc) == N
+            assert len(triangles_per_proc) == numprocs
+            assert num.allclose(num.sort(p2s_map), num.arange(N))
+
+            # Weight of each processor close to the mean
+            tri_ranges = num.cumsum([0] + list(triangles_per_proc))
+            w = weights[p2s_map]
+            proc_weights = [num.sum(w[tri_ranges[p]:tri_ranges[p+1]])
+                            for p in range(numprocs)]
+            mean = num.sum(weights)/numprocs
+            assert num.max(proc_weights) < 1.1*mean
+
+            # Unweighted partition balances the triangles
+            unweighted = pmesh_divide_metis_with_map(domain, numprocs)[3]
+            assert num.max(unweighted) < 1.1*N/numprocs
+
+        # The processor of the heavy region gets fewer triangles
+        nodes, triangles, boundary, triangles_per_proc, quantities, \
+               s2p_map, p2s_map = pmesh_divide_metis_with_map(domain, 2, weights)
+        x = centroids[p2s_map,0]
+        heavy = 0 if num.mean(x[:triangles_per_proc[0]]) < 0.5 else 1
+        assert triangles_per_proc[heavy] < triangles_per_proc[1-heavy]
+
+        # One weight per triangle
+        try:
+            pmesh_divide_metis_with_map(domain, 2, weights[:-1])
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Wrong number of weights not caught')
+
+
+    def test_partition_statistics(self):
+        """
+        Test the statistics of a partition
+        """
+
+        from anuga.parallel.distribute_mesh import build_partition
+        from anuga.parallel.distribute_mesh import get_partition_statistics
+        from anuga.parallel.distribute_mesh import partition_statistics
+
+        # Two processors of a 2 x 1 strip of rectangular_cross cells:
+        # the left cell on processor 0 and the right cell on processor 1
+        points, vertices, boundary = rectangular_cross(2, 1)
+        domain = Domain(points, vertices, boundary)
+
+        centroids = domain.centroid_coordinates
+        order = num.argsort(centroids[:,0] > 0.5, kind='mergesort')
+        triangles_per_proc = [4, 4]
+
+        nodes = domain.get_nodes()
+        triangles = domain.triangles[order]
+        inverse = num.argsort(order)
+        neighbours = domain.neighbours[order]
+        neighbours = num.where(neighbours >= 0, inverse[neighbours], -1)
+
+        new_boundary = {}
+        for (t, e), tag in domain.boundary.items():
+            new_boundary[(inverse[t], e)] = tag
+
+        partition = build_partition(nodes, triangles, new_boundary, {},
+                                    triangles_per_proc, neighbours)
+
+        stats = get_partition_statistics(partition)
+        assert num.allclose(stats['triangles'], [4, 4])
+        assert num.allclose(stats['weight'], [4, 4])
+        assert num.allclose(stats['edge_cut'], [1, 1])
+        assert num.allclose(stats['neighbour_procs'], [1, 1])
+        assert num.allclose(stats['ghost_triangles'], [3, 3])
+        assert stats['total_edge_cut'] == 1
+        assert num.allclose(stats['imbalance'], 1.0)
+
+        weights = [3, 1, 1, 1, 1, 1, 1, 1]
+        stats = get_partition_statistics(partition, weights,
+                                         {'ghost_layer_width' : 1})
+        assert num.allclose(stats['weight'], [6, 4])
+        assert num.allclose(stats['imbalance'], 1.2)
+        assert num.allclose(stats['ghost_triangles'], [1, 1])
+
+        msg = partition_statistics(partition, weights)
+        assert 'Total edge cut: 1' in msg
+        assert 'Imbalance (max/mean weight): 1.2000' in msg
+        assert len(msg.splitlines()) == 6
+
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import unittest
+import shutil
+import tempfile
+
+import numpy as num
+
+from anuga import Domain
+from anuga import rectangular_cross
+from anuga import Reflective_boundary
+from anuga import Rate_operator
+from anuga.operators.collect_max_stage_operator \
+        import Collect_max_stage_operator
+from anuga.abstract_2d_finite_volumes.profiler import get_operator_name
+
+from anuga.parallel.load_balance import wet_weights
+from anuga.parallel.load_balance import measured_weights
+from anuga.parallel.load_balance import rebalance_from_checkpoint
+
+
+def create_domain(name='test_load_balance'):
+
+    points, vertices, boundary = rectangular_cross(8, 8)
+
+    domain = Domain(points, vertices, boundary)
+    domain.set_name(name)
+    domain.set_store(False)
+    domain.set_quantity('elevation', lambda x,y: -x + 0.5)
+    domain.set_quantity('stage', 0.0)
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+class Test_load_balance(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp('_checkpoints')
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir)
+
+
+    def test_wet_weights(self):
+
+        domain = create_domain()
+        x = domain.centroid_coordinates[:,0]
+
+        weights = wet_weights(domain, dry_cost=0.25)
+        assert num.allclose(weights[x > 0.5], 1.0)
+        assert num.allclose(weights[x < 0.5], 0.25)
+
+        weights = wet_weights(domain, wet_fraction=0.5, dry_cost=0.0)
+        assert len(weights) == len(domain)
+        assert num.allclose(weights, 0.5)
+
+        try:
+            wet_weights(domain, wet_fraction=2.0)
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Wet fraction larger than one not caught')
+
+
+    def test_measured_weights(self):
+
+        domain = create_domain()
+
+        try:
+            measured_weights(domain)
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Domain without profiler not caught')
+
+        indices = num.arange(10)
+        operator = Rate_operator(domain, rate=1.0, indices=indices)
+
+        domain.enable_profiling()
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.2):
+            pass
+
+        profiler = domain.get_profiler()
+        compute_time = profiler.get_compute_time()
+        rain_time = profiler.get_operator_times()[get_operator_name(operator)]
+        assert compute_time > 0.0
+        assert 0.0 < rain_time < compute_time
+
+        weights = measured_weights(domain)
+        assert len(weights) == len(domain)
+        assert num.allclose(num.sum(weights), compute_time)
+
+        # The rain operator time is spread over its triangles
+        rest = weights[10:]
+        assert num.allclose(rest, rest[0])
+        assert num.allclose(weights[:10], rest[0] + rain_time/10)
+
+        weights = measured_weights(domain, dry_cost=0.5)
+        assert num.allclose(num.sum(weights), compute_time)
+
+
+    def test_rebalance_from_checkpoint(self):
+
+        domain = create_domain()
+        Collect_max_stage_operator(domain)
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                 checkpoint_step=1)
+        domain.enable_profiling()
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.2):
+            pass
+
+        stage = domain.quantities['stage'].centroid_values.copy()
+
+        # Sequential domain built again from the start
+        domain2 = create_domain()
+        weights = rebalance_from_checkpoint(domain2, 'test_load_balance',
+                                            self.checkpoint_dir)
+
+        assert num.allclose(domain2.get_time(), 0.2)
+        assert num.allclose(domain2.quantities['stage'].centroid_values,
+                            stage)
+
+        # The compute time of the only processor spread evenly
+        assert len(weights) == len(domain2)
+        assert num.allclose(weights, weights[0])
+        assert weights[0] > 0.0
+        assert num.sum(weights) <= domain.get_profiler().get_compute_time()
+
+        # Earlier checkpoint
+        domain3 = create_domain()
+        weights = rebalance_from_checkpoint(domain3, 'test_load_balance',
+                                            self.checkpoint_dir, time=0.1,
+                                            dry_cost=0.5)
+        assert num.allclose(domain3.get_time(), 0.1)
+        assert len(num.unique(num.round(weights/weights.max(), 6))) == 2
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_load_balance, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
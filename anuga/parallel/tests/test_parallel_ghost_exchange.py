@@ -0,0 +1,179 @@
+"""
+Test the split ghost exchange of parallel domains.
+
+Updating the ghost cells with update_ghosts_start and update_ghosts_finish,
+with computation in between, gives the same centroid values as
+communicate_ghosts_blocking, and evolving with the fluxes computed while
+the ghost cells are updated gives the same results as without.
+"""
+
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+import unittest
+import os
+import sys
+import numpy as num
+
+
+from anuga import Reflective_boundary
+from anuga import Dirichlet_boundary
+from anuga import rectangular_cross_domain
+
+from anuga import distribute, myid, numprocs, barrier, finalize
+
+import anuga.parallel.parallel_generic_communications as generic_comms
+
+#--------------------------------------------------------------------------
+# Setup parameters
+#--------------------------------------------------------------------------
+nprocs = 3
+N = 20
+M = 20
+verbose = False
+
+quantities = ['stage', 'xmomentum', 'ymomentum']
+
+#---------------------------------
+# Setup Functions
+#---------------------------------
+def topography(x,y):
+    return -x/2
+
+def stage(x,y):
+    return num.where(x < 0.3, 0.2, -x/2)
+
+def xmomentum(x,y):
+    return 0.01*y
+
+
+def create_domain(overlap=True):
+
+    domain = rectangular_cross_domain(M, N)
+    domain.set_quantity('elevation', topography)
+    domain.set_quantity('friction', 0.01)
+    domain.set_quantity('stage', stage)
+    domain.set_quantity('xmomentum', xmomentum)
+
+    domain = distribute(domain, verbose=False)
+
+    domain.set_name('ghost_exchange')
+    domain.set_datadir('.')
+    domain.set_quantities_to_be_stored(None)
+    domain.set_flow_algorithm('DE0')
+    domain.set_ghost_exchange_overlap(overlap)
+
+    Br = Reflective_boundary(domain)
+    Bd = Dirichlet_boundary([0.2, 0., 0.])
+    domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+def get_centroid_values(domain):
+
+    return [domain.quantities[q].centroid_values.copy() for q in quantities]
+
+
+def corrupt_ghosts(domain):
+
+    ghosts = domain.tri_full_flag == 0
+    for q in quantities:
+        domain.quantities[q].centroid_values[ghosts] = -999.0
+
+
+###########################################################################
+# Setup Test
+##########################################################################
+def run_test():
+
+    #--------------------------------------------------------------------------
+    # Split exchange against communicate_ghosts_blocking
+    #--------------------------------------------------------------------------
+    domain = create_domain()
+
+    assert_(num.any(domain.tri_full_flag == 0))
+
+    corrupt_ghosts(domain)
+    generic_comms.communicate_ghosts_blocking(domain)
+    blocking = get_centroid_values(domain)
+
+    corrupt_ghosts(domain)
+    domain.update_ghosts_start()
+    assert_(domain.ghost_exchange_pending is not None)
+
+    # Computation away from the ghost cells while the messages are in flight
+    cells = domain.get_ghost_overlap_cells()
+    assert_(num.all(domain.tri_full_flag[cells['fluxes'][0]] == 1))
+
+    domain.update_ghosts_finish()
+    assert_(domain.ghost_exchange_pending is None)
+
+    for Q_blocking, Q_split in zip(blocking, get_centroid_values(domain)):
+        assert_(num.all(Q_blocking == Q_split))
+
+    #--------------------------------------------------------------------------
+    # An error during the exchange does not leave it active
+    #--------------------------------------------------------------------------
+    corrupt_ghosts(domain)
+    try:
+        domain.update_ghosts_start()
+        try:
+            raise ValueError('Error between start and finish')
+        finally:
+            domain.update_ghosts_finish()
+    except ValueError:
+        pass
+
+    corrupt_ghosts(domain)
+    domain.update_ghosts()
+
+    for Q_blocking, Q_async in zip(blocking, get_centroid_values(domain)):
+        assert_(num.all(Q_blocking == Q_async))
+
+    #--------------------------------------------------------------------------
+    # Evolve with and without computing fluxes during the exchange
+    #--------------------------------------------------------------------------
+    results = []
+    for overlap in [True, False]:
+        domain = create_domain(overlap)
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.5):
+            pass
+
+        results.append(get_centroid_values(domain))
+
+    for Q_overlap, Q_sequential in zip(*results):
+        assert_(num.all(Q_overlap == Q_sequential))
+
+
+# Test an nprocs-way run of the split ghost exchange
+
+class Test_parallel_ghost_exchange(unittest.TestCase):
+    def test_parallel_ghost_exchange(self):
+        if verbose : print "Expect this test to fail if not run from the parallel directory."
+
+        abs_script_name = os.path.abspath(__file__)
+        cmd = "mpirun -np %d python %s" % (nprocs, abs_script_name)
+        result = os.system(cmd)
+
+        assert_(result == 0)
+
+# Because we are doing assertions outside of the TestCase class
+# the PyUnit defined assert_ function can't be used.
+def assert_(condition, msg="Assertion Failed"):
+    if condition == False:
+        raise AssertionError, msg
+
+if __name__=="__main__":
+    if numprocs == 1:
+        runner = unittest.TextTestRunner()
+        suite = unittest.makeSuite(Test_parallel_ghost_exchange, 'test')
+        runner.run(suite)
+    else:
+        barrier()
+
+        run_test()
+
+        finalize()
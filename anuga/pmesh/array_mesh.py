@@ -0,0 +1,464 @@
+"""Array backed 2D triangular mesh for generating large meshes
+
+Mesh (see mesh.py) keeps the outline of the mesh (vertices, segments,
+holes and regions) and the generated triangulation as lists of Python
+objects, as needed by the graphical mesh generator. For meshes of
+millions of triangles this object layer costs more time and memory than
+the triangulation itself.
+
+Array_mesh keeps the same information in numeric arrays, from the
+outline through the call to triangle to the .tsh/.msh file and the
+domain. Tags are arrays of strings. The attribute names are the keys of
+the mesh dictionary of anuga.load_mesh.loadASCII:
+
+    the outline:
+    points: (N, 2) array of user vertices, relative to geo_reference
+    point_attributes: (N, 0) array
+    outline_segments: (M, 2) array of indices of points
+    outline_segment_tags: (M,) array of tags
+    holes: (H, 2) array of points, one inside each hole
+    regions: (R, 2) array of points, one inside each region
+    region_tags: (R,) array of tags
+    region_max_areas: (R,) array of maximum triangle areas
+        (NOMAXAREA if none)
+
+    the triangulation, set by generate_mesh:
+    vertices, vertex_attributes, vertex_attribute_titles, segments,
+    segment_tags, triangles, triangle_tags, triangle_neighbors
+
+Usage, as Mesh:
+
+    m = Array_mesh(geo_reference=...)
+    m.add_region_from_polygon(polygon, segment_tags={'wall': [0, 1]},
+                              max_triangle_area=100.0)
+    m.generate_mesh(minimum_triangle_angle=28.0)
+    m.export_mesh_file('mesh.msh')
+
+or create_mesh_from_regions(..., use_array_mesh=True).
+"""
+
+import numpy as num
+
+from anuga.coordinate_transforms.geo_reference import Geo_reference, \
+     DEFAULT_ZONE
+from anuga.load_mesh.loadASCII import NOMAXAREA, export_mesh_file
+from anuga.geospatial_data.geospatial_data import ensure_geospatial, \
+     ensure_absolute
+from anuga.geometry.polygon import point_in_polygon
+from anuga.mesh_engine.mesh_engine import generate_mesh
+
+
+def segment_markers_and_names(segment_tags):
+    """Return the segment tags as integer markers for triangle and the
+    tag of each marker. The untagged segments on the boundary are
+    tagged 'exterior' by triangle (marker 1).
+    """
+
+    segment_tags = num.asarray(segment_tags, num.str)
+    names = ['', 'exterior']
+    names += [tag for tag in num.unique(segment_tags).tolist()
+              if tag not in names]
+    names = num.array(names)
+    order = num.argsort(names)
+    markers = order[num.searchsorted(names[order], segment_tags)]
+
+    return markers, names
+
+
+class Array_mesh:
+    """2D triangular mesh with the outline and the triangulation kept
+    in numeric arrays. All point information is relative to the
+    geo_reference.
+    """
+
+    def __init__(self, geo_reference=None):
+
+        if geo_reference is None:
+            self.geo_reference = Geo_reference(DEFAULT_ZONE, 0, 0)
+        else:
+            self.geo_reference = geo_reference
+
+        # The outline
+        self.points = num.zeros((0, 2), num.float)
+        self.point_attributes = num.zeros((0, 0), num.float)
+        self.outline_segments = num.zeros((0, 2), num.int)
+        self.outline_segment_tags = num.array([], num.str)
+        self.holes = num.zeros((0, 2), num.float)
+        self.regions = num.zeros((0, 2), num.float)
+        self.region_tags = num.array([], num.str)
+        self.region_max_areas = num.zeros(0, num.float)
+
+        self.clear_triangulation()
+
+
+    def __repr__(self):
+        return 'Array_mesh: %d points, %d outline segments, %d holes, ' \
+               '%d regions, %d triangles' % (len(self.points),
+                                             len(self.outline_segments),
+                                             len(self.holes),
+                                             len(self.regions),
+                                             len(self.triangles))
+
+
+    def clear_triangulation(self):
+
+        self.vertices = num.zeros((0, 2), num.float)
+        self.vertex_attributes = None
+        self.vertex_attribute_titles = []
+        self.segments = num.zeros((0, 2), num.int)
+        self.segment_tags = num.array([], num.str)
+        self.triangles = num.zeros((0, 3), num.int)
+        self.triangle_tags = num.array([], num.str)
+        self.triangle_neighbors = num.zeros((0, 3), num.int)
+
+
+    def get_triangle_count(self):
+        return len(self.triangles)
+
+
+    #--------------------------------------------------------------
+    # The outline
+    #--------------------------------------------------------------
+    def add_vertices(self, point_data):
+        """Add user vertices.
+
+        The point_data can be a list of (x,y) values, a numeric
+        array or a geospatial_data instance.
+        """
+
+        point_data = ensure_geospatial(point_data)
+        points = point_data.get_data_points(geo_reference=self.geo_reference)
+
+        self._add_points(points)
+
+
+    def add_points_and_segments(self, points, segments=None,
+                                segment_tags=None):
+        """Add an outline of the mesh, as Mesh.add_points_and_segments.
+
+        points are absolute. segments is an array of pairs of indices
+        of points, by default joining consecutive points. segment_tags
+        is an optional dictionary of lists of segment indices, keyed by
+        tag, e.g. {'wall':[0,3],'ocean':[2]}
+        """
+
+        points = ensure_absolute(points)
+
+        if segments is None:
+            i = num.arange(len(points) - 1)
+            segments = num.transpose([i, i + 1])
+
+        segments = num.array(segments, num.int).reshape(-1, 2)
+        tags = self._tag_dict2array(segment_tags, len(segments))
+
+        self._add_outline(points, segments, tags)
+
+
+    def add_region_from_polygon(self, polygon, segment_tags=None,
+                                max_triangle_area=None, geo_reference=None,
+                                region_tag=None):
+        """Add a polygon with tags to the mesh, as a region, see
+        Mesh.add_region_from_polygon.
+
+        Returns the index of the region if a max_triangle_area or a
+        region_tag is given, otherwise None.
+        """
+
+        create_region = max_triangle_area is not None or \
+                        region_tag is not None
+
+        return self._add_area_from_polygon(polygon,
+                                           segment_tags=segment_tags,
+                                           geo_reference=geo_reference,
+                                           region=create_region,
+                                           region_tag=region_tag,
+                                           max_area=max_triangle_area)
+
+
+    def add_hole_from_polygon(self, polygon, segment_tags=None,
+                              geo_reference=None):
+        """Add a polygon with tags to the mesh, as a hole. Untagged
+        segments get the tag 'interior'.
+
+        Returns the index of the hole.
+        """
+
+        return self._add_area_from_polygon(polygon,
+                                           segment_tags=segment_tags,
+                                           geo_reference=geo_reference,
+                                           hole=True)
+
+
+    def add_region(self, x, y, geo_reference=None, tag=None, max_area=None):
+        """Add a point which represents a region, with an optional tag
+        for its triangles and maximum triangle area.
+
+        If geo_reference is None the point is absolute.
+        Returns the index of the region.
+        """
+
+        [[x, y]] = self.geo_reference.change_points_geo_ref([x, y],
+                                               points_geo_ref=geo_reference)
+
+        if tag is None:
+            tag = ''
+        if max_area is None:
+            max_area = NOMAXAREA
+
+        self.regions = num.concatenate((self.regions, [[x, y]]))
+        self.region_tags = num.append(self.region_tags, tag)
+        self.region_max_areas = num.append(self.region_max_areas,
+                                           float(max_area))
+
+        return len(self.regions) - 1
+
+
+    def add_hole(self, x, y, geo_reference=None):
+        """Add a point which represents a hole.
+
+        If geo_reference is None the point is absolute.
+        Returns the index of the hole.
+        """
+
+        [[x, y]] = self.geo_reference.change_points_geo_ref([x, y],
+                                               points_geo_ref=geo_reference)
+
+        self.holes = num.concatenate((self.holes, [[x, y]]))
+
+        return len(self.holes) - 1
+
+
+    def _add_area_from_polygon(self, polygon, segment_tags=None,
+                               geo_reference=None, hole=False, region=False,
+                               region_tag=None, max_area=None):
+
+        polygon = num.array(polygon, num.float)
+        if geo_reference is not None:
+            polygon = geo_reference.get_absolute(polygon)
+
+        # Segments [[0,1], [1,2], ..., [N-1,0]]
+        N = len(polygon)
+        i = num.arange(N)
+        segments = num.transpose([i, (i + 1) % N])
+        tags = self._tag_dict2array(segment_tags, N, hole=hole)
+
+        self._add_outline(polygon, segments, tags)
+
+        if region is True:
+            inner_point = point_in_polygon(polygon)
+            return self.add_region(inner_point[0], inner_point[1],
+                                   tag=region_tag, max_area=max_area)
+        elif hole is True:
+            inner_point = point_in_polygon(polygon)
+            return self.add_hole(inner_point[0], inner_point[1])
+
+        return None
+
+
+    def _add_points(self, points):
+        """Add points relative to the geo_reference, return the index of
+        the first one
+        """
+
+        offset = len(self.points)
+
+        points = num.array(points, num.float).reshape(-1, 2)
+        self.points = num.concatenate((self.points, points))
+        self.point_attributes = num.zeros((len(self.points), 0), num.float)
+
+        return offset
+
+
+    def _add_outline(self, points, segments, tags):
+        """Add absolute points and the segments joining them"""
+
+        points = num.array(points, num.float).reshape(-1, 2)
+        points = points - [self.geo_reference.get_xllcorner(),
+                           self.geo_reference.get_yllcorner()]
+
+        offset = self._add_points(points)
+
+        self.outline_segments = num.concatenate((self.outline_segments,
+                                                 segments + offset))
+        self.outline_segment_tags = num.append(self.outline_segment_tags,
+                                               tags)
+
+
+    def _tag_dict2array(self, tags, number_of_segs, hole=False):
+        """Convert a tag dictionary, e.g. {'wall':[0,3],'ocean':[2]},
+        to an array of tags, e.g. ['wall', '', 'ocean', 'wall'].
+        Untagged segments of holes are tagged 'interior'.
+        """
+
+        if hole:
+            default_tag = 'interior'
+        else:
+            default_tag = ''
+
+        names = [default_tag]
+        ids = num.zeros(number_of_segs, num.int)
+        if tags is not None:
+            for key in tags:
+                names.append(key)
+                ids[num.array(tags[key], num.int)] = len(names) - 1
+
+        return num.array(names)[ids]
+
+
+    #--------------------------------------------------------------
+    # The triangulation
+    #--------------------------------------------------------------
+    def generate_mesh(self, maximum_triangle_area="",
+                      minimum_triangle_angle=28.0, verbose=False,
+                      cut_polylines=None, number_of_pieces=None,
+                      processes=1, cache_dir=None):
+        """Triangulate the outline, as Mesh.generate_mesh.
+
+        If cut_polylines (absolute) or number_of_pieces are given the
+        outline is triangulated in pieces, in a pool of processes and
+        cached in cache_dir, see piecewise_mesh.generate_mesh_in_pieces.
+        """
+
+        if cut_polylines is not None or \
+               (number_of_pieces is not None and number_of_pieces > 1):
+            from anuga.pmesh.piecewise_mesh import generate_mesh_in_pieces
+            generate_mesh_in_pieces(self,
+                                    cut_polylines=cut_polylines,
+                                    number_of_pieces=number_of_pieces,
+                                    maximum_triangle_area=maximum_triangle_area,
+                                    minimum_triangle_angle=minimum_triangle_angle,
+                                    processes=processes,
+                                    cache_dir=cache_dir,
+                                    verbose=verbose)
+            return
+
+        if verbose is True:
+            silent = ''
+        else:
+            silent = 'Q'
+
+        # p - planar straight line graph, z - number from zero,
+        # q - minimum angle, a - maximum area, then per region,
+        # n - neighbours, A - region attributes
+        mode = silent + 'pzq' + str(minimum_triangle_angle) + \
+               'a' + str(maximum_triangle_area) + 'anA'
+
+        segment_markers, names = segment_markers_and_names(
+                                                  self.outline_segment_tags)
+        regions, region_names = self.get_region_list()
+
+        if self.point_attributes.shape[1] > 0:
+            point_attributes = self.point_attributes
+        else:
+            point_attributes = None
+
+        generated = generate_mesh(self.points,
+                                  self._or_empty(self.outline_segments),
+                                  self._or_empty(self.holes),
+                                  self._or_empty(regions),
+                                  point_attributes,
+                                  segment_markers,
+                                  mode)
+
+        self.vertices = generated['generatedpointlist']
+        self.triangles = generated['generatedtrianglelist']
+        self.triangle_neighbors = generated['generatedtriangleneighborlist']
+        self.segments = generated['generatedsegmentlist']
+
+        markers = num.reshape(generated['generatedsegmentmarkerlist'], -1)
+        self.segment_tags = names[markers]
+
+        attributes = generated['generatedtriangleattributelist']
+        if attributes is None:
+            self.triangle_tags = num.array([''] * len(self.triangles))
+        else:
+            ids = num.array(attributes[:, 0], num.int)
+            self.triangle_tags = region_names[ids]
+
+        attributes = generated['generatedpointattributelist']
+        if attributes is None or attributes.shape[1] == 0:
+            self.vertex_attributes = None
+            self.vertex_attribute_titles = []
+        else:
+            self.vertex_attributes = attributes
+
+
+    def get_region_list(self):
+        """Return the regions as rows [x, y, attribute, max_area] for
+        triangle and the tag of each attribute.
+
+        Region i has the attribute i+1 and the triangles outside the
+        regions 0. Regions without maximum area get 0, no constraint.
+        """
+
+        regions = num.zeros((len(self.regions), 4), num.float)
+        regions[:, :2] = self.regions
+        regions[:, 2] = num.arange(1, len(self.regions) + 1)
+        regions[:, 3] = num.maximum(self.region_max_areas, 0.0)
+        region_names = num.append('', self.region_tags)
+
+        return regions, region_names
+
+
+    def _or_empty(self, array):
+        """Empty list for empty arrays, as expected by generate_mesh"""
+
+        if len(array) == 0:
+            return []
+
+        return array
+
+
+    #--------------------------------------------------------------
+    # Output
+    #--------------------------------------------------------------
+    def Mesh2IODict(self):
+        """Return the outline and the triangulation as a mesh dictionary
+        of arrays, see anuga.load_mesh.loadASCII
+        """
+
+        dict = {}
+
+        dict['vertices'] = self.vertices
+        dict['vertex_attributes'] = self.vertex_attributes
+        dict['vertex_attribute_titles'] = self.vertex_attribute_titles
+        dict['segments'] = self.segments
+        dict['segment_tags'] = self.segment_tags
+        dict['triangles'] = self.triangles
+        dict['triangle_tags'] = self.triangle_tags
+        dict['triangle_neighbors'] = self.triangle_neighbors
+
+        dict['points'] = self.points
+        dict['point_attributes'] = self.point_attributes
+        dict['outline_segments'] = self.outline_segments
+        dict['outline_segment_tags'] = self.outline_segment_tags
+        dict['holes'] = self.holes
+        dict['regions'] = self.regions
+        dict['region_tags'] = self.region_tags
+        dict['region_max_areas'] = self.region_max_areas
+
+        dict['geo_reference'] = self.geo_reference
+
+        return dict
+
+
+    def export_mesh_file(self, ofile):
+        """Write the mesh to a .tsh or .msh file"""
+
+        export_mesh_file(ofile, self.Mesh2IODict())
+
+
+    def get_mesh(self):
+        """Return the mesh as a Mesh instance, e.g. for the graphical
+        mesh generator
+        """
+
+        from anuga.pmesh.mesh import Mesh
+
+        dict = self.Mesh2IODict()
+        mesh = Mesh(geo_reference=self.geo_reference)
+        mesh.IOOutline2Mesh(dict)
+        if len(self.triangles) > 0:
+            mesh.IOTriangulation2Mesh(dict)
+
+        return mesh
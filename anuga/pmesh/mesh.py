@@ -576,7 +576,7 @@ class Mesh:
         self.regions.append(h)
         return h
    
-    def add_region(self, x,y, geo_reference=None, tag=None):
+    def add_region(self, x,y, geo_reference=None, tag=None, max_area=None):
         """
         adds a point, which represents a region.
 
@@ -590,6 +590,8 @@ class Mesh:
         region =  self._addRegion(x, y)
         if tag is not None:
             region.setTag(tag)
+        if max_area is not None:
+            region.setMaxArea(max_area)
         return region
 
     def build_grid(self,  vert_rows, vert_columns):
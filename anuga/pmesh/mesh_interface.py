@@ -12,8 +12,10 @@ import datetime
 # the current dir being unknown 
 try:
     from anuga.pmesh.mesh import Mesh
+    from anuga.pmesh.array_mesh import Array_mesh
 except ImportError:  
     from mesh import Mesh
+    from array_mesh import Array_mesh
 
 import exceptions
 class PolygonError(exceptions.Exception): pass
@@ -33,7 +35,12 @@ def create_mesh_from_regions(bounding_polygon,
                              minimum_triangle_angle=28.0,
                              fail_if_polygons_outside=True,
                              use_cache=False,
-                             verbose=True):
+                             verbose=True,
+                             use_array_mesh=False,
+                             cut_polylines=None,
+                             number_of_pieces=None,
+                             processes=1,
+                             piece_cache_dir=None):
     """Create mesh from bounding polygons, and resolutions.
 
     bounding_polygon is a list of points in Eastings and Northings,
@@ -85,7 +92,19 @@ def create_mesh_from_regions(bounding_polygon,
     fail_if_polygons_outside: If True (the default) Exception in thrown
     where interior polygons fall outside bounding polygon. If False, these
     will be ignored and execution continued.
-        
+
+    use_array_mesh: If True an Array_mesh is built, which keeps the
+    outline and the triangulation in numeric arrays and is much faster
+    for meshes of millions of triangles. Otherwise a Mesh, as used by the
+    graphical mesh generator, is built.
+
+    cut_polylines is a list of polylines (absolute, as breaklines)
+    splitting the mesh into pieces which are triangulated separately, in
+    processes processes, and stitched together. number_of_pieces gives
+    that many pieces, split by automatic vertical cuts, instead. With
+    piece_cache_dir the triangulation of each piece is cached there and
+    reused while the outline of the piece is unchanged. These imply
+    use_array_mesh, see piecewise_mesh.py.
     
     """
     
@@ -110,7 +129,12 @@ def create_mesh_from_regions(bounding_polygon,
               'fail_if_polygons_outside': fail_if_polygons_outside,
               'breaklines': breaklines,
               'verbose': verbose,
-              'regionPtArea': regionPtArea}   # FIXME (Ole): Should be bypassed one day. See ticket:14
+              'regionPtArea': regionPtArea,
+              'use_array_mesh': use_array_mesh,
+              'cut_polylines': cut_polylines,
+              'number_of_pieces': number_of_pieces,
+              'processes': processes,
+              'piece_cache_dir': piece_cache_dir}   # FIXME (Ole): Should be bypassed one day. See ticket:14
 
     # Call underlying engine with or without caching
     if use_cache is True:
@@ -149,7 +173,12 @@ def _create_mesh_from_regions(bounding_polygon,
                               fail_if_polygons_outside=True,
                               breaklines=None,
                               verbose=True,
-                              regionPtArea=None):
+                              regionPtArea=None,
+                              use_array_mesh=False,
+                              cut_polylines=None,
+                              number_of_pieces=None,
+                              processes=1,
+                              piece_cache_dir=None):
     """_create_mesh_from_regions - internal function.
 
     See create_mesh_from_regions for documentation.
@@ -165,12 +194,12 @@ def _create_mesh_from_regions(bounding_polygon,
                 msg += 'Number of points in bounding polygon = %d' % max_points
                 raise SegmentError(msg)
 
+        tagged = set()
+        for tag in boundary_tags:
+            tagged.update(boundary_tags[tag])
+
         for i in range(max_points):
-            found = False
-            for tag in boundary_tags:
-                if i in boundary_tags[tag]:
-                    found = True
-            if found is False:
+            if i not in tagged:
                 msg = 'Segment %d was not assigned a boundary_tag.' % i
                 msg +=  'Default tag "exterior" will be assigned to missing segment'
                 #raise Exception(msg)
@@ -277,7 +306,13 @@ def _create_mesh_from_regions(bounding_polygon,
                                            yllcorner = yllcorner,
                                            zone = zone)
 
-    m = Mesh(geo_reference=mesh_geo_reference)
+    in_pieces = cut_polylines is not None or \
+                (number_of_pieces is not None and number_of_pieces > 1)
+
+    if use_array_mesh or in_pieces:
+        m = Array_mesh(geo_reference=mesh_geo_reference)
+    else:
+        m = Mesh(geo_reference=mesh_geo_reference)
 
     # build a list of discrete segments from the breakline polygons
     if breaklines is not None:
@@ -306,8 +341,8 @@ def _create_mesh_from_regions(bounding_polygon,
         bounding_polygon_absolute = bounding_polygon
    
     inner_point = point_in_polygon(bounding_polygon_absolute)
-    inner = m.add_region(inner_point[0], inner_point[1])
-    inner.setMaxArea(maximum_triangle_area)
+    m.add_region(inner_point[0], inner_point[1],
+                 max_area=maximum_triangle_area)
 
     # Do interior regions
 #    if interior_regions is not None:    
@@ -348,8 +383,8 @@ def _create_mesh_from_regions(bounding_polygon,
     # Add user-specified point-based regions with max area
     if(regionPtArea is not None):
         for i in range(len(regionPtArea)):
-            inner = m.add_region(regionPtArea[i][0], regionPtArea[i][1])
-            inner.setMaxArea(regionPtArea[i][2])
+            m.add_region(regionPtArea[i][0], regionPtArea[i][1],
+                         max_area=regionPtArea[i][2])
         
                
 
@@ -367,8 +402,16 @@ def _create_mesh_from_regions(bounding_polygon,
     else:
         if verbose: log.critical("Generating mesh to file '%s'" % filename)
       
-        m.generate_mesh(minimum_triangle_angle=minimum_triangle_angle,
-                        verbose=verbose)
+        if in_pieces:
+            m.generate_mesh(minimum_triangle_angle=minimum_triangle_angle,
+                            verbose=verbose,
+                            cut_polylines=cut_polylines,
+                            number_of_pieces=number_of_pieces,
+                            processes=processes,
+                            cache_dir=piece_cache_dir)
+        else:
+            m.generate_mesh(minimum_triangle_angle=minimum_triangle_angle,
+                            verbose=verbose)
         m.export_mesh_file(filename)
 
         return m
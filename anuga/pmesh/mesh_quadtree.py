@@ -125,6 +125,26 @@ class MeshQuadtree(Cell):
 
         return element_found, sigma[0], sigma[1], sigma[2], index
 
+    def search_points(self, points):
+        """
+        Find the triangles (elements) that the points are in.
+
+        Inputs:
+            points:    N x 2 array of points to test
+
+        Return:
+            Array of indices of the triangles containing the points
+            (-1 for points not within any triangle)
+        """
+
+        if not hasattr(self, 'root'):
+            self.add_quad_tree()
+
+        points = ensure_numeric(points, num.float).reshape(-1, 2)
+        points = num.ascontiguousarray(points)
+
+        return fitsmooth.tree_search_points(self.root, points)
+
     # PADARN NOTE: Only here to pass unit tests - does nothing.
     def set_last_triangle(self):
         pass
@@ -0,0 +1,642 @@
+"""Generation of large meshes in pieces, triangulated concurrently
+
+generate_mesh_in_pieces triangulates the outline of an Array_mesh in
+pieces separated by cut polylines, given by the user or placed
+automatically so that the pieces get about the same number of
+triangles, and stitches the pieces into one conforming mesh:
+
+    1. The outline and the cuts are triangulated without refinement.
+       This gives the pieces, the intersections of the cuts with the
+       outline and the region (tag and maximum area) of each sub-area
+       of a piece bounded by segments.
+    2. The boundary of each piece (cuts, bounding polygon and holes) is
+       divided into segments about as long as the sides of the largest
+       triangles allowed next to it. Pieces sharing a cut get the same
+       points on it.
+    3. The pieces are triangulated, in a pool of processes, by triangle
+       without points added on their boundaries ('Y' switch).
+    4. The vertices on the boundaries of the pieces are merged by their
+       index and the cut segments dropped.
+
+As triangle cannot add points on the boundaries of the pieces, a few
+triangles next to them may be somewhat larger than the maximum area or
+have angles smaller than the minimum angle.
+
+Each piece is described independently of the rest of the mesh (points
+in sorted order, regions by tag and area) so that, with a cache_dir,
+pieces not changed by an edit of the outline (e.g. a new breakline in
+another piece) are read from the cache (see anuga.caching) instead of
+being triangulated again.
+
+Usage:
+
+    m = create_mesh_from_regions(..., use_array_mesh=True)
+    m.generate_mesh(cut_polylines=[[[x0, y0], [x1, y1]]],
+                    processes=4, cache_dir='mesh_cache')
+
+or create_mesh_from_regions(..., filename='mesh.msh', number_of_pieces=8,
+processes=4).
+"""
+
+import itertools
+
+import numpy as num
+
+from anuga.mesh_engine.mesh_engine import generate_mesh
+import anuga.utilities.log as log
+
+
+# Tag of the segments of the cuts, dropped from the final mesh
+CUT_TAG = '__cut__'
+
+
+def generate_mesh_in_pieces(mesh, cut_polylines=None, number_of_pieces=None,
+                            maximum_triangle_area="",
+                            minimum_triangle_angle=28.0,
+                            processes=1, cache_dir=None, verbose=False):
+    """Triangulate the outline of the Array_mesh mesh in pieces and store
+    the triangulation in mesh, as mesh.generate_mesh.
+
+    cut_polylines: list of polylines (absolute) separating the pieces.
+    Parts of cuts outside the outline are ignored. If None, there are
+    number_of_pieces pieces separated by vertical cuts.
+
+    processes: number of processes triangulating the pieces.
+
+    cache_dir: if given, the triangulation of each piece is cached there.
+    """
+
+    if cut_polylines is None:
+        msg = 'Give either cut_polylines or number_of_pieces'
+        assert number_of_pieces is not None, msg
+        cut_polylines = automatic_cuts(mesh, number_of_pieces,
+                                       maximum_triangle_area)
+    else:
+        cut_polylines = [mesh.geo_reference.change_points_geo_ref(polyline)
+                         for polyline in cut_polylines]
+
+    coarse = _coarse_triangulation(mesh, cut_polylines)
+    pieces, points = _split_pieces(mesh, coarse, maximum_triangle_area,
+                                   minimum_triangle_angle)
+
+    if verbose:
+        log.critical('Generating mesh in %d pieces' % len(pieces))
+
+    tasks = [(piece, cache_dir) for piece, ids in pieces]
+
+    pool = None
+    imap = itertools.imap
+    if processes > 1 and len(pieces) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(int(processes), len(pieces)))
+        imap = pool.imap
+
+    try:
+        results = list(imap(_triangulate_piece_task, tasks))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    _stitch(mesh, points, pieces, results, verbose)
+
+
+def automatic_cuts(mesh, number_of_pieces, maximum_triangle_area=""):
+    """Return number_of_pieces-1 vertical cuts (relative to the mesh)
+    splitting the estimated number of triangles of the mesh evenly.
+
+    The number of triangles is estimated from the area and the maximum
+    triangle area of the regions of the outline.
+    """
+
+    coarse = _coarse_triangulation(mesh, [])
+    vertices = coarse['vertices']
+    triangles = coarse['triangles']
+
+    x = vertices[triangles, 0]
+    y = vertices[triangles, 1]
+    area = 0.5*num.abs((x[:,1] - x[:,0])*(y[:,2] - y[:,0]) -
+                       (x[:,2] - x[:,0])*(y[:,1] - y[:,0]))
+    max_area = _maximum_areas(mesh, maximum_triangle_area)[coarse['regions']]
+    weights = num.where(num.isinf(max_area), 1.0, area/max_area)
+
+    # The weight of each triangle is spread over its x extent
+    xmin = num.min(x, axis=1)
+    xmax = num.max(x, axis=1)
+    breaks = num.unique(num.concatenate((xmin, xmax)))
+    density = num.zeros(len(breaks), num.float)
+    width = num.maximum(xmax - xmin, 1.0e-12)
+    num.add.at(density, num.searchsorted(breaks, xmin), weights/width)
+    num.add.at(density, num.searchsorted(breaks, xmax), -weights/width)
+    density = num.cumsum(density)[:-1]
+    cumulative = num.concatenate(([0.0],
+                                  num.cumsum(density*num.diff(breaks))))
+
+    targets = cumulative[-1]*num.arange(1, number_of_pieces)/number_of_pieces
+    cuts = num.interp(targets, cumulative, breaks)
+
+    # Keep the cuts in the middle of the gaps between the vertices of
+    # the outline, away from short segments
+    xs = num.unique(vertices[:,0])
+    k = num.clip(num.searchsorted(xs, cuts), 1, len(xs) - 1)
+    gap = xs[k] - xs[k-1]
+    cuts = num.unique(num.clip(cuts, xs[k-1] + 0.25*gap, xs[k] - 0.25*gap))
+
+    ymin = num.min(vertices[:,1])
+    ymax = num.max(vertices[:,1])
+    margin = 0.01*(ymax - ymin) + 1.0
+    return [num.array([[xc, ymin - margin], [xc, ymax + margin]])
+            for xc in cuts]
+
+
+#--------------------------------------------------------------
+# The pieces
+#--------------------------------------------------------------
+def _coarse_triangulation(mesh, cut_polylines):
+    """Triangulate the outline and the cuts (relative), without
+    refinement. Return the vertices, triangles, neighbours, segments,
+    segment tags and region of each triangle (0 outside the regions,
+    i+1 in region i of mesh).
+    """
+
+    points = [mesh.points]
+    segments = [mesh.outline_segments]
+    tags = [mesh.outline_segment_tags]
+
+    offset = len(mesh.points)
+    for polyline in cut_polylines:
+        polyline = num.array(polyline, num.float).reshape(-1, 2)
+        i = num.arange(len(polyline) - 1)
+        points.append(polyline)
+        segments.append(num.transpose([i, i + 1]) + offset)
+        tags.append([CUT_TAG]*len(i))
+        offset += len(polyline)
+
+    points = num.concatenate(points)
+    segments = num.concatenate(segments)
+    markers, names = _segment_markers_and_names(num.concatenate(tags))
+
+    generated = generate_mesh(points, _or_empty(segments),
+                              _or_empty(mesh.holes), [],
+                              None, markers, 'Qpzn')
+
+    markers = num.reshape(generated['generatedsegmentmarkerlist'], -1)
+
+    coarse = {}
+    coarse['vertices'] = generated['generatedpointlist']
+    coarse['triangles'] = num.array(generated['generatedtrianglelist'],
+                                    num.int)
+    coarse['neighbours'] = num.array(
+                       generated['generatedtriangleneighborlist'], num.int)
+    coarse['segments'] = num.array(generated['generatedsegmentlist'], num.int)
+    coarse['segment_tags'] = names[markers]
+    coarse['sides'] = _sides(coarse)
+
+    # Regions flooded from their points, as by triangle, but not
+    # stopped by the cuts. Later regions take over earlier ones.
+    tri_ids, begin, end, other, is_segment, side_tags = coarse['sides']
+    link = (other >= 0) & (~is_segment | (side_tags == CUT_TAG))
+    areas = _components(len(coarse['triangles']), tri_ids[link], other[link])
+
+    area_regions = num.zeros(num.max(areas) + 1, num.int)
+    for i, point in enumerate(mesh.regions):
+        t = _locate(point, coarse['vertices'], coarse['triangles'])
+        if t >= 0:
+            area_regions[areas[t]] = i + 1
+    coarse['regions'] = area_regions[areas]
+
+    return coarse
+
+
+def _sides(coarse):
+    """Return the sides of the triangles of the coarse triangulation.
+
+    Side j of triangle t is (triangles[t,j+1], triangles[t,j+2]), with
+    the triangle on its left. For each side: the triangle, its first and
+    second vertex, the neighbour across it (-1 if none), whether it is a
+    segment and the tag of the segment.
+    """
+
+    triangles = coarse['triangles']
+    N = len(coarse['vertices'])
+    M = len(triangles)
+
+    tri_ids = num.repeat(num.arange(M), 3)
+    begin = triangles[:, [1, 2, 0]].reshape(-1)
+    end = triangles[:, [2, 0, 1]].reshape(-1)
+    other = coarse['neighbours'].reshape(-1)
+
+    segments = coarse['segments']
+    seg_keys = num.minimum(segments[:,0], segments[:,1])*N + \
+               num.maximum(segments[:,0], segments[:,1])
+    seg_order = num.argsort(seg_keys)
+    side_keys = num.minimum(begin, end)*N + num.maximum(begin, end)
+    index = num.minimum(num.searchsorted(seg_keys[seg_order], side_keys),
+                        len(seg_keys) - 1)
+    is_segment = seg_keys[seg_order][index] == side_keys
+    side_tags = coarse['segment_tags'][seg_order][index]
+
+    return tri_ids, begin, end, other, is_segment, side_tags
+
+
+def _locate(point, vertices, triangles):
+    """Index of a triangle containing point, -1 if none"""
+
+    x = vertices[triangles, 0] - point[0]
+    y = vertices[triangles, 1] - point[1]
+
+    # Signed areas of the point with each side
+    inside = num.ones(len(triangles), num.bool)
+    for i, j in [(0, 1), (1, 2), (2, 0)]:
+        inside &= x[:,i]*y[:,j] - x[:,j]*y[:,i] >= 0
+
+    found = num.flatnonzero(inside)
+    if len(found) == 0:
+        return -1
+
+    return found[0]
+
+
+def _maximum_areas(mesh, maximum_triangle_area):
+    """Maximum triangle area of each region attribute of the coarse
+    triangulation, inf if not constrained
+    """
+
+    if maximum_triangle_area in ("", None):
+        maximum_triangle_area = num.inf
+    maximum_triangle_area = float(maximum_triangle_area)
+
+    areas = num.array(mesh.region_max_areas, num.float)
+    areas = num.where(areas > 0, areas, num.inf)
+    areas = num.minimum(areas, maximum_triangle_area)
+
+    return num.append(maximum_triangle_area, areas)
+
+
+def _split_pieces(mesh, coarse, maximum_triangle_area,
+                  minimum_triangle_angle):
+    """Split the coarse triangulation into pieces separated by the cuts.
+
+    Return a list of (piece, ids) and the points of all pieces. piece is
+    the description of the piece passed to _triangulate_piece and ids
+    the index in points of each point of the piece.
+    """
+
+    vertices = coarse['vertices']
+    N = len(vertices)
+    M = len(coarse['triangles'])
+
+    tri_ids, begin, end, other, is_segment, side_tags = coarse['sides']
+    side_keys = num.minimum(begin, end)*N + num.maximum(begin, end)
+    is_cut = is_segment & (side_tags == CUT_TAG)
+
+    msg = 'The boundary of the triangulation is not made of segments'
+    assert num.all(is_segment[other < 0]), msg
+
+    # Pieces are separated by the cuts and sub-areas by any segment
+    inside = other >= 0
+    link = inside & ~is_cut
+    piece_ids = _components(M, tri_ids[link], other[link])
+    link = inside & ~is_segment
+    subarea_ids = _components(M, tri_ids[link], other[link])
+
+    piece_of_side = piece_ids[tri_ids]
+    on_boundary = ~inside
+    on_boundary[inside] = piece_ids[other[inside]] != piece_of_side[inside]
+    interior = is_segment & ~on_boundary
+
+    # Divide the sides on the boundaries of the pieces, once for both
+    # pieces, as the sides of equilateral triangles of the maximum area
+    # next to them and their ends
+    areas_of_regions = _maximum_areas(mesh, maximum_triangle_area)
+    max_areas = areas_of_regions[coarse['regions']]
+    vertex_area = num.zeros(N, num.float) + num.inf
+    num.minimum.at(vertex_area, coarse['triangles'].reshape(-1),
+                   num.repeat(max_areas, 3))
+
+    sides = num.flatnonzero(on_boundary)
+    keys, shared = num.unique(side_keys[sides], return_inverse=True)
+    lo = keys // N
+    hi = keys % N
+    side_area = num.minimum(vertex_area[lo], vertex_area[hi])
+    num.minimum.at(side_area, shared, max_areas[tri_ids[sides]])
+    length = num.sqrt(num.sum((vertices[hi] - vertices[lo])**2, axis=1))
+    h = num.sqrt(4.0*side_area/num.sqrt(3.0))
+    parts = num.where(num.isinf(h), 1,
+                      num.maximum(num.ceil(length/h), 1)).astype(num.int)
+
+    # Points added on the sides, from lo to hi
+    added = parts - 1
+    offsets = N + num.concatenate(([0], num.cumsum(added)))
+    side_of_point = num.repeat(num.arange(len(keys)), added)
+    position = num.arange(len(side_of_point)) - \
+               num.repeat(offsets[:-1] - N, added)
+    fraction = (position + 1.0)/parts[side_of_point]
+    new_points = vertices[lo[side_of_point]] + fraction[:,num.newaxis]*\
+                 (vertices[hi[side_of_point]] - vertices[lo[side_of_point]])
+    points = num.concatenate((vertices, new_points))
+
+    # Segments of the divided sides, in the direction of each side
+    counts = parts[shared]
+    use = num.repeat(num.arange(len(sides)), counts)
+    part = num.arange(len(use)) - num.repeat(num.cumsum(counts) - counts,
+                                             counts)
+    side = shared[use]
+    start = num.where(part == 0, lo[side], offsets[side] + part - 1)
+    stop = num.where(part == parts[side] - 1, hi[side], offsets[side] + part)
+    forward = begin[sides[use]] == lo[side]
+    boundary_segments = num.where(forward, [start, stop], [stop, start]).T
+
+    # All segments of the pieces with the side they come from. Interior
+    # segments are on two sides, one for each sub-area next to them.
+    interior = num.flatnonzero(interior)
+    directed = num.concatenate((boundary_segments,
+                                num.transpose([begin[interior],
+                                               end[interior]])))
+    directed_sides = num.concatenate((sides[use], interior))
+    once = num.concatenate((num.ones(len(use), num.bool),
+                            tri_ids[interior] < other[interior]))
+
+    subarea_region = num.zeros(num.max(subarea_ids) + 1, num.int)
+    subarea_region[subarea_ids] = coarse['regions']
+    region_names = num.append('', mesh.region_tags)
+
+    pieces = []
+    for p in range(num.max(piece_ids) + 1):
+        mine = piece_of_side[directed_sides] == p
+        pieces.append(_describe_piece(points,
+                                      directed[mine],
+                                      side_tags[directed_sides[mine]],
+                                      once[mine],
+                                      subarea_ids[tri_ids[directed_sides[mine]]],
+                                      subarea_region,
+                                      region_names, areas_of_regions,
+                                      minimum_triangle_angle))
+
+    return pieces, points
+
+
+def _describe_piece(points, directed, tags, once, subareas, subarea_region,
+                    region_names, areas_of_regions, minimum_triangle_angle):
+    """Return the description of a piece independent of the rest of the
+    mesh and the index in points of each of its points.
+
+    directed are the segments of the piece, each with the sub-area
+    subareas on its left. Interior segments are given in both
+    directions, once marked by once.
+    """
+
+    # Points in sorted order
+    ids = num.unique(directed)
+    local = points[ids]
+    ids = ids[num.lexsort((local[:,1], local[:,0]))]
+    renumber = num.zeros(num.max(ids) + 1, num.int)
+    renumber[ids] = num.arange(len(ids))
+    directed = renumber[directed]
+
+    # Sub-areas are known by the first segment on their boundary, with
+    # the sub-area on its left
+    P = len(ids)
+    keys = directed[:,0]*P + directed[:,1]
+    order = num.argsort(keys)
+    subarea_ids, first = num.unique(subareas[order], return_index=True)
+    subarea_keys = keys[order][first]
+    regions = subarea_region[subarea_ids]
+
+    # Regions of the piece by tag and maximum area
+    areas = areas_of_regions[regions]
+    areas = num.where(num.isinf(areas), 0.0, areas)
+    names = region_names[regions]
+    pairs = sorted(set(zip(names.tolist(), areas.tolist())))
+    region_index = num.array([pairs.index(pair) for pair in
+                              zip(names.tolist(), areas.tolist())], num.int)
+    order = num.argsort(subarea_keys)
+
+    # Segments in sorted order
+    segments = directed[once]
+    tags = tags[once]
+    sort = num.lexsort((segments[:,1], segments[:,0]))
+    markers, segment_names = _segment_markers_and_names(tags[sort])
+
+    piece = {}
+    piece['points'] = num.array(points[ids], num.float)
+    piece['segments'] = num.array(segments[sort], num.int)
+    piece['segment_markers'] = num.array(markers, num.int)
+    piece['segment_names'] = segment_names.tolist()
+    piece['subarea_keys'] = num.array(subarea_keys[order], num.int64)
+    piece['subarea_regions'] = region_index[order]
+    piece['regions'] = pairs
+    piece['minimum_triangle_angle'] = float(minimum_triangle_angle)
+
+    return piece, ids
+
+
+def _segment_markers_and_names(tags):
+
+    from anuga.pmesh.array_mesh import segment_markers_and_names
+    return segment_markers_and_names(tags)
+
+
+#--------------------------------------------------------------
+# Triangulation of a piece
+#--------------------------------------------------------------
+def _triangulate_piece_task(task):
+    """Triangulate a piece, from its cache if given. Used directly or by
+    the processes of a multiprocessing pool.
+    """
+
+    piece, cache_dir = task
+
+    if cache_dir is None:
+        return _triangulate_piece(piece)
+
+    from anuga.caching import cache
+    return cache(_triangulate_piece, (piece,), cachedir=cache_dir,
+                 compression=False, verbose=False)
+
+
+def _triangulate_piece(piece):
+    """Triangulate the piece described by _describe_piece.
+
+    Return the vertices (the points of the piece first), triangles,
+    index in piece['regions'] of each triangle, segments and their tags.
+    """
+
+    points = piece['points']
+    segments = piece['segments']
+    markers = piece['segment_markers']
+    P = len(points)
+
+    # Sub-areas and holes in a triangulation without refinement
+    coarse = generate_mesh(points, segments, [], [], None, markers, 'Qpzn')
+    triangles = num.array(coarse['generatedtrianglelist'], num.int)
+    neighbours = num.array(coarse['generatedtriangleneighborlist'], num.int)
+    M = len(triangles)
+
+    msg = 'The vertices of a piece were changed by its triangulation'
+    assert num.allclose(coarse['generatedpointlist'][:P], points), msg
+
+    tri_ids = num.repeat(num.arange(M), 3)
+    begin = triangles[:, [1, 2, 0]].reshape(-1)
+    end = triangles[:, [2, 0, 1]].reshape(-1)
+    other = neighbours.reshape(-1)
+
+    seg_keys = num.sort(num.append(segments[:,0]*P + segments[:,1],
+                                   segments[:,1]*P + segments[:,0]))
+    keys = begin*P + end
+    index = num.minimum(num.searchsorted(seg_keys, keys), len(seg_keys) - 1)
+    is_segment = seg_keys[index] == keys
+
+    link = (other >= 0) & ~is_segment
+    components = _components(M, tri_ids[link], other[link])
+
+    # The first directed segment bounding each sub-area, as in the
+    # description of the piece
+    first_key = num.zeros(num.max(components) + 1, num.int64) + \
+                num.iinfo(num.int64).max
+    num.minimum.at(first_key, components[tri_ids[is_segment]],
+                   keys[is_segment])
+    subarea_keys = piece['subarea_keys']
+    index = num.minimum(num.searchsorted(subarea_keys, first_key),
+                        len(subarea_keys) - 1)
+    known = subarea_keys[index] == first_key
+
+    # One point in each component
+    seed, first = num.unique(components, return_index=True)
+    x = coarse['generatedpointlist'][triangles[first]]
+    centroids = num.mean(x, axis=1)
+
+    regions = num.zeros((num.sum(known), 4), num.float)
+    regions[:,:2] = centroids[known]
+    regions[:,2] = piece['subarea_regions'][index[known]] + 1
+    regions[:,3] = [piece['regions'][i][1]
+                    for i in piece['subarea_regions'][index[known]]]
+    holes = centroids[~known]
+
+    mode = 'QpzYq%saAn' % piece['minimum_triangle_angle']
+    generated = generate_mesh(points, segments, _or_empty(holes), regions,
+                              None, markers, mode)
+
+    result = {}
+    result['vertices'] = generated['generatedpointlist']
+    result['triangles'] = num.array(generated['generatedtrianglelist'],
+                                    num.int)
+    result['neighbours'] = num.array(
+                     generated['generatedtriangleneighborlist'], num.int)
+    result['regions'] = num.array(
+        generated['generatedtriangleattributelist'][:,0], num.int) - 1
+    result['segments'] = num.array(generated['generatedsegmentlist'], num.int)
+    markers = num.reshape(generated['generatedsegmentmarkerlist'], -1)
+    result['segment_tags'] = num.array(piece['segment_names'])[markers]
+
+    msg = 'The boundary of a piece was changed by its triangulation'
+    assert num.allclose(result['vertices'][:P], points), msg
+
+    return result
+
+
+#--------------------------------------------------------------
+# Stitching
+#--------------------------------------------------------------
+def _stitch(mesh, points, pieces, results, verbose=False):
+    """Merge the triangulations of the pieces and store them in mesh"""
+
+    vertices = [points]
+    triangles = []
+    neighbours = []
+    triangle_tags = []
+    segments = []
+    segment_tags = []
+
+    offset = len(points)
+    tri_offset = 0
+    for (piece, ids), result in zip(pieces, results):
+        P = len(ids)
+        steiner = len(result['vertices']) - P
+        renumber = num.concatenate((ids, offset + num.arange(steiner)))
+        offset += steiner
+
+        vertices.append(result['vertices'][P:])
+        triangles.append(renumber[result['triangles']])
+        neighbours.append(num.where(result['neighbours'] >= 0,
+                                    result['neighbours'] + tri_offset, -1))
+        tri_offset += len(result['triangles'])
+
+        names = num.array([name for name, area in piece['regions']])
+        triangle_tags.append(names[result['regions']])
+
+        keep = result['segment_tags'] != CUT_TAG
+        segments.append(renumber[result['segments'][keep]])
+        segment_tags.append(result['segment_tags'][keep])
+
+        if verbose:
+            log.critical('Piece with %d triangles'
+                         % len(result['triangles']))
+
+    vertices = num.concatenate(vertices)
+    triangles = num.concatenate(triangles)
+    neighbours = num.concatenate(neighbours)
+    segments = num.concatenate(segments)
+
+    # Neighbours across the boundaries of the pieces
+    tri_ids, sides = num.nonzero(neighbours < 0)
+    begin = triangles[tri_ids, (sides + 1) % 3].astype(num.int64)
+    end = triangles[tri_ids, (sides + 2) % 3].astype(num.int64)
+    N = len(vertices)
+    keys = begin*N + end
+    order = num.argsort(keys)
+    reverse = end*N + begin
+    index = num.minimum(num.searchsorted(keys[order], reverse),
+                        len(keys) - 1)
+    found = keys[order][index] == reverse
+    neighbours[tri_ids[found], sides[found]] = tri_ids[order[index[found]]]
+
+    # Drop the points not used by any piece
+    used = num.zeros(len(vertices), num.bool)
+    used[triangles] = True
+    renumber = num.cumsum(used) - 1
+
+    mesh.vertices = vertices[used]
+    mesh.triangles = renumber[triangles]
+    mesh.triangle_tags = num.concatenate(triangle_tags)
+    mesh.segments = renumber[segments]
+    mesh.segment_tags = num.concatenate(segment_tags)
+    mesh.triangle_neighbors = neighbours
+    mesh.vertex_attributes = None
+    mesh.vertex_attribute_titles = []
+
+
+def _components(n, a, b):
+    """Label the n nodes of the graph with edges (a, b) by connected
+    component, numbered from 0 in the order of their first node
+    """
+
+    label = num.arange(n)
+    while True:
+        la = label[a]
+        lb = label[b]
+        differ = la != lb
+        if not num.any(differ):
+            break
+
+        # Hook the larger roots onto the smaller ones and compress
+        num.minimum.at(label, num.maximum(la, lb)[differ],
+                       num.minimum(la, lb)[differ])
+        while True:
+            jumped = label[label]
+            if num.all(jumped == label):
+                break
+            label = jumped
+
+    roots, components = num.unique(label, return_inverse=True)
+
+    return components
+
+
+def _or_empty(array):
+    """Empty list for empty arrays, as expected by generate_mesh"""
+
+    if len(array) == 0:
+        return []
+
+    return array
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+import tempfile
+import unittest
+import os
+
+import numpy as num
+
+from anuga.pmesh.mesh import Mesh
+from anuga.pmesh.array_mesh import Array_mesh
+from anuga.pmesh.mesh_interface import create_mesh_from_regions
+from anuga.load_mesh.loadASCII import import_mesh_file
+from anuga.abstract_2d_finite_volumes.pmesh2domain import \
+     pmesh_to_domain_instance, pmesh_dict_to_tag_dict, \
+     pmesh_dict_to_tag_dict_c, pmesh_dict_to_tag_dict_old
+from anuga.coordinate_transforms.geo_reference import Geo_reference
+from anuga.shallow_water.shallow_water_domain import Domain
+
+
+def create_meshes(**kwargs):
+    """The same mesh as Mesh and as Array_mesh"""
+
+    polygon = [[0,0], [10,0], [10,10], [0,10]]
+    boundary_tags = {'bottom': [0], 'right': [1], 'top': [2], 'left': [3]}
+    interior_regions = [([[2,2], [4,2], [4,4], [2,4]], 0.1)]
+    interior_holes = [[[6,6], [8,6], [8,8]]]
+    breaklines = [[[1,9], [5,9]]]
+
+    meshes = []
+    for use_array_mesh in [False, True]:
+        m = create_mesh_from_regions(polygon, boundary_tags,
+                                     maximum_triangle_area=1.0,
+                                     interior_regions=interior_regions,
+                                     interior_holes=interior_holes,
+                                     breaklines=breaklines,
+                                     use_array_mesh=use_array_mesh,
+                                     **kwargs)
+        m.generate_mesh(maximum_triangle_area=1.0, verbose=False)
+        meshes.append(m)
+
+    return meshes
+
+
+class Test_array_mesh(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def test_same_as_mesh(self):
+
+        m, am = create_meshes(mesh_geo_reference=Geo_reference(56, 100, 200))
+
+        assert isinstance(m, Mesh)
+        assert isinstance(am, Array_mesh)
+        assert am.get_triangle_count() == m.get_triangle_count() > 0
+
+        d = m.Mesh2IODict()
+        ad = am.Mesh2IODict()
+
+        assert num.allclose(ad['vertices'], d['vertices'])
+        assert num.alltrue(ad['triangles'] == d['triangles'])
+        assert num.alltrue(ad['triangle_neighbors'] == d['triangle_neighbors'])
+        assert num.alltrue(ad['segments'] == d['segments'])
+        assert ad['segment_tags'].tolist() == d['segment_tags']
+        assert ad['triangle_tags'].tolist() == d['triangle_tags']
+        assert ad['geo_reference'] == d['geo_reference']
+
+        assert pmesh_dict_to_tag_dict(ad) == pmesh_dict_to_tag_dict(d)
+
+
+    def test_export_and_import(self):
+
+        m, am = create_meshes()
+
+        for extension in ['.msh', '.tsh']:
+            handle, file_name = tempfile.mkstemp(extension)
+            os.close(handle)
+
+            m.export_mesh_file(file_name)
+            d = import_mesh_file(file_name)
+
+            am.export_mesh_file(file_name)
+            ad = import_mesh_file(file_name)
+            os.remove(file_name)
+
+            assert num.allclose(ad['vertices'], d['vertices'])
+            assert num.alltrue(ad['triangles'] == d['triangles'])
+            assert list(ad['segment_tags']) == list(d['segment_tags'])
+            assert list(ad['triangle_tags']) == list(d['triangle_tags'])
+            assert num.allclose(ad['points'], d['points'])
+            assert num.alltrue(ad['outline_segments'] == d['outline_segments'])
+            assert list(ad['outline_segment_tags']) == \
+                   list(d['outline_segment_tags'])
+            assert num.allclose(ad['regions'], d['regions'])
+            assert num.allclose(ad['holes'], d['holes'])
+
+
+    def test_domain_from_array_mesh(self):
+
+        m, am = create_meshes()
+
+        domain = pmesh_to_domain_instance(m, Domain)
+        array_domain = pmesh_to_domain_instance(am, Domain)
+
+        assert len(array_domain) == len(domain)
+        assert array_domain.boundary == domain.boundary
+        assert num.allclose(array_domain.get_vertex_coordinates(),
+                            domain.get_vertex_coordinates())
+        assert sorted(array_domain.get_tagged_elements().keys()) == \
+               sorted(domain.get_tagged_elements().keys())
+
+        tags = sorted(set(array_domain.boundary.values()))
+        assert tags == ['bottom', 'interior', 'left', 'right', 'top'], tags
+
+
+    def test_get_mesh(self):
+
+        m, am = create_meshes()
+
+        mesh = am.get_mesh()
+        assert isinstance(mesh, Mesh)
+        assert mesh.get_triangle_count() == m.get_triangle_count()
+
+        d = mesh.Mesh2IODict()
+        assert num.alltrue(num.array(d['triangles']) ==
+                           m.Mesh2IODict()['triangles'])
+        assert list(d['triangle_tags']) == m.Mesh2IODict()['triangle_tags']
+        assert len(mesh.getUserSegments()) == len(am.outline_segments)
+
+
+    def test_duplicate_points(self):
+
+        am = Array_mesh()
+        am.add_points_and_segments([[0,0], [1,0], [1,1], [0,1],
+                                    [1,0], [0.5,0.5]],
+                                   [[0,1], [4,2], [2,3], [3,0]],
+                                   {'wall': [0, 1]})
+        am.generate_mesh(maximum_triangle_area=0.1)
+
+        # The duplicated point is dropped
+        assert len(am.vertices) >= 5
+        assert num.allclose(am.vertices[:5],
+                            [[0,0], [1,0], [1,1], [0,1], [0.5,0.5]])
+        assert 'wall' in am.segment_tags.tolist()
+
+        domain = pmesh_to_domain_instance(am, Domain)
+        assert num.allclose(domain.get_area(), 1.0)
+
+
+    def test_pmesh_dict_to_tag_dict(self):
+
+        m, am = create_meshes()
+        d = am.Mesh2IODict()
+
+        tag_dict = pmesh_dict_to_tag_dict(d)
+        assert tag_dict == pmesh_dict_to_tag_dict_c(d)
+        assert tag_dict == pmesh_dict_to_tag_dict_old(d)
+
+        # Duplicate sides
+        d = {'triangles': [[0,1,2], [0,1,2]],
+             'segments': [[0,1]],
+             'segment_tags': ['wall']}
+        try:
+            pmesh_dict_to_tag_dict(d)
+        except RuntimeError:
+            pass
+        else:
+            raise Exception('Duplicate segments not caught')
+
+        d = {'triangles': [[0,1,2], [2,1,3]],
+             'segments': [[1,0], [3,2], [2,1]],
+             'segment_tags': ['a', 'b', '']}
+        assert pmesh_dict_to_tag_dict(d) == {(0,2): 'a', (1,1): 'b'}
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_array_mesh, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
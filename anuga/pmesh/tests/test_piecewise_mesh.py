@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+import tempfile
+import unittest
+import shutil
+import os
+
+import numpy as num
+
+from anuga.pmesh.mesh_interface import create_mesh_from_regions
+from anuga.pmesh.piecewise_mesh import automatic_cuts, _components
+from anuga.abstract_2d_finite_volumes.pmesh2domain import \
+     pmesh_to_domain_instance
+from anuga.shallow_water.shallow_water_domain import Domain
+
+
+def create_mesh(breakline=[[1,9], [9,9]], **kwargs):
+
+    return create_mesh_from_regions([[0,0], [10,0], [10,10], [5,12], [0,10]],
+                                    {'bottom': [0], 'right': [1],
+                                     'top': [2, 3], 'left': [4]},
+                                    maximum_triangle_area=0.05,
+                                    interior_regions=[([[2,2], [6,2],
+                                                        [6,6], [2,6]],
+                                                       0.005)],
+                                    interior_holes=[[[7,7], [8,7], [8,8]]],
+                                    breaklines=[breakline],
+                                    use_array_mesh=True,
+                                    verbose=False,
+                                    **kwargs)
+
+
+def triangle_areas(mesh):
+
+    x = mesh.vertices[mesh.triangles]
+    return 0.5*((x[:,1,0] - x[:,0,0])*(x[:,2,1] - x[:,0,1]) -
+                (x[:,2,0] - x[:,0,0])*(x[:,1,1] - x[:,0,1]))
+
+
+class Test_piecewise_mesh(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp('_pieces')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+
+    def check_mesh(self, mesh):
+        """The triangulation conforms and covers the domain"""
+
+        triangles = mesh.triangles
+        N = len(mesh.vertices)
+        M = len(triangles)
+
+        # All vertices used, triangles counter clockwise
+        assert len(num.unique(triangles)) == N
+        areas = triangle_areas(mesh)
+        assert num.all(areas > 0.0)
+        assert num.allclose(num.sum(areas), 110.0 - 0.5)
+
+        # Each side is shared by at most two triangles, in opposite
+        # directions, as given by the neighbours
+        begin = triangles[:, [1, 2, 0]].reshape(-1)
+        end = triangles[:, [2, 0, 1]].reshape(-1)
+        keys = begin*N + end
+        assert len(num.unique(keys)) == len(keys)
+
+        neighbours = mesh.triangle_neighbors.reshape(-1)
+        inner = neighbours >= 0
+        reverse = dict(zip(keys.tolist(), num.repeat(num.arange(M), 3)))
+        for key, neighbour in zip((end*N + begin)[inner].tolist(),
+                                  neighbours[inner].tolist()):
+            assert reverse[key] == neighbour
+
+        # Only the sides on the bounding polygon and the hole are free
+        free = (end*N + begin)[~inner]
+        assert num.all(~num.in1d(free, keys))
+        length = num.sqrt(num.sum((mesh.vertices[begin[~inner]] -
+                                   mesh.vertices[end[~inner]])**2, axis=1))
+        assert num.allclose(num.sum(length), 30.0 + 2*num.sqrt(29.0) +
+                                              2.0 + num.sqrt(2.0))
+
+        # Cuts are not segments
+        assert '__cut__' not in mesh.segment_tags.tolist()
+
+        # Boundary tags and regions
+        domain = pmesh_to_domain_instance(mesh, Domain)
+        assert len(domain.boundary) == num.sum(~inner)
+        assert sorted(set(domain.boundary.values())) == \
+               ['bottom', 'interior', 'left', 'right', 'top']
+
+        x = num.mean(mesh.vertices[triangles], axis=1)
+        region = (x[:,0] > 2) & (x[:,0] < 6) & (x[:,1] > 2) & (x[:,1] < 6)
+        assert num.max(areas[region]) < 1.2*0.005
+        assert num.max(areas[~region]) < 1.2*0.05
+        assert num.mean(areas[region]) < 0.005
+        assert num.mean(areas[~region]) > 0.005
+
+
+    def test_cut_polylines(self):
+
+        single = create_mesh()
+        single.generate_mesh(maximum_triangle_area=0.05)
+
+        mesh = create_mesh()
+        mesh.generate_mesh(maximum_triangle_area=0.05,
+                           cut_polylines=[[[3,-1], [3,13]],
+                                          [[-1,5], [4,5], [11,6]]])
+
+        self.check_mesh(mesh)
+
+        # About the same number of triangles as in one piece
+        assert abs(len(mesh.triangles) - len(single.triangles)) < \
+               0.1*len(single.triangles)
+
+
+    def test_number_of_pieces(self):
+
+        mesh = create_mesh()
+        cuts = automatic_cuts(mesh, 4, 0.05)
+        assert len(cuts) == 3
+        x = [cut[0][0] for cut in cuts]
+        assert x == sorted(x)
+        assert 0.0 < x[0] < x[-1] < 10.0
+
+        mesh.generate_mesh(number_of_pieces=4)
+        self.check_mesh(mesh)
+
+        # The same mesh with processes
+        other = create_mesh()
+        other.generate_mesh(number_of_pieces=4, processes=2)
+
+        assert num.allclose(other.vertices, mesh.vertices)
+        assert num.alltrue(other.triangles == mesh.triangles)
+        assert num.alltrue(other.triangle_tags == mesh.triangle_tags)
+
+
+    def test_cache(self):
+
+        def results():
+            return len([name for name in os.listdir(self.cache_dir)
+                        if name.endswith('_Result')])
+
+        cuts = [[[3,-1], [3,13]], [[7.5,-1], [7.5,13]], [[-1,5], [11,5]]]
+
+        mesh = create_mesh(breakline=[[8.5,1], [9.5,3]])
+        mesh.generate_mesh(cut_polylines=cuts, cache_dir=self.cache_dir)
+        assert results() == 6
+
+        # The same mesh from the cache
+        other = create_mesh(breakline=[[8.5,1], [9.5,3]])
+        other.generate_mesh(cut_polylines=cuts, cache_dir=self.cache_dir)
+        assert results() == 6
+        assert num.alltrue(other.triangles == mesh.triangles)
+
+        # A breakline moved within one piece
+        other = create_mesh(breakline=[[8.5,1], [9.0,3]])
+        other.generate_mesh(cut_polylines=cuts, cache_dir=self.cache_dir)
+        assert results() == 7
+
+
+    def test_create_mesh_from_regions_in_pieces(self):
+
+        handle, filename = tempfile.mkstemp('.msh')
+        os.close(handle)
+
+        mesh = create_mesh(filename=filename, number_of_pieces=3)
+        domain = Domain(filename)
+        os.remove(filename)
+
+        assert len(domain) == len(mesh.triangles)
+        assert num.allclose(num.sum(domain.areas), 110.0 - 0.5)
+
+
+    def test_components(self):
+
+        components = _components(6, num.array([0, 4, 3]),
+                                    num.array([2, 2, 5]))
+        assert num.alltrue(components == [0, 1, 0, 2, 0, 2])
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_piecewise_mesh, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -4,6 +4,8 @@
 
 //#include <metis.h>
 
+#include <stddef.h>
+
 #include <defs.h>
 #include <struct.h>
 #include <macros.h>
@@ -14,3 +16,10 @@
 void bridge_partMeshNodal(int * ne, int * nn, idxtype * elmnts, int * etype, int * numflag, int * nparts, int * edgecut, idxtype * epart, idxtype * npart){
   METIS_PartMeshNodal(ne, nn, elmnts, etype, numflag, nparts, edgecut, epart, npart);
 }
+
+void bridge_partGraph(int kway, int * n, idxtype * xadj, idxtype * adjncy, idxtype * vwgt, int * wgtflag, int * numflag, int * nparts, int * options, int * edgecut, idxtype * part){
+  if(kway)
+    METIS_PartGraphKway(n, xadj, adjncy, vwgt, NULL, wgtflag, numflag, nparts, options, edgecut, part);
+  else
+    METIS_PartGraphRecursive(n, xadj, adjncy, vwgt, NULL, wgtflag, numflag, nparts, options, edgecut, part);
+}
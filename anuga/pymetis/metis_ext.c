@@ -7,9 +7,14 @@ typedef int idxtype;
 #include "bridge.h"
 
 static PyObject * metis_partMeshNodal(PyObject *, PyObject *);
+static PyObject * metis_partGraphKway(PyObject *, PyObject *);
+static PyObject * metis_partGraphRecursive(PyObject *, PyObject *);
 
 static PyMethodDef methods[] = {
   {"partMeshNodal", metis_partMeshNodal, METH_VARARGS, "METIS_PartMeshNodal"},
+  {"partGraphKway", metis_partGraphKway, METH_VARARGS, "METIS_PartGraphKway"},
+  {"partGraphRecursive", metis_partGraphRecursive, METH_VARARGS,
+   "METIS_PartGraphRecursive"},
   {NULL, NULL, 0, NULL}
 };
 
@@ -115,3 +120,134 @@ static PyObject * metis_partMeshNodal(PyObject * self, PyObject * args){
 
   return Py_BuildValue("iOO", edgecut, (PyObject *)epart_pyarr, (PyObject *)npart_pyarr);
 }
+
+
+/* Return a newly allocated idxtype copy of the integer sequence obj of
+ * length n (or NULL with a Python exception set)
+ */
+static idxtype * idxtype_array(PyObject * obj, int n){
+  int i;
+  idxtype * a;
+  PyArrayObject * arr;
+
+  arr = (PyArrayObject *) PyArray_ContiguousFromObject(obj, PyArray_LONG, 1, 1);
+  if(!arr)
+    return NULL;
+
+  if(arr->dimensions[0] != n){
+    PyErr_SetString(PyExc_ValueError, "metis_ext: array has wrong length");
+    Py_DECREF(arr);
+    return NULL;
+  }
+
+  a = (idxtype *)malloc((n > 0 ? n : 1) * sizeof(idxtype));
+  if(a == NULL){
+    PyErr_NoMemory();
+    Py_DECREF(arr);
+    return NULL;
+  }
+
+  for(i = 0 ; i < n ; i++){
+    a[i] = (idxtype)(((long *)arr->data)[i]);
+    if(a[i] != ((long *)arr->data)[i]){ /* i.e. downcast failed */
+      PyErr_SetString(PyExc_OverflowError, "metis_ext: value too large");
+      free(a);
+      Py_DECREF(arr);
+      return NULL;
+    }
+  }
+
+  Py_DECREF(arr);
+  return a;
+}
+
+/* Partition the graph given in compressed storage format with METIS
+ * expected args:
+ * n: number of vertices
+ * xadj: the adjacency list of vertex i is adjncy[xadj[i]:xadj[i+1]]
+ * adjncy: adjacency lists
+ * vwgt: integer weights of the vertices or None for equal weights
+ * nparts: number of partitions
+ * returns:
+ * edgecut: number of cut edges
+ * part: partitioning of the vertices
+ *
+ * kway selects METIS_PartGraphKway, otherwise METIS_PartGraphRecursive
+ * (which the metis manual recommends for fewer than 8 partitions).
+ */
+static PyObject * metis_partGraph(PyObject * args, int kway){
+  int n;
+  int nparts;
+  int edgecut;
+  int wgtflag;
+  int numflag = 0;
+  int options[5] = {0, 0, 0, 0, 0}; /* default options */
+  npy_intp dims[1];
+
+  PyObject * xadj_obj;
+  PyObject * adjncy_obj;
+  PyObject * vwgt_obj;
+  PyArrayObject * part_pyarr;
+
+  idxtype * xadj;
+  idxtype * adjncy = NULL;
+  idxtype * vwgt = NULL;
+  idxtype * part;
+
+  if(!PyArg_ParseTuple(args, "iOOOi", &n, &xadj_obj, &adjncy_obj, &vwgt_obj, &nparts))
+    return NULL;
+
+  xadj = idxtype_array(xadj_obj, n+1);
+  if(!xadj)
+    return NULL;
+
+  adjncy = idxtype_array(adjncy_obj, xadj[n]);
+  if(!adjncy){
+    free(xadj);
+    return NULL;
+  }
+
+  if(vwgt_obj == Py_None){
+    wgtflag = 0;
+  }else{
+    wgtflag = 2; /* weights on the vertices only */
+    vwgt = idxtype_array(vwgt_obj, n);
+    if(!vwgt){
+      free(xadj);
+      free(adjncy);
+      return NULL;
+    }
+  }
+
+  part = (idxtype *)malloc((n > 0 ? n : 1) * sizeof(idxtype));
+  if(part == NULL){
+    free(xadj);
+    free(adjncy);
+    if(vwgt) free(vwgt);
+    return PyErr_NoMemory();
+  }
+
+  bridge_partGraph(kway, &n, xadj, adjncy, vwgt, &wgtflag, &numflag, &nparts, options, &edgecut, part);
+
+  free(xadj);
+  free(adjncy);
+  if(vwgt) free(vwgt);
+
+  dims[0] = n;
+  part_pyarr = (PyArrayObject *)PyArray_SimpleNewFromData(1, dims, PyArray_INT, (void *)part);
+  if(!part_pyarr){
+    free(part);
+    return NULL;
+  }
+  part_pyarr->flags |= NPY_OWNDATA; /* part is freed with the array */
+
+  return Py_BuildValue("iN", edgecut, (PyObject *)part_pyarr);
+}
+
+static PyObject * metis_partGraphKway(PyObject * self, PyObject * args){
+  return metis_partGraph(args, 1);
+}
+
+static PyObject * metis_partGraphRecursive(PyObject * self, PyObject * args){
+  return metis_partGraph(args, 0);
+}
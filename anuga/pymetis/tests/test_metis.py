@@ -131,7 +131,26 @@ class TestMetis(unittest.TestCase):
             self.assert_(edgecut == 14)
             assert allclose(epart, epart_expected)
             assert allclose(npart, npart_expected)
-                
+
+
+    def test_partGraph_weights(self):
+        # Path graph 0-1-2-3-4-5 in compressed row storage
+        xadj = array([0, 1, 3, 5, 7, 9, 10], 'i')
+        adjncy = array([1, 0, 2, 1, 3, 2, 4, 3, 5, 4], 'i')
+
+        for partGraph in [metis.partGraphRecursive, metis.partGraphKway]:
+            edgecut, part = partGraph(6, xadj, adjncy, None, 2)
+            assert len(part) == 6
+            assert sorted(part.tolist()).count(0) == 3
+            assert edgecut == 1
+
+            # Vertex 0 as heavy as the others together
+            vwgt = array([5, 1, 1, 1, 1, 1], 'i')
+            edgecut, part = partGraph(6, xadj, adjncy, vwgt, 2)
+            assert edgecut == 1
+            assert part[0] != part[1]
+            assert allclose(part[1:], part[1])
+
 
 if __name__ == "__main__":
     suite = unittest.makeSuite(TestMetis,'test_')
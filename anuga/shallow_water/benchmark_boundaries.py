@@ -0,0 +1,95 @@
+"""
+Compare the cost of evaluating boundary conditions edge by edge (the
+generic Boundary.evaluate_segment) with the vectorised evaluate_segment
+of each boundary class.
+
+Usage: python benchmark_boundaries.py [n [repeats]]
+
+The domain is a rectangular_cross mesh with n x n cells, so the
+boundary has 8n edges. Timings are per evaluation of the whole boundary.
+"""
+
+import sys
+import time
+
+import numpy as num
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+        import Boundary, Dirichlet_boundary, Time_boundary, \
+        Time_space_boundary
+from anuga.shallow_water.boundaries import Reflective_boundary, \
+        Transmissive_momentum_set_stage_boundary, \
+        Transmissive_stage_zero_momentum_boundary, \
+        Dirichlet_discharge_boundary, Inflow_boundary, \
+        Flather_external_stage_zero_velocity_boundary
+
+
+def create_domain(n):
+
+    points, vertices, boundary = rectangular_cross(n, n)
+
+    domain = Domain(points, vertices, boundary)
+    domain.set_quantity('elevation', lambda x,y: -x)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', 0.5)
+    domain.set_quantity('xmomentum', lambda x,y: 0.1*y)
+    domain.set_quantity('ymomentum', lambda x,y: 0.1*x)
+    domain.distribute_to_vertices_and_edges()
+
+    return domain
+
+
+def time_segment(evaluate_segment, B, domain, ids, repeats):
+
+    t0 = time.time()
+    for i in range(repeats):
+        evaluate_segment(B, domain, ids)
+    return (time.time() - t0)/repeats
+
+
+def benchmark(n=100, repeats=5):
+
+    domain = create_domain(n)
+    ids = num.arange(len(domain.boundary_cells))
+
+    boundaries = [Reflective_boundary(domain),
+                  Dirichlet_boundary([0.4, 0.0, 0.0]),
+                  Time_boundary(domain, lambda t: [0.1*t, 0.0, 0.0]),
+                  Time_space_boundary(domain,
+                                      lambda t,x,y: [0.1*t + 0.01*x, 0.0, 0.0]),
+                  Transmissive_momentum_set_stage_boundary(domain,
+                                                           lambda t: 0.1*t),
+                  Transmissive_stage_zero_momentum_boundary(domain),
+                  Dirichlet_discharge_boundary(domain, 0.3, 0.5),
+                  Inflow_boundary(domain, rate=2.0),
+                  Flather_external_stage_zero_velocity_boundary(domain,
+                                                           lambda t: 0.1*t)]
+
+    print 'Boundary edges: %d' % len(ids)
+    print '%-50s %12s %12s %8s' % ('boundary', 'per edge (s)',
+                                   'vector (s)', 'speedup')
+
+    for B in boundaries:
+        domain.set_boundary({'left': B, 'right': B, 'top': B, 'bottom': B})
+
+        t_edge = time_segment(Boundary.evaluate_segment.im_func,
+                              B, domain, ids, repeats)
+        t_vector = time_segment(B.__class__.evaluate_segment.im_func,
+                                B, domain, ids, repeats)
+
+        print '%-50s %12.6f %12.6f %8.1f' % (B.__class__.__name__, t_edge,
+                                             t_vector, t_edge/t_vector)
+
+
+if __name__ == '__main__':
+
+    n = 100
+    repeats = 5
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        repeats = int(sys.argv[2])
+
+    benchmark(n, repeats)
@@ -0,0 +1,82 @@
+"""
+Scaling of the multithreaded flux, extrapolation and update kernels of
+the DE algorithms with the number of threads (see set_omp_num_threads).
+
+Usage: python benchmark_threads.py [n [finaltime [flow_algorithm]]]
+
+The domain is a rectangular_cross mesh with n x n cells (4n^2 triangles)
+with a dam break. Each run evolves the same model to finaltime with
+1, 2, 4, 8, 16 and 32 threads. The final stage of each run is checked
+against the single threaded run, which it must match bitwise.
+"""
+
+import sys
+import time
+
+import numpy as num
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+from anuga.shallow_water.boundaries import Reflective_boundary
+
+
+def create_domain(n, flow_algorithm):
+
+    points, vertices, boundary = rectangular_cross(n, n, len1=100.0,
+                                                   len2=100.0)
+
+    domain = Domain(points, vertices, boundary)
+    domain.set_flow_algorithm(flow_algorithm)
+    domain.set_store(False)
+    domain.set_quantity('elevation', lambda x,y: -x/100)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', lambda x,y: num.where(x < 30.0, 1.0, 0.0))
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+def benchmark(n=200, finaltime=5.0, flow_algorithm='DE1',
+              threads=[1, 2, 4, 8, 16, 32]):
+
+    print 'Triangles: %d, flow algorithm: %s' % (4*n*n, flow_algorithm)
+    print '%8s %8s %12s %8s %10s' % ('threads', 'steps', 'time (s)',
+                                     'speedup', 'identical')
+
+    t_serial = None
+    stage_serial = None
+    for num_threads in threads:
+        domain = create_domain(n, flow_algorithm)
+        domain.set_omp_num_threads(num_threads)
+
+        t0 = time.time()
+        for t in domain.evolve(yieldstep=finaltime, finaltime=finaltime):
+            pass
+        t_run = time.time() - t0
+
+        stage = domain.quantities['stage'].centroid_values
+        if t_serial is None:
+            t_serial = t_run
+            stage_serial = stage.copy()
+
+        print '%8d %8d %12.3f %8.2f %10s' % (num_threads,
+                                             domain.number_of_steps, t_run,
+                                             t_serial/t_run,
+                                             num.all(stage == stage_serial))
+
+
+if __name__ == '__main__':
+
+    n = 200
+    finaltime = 5.0
+    flow_algorithm = 'DE1'
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        finaltime = float(sys.argv[2])
+    if len(sys.argv) > 3:
+        flow_algorithm = sys.argv[3]
+
+    benchmark(n, finaltime, flow_algorithm)
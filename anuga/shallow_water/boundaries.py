@@ -207,6 +207,43 @@ class Transmissive_momentum_set_stage_boundary(Boundary):
         """
 
         q = self.domain.get_conserved_quantities(vol_id, edge = edge_id)
+        q[0] = self.get_stage()
+
+        return q
+
+        # FIXME: Consider this (taken from File_boundary) to allow
+        # spatial variation
+        # if vol_id is not None and edge_id is not None:
+        #     i = self.boundary_indices[ vol_id, edge_id ]
+        #     return self.F(t, point_id = i)
+        # else:
+        #     return self.F(t)
+
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Transmissive momentum set stage boundary applied to all edges
+        in segment_edges in vectorized form.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        for name in domain.evolved_quantities:
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = Q.edge_values[vol_ids,edge_ids]
+
+        domain.quantities['stage'].boundary_values[ids] = self.get_stage()
+
+
+    def get_stage(self):
+        """Return stage from function at the current time"""
+
         t = self.domain.get_time()
 
         if hasattr(self.function, 'time'):
@@ -225,17 +262,7 @@ class Transmissive_momentum_set_stage_boundary(Boundary):
         except:
             x = float(value[0])
 
-        q[0] = x
-           
-        return q
-
-        # FIXME: Consider this (taken from File_boundary) to allow
-        # spatial variation
-        # if vol_id is not None and edge_id is not None:
-        #     i = self.boundary_indices[ vol_id, edge_id ]
-        #     return self.F(t, point_id = i)
-        # else:
-        #     return self.F(t)
+        return x
 
 
 class Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(Boundary):
@@ -398,6 +425,28 @@ class Transmissive_stage_zero_momentum_boundary(Boundary):
         return q
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Transmissive (zero momentum) boundary applied to all edges
+        in segment_edges in vectorized form.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        for name in domain.evolved_quantities:
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = Q.edge_values[vol_ids,edge_ids]
+
+        domain.quantities['xmomentum'].boundary_values[ids] = 0.0
+        domain.quantities['ymomentum'].boundary_values[ids] = 0.0
+
+
 
 class Time_stage_zero_momentum_boundary(Boundary):
     """Time dependent boundary returns values for stage
@@ -451,6 +500,7 @@ class Time_stage_zero_momentum_boundary(Boundary):
 
 
         self.f = function
+        self.function = function # Used by get_boundary_values
         self.domain = domain
 
     def __repr__(self):
@@ -694,6 +744,32 @@ class Dirichlet_discharge_boundary(Boundary):
         #     return self.F(t)
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Set discharge in the (inward) normal direction for all edges
+        in segment_edges in vectorized form.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+        Normals = domain.normals
+
+        n1  = Normals[vol_ids,2*edge_ids]
+        n2  = Normals[vol_ids,2*edge_ids+1]
+
+        q = num.zeros((len(ids), 3), num.float)
+        q[:,0] = self.stage0
+        q[:,1] = -self.wh0*n1
+        q[:,2] = -self.wh0*n2
+
+        self.set_segment_values(domain, ids, q)
+
+
 class Inflow_boundary(Boundary):
     """Apply given flow in m^3/s to boundary segment.
     Depth and momentum is derived using Manning's formula.
@@ -728,18 +804,7 @@ class Inflow_boundary(Boundary):
         # First find all segments having the same tag is vol_id, edge_id
         # This will be done the first time evaluate is called.
         if self.tag is None:
-            boundary = self.domain.boundary
-            self.tag = boundary[(vol_id, edge_id)]        
-            
-            # Find total length of boundary with this tag
-            length = 0.0
-            for v_id, e_id in boundary:
-                if self.tag == boundary[(v_id, e_id)]:
-                    length += self.domain.mesh.get_edgelength(v_id, e_id)            
-
-            self.length = length
-            self.average_momentum = self.rate/length
-            
+            self.set_tag(vol_id, edge_id)
             
         # Average momentum has now been established across this boundary
         # Compute momentum in the inward normal direction 
@@ -781,6 +846,71 @@ class Inflow_boundary(Boundary):
         return q
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Apply inflow rate at all edges in segment_edges in
+        vectorized form. See evaluate for details.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+        Normals = domain.normals
+
+        if len(ids) == 0:
+            return
+
+        if self.tag is None:
+            self.set_tag(vol_ids[0], edge_ids[0])
+
+        # Momentum in the inward normal direction
+        n1  = Normals[vol_ids,2*edge_ids]
+        n2  = Normals[vol_ids,2*edge_ids+1]
+
+        slope = 0 # get gradient for this triangle dot normal
+        epsilon = 1.0e-12
+
+        mannings_n = domain.quantities['friction'].edge_values[vol_ids,edge_ids]
+
+        if slope > epsilon:
+            depth = num.where(mannings_n > epsilon,
+                              (self.average_momentum*mannings_n/
+                               num.sqrt(slope))**(3.0/5), 1.0)
+        else:
+            depth = num.ones(len(ids), num.float)
+
+        elevation = domain.quantities['elevation'].edge_values[vol_ids,edge_ids]
+
+        q = num.zeros((len(ids), 3), num.float)
+        q[:,0] = elevation + depth
+        q[:,1] = -self.average_momentum*n1
+        q[:,2] = -self.average_momentum*n2
+
+        self.set_segment_values(domain, ids, q)
+
+
+    def set_tag(self, vol_id, edge_id):
+        """Find the tag associated with boundary segment vol_id, edge_id
+        and the average momentum over all segments having that tag.
+        """
+
+        boundary = self.domain.boundary
+        self.tag = boundary[(vol_id, edge_id)]
+
+        # Find total length of boundary with this tag
+        length = 0.0
+        for v_id, e_id in boundary:
+            if self.tag == boundary[(v_id, e_id)]:
+                length += self.domain.mesh.get_edgelength(v_id, e_id)
+
+        self.length = length
+        self.average_momentum = self.rate/length
+
+
         
     
             
@@ -882,6 +1012,22 @@ class Field_boundary(Boundary):
         return q
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Evaluate file boundary for all edges in segment_edges
+        and adjust stage.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        self.file_boundary.evaluate_segment(domain, segment_edges)
+
+        Stage = domain.quantities['stage']
+        Stage.boundary_values[segment_edges] += self.mean_stage
+
+
 
 
 
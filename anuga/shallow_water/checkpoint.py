@@ -6,28 +6,152 @@ There is already checkpointing available in domain.
 Setup with  domain.set_checkpointing(checkpoint_step, checkpoint_dir)
 
 checkpoint_step: the number of yieldsteps between saving a checkpoint file
-checkpoint_dir: the name of the directory where teh checkpoint files are stored. 
+checkpoint_dir: the name of the directory where teh checkpoint files are stored.
 
 
-But if we are restarting a calculation there is no domain yet available, so we must 
+But if we are restarting a calculation there is no domain yet available, so we must
 read in the last stored domain. Do that via
 
 domain = load_last_checkpoint_file(domain_name, checkpoint_dir)
 
+
+Layout of the checkpoint directory
+----------------------------------
+
+The static part of the domain (mesh, boundaries, operators etc) is pickled
+once per call to evolve, at the first checkpoint, to
+
+    <name>_static_<time>.pickle
+
+Each checkpoint then only stores the evolving state of the domain, one
+.npy file per array, in the directory
+
+    <name>_<time>/
+
+holding the centroid values of the evolved quantities, the centroid,
+vertex and edge values of the other quantities, the numerical state of
+the fractional step operators and a small pickle with time, extrema and
+mass balance information.
+
+For parallel domains <name> includes the processor number so each
+processor writes its own files. Once all processors have written their
+files processor 0 writes the manifest
+
+    <global_name>_<time>.manifest
+
+A checkpoint is only used on restart if its manifest exists.
+
+A parallel run can also be continued with a different partition: build
+the sequential domain again on processor 0 and copy the checkpoint into
+it with load_checkpoint_sequential (see also
+anuga.parallel.load_balance.rebalance_from_checkpoint) before
+distributing it.
 """
 
-from anuga import send, receive, myid, numprocs, barrier
+from anuga import myid, numprocs, barrier
+from anuga.utilities.parallel_abstraction import allreduce, bcast, MIN
 from time import time as walltime
 
+import os
+import shutil
+import cPickle
+import json
+
+import numpy as num
+
+
+manifest_extension = '.manifest'
+state_filename = 'state.pickle'
+
+
+def save_checkpoint_file(domain):
+    """Save the evolving state of domain to domain.checkpoint_dir
+
+    The static part of the domain is pickled the first time this is called
+    during an evolve.
+    """
+
+    from os.path import join
+
+    checkpoint_dir = domain.checkpoint_dir
+    domain_name = domain.get_name()
+    time = domain.get_time()
+
+    #--------------------------------------
+    # Static part, written once per evolve
+    #--------------------------------------
+    if domain.checkpoint_static_time is None:
+        static_name = domain_name + '_static_' + str(time) + '.pickle'
+        cPickle.dump(domain, open(join(checkpoint_dir, static_name), 'wb'),
+                     cPickle.HIGHEST_PROTOCOL)
+        domain.checkpoint_static_time = time
+
+    #--------------------------------------
+    # Evolving state
+    #--------------------------------------
+    state_dir = join(checkpoint_dir, domain_name + '_' + str(time))
+    tmp_dir = state_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.mkdir(tmp_dir)
+
+    arrays = _get_domain_arrays(domain)
+    for name, array in arrays.items():
+        num.save(join(tmp_dir, name + '.npy'), array)
+
+    state = _get_domain_state(domain)
+    cPickle.dump(state, open(join(tmp_dir, state_filename), 'wb'),
+                 cPickle.HIGHEST_PROTOCOL)
+
+    if os.path.exists(state_dir):
+        shutil.rmtree(state_dir)
+    os.rename(tmp_dir, state_dir)
+
+    #--------------------------------------
+    # Manifest, written once all
+    # processors have saved their state
+    #--------------------------------------
+    barrier()
+
+    if myid == 0:
+        global_name = _get_global_name(domain)
+
+        if numprocs > 1:
+            names = [global_name + '_P{}_{}'.format(numprocs, cpu)
+                     for cpu in range(numprocs)]
+        else:
+            names = [domain_name]
+
+        manifest = {}
+        manifest['time'] = time
+        manifest['numprocs'] = numprocs
+        manifest['static'] = [name + '_static_' +
+                              str(domain.checkpoint_static_time) + '.pickle'
+                              for name in names]
+        manifest['state'] = [name + '_' + str(time) for name in names]
+        manifest['arrays'] = sorted(arrays.keys())
+
+        manifest_name = join(checkpoint_dir,
+                             global_name + '_' + str(time) + manifest_extension)
+        fid = open(manifest_name + '.tmp', 'w')
+        json.dump(manifest, fid, indent=1)
+        fid.close()
+        os.rename(manifest_name + '.tmp', manifest_name)
+
+    barrier()
 
 
 def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = None):
-    
+    """Restore domain from checkpoint files
+
+    domain_name: global name of the domain
+    checkpoint_dir: directory holding the checkpoint files
+    time: time of the checkpoint to restore. If None the latest
+          checkpoint available on all processors is used.
+    """
+
     from os.path import join
 
-    if numprocs > 1:
-        domain_name = domain_name+'_P{}_{}'.format(numprocs,myid)
-            
     if time is None:
         # will pull out the last available time
         times = _get_checkpoint_times(domain_name, checkpoint_dir)
@@ -37,82 +161,305 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
         #print times
     else:
         times = [float(time)]
-    
+
     if len(times) == 0: raise Exception, "Unable to open checkpoint file"
-    
+
     for time in reversed(times):
-        
-        pickle_name = join(checkpoint_dir,domain_name)+'_'+str(time)+'.pickle'
-        #print pickle_name
-        
+
+        manifest_name = join(checkpoint_dir,
+                             domain_name + '_' + str(time) + manifest_extension)
+        #print manifest_name
+
         try:
-            import cPickle
-            domain = cPickle.load(open(pickle_name, 'rb'))
+            manifest = json.load(open(manifest_name))
+            assert manifest['numprocs'] == numprocs
+
+            static_name = join(checkpoint_dir, manifest['static'][myid])
+            state_dir = join(checkpoint_dir, manifest['state'][myid])
+
+            domain = cPickle.load(open(static_name, 'rb'))
+            _set_domain_arrays(domain, state_dir, manifest['arrays'])
+            _set_domain_state(domain,
+                              cPickle.load(open(join(state_dir, state_filename), 'rb')))
             success = True
         except:
             success = False
-            
+
         #print success
-        overall = success
-        for cpu in range(numprocs):
-            if cpu != myid:
-                send(success,cpu)
-                
-        for cpu in range(numprocs):
-            if cpu != myid:
-                overall = overall & receive(cpu)
-        
-        barrier() 
-        
+        # Successful only if all processors succeeded
+        overall = allreduce(success, MIN)
+
         #print myid, overall, success, time
-        
+
         if overall: break
-    
+
     if not overall: raise Exception, "Unable to open checkpoint file"
-    
+
+    # Vertex and edge values of the evolved quantities
+    # are derived from the restored centroid values
+    domain.distribute_to_vertices_and_edges()
+
+    # The next checkpoint starts a new run
+    domain.checkpoint_static_time = None
+
     domain.last_walltime = walltime()
     domain.communication_time = 0.0
     domain.communication_reduce_time = 0.0
     domain.communication_broadcast_time = 0.0
-    
+
+    # The MPI requests of the ghost exchange plans are only valid in
+    # the process which made them
+    if hasattr(domain, 'ghost_exchange_plans'):
+        domain.ghost_exchange_plans = {}
+        domain.ghost_exchange_pending = None
+
     return domain
 
 
-def _get_checkpoint_times(domain_name, checkpoint_dir):
+def load_checkpoint_sequential(domain, domain_name = 'domain',
+                               checkpoint_dir = '.', time = None):
+    """Copy the quantities stored in a checkpoint of a (possibly
+    parallel) run into the sequential domain.
+
+    domain: sequential domain of the run, e.g. built again on processor 0
+    domain_name: global name of the domain
+    checkpoint_dir: directory holding the checkpoint files
+    time: time of the checkpoint. If None the latest checkpoint is used.
+
+    The time of domain is set to that of the checkpoint. Operators, and
+    quantities domain does not have, are not restored. Returns a list
+    with, for each processor of the run, the ids of its full triangles
+    in domain and its compute time (see Profiler.get_compute_time, None
+    if it was not profiled).
+    """
+
+    from os.path import join
+
+    if time is None:
+        times = sorted(_get_manifest_times(domain_name, checkpoint_dir))
+        if len(times) == 0: raise Exception, "Unable to open checkpoint file"
+        time = times[-1]
+
+    manifest_name = join(checkpoint_dir,
+                         domain_name + '_' + str(float(time)) + manifest_extension)
+    manifest = json.load(open(manifest_name))
+
+    processors = []
+    for cpu in range(manifest['numprocs']):
+        static_name = join(checkpoint_dir, manifest['static'][cpu])
+        state_dir = join(checkpoint_dir, manifest['state'][cpu])
+
+        sub_domain = cPickle.load(open(static_name, 'rb'))
+        full = sub_domain.number_of_full_triangles
+        if manifest['numprocs'] > 1:
+            ids = num.array(sub_domain.tri_l2g[:full], num.int)
+        else:
+            ids = num.arange(full)
+        sub_domain = None
+
+        for name in manifest['arrays']:
+            owner, _, key = name.partition('.')
+            if owner not in domain.quantities:
+                # Operator arrays and quantities created by operators
+                continue
+            values = num.load(join(state_dir, name + '.npy'), mmap_mode='r')
+            getattr(domain.quantities[owner], key)[ids] = values[:full]
+
+        state = cPickle.load(open(join(state_dir, state_filename), 'rb'))
+        processors.append((ids, state.get('compute_time')))
+
+    domain.set_time(manifest['time'])
+
+    # Vertex and edge values of the evolved quantities
+    domain.distribute_to_vertices_and_edges()
+
+    return processors
+
+
+def _get_manifest_times(domain_name, checkpoint_dir):
+    """Return set of times of the manifests of domain_name in
+    checkpoint_dir
+    """
 
-    import os
     times = set()
-    
-    for (path, directory, filenames) in os.walk(checkpoint_dir):
-        #print filenames
-        #print directory
-        
-        if len(filenames) == 0:
-            return None
-        else:          
-            for filename in filenames:
-                filebase = os.path.splitext(filename)[0].rpartition("_")
-                time = filebase[-1]
-                domain_name_base = filebase[0]
-                if domain_name_base == domain_name :
-                    #print domain_name_base, time
-                    times.add(float(time))
-
-
-    #times.sort()
-    #times = set(times)
-    
-    #print times
-    combined = times
-    for cpu in range(numprocs):
-        if myid != cpu:
-            send(times,cpu)
-            rec = receive(cpu) 
-            #print rec
-            combined = combined & rec 
-    
-    #combined = list(combined).sort()
-    #print combined
-    
-    return combined
-    
+
+    if os.path.isdir(checkpoint_dir):
+        for filename in os.listdir(checkpoint_dir):
+            if not filename.endswith(manifest_extension):
+                continue
+
+            filebase = filename[:-len(manifest_extension)].rpartition("_")
+            time = filebase[-1]
+            domain_name_base = filebase[0]
+            if domain_name_base == domain_name :
+                times.add(float(time))
+
+    return times
+
+
+def _get_checkpoint_times(domain_name, checkpoint_dir):
+    """Return set of times of complete checkpoints available on all
+    processors
+    """
+
+    times = _get_manifest_times(domain_name, checkpoint_dir)
+
+    # The times of processor 0, each kept if available on all processors
+    candidates = bcast(sorted(times))
+    if len(candidates) == 0:
+        return set()
+
+    available = num.array([time in times for time in candidates], num.bool)
+    available = allreduce(available, MIN)
+
+    return set(time for time, flag in zip(candidates, available) if flag)
+
+
+def _get_global_name(domain):
+
+    try:
+        return domain.get_global_name()
+    except AttributeError:
+        return domain.get_name()
+
+
+def _get_domain_arrays(domain):
+    """Return dictionary of the arrays describing the evolving state
+    of domain
+    """
+
+    arrays = {}
+
+    for name, Q in domain.quantities.items():
+        arrays[name + '.centroid_values'] = Q.centroid_values
+        if name not in domain.evolved_quantities:
+            # Not derived from centroid values by
+            # distribute_to_vertices_and_edges
+            arrays[name + '.vertex_values'] = Q.vertex_values
+            arrays[name + '.edge_values'] = Q.edge_values
+
+    exclude = _get_domain_array_ids(domain)
+    for i, operator in enumerate(domain.fractional_step_operators):
+        for key, value in _get_object_state(operator, exclude).items():
+            if isinstance(value, num.ndarray):
+                arrays['operator_%d.%s' % (i, key)] = value
+
+    return arrays
+
+
+def _set_domain_arrays(domain, state_dir, names):
+    """Copy the arrays stored in state_dir into domain
+    """
+
+    from os.path import join
+
+    for name in names:
+        values = num.load(join(state_dir, name + '.npy'), mmap_mode='r')
+
+        owner, _, key = name.partition('.')
+        if owner.startswith('operator_'):
+            obj = domain.fractional_step_operators[int(owner[9:])]
+        else:
+            obj = domain.quantities[owner]
+
+        _set_object_state(obj, {key: values})
+
+
+def _get_domain_state(domain):
+    """Return dictionary of scalar state of domain and its operators
+    """
+
+    state = {}
+    state['time'] = domain.get_time()
+    state['timestep'] = domain.timestep
+    state['yieldstep_id'] = domain.yieldstep_id
+    state['quantities_to_be_monitored'] = domain.quantities_to_be_monitored
+
+    # Load of this processor, used to rebalance a parallel run
+    profiler = domain.get_profiler()
+    if profiler is not None:
+        state['compute_time'] = profiler.get_compute_time()
+
+    for key in ['boundary_flux_sum', 'fractional_step_volume_integral',
+                'volume_history']:
+        if hasattr(domain, key):
+            state[key] = getattr(domain, key)
+
+    exclude = _get_domain_array_ids(domain)
+    state['operators'] = []
+    for operator in domain.fractional_step_operators:
+        scalars = {}
+        for key, value in _get_object_state(operator, exclude).items():
+            if not isinstance(value, num.ndarray):
+                scalars[key] = value
+        state['operators'].append(scalars)
+
+    return state
+
+
+def _set_domain_state(domain, state):
+    """Restore scalar state of domain and its operators
+    """
+
+    domain.set_time(state['time'])
+    domain.timestep = state['timestep']
+    domain.yieldstep_id = state['yieldstep_id']
+    domain.quantities_to_be_monitored = state['quantities_to_be_monitored']
+
+    for key in ['boundary_flux_sum', 'fractional_step_volume_integral',
+                'volume_history']:
+        if key in state:
+            _set_object_state(domain, {key: state[key]})
+
+    for operator, scalars in zip(domain.fractional_step_operators,
+                                 state['operators']):
+        _set_object_state(operator, scalars)
+
+
+def _get_domain_array_ids(domain):
+    """Return ids of arrays owned by domain and its quantities
+
+    Operators keep aliases of these (e.g. stage_c), which are not
+    part of the operator state.
+    """
+
+    ids = set()
+    for obj in [domain] + domain.quantities.values():
+        for value in obj.__dict__.values():
+            if isinstance(value, num.ndarray):
+                ids.add(id(value))
+
+    return ids
+
+
+def _get_object_state(obj, exclude=()):
+    """Return dictionary of the numerical attributes of obj, ie numpy arrays
+    and scalars, excluding arrays whose id is in exclude.
+    """
+
+    state = {}
+    for key, value in obj.__dict__.items():
+        if isinstance(value, num.ndarray):
+            if id(value) not in exclude and value.dtype != object:
+                state[key] = value
+        elif isinstance(value, (bool, int, long, float, num.number)):
+            state[key] = value
+
+    return state
+
+
+def _set_object_state(obj, state):
+    """Set numerical attributes of obj. Arrays are copied into existing
+    arrays of the same shape so that any aliases stay valid.
+    """
+
+    for key, value in state.items():
+        current = getattr(obj, key, None)
+        if isinstance(current, num.ndarray) and \
+               isinstance(value, num.ndarray) and \
+               current.shape == value.shape:
+            current[...] = value
+        elif isinstance(value, num.ndarray):
+            setattr(obj, key, num.array(value))
+        else:
+            setattr(obj, key, value)
@@ -99,13 +99,14 @@ from anuga.abstract_2d_finite_volumes.generic_domain \
 
 from anuga.shallow_water.forcing import Cross_section
 from anuga.utilities.numerical_tools import mean
-from anuga.file.sww import SWW_file  
+from anuga.file.sww import SWW_file, Buffered_SWW_file
             
 import anuga.utilities.log as log
 
 from anuga.utilities.parallel_abstraction import size, rank, get_processor_name
 from anuga.utilities.parallel_abstraction import finalize, send, receive
 from anuga.utilities.parallel_abstraction import pypar_available, barrier
+from anuga.utilities.parallel_abstraction import allreduce, bcast, SUM
 
 
 #from pypar import size, rank, send, receive, barrier
@@ -170,6 +171,7 @@ class Domain(Generic_Domain):
                  number_of_full_nodes=None,
                  number_of_full_triangles=None,
                  ghost_layer_width=2,
+                 reorder=None,
                  **kwargs):
 
         """
@@ -178,6 +180,8 @@ class Domain(Generic_Domain):
         @param coordinates: vertex locations for the mesh
         @param vertices: vertex indices for the mesh
         @param boundary: boundaries of the mesh
+        @param reorder: renumber triangles and nodes for memory locality
+                        ('hilbert', 'morton' or 'rcm')
         """
 
         # Define quantities for the shallow_water domain
@@ -215,7 +219,8 @@ class Domain(Generic_Domain):
                             numproc,
                             number_of_full_nodes=number_of_full_nodes,
                             number_of_full_triangles=number_of_full_triangles,
-                            ghost_layer_width=ghost_layer_width)
+                            ghost_layer_width=ghost_layer_width,
+                            reorder=reorder)
 
         #-------------------------------
         # Operator Data Structures
@@ -245,6 +250,8 @@ class Domain(Generic_Domain):
         #-------------------------------
         self.set_store(True)
         self.set_store_centroids(True)
+        self.set_store_buffered(False)
+        self.set_store_original_order(False)
         self.set_store_vertices_uniquely(False)
         self.quantities_to_be_stored = {'elevation': 1, 
                                         'friction':1,
@@ -270,6 +277,10 @@ class Domain(Generic_Domain):
         self.quantities['y'].set_values(self.vertex_coordinates[:,1].reshape(n,3))
         self.quantities['y'].set_boundary_values_from_edges()
 
+        # Derived quantities not read by the flow algorithms which are
+        # stored in single precision with compact storage
+        self.single_precision_quantities = ['x', 'y']
+
         # For riverwalls, we need to know the 'edge_flux_type' for each edge
         # Edge-flux-type of 0 == Normal edge, with shallow water flux
         #                   1 == riverwall
@@ -277,6 +288,10 @@ class Domain(Generic_Domain):
         #                   etc
         self.edge_flux_type=num.zeros(len(self.edge_coordinates[:,0])).astype(int)
 
+        # Index of each riverwall edge in the riverwall data arrays
+        # (riverwall_elevation, hydraulic_properties_rowIndex), -1 otherwise
+        self.edge_riverwall_index=-num.ones(len(self.edge_coordinates[:,0])).astype(int)
+
         # Riverwalls -- initialise with dummy values
         # Presently only works with DE algorithms, will fail otherwise
         import anuga.structures.riverwall
@@ -301,6 +316,11 @@ class Domain(Generic_Domain):
         self.x_centroid_work=num.zeros(len(self.edge_coordinates[:,0])/3) 
         self.y_centroid_work=num.zeros(len(self.edge_coordinates[:,0])/3)
 
+        # Compute the fluxes away from the ghost cells while the ghost cells
+        # are updated (see update_ghosts_and_compute_fluxes)
+        self.ghost_exchange_overlap = True
+        self.ghost_overlap_cells = None
+
         ############################################################################
         ## Local-timestepping information
         #
@@ -1053,6 +1073,40 @@ class Domain(Generic_Domain):
         """
         
         return self.store_centroids   
+
+
+    def set_store_buffered(self, flag=True, buffer_size=4):
+        """Set whether the sww file is kept open for the whole run and
+        timesteps are written by a background thread.
+
+        @param flag: Default = True. Set to False to open and write the
+                     sww file on each call to store_timestep
+        @param buffer_size: Number of timesteps which can be waiting to
+                     be written before store_timestep blocks
+        """
+
+        self.store_buffered = flag
+        self.store_buffer_size = buffer_size
+
+    def get_store_buffered(self):
+        """Get whether the sww file is written by a background thread.
+        """
+
+        return self.store_buffered
+
+    def set_store_original_order(self, flag=True):
+        """Set whether triangles, nodes and values are written to the sww
+        file in their order before the mesh was reordered (see the reorder
+        argument of Domain). Has no effect if the mesh was not reordered.
+        """
+
+        self.store_original_order = flag
+
+    def get_store_original_order(self):
+        """Get whether the sww file uses the original ordering of the mesh.
+        """
+
+        return self.store_original_order
     
     def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None):
         """
@@ -1479,6 +1533,21 @@ class Domain(Generic_Domain):
 
         self.points_file_block_line_size = points_file_block_line_size
 
+    def set_raster_tile_size(self, raster_tile_size):
+        """Set the width in cells of the raster tiles sampled at a time
+        when setting quantities from raster grids. None samples the window
+        of all points at once.
+        """
+
+        self.raster_tile_size = raster_tile_size
+
+    def set_raster_threads(self, raster_threads):
+        """Set the number of threads sampling raster tiles when setting
+        quantities from raster grids.
+        """
+
+        self.raster_threads = raster_threads
+
         
     # FIXME: Probably obsolete in its curren form    
     def set_quantities_to_be_stored(self, q):
@@ -1588,8 +1657,8 @@ class Domain(Generic_Domain):
 
 
     def get_water_volume(self):
-    
-        from anuga import numprocs
+        """Return the volume of water in the (global) domain
+        """
 
         #print self.evolved_called
         
@@ -1612,29 +1681,9 @@ class Domain(Generic_Domain):
             Height = Stage-Elev
             volume = Height.get_integral()
 
-        if numprocs == 1:
-            self.volume_history.append(volume) 
-            return volume
+        # Sum over all processors
+        water_volume = allreduce(volume, SUM)
 
-        # isolated parallel code
-        from anuga import myid, send, receive, barrier
-            
-        if myid == 0:
-            water_volume = volume
-            for i in range(1,numprocs):
-                remote_volume = receive(i)
-                water_volume = water_volume + remote_volume
-        else:
-            send(volume,0)
-        
-        #barrier()
-    
-        if myid == 0:
-            for i in range(1,numprocs):
-                send(water_volume,i)
-        else:
-            water_volume = receive(0)
-       
         self.volume_history.append(water_volume) 
         return water_volume
 
@@ -1643,8 +1692,6 @@ class Domain(Generic_Domain):
             Compute the boundary flux integral.
             Should work in parallel
         """
-    
-        from anuga import numprocs
 
         if not self.compute_fluxes_method=='DE':
             msg='Boundary flux integral only supported for DE fluxes '+\
@@ -1653,28 +1700,8 @@ class Domain(Generic_Domain):
             
         flux_integral = self.boundary_flux_integral.boundary_flux_integral
 
-        if numprocs == 1:
-            return flux_integral
-
-        # isolate parallel code
-        from anuga import myid, send, receive, barrier
-        
-        if myid == 0:
-            for i in range(1,numprocs):
-                remote_flux_integral = receive(i)
-                flux_integral = flux_integral + remote_flux_integral
-        else:
-            send(flux_integral,0)
-        
-        #barrier()
-    
-        if myid == 0:
-            for i in range(1,numprocs):
-                send(flux_integral,i)
-        else:
-            flux_integral = receive(0)
-        
-        return flux_integral 
+        # Sum over all processors
+        return allreduce(flux_integral, SUM)
     
     def get_fractional_step_volume_integral(self):
         """
@@ -1683,33 +1710,11 @@ class Domain(Generic_Domain):
               update the fractional_step_volume_integral
             Should work in parallel
         """
-    
-        from anuga import numprocs
 
         flux_integral = self.fractional_step_volume_integral
 
-        if numprocs == 1:
-            return flux_integral
-
-        # isolate parallel code
-        from anuga import myid, send, receive, barrier
-                
-        if myid == 0:
-            for i in range(1,numprocs):
-                remote_flux_integral = receive(i)
-                flux_integral = flux_integral + remote_flux_integral
-        else:
-            send(flux_integral,0)
-        
-        #barrier()
-    
-        if myid == 0:
-            for i in range(1,numprocs):
-                send(flux_integral,i)
-        else:
-            flux_integral = receive(0)
-        
-        return flux_integral 
+        # Sum over all processors
+        return allreduce(flux_integral, SUM)
 
     def get_flow_through_cross_section(self, polyline, verbose=False):
         """Get the total flow through an arbitrary poly line.
@@ -1921,6 +1926,108 @@ class Domain(Generic_Domain):
 
 
 
+    def set_ghost_exchange_overlap(self, flag=True):
+        """Compute the fluxes away from the ghost cells while the ghost
+        cells are updated (DE algorithms only). The results are the same
+        with and without the overlap.
+        """
+
+        self.ghost_exchange_overlap = flag
+
+
+    def get_ghost_overlap_cells(self):
+        """Return the triangles computed before and after the ghost cells
+        are updated in update_ghosts_and_compute_fluxes as a dictionary
+        with a pair of index arrays (before, after) for 'protect',
+        'fluxes' and each argument of the extrapolation ('velocity', 'dry'
+        and 'extrapolate').
+
+        The triangles are chosen by their distance d to the nearest ghost
+        cell, counted in neighbours. Protecting a triangle only uses the
+        triangle itself. The extrapolation uses the velocity and height of
+        the triangle and its neighbours and the dry cell check of its
+        neighbours, which uses their neighbours in turn. The fluxes of a
+        triangle use the edge values of its neighbours.
+        """
+
+        if self.ghost_overlap_cells is not None:
+            return self.ghost_overlap_cells
+
+        N = self.number_of_elements
+        neighbours = self.neighbours
+
+        # Distance to the nearest ghost cell, 5 for 5 or more
+        distance = num.where(self.tri_full_flag == 0, 0, 5)
+        for d in range(1, 5):
+            reached = neighbours[distance == d-1].flatten()
+            reached = reached[reached >= 0]
+            reached = reached[distance[reached] > d]
+            distance[reached] = d
+
+        boundary = num.any(neighbours < 0, axis=1)
+
+        def cells(mask):
+            return num.flatnonzero(mask).astype(num.int)
+
+        self.ghost_overlap_cells = {
+            'protect': (cells(distance >= 1), cells(distance == 0)),
+            'velocity': (cells(distance >= 1), cells(distance <= 4)),
+            'dry': (cells(distance >= 2), cells(distance <= 3)),
+            'extrapolate': (cells(distance >= 3), cells(distance <= 2)),
+            'fluxes': (cells((distance >= 4) & ~boundary),
+                       cells((distance < 4) | boundary))}
+
+        return self.ghost_overlap_cells
+
+
+    def update_ghosts_and_compute_fluxes(self):
+        """Update the ghost cells, calculate edge and vertex values, apply
+        the boundary conditions and compute the fluxes.
+
+        With the DE algorithms the triangles which do not depend on the
+        ghost cells are protected, extrapolated and their fluxes computed
+        between update_ghosts_start and update_ghosts_finish, so parallel
+        domains compute while the ghost cells are communicated. The rest
+        follows once the ghost cells are updated. The results are the same
+        as updating the ghost cells first.
+        """
+
+        if self.compute_fluxes_method != 'DE' or \
+               not self.ghost_exchange_overlap or \
+               num.all(self.tri_full_flag == 1):
+            Generic_Domain.update_ghosts_and_compute_fluxes(self)
+            return
+
+        from swDE1_domain_ext import protect_new
+        from swDE1_domain_ext import extrapolate_second_order_edge_sw as extrapol2
+        from swDE1_domain_ext import compute_fluxes_ext_central \
+                                  as compute_fluxes_ext
+
+        cells = self.get_ghost_overlap_cells()
+        timestep = self.evolve_max_timestep
+
+        self.update_ghosts_start()
+        try:
+            mass_error = protect_new(self, cells['protect'][0])
+            extrapol2(self, cells['velocity'][0], cells['dry'][0],
+                      cells['extrapolate'][0])
+            compute_fluxes_ext(self, timestep, cells['fluxes'][0], 1, 0)
+        finally:
+            self.update_ghosts_finish()
+
+        mass_error += protect_new(self, cells['protect'][1])
+        if mass_error > 0.0 and self.verbose :
+            print 'Cumulative mass protection: '+str(mass_error)+' m^3 '
+
+        extrapol2(self, cells['velocity'][1], cells['dry'][1],
+                  cells['extrapolate'][1])
+
+        self.update_boundary()
+
+        self.flux_timestep = compute_fluxes_ext(self, timestep,
+                                                cells['fluxes'][1], 0, 1)
+
+
     def distribute_to_vertices_and_edges(self):
         """ Call correct module function """
 
@@ -2421,48 +2528,56 @@ class Domain(Generic_Domain):
             self.initialise_storage()
             
 
+        if self.checkpoint:
+            from anuga.shallow_water.checkpoint import save_checkpoint_file
+
+            # Static part of the domain is saved with the first checkpoint
+            self.checkpoint_static_time = None
+
         # Call basic machinery from parent class
-        for t in self._evolve_base(yieldstep=yieldstep,
-                                   finaltime=finaltime, duration=duration,
-                                   skip_initial_step=skip_initial_step):
+        try:
+            for t in self._evolve_base(yieldstep=yieldstep,
+                                       finaltime=finaltime, duration=duration,
+                                       skip_initial_step=skip_initial_step):
 
-            self.yieldstep_id += 1
-            walltime = time.time()
+                self.yieldstep_id += 1
+                walltime = time.time()
             
-            #print t , self.get_time()
-            # Store model data, e.g. for subsequent visualisation
-            if self.store is True:
-                self.store_timestep()
+                #print t , self.get_time()
+                # Store model data, e.g. for subsequent visualisation
+                if self.store is True:
+                    self.store_timestep()
 
-            if self.checkpoint:
+                if self.checkpoint:
                 
                 
-                save_checkpoint=False
-                if self.checkpoint_step == 0:
-                    if rank() == 0:
-                        if walltime - self.walltime_prev > self.checkpoint_time:
+                    save_checkpoint=False
+                    if self.checkpoint_step == 0:
+                        # Processor 0 decides for all processors
+                        if rank() == 0:
+                            if walltime - self.walltime_prev > self.checkpoint_time:
                             
-                            save_checkpoint = True
-                        for cpu in range(size()):
-                            if cpu != rank():
-                                send(save_checkpoint, cpu)
-                    else:
-                        save_checkpoint = receive(0) 
+                                save_checkpoint = True
+                        save_checkpoint = bcast(save_checkpoint, 0)
                         
-                elif self.yieldstep_id%self.checkpoint_step == 0:
-                        save_checkpoint = True
+                    elif self.yieldstep_id%self.checkpoint_step == 0:
+                            save_checkpoint = True
                         
-                if save_checkpoint:   
-                    pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
-                    cPickle.dump(self, open(pickle_name, 'wb'))
+                    if save_checkpoint:   
+                        # Make sure the sww file is consistent with the checkpoint
+                        if self.store is True:
+                            self.writer.flush()
 
-                    barrier()
-                    self.walltime_prev = time.time()
-                    
-                    #print 'Stored Checkpoint File '+pickle_name 
+                        save_checkpoint_file(self)
 
-            # Pass control on to outer loop for more specific actions
-            yield(t)
+                        self.walltime_prev = time.time()
+
+                # Pass control on to outer loop for more specific actions
+                yield(t)
+        finally:
+            # Make sure buffered output reaches the sww file
+            if self.store is True:
+                self.finalise_storage()
      
 
     def initialise_storage(self):
@@ -2471,7 +2586,11 @@ class Domain(Generic_Domain):
         """
         
         # Initialise writer
-        self.writer = SWW_file(self)
+        if self.store_buffered:
+            self.writer = Buffered_SWW_file(self,
+                                            buffer_size=self.store_buffer_size)
+        else:
+            self.writer = SWW_file(self)
 
         # Store vertices and connectivity
         self.writer.store_connectivity()
@@ -2487,6 +2606,17 @@ class Domain(Generic_Domain):
         self.writer.store_timestep()
 
 
+    def finalise_storage(self):
+        """Write any buffered timesteps and close the sww file.
+
+        Storage is reopened by the next call to store_timestep.
+        """
+
+        writer = getattr(self, 'writer', None)
+        if writer is not None:
+            writer.close()
+
+
     def sww_merge(self,  *args, **kwargs):
 
         pass
@@ -2758,6 +2888,145 @@ class Domain(Generic_Domain):
                                   as compute_flux_update_frequency_ext
 
         compute_flux_update_frequency_ext(self, self.timestep)
+
+
+    def can_evolve_native(self):
+        """Return True if evolve_steps_native supports the current setup,
+        i.e. the DE algorithms with euler or rk2 timestepping on a sequential
+        domain.
+        """
+
+        if self.compute_fluxes_method != 'DE':
+            return False
+
+        if self.timestepping_method not in ['euler', 'rk2']:
+            return False
+
+        # Ghost cells are updated by the Python evolve loop
+        if self.numproc > 1 or self.full_send_dict.has_key(self.processor):
+            return False
+
+        return self.conserved_quantities == self.evolved_quantities == \
+               ['stage', 'xmomentum', 'ymomentum']
+
+
+    def evolve_steps_native(self, n):
+        """Take up to n timesteps in the C extension, stopping at the
+        next yield time or the final time. Return the number of timesteps
+        taken.
+
+        Protection, extrapolation, fluxes, timestep, update of the conserved
+        quantities, Reflective, Dirichlet and Transmissive boundaries,
+        implicit Manning friction and the boundary flux integral are
+        computed in C. Other boundaries, forcing terms and fractional step
+        operators are called back from C each timestep.
+
+        Used by evolve after set_native_steps.
+        """
+
+        from swDE1_domain_ext import evolve_steps_native as evolve_ext
+        from anuga.config import epsilon, max_float
+
+        msg = ('evolve_steps_native needs the DE algorithms with euler or '
+               'rk2 timestepping on a sequential domain')
+        assert self.can_evolve_native(), msg
+
+        boundary_type, boundary_values, python_tags = \
+                                    self.get_native_boundaries()
+
+        boundary_callback = None
+        if len(python_tags) > 0:
+            boundary_callback = lambda: self.update_boundary(python_tags)
+
+        friction = 0
+        forcing_callback = None
+        if self.forcing_terms == [manning_friction_implicit]:
+            if self.use_sloped_mannings:
+                friction = 2
+            else:
+                friction = 1
+        elif len(self.forcing_terms) > 0:
+            forcing_callback = self.compute_forcing_terms
+
+        # The boundary flux integral is accumulated in C if it is
+        # the first operator
+        operators = list(self.fractional_step_operators)
+        flux_integral = None
+        if len(operators) > 0 and operators[0] is self.boundary_flux_integral:
+            operator = operators.pop(0)
+            operator.boundary_flux_integral = \
+                      num.array(operator.boundary_flux_integral, num.float)
+            flux_integral = operator.boundary_flux_integral
+
+        operator_callback = None
+        if len(operators) > 0:
+            operator_callback = lambda: self.apply_fractional_steps(operators)
+
+        extrema_callback = None
+        if self.quantities_to_be_monitored is not None:
+            extrema_callback = self.update_extrema
+
+        native_timestep = not self.protect_against_isolated_degenerate_timesteps
+
+        finaltime = self.finaltime
+        if finaltime is None:
+            finaltime = max_float
+
+        return evolve_ext(self, int(n), self.yieldstep, finaltime, epsilon,
+                          boundary_type, boundary_values, flux_integral,
+                          friction, int(native_timestep),
+                          boundary_callback, forcing_callback,
+                          operator_callback, extrema_callback)
+
+
+    def get_native_boundaries(self):
+        """Return the boundary type and Dirichlet values of each boundary
+        edge as used by evolve_steps_native, and the list of boundary tags
+        which have to be evaluated in Python.
+        """
+
+        from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+             import Dirichlet_boundary, Transmissive_boundary
+        from anuga.shallow_water.boundaries import Reflective_boundary
+        from anuga.shallow_water.boundaries import \
+             Transmissive_stage_zero_momentum_boundary
+
+        # Must match the NATIVE_BOUNDARY types in swDE1_domain_ext.c
+        native_boundary_types = {
+            Reflective_boundary : 1,
+            Dirichlet_boundary : 2,
+            Transmissive_boundary : 3,
+            Transmissive_stage_zero_momentum_boundary : 5}
+
+        N = len(self.boundary_cells)
+        boundary_type = num.zeros(N, num.int)
+        boundary_values = num.zeros((N, 3), num.float)
+        python_tags = []
+
+        for tag in self.tag_boundary_cells:
+
+            B = self.boundary_map[tag]
+
+            if B is None:
+                continue
+
+            ids = self.tag_boundary_cells[tag]
+            btype = native_boundary_types.get(B.__class__, 0)
+
+            if btype == 2:
+                if len(B.dirichlet_values) == 3:
+                    boundary_values[ids] = B.dirichlet_values
+                else:
+                    btype = 0
+            elif btype == 3 and self.centroid_transmissive_bc:
+                btype = 4
+
+            if btype == 0:
+                python_tags.append(tag)
+            else:
+                boundary_type[ids] = btype
+
+        return boundary_type, boundary_values, python_tags
         
     def report_water_volume_statistics(self, verbose=True, returnStats=False):
         """
@@ -709,8 +709,16 @@ inline double adjust_edgeflux_with_weir(double *edgeflux,
     return 0;
 }
 
-// Computational function for flux computation
-inline double _compute_fluxes_central(struct domain *D, double timestep){
+// Computational function for flux computation.
+// Compute the fluxes of the triangles in cells (all triangles if cells
+// is NULL). The fluxes of a timestep may be computed in several calls with
+// disjoint cells, the first of which resets the explicit updates and the
+// last of which adds up the explicit updates and returns the timestep.
+// Each edge flux is computed by the same triangle, whichever call that
+// triangle is in, so the result does not depend on the split.
+inline double _compute_fluxes_central_cells(struct domain *D, double timestep,
+                                            long *cells, long ncells,
+                                            int first, int last){
 
     // Local variables
     double max_speed_local, length, inv_area, zl, zr;
@@ -719,6 +727,7 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
     double limiting_threshold = 10*D->H0;
     //
     int k, i, m, n,j, ii;
+    long ic; // Index into cells
     int ki,k3, nm = 0, ki2,ki3, nm3; // Index shorthands
     // Workspace (making them static actually made function slightly slower (Ole))
     double ql[3], qr[3], edgeflux[3]; // Work array for summing up fluxes
@@ -727,6 +736,7 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
     static double local_timestep;
     int neighbours_wet[3];//Work array
     long RiverWall_count, substep_count;
+    double timestep_min;
     double hle, hre, zc, zc_n, Qfactor, s1, s2, h1, h2; 
     double stage_edge_lim, outgoing_mass_edges, pressure_flux, hc, hc_n, tmp, tmp2;
     double h_left_tmp, h_right_tmp;
@@ -735,37 +745,48 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
     static long base_call = 1;
     double speed_max_last, vol, weir_height;
 
-    call++; // Flag 'id' of flux calculation for this timestep
-
-    if (D->timestep_fluxcalls != timestep_fluxcalls) {
-    	timestep_fluxcalls = D->timestep_fluxcalls;
-    	base_call = call;
-    }
+    if (first) {
+        call++; // Flag 'id' of flux calculation for this timestep
 
-    // Set explicit_update to zero for all conserved_quantities.
-    // This assumes compute_fluxes called before forcing terms
-    memset((char*) D->stage_explicit_update, 0, D->number_of_elements * sizeof (double));
-    memset((char*) D->xmom_explicit_update, 0, D->number_of_elements * sizeof (double));
-    memset((char*) D->ymom_explicit_update, 0, D->number_of_elements * sizeof (double));
+        if (D->timestep_fluxcalls != timestep_fluxcalls) {
+            timestep_fluxcalls = D->timestep_fluxcalls;
+            base_call = call;
+        }
 
+        // Set explicit_update to zero for all conserved_quantities.
+        // This assumes compute_fluxes called before forcing terms
+        memset((char*) D->stage_explicit_update, 0, D->number_of_elements * sizeof (double));
+        memset((char*) D->xmom_explicit_update, 0, D->number_of_elements * sizeof (double));
+        memset((char*) D->ymom_explicit_update, 0, D->number_of_elements * sizeof (double));
+
+        // Fluxes are not updated every timestep,
+        // but all fluxes ARE updated when the following condition holds
+        if(D->allow_timestep_increase[0]==1){
+            // We can only increase the timestep if all fluxes are allowed to be updated
+            // If this is not done the timestep can't increase (since local_timestep is static)
+            local_timestep=1.0e+100;
+        }
+    }
 
-    // Counter for riverwall edges
-    RiverWall_count=0;
     // Which substep of the timestepping method are we on?
     substep_count=(call-base_call)%D->timestep_fluxcalls;
     
     //printf("call = %d substep_count = %d base_call = %d \n",call,substep_count, base_call);
 
-    // Fluxes are not updated every timestep,
-    // but all fluxes ARE updated when the following condition holds
-    if(D->allow_timestep_increase[0]==1){
-        // We can only increase the timestep if all fluxes are allowed to be updated
-        // If this is not done the timestep can't increase (since local_timestep is static)
-        local_timestep=1.0e+100;
-    }
-
     // For all triangles
-    for (k = 0; k < D->number_of_elements; k++) {
+    // Each edge flux is computed once, by the triangle which would have
+    // computed it first when looping over the triangles in order. This
+    // makes the results independent of the number of threads.
+    timestep_min = local_timestep;
+    #pragma omp parallel for num_threads(D->omp_num_threads) \
+        private(k, i, m, n, nm, ki, ki2, ki3, nm3, ii, ql, qr, edgeflux, \
+                zl, zr, zc, zc_n, hc, hc_n, hle, hre, z_half, h_left, h_right, \
+                h_left_tmp, h_right_tmp, max_speed_local, pressure_flux, \
+                weir_height, Qfactor, s1, s2, h1, h2, length, bedslope_work, \
+                tmp, speed_max_last, RiverWall_count) \
+        reduction(min:timestep_min)
+    for (ic = 0; ic < ncells; ic++) {
+        k = cells == NULL ? ic : cells[ic];
         speed_max_last = 0.0;
 
         // Loop through neighbours and compute edge flux for each
@@ -774,17 +795,20 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
             ki2 = 2 * ki; //k*6 + i*2
             ki3 = 3*ki; 
 
-            if ((D->already_computed_flux[ki] == call) || (D->update_next_flux[ki]!=1)) {
-                // We've already computed the flux across this edge
-                // Check if it is a riverwall
-                if(D->edge_flux_type[ki] == 1){
-                    // Update counter of riverwall edges == index of
-                    // riverwall_elevation + riverwall_rowIndex
-                    RiverWall_count += 1;
-                }
+            if (D->update_next_flux[ki]!=1) {
                 continue;
             }
 
+            n = D->neighbours[ki];
+            if (n >= 0 && n < k) {
+                nm = n * 3 + D->neighbour_edges[ki];
+                if (D->update_next_flux[nm]==1) {
+                    // The flux across this edge is computed by the
+                    // neighbour
+                    continue;
+                }
+            }
+
             // Get left hand side values from triangle k, edge i
             ql[0] = D->stage_edge_values[ki];
             ql[1] = D->xmom_edge_values[ki];
@@ -796,7 +820,6 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
 
             // Get right hand side values either from neighbouring triangle
             // or from boundary array (Quantities at neighbour on nearest face).
-            n = D->neighbours[ki];
             hc_n = hc;
             zc_n = D->bed_centroid_values[k];
             if (n < 0) {
@@ -832,8 +855,9 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
                     printf("Riverwall Error\n");
                 }
                 // Update counter of riverwall edges == index of
-                // riverwall_elevation + riverwall_rowIndex
-                RiverWall_count += 1;
+                // riverwall_elevation + riverwall_rowIndex, stored for each
+                // edge so the triangles can be processed in any order
+                RiverWall_count = D->edge_riverwall_index[ki] + 1;
                 
                 // Set central bed to riverwall elevation
                 z_half = max(D->riverwall_elevation[RiverWall_count-1], z_half) ;
@@ -974,11 +998,11 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
                         // Apply CFL condition for triangles joining this edge (triangle k and triangle n)
 
                         // CFL for triangle k
-                        local_timestep = min(local_timestep, D->edge_timestep[ki]);
+                        timestep_min = min(timestep_min, D->edge_timestep[ki]);
 
                         if (n >= 0) {
                             // Apply CFL condition for neigbour n (which is on the ith edge of triangle k)
-                            local_timestep = min(local_timestep, D->edge_timestep[nm]);
+                            timestep_min = min(timestep_min, D->edge_timestep[nm]);
                         }
                     }
                 }
@@ -991,6 +1015,12 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
 
     } // End triangle k
 
+    local_timestep = timestep_min;
+
+    if (!last) {
+        return timestep;
+    }
+
     //// Limit edgefluxes, for mass conservation near wet/dry cells
     //// This doesn't seem to be needed anymore
     //for(k=0; k< number_of_elements; k++){
@@ -1046,28 +1076,19 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
     // }
 
     // Now add up stage, xmom, ymom explicit updates
+    #pragma omp parallel for num_threads(D->omp_num_threads) \
+        private(i, ki, ki2, ki3, inv_area)
     for(k=0; k < D->number_of_elements; k++){
-        hc = max(D->stage_centroid_values[k] - D->bed_centroid_values[k],0.);
 
         for(i=0;i<3;i++){
             // FIXME: Make use of neighbours to efficiently set things
             ki=3*k+i;   
             ki2=ki*2;
             ki3 = ki*3;
-            n=D->neighbours[ki];
 
             D->stage_explicit_update[k] += D->edge_flux_work[ki3+0];
             D->xmom_explicit_update[k] += D->edge_flux_work[ki3+1];
             D->ymom_explicit_update[k] += D->edge_flux_work[ki3+2];
-
-            // If this cell is not a ghost, and the neighbour is a boundary
-            // condition OR a ghost cell, then add the flux to the
-            // boundary_flux_integral
-            if( (n<0 & D->tri_full_flag[k]==1) | ( n>=0 && (D->tri_full_flag[k]==1 & D->tri_full_flag[n]==0)) ){ 
-                // boundary_flux_sum is an array with length = timestep_fluxcalls
-                // For each sub-step, we put the boundary flux sum in.
-                D->boundary_flux_sum[substep_count] += D->edge_flux_work[ki3];
-            }
     
             D->xmom_explicit_update[k] -= D->normals[ki2]*D->pressuregrad_work[ki];
             D->ymom_explicit_update[k] -= D->normals[ki2+1]*D->pressuregrad_work[ki];
@@ -1084,12 +1105,33 @@ inline double _compute_fluxes_central(struct domain *D, double timestep){
    
     }  // end cell k
 
+    // If a cell is not a ghost, and the neighbour is a boundary condition
+    // OR a ghost cell, then add the flux to the boundary_flux_integral.
+    // Summed in a separate loop to keep the order of the summation fixed
+    for(k=0; k < D->number_of_elements; k++){
+        for(i=0;i<3;i++){
+            ki=3*k+i;
+            n=D->neighbours[ki];
+
+            if( (n<0 & D->tri_full_flag[k]==1) | ( n>=0 && (D->tri_full_flag[k]==1 & D->tri_full_flag[n]==0)) ){
+                // boundary_flux_sum is an array with length = timestep_fluxcalls
+                // For each sub-step, we put the boundary flux sum in.
+                D->boundary_flux_sum[substep_count] += D->edge_flux_work[3*ki];
+            }
+        }
+    }
+
     // Ensure we only update the timestep on the first call within each rk2/rk3 step
     if(substep_count == 0) timestep=local_timestep; 
          
     return timestep;
 }
 
+inline double _compute_fluxes_central(struct domain *D, double timestep){
+
+    return _compute_fluxes_central_cells(D, timestep, NULL, D->number_of_elements, 1, 1);
+}
+
 // Protect against the water elevation falling below the triangle bed
 inline double  _protect(int N,
          double minimum_allowed_height,
@@ -1153,10 +1195,12 @@ inline double  _protect(int N,
   return mass_error;
 }
 
-// Protect against the water elevation falling below the triangle bed
-inline double  _protect_new(struct domain *D) {
+// Protect against the water elevation falling below the bed of the
+// triangles in cells (all triangles if cells is NULL)
+inline double  _protect_new_cells(struct domain *D, long *cells, long ncells) {
 
   int k;
+  long ic;
   double hc, bmin, bmax;
   double u, v, reduced_speed;
   double mass_error = 0.;
@@ -1191,7 +1235,8 @@ inline double  _protect_new(struct domain *D) {
 
   // Protect against inifintesimal and negative heights
   //if (maximum_allowed_speed < epsilon) {
-    for (k=0; k<D->number_of_elements; k++) {
+    for (ic=0; ic<ncells; ic++) {
+      k = cells == NULL ? ic : cells[ic];
       hc = wc[k] - zc[k];
       if (hc < minimum_allowed_height*1.0 ){
             // Set momentum to zero and ensure h is non negative
@@ -1227,6 +1272,11 @@ inline double  _protect_new(struct domain *D) {
   return mass_error;
 }
 
+inline double  _protect_new(struct domain *D) {
+
+  return _protect_new_cells(D, NULL, D->number_of_elements);
+}
+
 
 
 
@@ -1321,16 +1371,28 @@ inline int limit_gradient(double *dqv, double qmin, double qmax, double beta_w){
 //                                 double* x_centroid_work,
 //                                 double* y_centroid_work,
 //                                 long* update_extrapolation) {
-inline int _extrapolate_second_order_edge_sw(struct domain *D){
+// Extrapolate the triangles in cells (all triangles if cells is NULL).
+// Extrapolating a triangle reads the velocities of its neighbours, which
+// are computed for velocity_cells, and their momenta after zeroing the
+// momenta of triangles surrounded by dry cells, which is done for
+// dry_cells. So for the triangles in cells to be extrapolated as when
+// extrapolating all triangles, dry_cells must include the neighbours of
+// cells and velocity_cells the neighbours of dry_cells.
+inline int _extrapolate_second_order_edge_sw_cells(struct domain *D,
+        long *velocity_cells, long nvelocity,
+        long *dry_cells, long ndry,
+        long *cells, long ncells){
                   
   // Local variables
   double a, b; // Gradient vector used to calculate edge values from centroids
   int k, k0, k1, k2, k3, k6, coord_index, i, ii, ktmp, k_wetdry;
+  long ic; // Index into the cell lists
   double x, y, x0, y0, x1, y1, x2, y2, xv0, yv0, xv1, yv1, xv2, yv2; // Vertices of the auxiliary triangle
   double dx1, dx2, dy1, dy2, dxv0, dxv1, dxv2, dyv0, dyv1, dyv2, dq0, dq1, dq2, area2, inv_area2, dpth,momnorm;
   double dqv[3], qmin, qmax, hmin, hmax, bedmax,bedmin, stagemin;
   double hc, h0, h1, h2, beta_tmp, hfactor, xtmp, ytmp, weight, tmp;
   double dk, dk_inv,dv0, dv1, dv2, de[3], demin, dcmax, r0scale, vel_norm, l1, l2, a_tmp, b_tmp, c_tmp,d_tmp;
+  int neighbour_not_found = 0;
   
 
   memset((char*) D->x_centroid_work, 0, D->number_of_elements * sizeof (double));
@@ -1347,7 +1409,10 @@ inline int _extrapolate_second_order_edge_sw(struct domain *D){
 
       // Replace momentum centroid with velocity centroid to allow velocity
       // extrapolation This will be changed back at the end of the routine
-      for (k=0; k< D->number_of_elements; k++){
+      #pragma omp parallel for num_threads(D->omp_num_threads) \
+          private(k, dk, dk_inv)
+      for (ic=0; ic< nvelocity; ic++){
+          k = velocity_cells == NULL ? ic : velocity_cells[ic];
           
           D->height_centroid_values[k] = max(D->stage_centroid_values[k] - D->bed_centroid_values[k], 0.);
 
@@ -1373,7 +1438,10 @@ inline int _extrapolate_second_order_edge_sw(struct domain *D){
   // condition) set its momentum to zero too. This prevents 'pits' of
   // of water being trapped and unable to lose momentum, which can occur in
   // some situations
-  for (k=0; k< D->number_of_elements;k++){
+  #pragma omp parallel for num_threads(D->omp_num_threads) \
+      private(k, k0, k1, k2, k3)
+  for (ic=0; ic< ndry; ic++){
+      k = dry_cells == NULL ? ic : dry_cells[ic];
       
       k3=k*3;
       k0 = D->surrogate_neighbours[k3];
@@ -1395,8 +1463,16 @@ inline int _extrapolate_second_order_edge_sw(struct domain *D){
   }
 
   // Begin extrapolation routine
-  for (k = 0; k < D->number_of_elements; k++) 
+  #pragma omp parallel for num_threads(D->omp_num_threads) \
+      private(k, a, b, k0, k1, k2, k3, k6, coord_index, i, \
+              x, y, x0, y0, x1, y1, x2, y2, xv0, yv0, xv1, yv1, xv2, yv2, \
+              dx1, dx2, dy1, dy2, dxv0, dxv1, dxv2, dyv0, dyv1, dyv2, \
+              dq0, dq1, dq2, area2, inv_area2, dqv, qmin, qmax, hmin, hmax, \
+              hc, h0, h1, h2, beta_tmp, hfactor, dk) \
+      reduction(max:neighbour_not_found)
+  for (ic = 0; ic < ncells; ic++)
   {
+    k = cells == NULL ? ic : cells[ic];
 
     // Don't update the extrapolation if the flux will not be computed on the
     // next timestep
@@ -1775,8 +1851,9 @@ inline int _extrapolate_second_order_edge_sw(struct domain *D){
       if ((k2 == k3 + 3)) 
       {
         // If we didn't find an internal neighbour
-        report_python_error(AT, "Internal neighbour not found");
-        return -1;
+        // (reported after the loop as we can't return from a parallel loop)
+        neighbour_not_found = 1;
+        continue;
       }
       
       k1 = D->surrogate_neighbours[k2];
@@ -1952,14 +2029,27 @@ inline int _extrapolate_second_order_edge_sw(struct domain *D){
     } // else [number_of_boundaries==2]
   } // for k=0 to number_of_elements-1
 
+  if (neighbour_not_found) {
+    report_python_error(AT, "Internal neighbour not found");
+    return -1;
+  }
 
-  // Compute vertex values of quantities
-  for (k=0; k< D->number_of_elements; k++){
-      if(D->extrapolate_velocity_second_order==1){
-          //Convert velocity back to momenta at centroids
+
+  if(D->extrapolate_velocity_second_order==1){
+      //Convert velocity back to momenta at centroids
+      #pragma omp parallel for num_threads(D->omp_num_threads) private(k)
+      for (ic=0; ic< nvelocity; ic++){
+          k = velocity_cells == NULL ? ic : velocity_cells[ic];
           D->xmom_centroid_values[k] = D->x_centroid_work[k];
           D->ymom_centroid_values[k] = D->y_centroid_work[k];
       }
+  }
+
+  // Compute vertex values of quantities
+  #pragma omp parallel for num_threads(D->omp_num_threads) \
+      private(k, k3, i, dk)
+  for (ic=0; ic< ncells; ic++){
+      k = cells == NULL ? ic : cells[ic];
      
       // Don't proceed if we didn't update the edge/vertex values
       if(D->update_extrapolation[k]==0){
@@ -2007,11 +2097,541 @@ inline int _extrapolate_second_order_edge_sw(struct domain *D){
   return 0;
 }           
 
+inline int _extrapolate_second_order_edge_sw(struct domain *D){
+
+  return _extrapolate_second_order_edge_sw_cells(D,
+          NULL, D->number_of_elements,
+          NULL, D->number_of_elements,
+          NULL, D->number_of_elements);
+}
+
+//=========================================================================
+// Native time stepping
+//
+// Computational routines used by evolve_steps_native to take many
+// consecutive timesteps without returning to python.
+//=========================================================================
+
+// Boundary types evaluated natively. Must match native_boundary_types
+// in shallow_water_domain.py
+#define NATIVE_BOUNDARY_PYTHON 0
+#define NATIVE_BOUNDARY_REFLECTIVE 1
+#define NATIVE_BOUNDARY_DIRICHLET 2
+#define NATIVE_BOUNDARY_TRANSMISSIVE 3
+#define NATIVE_BOUNDARY_TRANSMISSIVE_CENTROID 4
+#define NATIVE_BOUNDARY_TRANSMISSIVE_STAGE_ZERO_MOMENTUM 5
+
+
+// Arrays needed by the native time stepping which are not
+// part of struct domain
+struct native_domain {
+    long    number_of_boundary_edges;
+    long    number_of_boundary_flux_sums;
+
+    long*   boundary_type;
+    double* boundary_values;
+    long*   boundary_cells;
+    long*   boundary_edges;
+
+    double* height_boundary_values;
+    double* xvel_edge_values;
+    double* yvel_edge_values;
+    double* xvel_boundary_values;
+    double* yvel_boundary_values;
+
+    double* stage_semi_implicit_update;
+    double* xmom_semi_implicit_update;
+    double* ymom_semi_implicit_update;
+
+    double* stage_centroid_backup_values;
+    double* xmom_centroid_backup_values;
+    double* ymom_centroid_backup_values;
+
+    double* friction_centroid_values;
+};
+
+
+// Model time and timestep bookkeeping which is kept on the python
+// domain by the python evolve loop
+struct evolve_state {
+    double time;
+    double timestep;
+    double flux_timestep;
+    double yieldtime;
+    double finaltime;
+    double CFL;
+    double evolve_min_timestep;
+    double recorded_min_timestep;
+    double recorded_max_timestep;
+
+    long smallsteps;
+    long order;
+    long default_order;
+    long number_of_steps;
+    long number_of_first_order_steps;
+};
+
+
+int _get_native_domain(struct native_domain *ND, PyObject *domain,
+                       PyArrayObject *boundary_type,
+                       PyArrayObject *boundary_values) {
+
+    PyObject *quantities;
+    PyArrayObject *boundary_cells, *boundary_edges, *boundary_flux_sum;
+
+    ND->number_of_boundary_edges = boundary_type->dimensions[0];
+    ND->boundary_type = (long*) boundary_type->data;
+    ND->boundary_values = (double*) boundary_values->data;
+
+    boundary_cells = get_consecutive_array(domain, "boundary_cells");
+    if (boundary_cells == NULL) return -1;
+    ND->boundary_cells = (long*) boundary_cells->data;
+    Py_DECREF(boundary_cells);
+
+    boundary_edges = get_consecutive_array(domain, "boundary_edges");
+    if (boundary_edges == NULL) return -1;
+    ND->boundary_edges = (long*) boundary_edges->data;
+    Py_DECREF(boundary_edges);
+
+    boundary_flux_sum = get_consecutive_array(domain, "boundary_flux_sum");
+    if (boundary_flux_sum == NULL) return -1;
+    ND->number_of_boundary_flux_sums = boundary_flux_sum->dimensions[0];
+    Py_DECREF(boundary_flux_sum);
+
+    quantities = get_python_object(domain, "quantities");
+    if (quantities == NULL) return -1;
+
+    ND->height_boundary_values = get_python_array_data_from_dict(quantities, "height", "boundary_values");
+    ND->xvel_edge_values       = get_python_array_data_from_dict(quantities, "xvelocity", "edge_values");
+    ND->yvel_edge_values       = get_python_array_data_from_dict(quantities, "yvelocity", "edge_values");
+    ND->xvel_boundary_values   = get_python_array_data_from_dict(quantities, "xvelocity", "boundary_values");
+    ND->yvel_boundary_values   = get_python_array_data_from_dict(quantities, "yvelocity", "boundary_values");
+
+    ND->stage_semi_implicit_update = get_python_array_data_from_dict(quantities, "stage", "semi_implicit_update");
+    ND->xmom_semi_implicit_update  = get_python_array_data_from_dict(quantities, "xmomentum", "semi_implicit_update");
+    ND->ymom_semi_implicit_update  = get_python_array_data_from_dict(quantities, "ymomentum", "semi_implicit_update");
+
+    ND->stage_centroid_backup_values = get_python_array_data_from_dict(quantities, "stage", "centroid_backup_values");
+    ND->xmom_centroid_backup_values  = get_python_array_data_from_dict(quantities, "xmomentum", "centroid_backup_values");
+    ND->ymom_centroid_backup_values  = get_python_array_data_from_dict(quantities, "ymomentum", "centroid_backup_values");
+
+    ND->friction_centroid_values = get_python_array_data_from_dict(quantities, "friction", "centroid_values");
+
+    Py_DECREF(quantities);
+
+    if (PyErr_Occurred()) return -1;
+
+    return 0;
+}
+
+
+int _get_evolve_state(struct evolve_state *S, PyObject *domain) {
+
+    S->time                  = get_python_double(domain, "time");
+    S->timestep              = get_python_double(domain, "timestep");
+    S->flux_timestep         = get_python_double(domain, "flux_timestep");
+    S->yieldtime             = get_python_double(domain, "yieldtime");
+    S->CFL                   = get_python_double(domain, "CFL");
+    S->evolve_min_timestep   = get_python_double(domain, "evolve_min_timestep");
+    S->recorded_min_timestep = get_python_double(domain, "recorded_min_timestep");
+    S->recorded_max_timestep = get_python_double(domain, "recorded_max_timestep");
+
+    S->smallsteps      = get_python_integer(domain, "smallsteps");
+    S->order           = get_python_integer(domain, "_order_");
+    S->default_order   = get_python_integer(domain, "default_order");
+    S->number_of_steps = get_python_integer(domain, "number_of_steps");
+    S->number_of_first_order_steps = get_python_integer(domain, "number_of_first_order_steps");
+
+    if (PyErr_Occurred()) return -1;
+
+    return 0;
+}
+
+
+int _set_python_double(PyObject *O, char *name, double x) {
+    PyObject *value;
+    int e;
+
+    value = PyFloat_FromDouble(x);
+    if (value == NULL) return -1;
+
+    e = PyObject_SetAttrString(O, name, value);
+    Py_DECREF(value);
+
+    return e;
+}
+
+
+int _set_python_integer(PyObject *O, char *name, long x) {
+    PyObject *value;
+    int e;
+
+    value = PyInt_FromLong(x);
+    if (value == NULL) return -1;
+
+    e = PyObject_SetAttrString(O, name, value);
+    Py_DECREF(value);
+
+    return e;
+}
+
+
+int _set_evolve_state(struct evolve_state *S, PyObject *domain) {
+
+    if (_set_python_double(domain, "time", S->time) == -1 ||
+        _set_python_double(domain, "timestep", S->timestep) == -1 ||
+        _set_python_double(domain, "flux_timestep", S->flux_timestep) == -1 ||
+        _set_python_double(domain, "recorded_min_timestep", S->recorded_min_timestep) == -1 ||
+        _set_python_double(domain, "recorded_max_timestep", S->recorded_max_timestep) == -1 ||
+        _set_python_integer(domain, "smallsteps", S->smallsteps) == -1 ||
+        _set_python_integer(domain, "_order_", S->order) == -1 ||
+        _set_python_integer(domain, "number_of_steps", S->number_of_steps) == -1 ||
+        _set_python_integer(domain, "number_of_first_order_steps", S->number_of_first_order_steps) == -1) {
+        return -1;
+    }
+
+    return 0;
+}
+
+
+// Call python function func(*args) in the middle of the time stepping.
+// The evolve state is handed over to the python domain before the call
+// and read back afterwards. Arrays might have been replaced by the call
+// so the pointers in D and ND are refreshed.
+int _native_callback(PyObject *domain, PyObject *func, PyObject *args,
+                     struct evolve_state *S, struct domain *D,
+                     struct native_domain *ND,
+                     PyArrayObject *boundary_type,
+                     PyArrayObject *boundary_values) {
+    PyObject *result;
+
+    if (_set_evolve_state(S, domain) == -1) return -1;
+
+    result = PyObject_CallObject(func, args);
+    if (result == NULL) return -1;
+    Py_DECREF(result);
+
+    if (_get_evolve_state(S, domain) == -1) return -1;
+
+    get_python_domain(D, domain);
+    if (_get_native_domain(ND, domain, boundary_type, boundary_values) == -1) return -1;
+
+    return 0;
+}
+
+
+// Vectorised counterparts of evaluate_segment of the Reflective,
+// Dirichlet and Transmissive boundaries. Edges of type
+// NATIVE_BOUNDARY_PYTHON are left for python.
+void _evaluate_native_boundaries(struct domain *D, struct native_domain *ND) {
+
+    long j, k, i, ki;
+    long type;
+    double n1, n2, q1, q2, r1, r2;
+
+    for (j = 0; j < ND->number_of_boundary_edges; j++) {
+
+        type = ND->boundary_type[j];
+        if (type == NATIVE_BOUNDARY_PYTHON) continue;
+
+        k = ND->boundary_cells[j];
+        i = ND->boundary_edges[j];
+        ki = 3*k + i;
+
+        switch (type) {
+
+        case NATIVE_BOUNDARY_REFLECTIVE:
+            n1 = D->normals[2*ki];
+            n2 = D->normals[2*ki + 1];
+
+            D->stage_boundary_values[j] = D->stage_edge_values[ki];
+            D->bed_boundary_values[j] = D->bed_edge_values[ki];
+            ND->height_boundary_values[j] = D->height_edge_values[ki];
+
+            // Rotate and negate momentum
+            q1 = D->xmom_edge_values[ki];
+            q2 = D->ymom_edge_values[ki];
+
+            r1 = -q1*n1 - q2*n2;
+            r2 = -q1*n2 + q2*n1;
+
+            D->xmom_boundary_values[j] = n1*r1 - n2*r2;
+            D->ymom_boundary_values[j] = n2*r1 + n1*r2;
+
+            // Rotate and negate velocity
+            q1 = ND->xvel_edge_values[ki];
+            q2 = ND->yvel_edge_values[ki];
+
+            r1 = q1*n1 + q2*n2;
+            r2 = q1*n2 - q2*n1;
+
+            ND->xvel_boundary_values[j] = n1*r1 - n2*r2;
+            ND->yvel_boundary_values[j] = n2*r1 + n1*r2;
+            break;
+
+        case NATIVE_BOUNDARY_DIRICHLET:
+            D->stage_boundary_values[j] = ND->boundary_values[3*j];
+            D->xmom_boundary_values[j]  = ND->boundary_values[3*j + 1];
+            D->ymom_boundary_values[j]  = ND->boundary_values[3*j + 2];
+            break;
+
+        case NATIVE_BOUNDARY_TRANSMISSIVE:
+            D->stage_boundary_values[j] = D->stage_edge_values[ki];
+            D->xmom_boundary_values[j]  = D->xmom_edge_values[ki];
+            D->ymom_boundary_values[j]  = D->ymom_edge_values[ki];
+            break;
+
+        case NATIVE_BOUNDARY_TRANSMISSIVE_CENTROID:
+            D->stage_boundary_values[j] = D->stage_centroid_values[k];
+            D->xmom_boundary_values[j]  = D->xmom_centroid_values[k];
+            D->ymom_boundary_values[j]  = D->ymom_centroid_values[k];
+            break;
+
+        case NATIVE_BOUNDARY_TRANSMISSIVE_STAGE_ZERO_MOMENTUM:
+            D->stage_boundary_values[j] = D->stage_edge_values[ki];
+            D->xmom_boundary_values[j]  = 0.0;
+            D->ymom_boundary_values[j]  = 0.0;
+            break;
+        }
+    }
+}
+
+
+// Implicit Manning friction as computed by manning_friction_implicit
+// in shallow_water_domain.py
+void _manning_friction_implicit(struct domain *D, struct native_domain *ND,
+                                long sloped) {
+
+    long k, k3, k6;
+    double S, h, z, z0, z1, z2, zs, zx, zy;
+    double x0, y0, x1, y1, x2, y2;
+    double g = D->g;
+    double eps = D->minimum_allowed_height;
+    double *eta = ND->friction_centroid_values;
+    double *w = D->stage_centroid_values;
+    double *uh = D->xmom_centroid_values;
+    double *vh = D->ymom_centroid_values;
+    double *zv = D->bed_vertex_values;
+    double *x = D->vertex_coordinates;
+    const double one_third = 1.0/3.0;
+    const double seven_thirds = 7.0/3.0;
+
+    for (k = 0; k < D->number_of_elements; k++) {
+        if (eta[k] > eps) {
+            k3 = 3 * k;
+            z0 = zv[k3 + 0];
+            z1 = zv[k3 + 1];
+            z2 = zv[k3 + 2];
+
+            zs = 1.0;
+            if (sloped) {
+                k6 = 6 * k;
+
+                x0 = x[k6 + 0];
+                y0 = x[k6 + 1];
+                x1 = x[k6 + 2];
+                y1 = x[k6 + 3];
+                x2 = x[k6 + 4];
+                y2 = x[k6 + 5];
+
+                _gradient(x0, y0, x1, y1, x2, y2, z0, z1, z2, &zx, &zy);
+
+                zs = sqrt(1.0 + zx * zx + zy * zy);
+            }
+
+            z = (z0 + z1 + z2) * one_third;
+            h = w[k] - z;
+            if (h >= eps) {
+                if (sloped) {
+                    S = -g * eta[k] * eta[k] * zs * sqrt((uh[k] * uh[k] + vh[k] * vh[k]));
+                } else {
+                    S = -g * eta[k] * eta[k] * sqrt((uh[k] * uh[k] + vh[k] * vh[k]));
+                }
+                S /= pow(h, seven_thirds);
+
+                ND->xmom_semi_implicit_update[k] += S * uh[k];
+                ND->ymom_semi_implicit_update[k] += S * vh[k];
+            }
+        }
+    }
+}
+
+
+// Same as _update in quantity_ext.c
+int _update_centroid_values(long N, double timestep,
+                            double* centroid_values,
+                            double* explicit_update,
+                            double* semi_implicit_update,
+                            long num_threads) {
+
+    long k;
+    double denominator, x;
+    int err = 0;
+
+    // The updates of each triangle are independent so the three passes
+    // of _update are done in one loop
+    #pragma omp parallel for num_threads(num_threads) \
+        private(denominator, x) reduction(min:err)
+    for (k = 0; k < N; k++) {
+        x = centroid_values[k];
+        if (x == 0.0) {
+            semi_implicit_update[k] = 0.0;
+        } else {
+            semi_implicit_update[k] /= x;
+        }
+
+        centroid_values[k] += timestep*explicit_update[k];
+
+        denominator = 1.0 - timestep*semi_implicit_update[k];
+        if (denominator <= 0.0) {
+            err = -1;
+        } else {
+            centroid_values[k] /= denominator;
+        }
+    }
+
+    if (err != 0) {
+        return err;
+    }
+
+    memset(semi_implicit_update, 0, N*sizeof(double));
+
+    return 0;
+}
+
+
+// Same as _saxpy_centroid_values in quantity_ext.c
+void _saxpy_native(long N, double a, double b,
+                   double* centroid_values,
+                   double* centroid_backup_values,
+                   long num_threads) {
+
+    long k;
+
+    #pragma omp parallel for num_threads(num_threads)
+    for (k = 0; k < N; k++) {
+        centroid_values[k] = a*centroid_values[k] + b*centroid_backup_values[k];
+    }
+}
+
+
+// Update stage and momenta and set cells with negative depth
+// to zero depth, as update_conserved_quantities in shallow_water_domain.py
+int _update_conserved_quantities(struct domain *D, struct native_domain *ND,
+                                 double timestep) {
+
+    long k, N, negative_cells;
+    int err;
+
+    N = D->number_of_elements;
+
+    err = _update_centroid_values(N, timestep, D->stage_centroid_values,
+            D->stage_explicit_update, ND->stage_semi_implicit_update,
+                D->omp_num_threads);
+    if (err == 0) {
+        err = _update_centroid_values(N, timestep, D->xmom_centroid_values,
+                D->xmom_explicit_update, ND->xmom_semi_implicit_update,
+                D->omp_num_threads);
+    }
+    if (err == 0) {
+        err = _update_centroid_values(N, timestep, D->ymom_centroid_values,
+                D->ymom_explicit_update, ND->ymom_semi_implicit_update,
+                D->omp_num_threads);
+    }
+    if (err != 0) {
+        PyErr_SetString(PyExc_RuntimeError,
+                "swDE1_domain_ext.c: update, division by zero in semi implicit update");
+        return -1;
+    }
+
+    negative_cells = 0;
+    for (k = 0; k < N; k++) {
+        if (D->tri_full_flag[k] > 0 &&
+            D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0) {
+            D->stage_centroid_values[k] = D->bed_centroid_values[k];
+            D->xmom_centroid_values[k] = 0.0;
+            D->ymom_centroid_values[k] = 0.0;
+            negative_cells++;
+        }
+    }
+
+    if (negative_cells > 0) {
+        if (PyErr_WarnEx(PyExc_UserWarning,
+                "Negative cells being set to zero depth, possible loss of conservation. \n"
+                "Consider using domain.report_water_volume_statistics() to check the extent of the problem", 1) == -1) {
+            return -1;
+        }
+    }
+
+    return 0;
+}
+
+
+// Timestep from the flux timestep, as update_timestep in generic_domain.py
+// for timesteps which are not smaller than evolve_min_timestep
+void _update_timestep(struct evolve_state *S, double timestep) {
+
+    S->recorded_max_timestep = max(timestep, S->recorded_max_timestep);
+    S->recorded_min_timestep = min(timestep, S->recorded_min_timestep);
+
+    S->smallsteps = 0;
+    if (S->order == 1 && S->default_order == 2) {
+        S->order = 2;
+    }
+
+    // Ensure that final time is not exceeded
+    if (S->time + timestep > S->finaltime) {
+        timestep = S->finaltime - S->time;
+    }
+
+    // Ensure that model time is aligned with yieldsteps
+    if (S->time + timestep > S->yieldtime) {
+        timestep = S->yieldtime - S->time;
+    }
+
+    S->timestep = timestep;
+}
+
+
 //=========================================================================
 // Python Glue
 //=========================================================================
 
 
+// Get the triangle indices from the optional cells argument of the
+// wrappers below; all n triangles of the domain if cells is None
+int _get_cells(PyObject *cells, long n, long **data, long *ncells) {
+
+    PyArrayObject *A;
+    long ic;
+
+    if (cells == NULL || cells == Py_None) {
+        *data = NULL;
+        *ncells = n;
+        return 0;
+    }
+
+    A = (PyArrayObject*) cells;
+    if (!PyArray_Check(cells) || A->nd != 1 || A->descr->type_num != NPY_LONG ||
+        !PyArray_ISCARRAY(A)) {
+        PyErr_SetString(PyExc_TypeError,
+                "cells must be a contiguous 1d array of type long");
+        return -1;
+    }
+
+    *data = (long*) A->data;
+    *ncells = A->dimensions[0];
+    for (ic = 0; ic < *ncells; ic++) {
+        if ((*data)[ic] < 0 || (*data)[ic] >= n) {
+            PyErr_SetString(PyExc_IndexError, "cell index out of range");
+            return -1;
+        }
+    }
+
+    return 0;
+}
+
+
 //========================================================================
 // Compute fluxes
 //========================================================================
@@ -2032,21 +2652,33 @@ PyObject *swde1_compute_fluxes_ext_central(PyObject *self, PyObject *args) {
     The maximal allowable speed computed by the flux_function for each volume
     is converted to a timestep that must not be exceeded. The minimum of
     those is computed as the next overall timestep.
+
+    Optionally only the fluxes of the triangles in cells are computed,
+    where first and last flag the first and last of the calls which
+    together compute the fluxes of all triangles.
   */
   struct domain D;
   PyObject *domain;
+  PyObject *cells = NULL;
+  long *cells_data;
+  long ncells;
+  int first = 1, last = 1;
 
    
   double timestep;
   
-  if (!PyArg_ParseTuple(args, "Od", &domain, &timestep)) {
+  if (!PyArg_ParseTuple(args, "Od|Oii", &domain, &timestep, &cells, &first, &last)) {
       report_python_error(AT, "could not parse input arguments");
       return NULL;
   }
     
   get_python_domain(&D,domain);
 
-  timestep=_compute_fluxes_central(&D,timestep);
+  if (_get_cells(cells, D.number_of_elements, &cells_data, &ncells) == -1) {
+      return NULL;
+  }
+
+  timestep=_compute_fluxes_central_cells(&D, timestep, cells_data, ncells, first, last);
 
   // Return updated flux timestep
   return Py_BuildValue("d", timestep);
@@ -2211,23 +2843,36 @@ PyObject *swde1_extrapolate_second_order_edge_sw(PyObject *self, PyObject *args)
         limited linear reconstruction
         based on centroid values
 
+    Optionally only the triangles in cells are extrapolated, see
+    _extrapolate_second_order_edge_sw_cells for velocity_cells and
+    dry_cells.
   */
  
   struct domain D; 
   PyObject *domain;
+  PyObject *velocity_cells = NULL, *dry_cells = NULL, *cells = NULL;
+  long *velocity_data, *dry_data, *cells_data;
+  long nvelocity, ndry, ncells;
 
   int e;
   
-  if (!PyArg_ParseTuple(args, "O", &domain)) {
+  if (!PyArg_ParseTuple(args, "O|OOO", &domain, &velocity_cells, &dry_cells, &cells)) {
       report_python_error(AT, "could not parse input arguments");
       return NULL;
   }
   
   get_python_domain(&D, domain);
 
+  if (_get_cells(velocity_cells, D.number_of_elements, &velocity_data, &nvelocity) == -1 ||
+      _get_cells(dry_cells, D.number_of_elements, &dry_data, &ndry) == -1 ||
+      _get_cells(cells, D.number_of_elements, &cells_data, &ncells) == -1) {
+      return NULL;
+  }
+
   // Call underlying flux computation routine and update
   // the explicit update arrays
-  e = _extrapolate_second_order_edge_sw(&D);
+  e = _extrapolate_second_order_edge_sw_cells(&D, velocity_data, nvelocity,
+          dry_data, ndry, cells_data, ncells);
 
   if (e == -1) {
     // Use error string set inside computational routine
@@ -2305,18 +2950,25 @@ PyObject *swde1_protect_new(PyObject *self, PyObject *args) {
 
 	struct domain D;
 	PyObject *domain;
+	PyObject *cells = NULL;
+	long *cells_data;
+	long ncells;
 
 	double mass_error;
 
 	// Convert Python arguments to C
-	if (!PyArg_ParseTuple(args, "O", &domain)) {
+	if (!PyArg_ParseTuple(args, "O|O", &domain, &cells)) {
 		report_python_error(AT, "could not parse input arguments");
 		return NULL;
 	}
 
 	get_python_domain(&D, domain);
 
-	mass_error = _protect_new(&D);
+	if (_get_cells(cells, D.number_of_elements, &cells_data, &ncells) == -1) {
+		return NULL;
+	}
+
+	mass_error = _protect_new_cells(&D, cells_data, ncells);
 
 	return Py_BuildValue("d", mass_error);
 }
@@ -2448,6 +3100,241 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
 
 }// swde1_evolve_one_euler_step
 
+//========================================================================
+// swde1_evolve_steps_native
+//========================================================================
+
+int _native_substep(PyObject *domain, struct evolve_state *S,
+                    struct domain *D, struct native_domain *ND,
+                    PyArrayObject *boundary_type,
+                    PyArrayObject *boundary_values,
+                    long friction,
+                    PyObject *boundary_callback,
+                    PyObject *forcing_callback) {
+  /*
+   * First part of a euler step: distribute to edges, apply boundary
+   * conditions, compute fluxes and forcing terms
+   */
+
+  _protect_new(D);
+
+  if (_extrapolate_second_order_edge_sw(D) == -1) {
+    return -1;
+  }
+
+  _evaluate_native_boundaries(D, ND);
+  if (boundary_callback != Py_None) {
+    if (_native_callback(domain, boundary_callback, NULL, S, D, ND,
+                         boundary_type, boundary_values) == -1) {
+      return -1;
+    }
+  }
+
+  S->flux_timestep = _compute_fluxes_central(D, D->evolve_max_timestep);
+
+  if (friction > 0) {
+    _manning_friction_implicit(D, ND, friction == 2);
+  }
+  if (forcing_callback != Py_None) {
+    if (_native_callback(domain, forcing_callback, NULL, S, D, ND,
+                         boundary_type, boundary_values) == -1) {
+      return -1;
+    }
+  }
+
+  return 0;
+}
+
+
+PyObject *swde1_evolve_steps_native(PyObject *self, PyObject *args) {
+  /*
+   * Take up to n euler or rk2 timesteps, stopping at the next yield time
+   * or at the final time. Returns the number of timesteps taken.
+   *
+   * Boundary edges are evaluated according to boundary_type (with
+   * the dirichlet values in boundary_values). The remaining edges are
+   * evaluated by boundary_callback. friction is 1 (flat) or 2 (sloped)
+   * for a native manning_friction_implicit forcing term, otherwise
+   * forcing terms are computed by forcing_callback. flux_integral is
+   * the boundary flux integral array to accumulate or None, all other
+   * fractional step operators are applied by operator_callback. Callbacks
+   * may be None.
+   *
+   * If native_timestep is 0, or the timestep falls below
+   * evolve_min_timestep, the timestep is computed by
+   * domain.update_timestep.
+  */
+
+  PyObject *domain;
+  PyObject *flux_integral_object;
+  PyObject *boundary_callback, *forcing_callback;
+  PyObject *operator_callback, *extrema_callback;
+  PyObject *update_timestep = NULL;
+  PyObject *update_timestep_args = NULL;
+  PyObject *error_type, *error_value, *error_traceback;
+  PyArrayObject *boundary_type, *boundary_values, *flux_integral = NULL;
+
+  struct domain D;
+  struct native_domain ND;
+  struct evolve_state S;
+
+  long n, steps, fluxcalls, N;
+  int friction, native_timestep;
+  double yieldstep, finaltime, epsilon;
+  double initial_time, timestep, flux_sum;
+
+  if (!PyArg_ParseTuple(args, "OldddOOOiiOOOO", &domain, &n,
+                        &yieldstep, &finaltime, &epsilon,
+                        &boundary_type, &boundary_values,
+                        &flux_integral_object, &friction, &native_timestep,
+                        &boundary_callback, &forcing_callback,
+                        &operator_callback, &extrema_callback)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  get_python_domain(&D, domain);
+  if (_get_native_domain(&ND, domain, boundary_type, boundary_values) == -1) {
+    return NULL;
+  }
+  if (_get_evolve_state(&S, domain) == -1) {
+    return NULL;
+  }
+  S.finaltime = finaltime;
+
+  if (flux_integral_object != Py_None) {
+    flux_integral = (PyArrayObject*) flux_integral_object;
+  }
+
+  fluxcalls = D.timestep_fluxcalls;
+  N = D.number_of_elements;
+
+  update_timestep = PyObject_GetAttrString(domain, "update_timestep");
+  update_timestep_args = Py_BuildValue("(dd)", yieldstep, finaltime);
+  if (update_timestep == NULL || update_timestep_args == NULL) {
+    goto error;
+  }
+
+  steps = 0;
+  while (steps < n) {
+
+    initial_time = S.time;
+
+    if (fluxcalls == 2) {
+      // Save initial conserved quantities values
+      memcpy(ND.stage_centroid_backup_values, D.stage_centroid_values, N*sizeof(double));
+      memcpy(ND.xmom_centroid_backup_values, D.xmom_centroid_values, N*sizeof(double));
+      memcpy(ND.ymom_centroid_backup_values, D.ymom_centroid_values, N*sizeof(double));
+    }
+
+    if (_native_substep(domain, &S, &D, &ND, boundary_type, boundary_values,
+                        friction, boundary_callback, forcing_callback) == -1) {
+      goto error;
+    }
+
+    // Update timestep to fit yieldstep and finaltime
+    timestep = min(S.CFL*S.flux_timestep, D.evolve_max_timestep);
+    if (native_timestep && timestep >= S.evolve_min_timestep) {
+      _update_timestep(&S, timestep);
+    } else {
+      if (_native_callback(domain, update_timestep, update_timestep_args,
+                           &S, &D, &ND, boundary_type, boundary_values) == -1) {
+        goto error;
+      }
+    }
+
+    if (fluxcalls == 1 && D.max_flux_update_frequency != 1) {
+      _compute_flux_update_frequency(&D, S.timestep);
+    }
+
+    if (_update_conserved_quantities(&D, &ND, S.timestep) == -1) {
+      goto error;
+    }
+
+    if (fluxcalls == 2) {
+      // Second euler step using the same timestep
+      S.time = initial_time + S.timestep;
+
+      if (_native_substep(domain, &S, &D, &ND, boundary_type, boundary_values,
+                          friction, boundary_callback, forcing_callback) == -1) {
+        goto error;
+      }
+
+      if (_update_conserved_quantities(&D, &ND, S.timestep) == -1) {
+        goto error;
+      }
+
+      // Combine steps
+      _saxpy_native(N, 0.5, 0.5, D.stage_centroid_values, ND.stage_centroid_backup_values,
+                    D.omp_num_threads);
+      _saxpy_native(N, 0.5, 0.5, D.xmom_centroid_values, ND.xmom_centroid_backup_values,
+                    D.omp_num_threads);
+      _saxpy_native(N, 0.5, 0.5, D.ymom_centroid_values, ND.ymom_centroid_backup_values,
+                    D.omp_num_threads);
+    }
+
+    // Fractional step operators
+    if (flux_integral != NULL) {
+      if (fluxcalls == 1) {
+        flux_sum = D.boundary_flux_sum[0];
+      } else {
+        flux_sum = 0.5*(D.boundary_flux_sum[0] + D.boundary_flux_sum[1]);
+      }
+      ((double*) flux_integral->data)[0] += S.timestep*flux_sum;
+      memset(D.boundary_flux_sum, 0, ND.number_of_boundary_flux_sums*sizeof(double));
+    }
+    if (operator_callback != Py_None) {
+      if (_native_callback(domain, operator_callback, NULL, &S, &D, &ND,
+                           boundary_type, boundary_values) == -1) {
+        goto error;
+      }
+    }
+
+    S.time = initial_time + S.timestep;
+
+    if (extrema_callback != Py_None) {
+      if (_native_callback(domain, extrema_callback, NULL, &S, &D, &ND,
+                           boundary_type, boundary_values) == -1) {
+        goto error;
+      }
+    }
+
+    S.number_of_steps++;
+    if (S.order == 1) {
+      S.number_of_first_order_steps++;
+    }
+    steps++;
+
+    // Return to python at yield times
+    if (S.time >= S.finaltime - epsilon || S.time >= S.yieldtime) {
+      break;
+    }
+  }
+
+  Py_DECREF(update_timestep);
+  Py_DECREF(update_timestep_args);
+
+  if (_set_evolve_state(&S, domain) == -1) {
+    return NULL;
+  }
+
+  return Py_BuildValue("l", steps);
+
+error:
+  Py_XDECREF(update_timestep);
+  Py_XDECREF(update_timestep_args);
+
+  // Keep the python domain consistent with the steps taken so far
+  PyErr_Fetch(&error_type, &error_value, &error_traceback);
+  if (_set_evolve_state(&S, domain) == -1) {
+    PyErr_Clear();
+  }
+  PyErr_Restore(error_type, error_value, error_traceback);
+
+  return NULL;
+
+}// swde1_evolve_steps_native
+
 //========================================================================
 // Method table for python module
 //========================================================================
@@ -2466,6 +3353,7 @@ static struct PyMethodDef MethodTable[] = {
   {"protect",          swde1_protect, METH_VARARGS | METH_KEYWORDS, "Print out"},
   {"protect_new",      swde1_protect_new, METH_VARARGS | METH_KEYWORDS, "Print out"},
   {"evolve_one_euler_step", swde1_evolve_one_euler_step, METH_VARARGS | METH_KEYWORDS, "Print out"},
+  {"evolve_steps_native", swde1_evolve_steps_native, METH_VARARGS, "Print out"},
   {NULL, NULL, 0, NULL}
 };
 
@@ -34,6 +34,8 @@ struct domain {
     long max_flux_update_frequency;
     long ncol_riverwall_hydraulic_properties;
 
+    long omp_num_threads;
+
     // Changing values in these arrays will change the values in the python object
     long*   neighbours;
     long*   neighbour_edges;
@@ -44,6 +46,7 @@ struct domain {
     double* areas;
 
     long* edge_flux_type;
+    long* edge_riverwall_index;
 
     long*   tri_full_flag;
     long*   already_computed_flux;
@@ -177,6 +180,7 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
             *radii,
             *areas,
             *edge_flux_type,
+            *edge_riverwall_index,
             *tri_full_flag,
             *already_computed_flux,
             *vertex_coordinates,
@@ -223,6 +227,8 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     D->beta_vh_dry = get_python_double(domain, "beta_vh_dry");
 
     D->max_flux_update_frequency = get_python_integer(domain,"max_flux_update_frequency");
+
+    D->omp_num_threads = get_python_integer(domain, "omp_num_threads");
     
     neighbours = get_consecutive_array(domain, "neighbours");
     D->neighbours = (long *) neighbours->data;
@@ -248,6 +254,9 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     edge_flux_type = get_consecutive_array(domain, "edge_flux_type");
     D->edge_flux_type = (long *) edge_flux_type->data;
 
+    edge_riverwall_index = get_consecutive_array(domain, "edge_riverwall_index");
+    D->edge_riverwall_index = (long *) edge_riverwall_index->data;
+
 
     tri_full_flag = get_consecutive_array(domain, "tri_full_flag");
     D->tri_full_flag = (long *) tri_full_flag->data;
@@ -355,6 +364,7 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     Py_DECREF(radii);
     Py_DECREF(areas);
     Py_DECREF(edge_flux_type);
+    Py_DECREF(edge_riverwall_index);
     Py_DECREF(tri_full_flag);
     Py_DECREF(already_computed_flux);
     Py_DECREF(vertex_coordinates);
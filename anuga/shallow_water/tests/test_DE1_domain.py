@@ -103,7 +103,125 @@ class Test_DE1_domain(unittest.TestCase):
         assert num.all(vv<2.0e-02)
 
 
-            
+    def test_omp_num_threads(self):
+        """Results are bitwise identical for any number of threads
+        """
+
+        def create_domain(num_threads):
+
+            points, vertices, boundary = anuga.rectangular_cross(10, 10)
+
+            domain = Domain(points, vertices, boundary)
+            domain.set_flow_algorithm('DE1')
+            domain.set_store(False)
+            domain.set_omp_num_threads(num_threads)
+
+            domain.set_quantity('elevation', lambda x,y: -x/2.0)
+            domain.set_quantity('friction', 0.03)
+            domain.set_quantity('stage', lambda x,y: num.where(x < 0.3, 0.2, -0.5))
+
+            domain.riverwallData.create_riverwalls(
+                {'wall': [[0.5, 0.0, -0.1], [0.5, 1.0, -0.1]]}, verbose=False)
+
+            Br = anuga.Reflective_boundary(domain)
+            Bd = anuga.Dirichlet_boundary([0.2, 0.0, 0.0])
+            domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+            return domain
+
+        results = []
+        for num_threads in [1, 3]:
+            domain = create_domain(num_threads)
+            assert domain.get_omp_num_threads() == num_threads
+
+            for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+                pass
+
+            results.append(domain)
+
+        domain1, domain3 = results
+        assert domain1.number_of_steps == domain3.number_of_steps
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q1 = domain1.quantities[name]
+            Q3 = domain3.quantities[name]
+            assert num.all(Q1.centroid_values == Q3.centroid_values)
+            assert num.all(Q1.edge_values == Q3.edge_values)
+        assert num.all(domain1.get_boundary_flux_integral() ==
+                       domain3.get_boundary_flux_integral())
+
+        # Water has passed over the riverwall
+        assert num.sum(domain1.edge_flux_type == 1) > 0
+        depth = domain1.quantities['stage'].centroid_values - \
+                domain1.quantities['elevation'].centroid_values
+        x = domain1.centroid_coordinates[:,0]
+        assert num.any(depth[x > 0.5] > 0.1)
+
+        try:
+            domain1.set_omp_num_threads(0)
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Expected AssertionError')
+
+
+    def test_ghost_exchange_overlap(self):
+        """Computing the fluxes away from the ghost cells while the ghost
+        cells are updated gives bitwise identical results
+        """
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory \
+             import rectangular_periodic
+
+        def create_domain(flow_algorithm, overlap):
+
+            points, vertices, boundary, full_send_dict, ghost_recv_dict = \
+                    rectangular_periodic(12, 10)
+
+            domain = Domain(points, vertices, boundary,
+                            full_send_dict=full_send_dict,
+                            ghost_recv_dict=ghost_recv_dict)
+            domain.set_flow_algorithm(flow_algorithm)
+            domain.set_store(False)
+            domain.set_ghost_exchange_overlap(overlap)
+
+            domain.set_quantity('elevation', lambda x,y: 0.1*x - 0.05*y)
+            domain.set_quantity('friction', 0.03)
+            domain.set_quantity('stage',
+                                lambda x,y: num.where(x < 0.4, 0.5, 0.02*y))
+            domain.set_quantity('xmomentum', lambda x,y: 0.01*y)
+
+            Br = anuga.Reflective_boundary(domain)
+            Bd = anuga.Dirichlet_boundary([0.3, 0.0, 0.0])
+            domain.set_boundary({'top': Bd, 'bottom': Br, 'left': Br,
+                                 'right': Br, 'ghost': None})
+
+            return domain
+
+        for flow_algorithm in ['DE0', 'DE1', 'DE2']:
+            domain1 = create_domain(flow_algorithm, True)
+            domain2 = create_domain(flow_algorithm, False)
+
+            # Some fluxes are computed before the ghost cells are updated
+            before, after = domain1.get_ghost_overlap_cells()['fluxes']
+            assert len(before) > 0 and len(after) > 0
+            assert len(before) + len(after) == len(domain1)
+
+            for t in domain1.evolve(yieldstep=0.05, finaltime=0.2):
+                pass
+            for t in domain2.evolve(yieldstep=0.05, finaltime=0.2):
+                pass
+
+            assert domain1.number_of_steps == domain2.number_of_steps
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                Q1 = domain1.quantities[name]
+                Q2 = domain2.quantities[name]
+                assert num.all(Q1.centroid_values == Q2.centroid_values)
+                assert num.all(Q1.edge_values == Q2.edge_values)
+            assert num.all(domain1.get_boundary_flux_integral() ==
+                           domain2.get_boundary_flux_integral())
+
+
+
 if __name__ == "__main__":
     suite = unittest.makeSuite(Test_DE1_domain, 'test')
     runner = unittest.TextTestRunner(verbosity=1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import tempfile
+
+import numpy as num
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+        import Boundary, Dirichlet_boundary, Time_boundary, \
+        Time_space_boundary, File_boundary
+from anuga.shallow_water.boundaries import Reflective_boundary, \
+        Field_boundary, Transmissive_momentum_set_stage_boundary, \
+        Transmissive_stage_zero_momentum_boundary, \
+        Time_stage_zero_momentum_boundary, Dirichlet_discharge_boundary, \
+        Inflow_boundary, Flather_external_stage_zero_velocity_boundary
+
+
+def create_domain(name='test_boundaries'):
+
+    points, vertices, boundary = rectangular_cross(4, 4, len1=4.0, len2=4.0)
+
+    domain = Domain(points, vertices, boundary)
+    domain.set_name(name)
+    domain.set_quantity('elevation', lambda x,y: -x/4)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', lambda x,y: 0.1*y - x/4 + 0.2)
+    domain.set_quantity('xmomentum', lambda x,y: 0.01*x + 0.02*y)
+    domain.set_quantity('ymomentum', lambda x,y: 0.03*x - 0.01*y)
+    domain.distribute_to_vertices_and_edges()
+
+    return domain
+
+
+def create_sww_file(filename):
+    """Write small sww file to be used with File_boundary
+    """
+
+    domain = create_domain(filename)
+    domain.set_datadir(os.path.dirname(filename))
+    domain.set_name(os.path.basename(filename))
+    domain.set_quantities_to_be_stored({'stage': 2,
+                                        'xmomentum': 2,
+                                        'ymomentum': 2})
+
+    Br = Reflective_boundary(domain)
+    Bd = Dirichlet_boundary([0.4, 0., 0.])
+    domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+    for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+        pass
+
+    return filename + '.sww'
+
+
+class Test_boundaries(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def check_segment(self, domain, B):
+        """Vectorised evaluate_segment must give the same boundary values
+        as the generic per-edge implementation.
+        """
+
+        ids = num.arange(len(domain.boundary_cells))
+
+        Boundary.evaluate_segment(B, domain, ids)
+        expected = {}
+        for name in domain.evolved_quantities:
+            Q = domain.quantities[name]
+            expected[name] = Q.boundary_values.copy()
+            Q.boundary_values[:] = -99.0
+
+        B.evaluate_segment(domain, ids)
+        for name in domain.evolved_quantities:
+            Q = domain.quantities[name]
+            assert num.allclose(Q.boundary_values, expected[name]), name
+
+
+    def test_segment_time_space_boundary(self):
+
+        domain = create_domain()
+        domain.set_time(1.5)
+
+        # Function accepting vectors x and y
+        B = Time_space_boundary(domain, lambda t,x,y: [t + x, 0.1*y, 0.0])
+        self.check_segment(domain, B)
+        assert B.vectorised
+
+        # Function only accepting scalar x and y
+        from math import sin
+        B = Time_space_boundary(domain, lambda t,x,y: [sin(x), t*y, 0.0])
+        self.check_segment(domain, B)
+        assert not B.vectorised
+
+
+    def test_segment_shallow_water_boundaries(self):
+
+        domain = create_domain()
+        domain.set_time(2.0)
+
+        boundaries = [Reflective_boundary(domain),
+                      Dirichlet_boundary([0.4, 0.1, -0.1]),
+                      Time_boundary(domain, lambda t: [0.1*t, 0.0, 0.2]),
+                      Transmissive_momentum_set_stage_boundary(domain,
+                                                      lambda t: 0.1*t),
+                      Transmissive_stage_zero_momentum_boundary(domain),
+                      Dirichlet_discharge_boundary(domain, 0.3, 0.5),
+                      Inflow_boundary(domain, rate=2.0),
+                      Flather_external_stage_zero_velocity_boundary(domain,
+                                                      lambda t: 0.1*t)]
+
+        for B in boundaries:
+            domain.set_boundary({'left': B, 'right': B,
+                                 'top': B, 'bottom': B})
+            self.check_segment(domain, B)
+
+        # Only sets stage so can't be evaluated per edge
+        B = Time_stage_zero_momentum_boundary(domain, lambda t: 0.1*t)
+        B.evaluate_segment(domain, num.arange(len(domain.boundary_cells)))
+        assert num.allclose(domain.quantities['stage'].boundary_values, 0.2)
+        assert num.allclose(domain.quantities['xmomentum'].boundary_values, 0.0)
+
+
+    def test_segment_file_boundary(self):
+
+        tmpdir = tempfile.mkdtemp()
+        filename = create_sww_file(os.path.join(tmpdir, 'test_file_boundary'))
+
+        try:
+            domain = create_domain()
+            domain.set_time(0.75)
+
+            Bf = File_boundary(filename, domain)
+            self.check_segment(domain, Bf)
+
+            Bf = Field_boundary(filename, domain, mean_stage=0.3)
+            self.check_segment(domain, Bf)
+
+            # Beyond the end of the file the default boundary is used
+            Bd = Dirichlet_boundary([0.4, 0., 0.])
+            Bf = File_boundary(filename, domain, default_boundary=Bd)
+            domain.set_time(5.0)
+            self.check_segment(domain, Bf)
+            assert num.allclose(domain.quantities['stage'].boundary_values, 0.4)
+        finally:
+            os.remove(filename)
+            os.rmdir(tmpdir)
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_boundaries, 'test')
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as num
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+from anuga.shallow_water.boundaries import Reflective_boundary
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+        import Dirichlet_boundary
+from anuga.operators.collect_max_stage_operator \
+        import Collect_max_stage_operator
+from anuga.shallow_water.checkpoint import load_checkpoint_file, \
+     _get_checkpoint_times
+
+
+def create_domain(name, checkpoint_dir):
+
+    points, vertices, boundary = rectangular_cross(8, 8)
+
+    domain = Domain(points, vertices, boundary)
+    domain.set_name(name)
+    domain.set_store(False)
+    domain.set_quantity('elevation', lambda x,y: -x/2)
+    domain.set_quantity('stage', expression='elevation + 0.2')
+
+    Br = Reflective_boundary(domain)
+    Bd = Dirichlet_boundary([0.4, 0., 0.])
+    domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+    Collect_max_stage_operator(domain)
+
+    domain.set_checkpointing(checkpoint_dir=checkpoint_dir, checkpoint_step=1)
+
+    return domain
+
+
+class Test_checkpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp('_checkpoints')
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir)
+
+
+    def test_checkpoint_files(self):
+        """Static part written once, evolving state per checkpoint
+        """
+
+        domain = create_domain('test_checkpoint_files', self.checkpoint_dir)
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.3):
+            pass
+
+        filenames = os.listdir(self.checkpoint_dir)
+
+        static = [f for f in filenames if '_static_' in f]
+        manifests = [f for f in filenames if f.endswith('.manifest')]
+
+        assert len(static) == 1
+        assert len(manifests) == 4 # including initial time 0.0
+
+        state_dir = os.path.join(self.checkpoint_dir,
+                                 'test_checkpoint_files_0.3')
+        assert os.path.isdir(state_dir)
+
+        stage = num.load(os.path.join(state_dir, 'stage.centroid_values.npy'))
+        assert num.allclose(stage,
+                            domain.quantities['stage'].centroid_values)
+
+        # Evolved quantities only store centroid values
+        assert not os.path.exists(os.path.join(state_dir,
+                                               'stage.vertex_values.npy'))
+        assert os.path.exists(os.path.join(state_dir,
+                                           'elevation.vertex_values.npy'))
+
+
+    def test_restart_from_checkpoint(self):
+        """Restarting from a checkpoint should reproduce the original run
+        """
+
+        domain = create_domain('test_checkpoint_restart', self.checkpoint_dir)
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.4):
+            if t == 0.2:
+                stage_at_checkpoint = \
+                        domain.quantities['stage'].centroid_values.copy()
+
+        # Latest checkpoint
+        domain2 = load_checkpoint_file('test_checkpoint_restart',
+                                       self.checkpoint_dir)
+        assert num.allclose(domain2.get_time(), 0.4)
+        assert num.allclose(domain2.quantities['stage'].centroid_values,
+                            domain.quantities['stage'].centroid_values)
+
+        # Restart at earlier time and evolve to the end
+        domain3 = load_checkpoint_file('test_checkpoint_restart',
+                                       self.checkpoint_dir, time=0.2)
+        assert num.allclose(domain3.get_time(), 0.2)
+        assert num.allclose(domain3.quantities['stage'].centroid_values,
+                            stage_at_checkpoint)
+
+        for t in domain3.evolve(yieldstep=0.1, finaltime=0.4):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum', 'elevation']:
+            assert num.allclose(domain3.quantities[name].centroid_values,
+                                domain.quantities[name].centroid_values), name
+
+        # Operator state is restored and aliases kept
+        assert num.allclose(domain3.quantities['max_stage'].centroid_values,
+                            domain.quantities['max_stage'].centroid_values)
+
+        op = domain3.fractional_step_operators[-1]
+        assert op.stage_c is domain3.quantities['stage'].centroid_values
+
+        flux_integral = domain.get_boundary_flux_integral()
+        assert num.allclose(domain3.get_boundary_flux_integral(),
+                            flux_integral)
+
+
+    def test_checkpoint_times(self):
+
+        for name in ['test_times_1.0.manifest', 'test_times_0.5.manifest',
+                     'test_times_other_2.0.manifest', 'test_times_3.0.txt']:
+            open(os.path.join(self.checkpoint_dir, name), 'w').close()
+
+        times = _get_checkpoint_times('test_times', self.checkpoint_dir)
+        assert times == set([0.5, 1.0])
+
+        assert _get_checkpoint_times('test_none', self.checkpoint_dir) == set()
+
+
+    def test_missing_checkpoint(self):
+
+        try:
+            load_checkpoint_file('test_checkpoint_missing', self.checkpoint_dir)
+        except Exception:
+            pass
+        else:
+            raise Exception('Loading missing checkpoint should fail')
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_checkpoint, 'test')
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
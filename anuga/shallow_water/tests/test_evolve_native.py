@@ -0,0 +1,179 @@
+"""Test the C-resident evolve loop of the DE algorithms
+"""
+
+import unittest
+import warnings
+
+import numpy as num
+
+import anuga
+
+from anuga import Domain
+from anuga import rectangular_cross
+
+
+def create_domain(flow_algorithm, boundaries='native'):
+
+    points, vertices, boundary = rectangular_cross(10, 6, len1=10.0, len2=6.0)
+
+    domain = Domain(points, vertices, boundary)
+    domain.set_flow_algorithm(flow_algorithm)
+    domain.set_store(False)
+
+    domain.set_quantity('elevation', lambda x,y: -x/10 + 0.1*num.sin(y))
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', expression='elevation + 0.2')
+
+    Br = anuga.Reflective_boundary(domain)
+    Bd = anuga.Dirichlet_boundary([0.3, 0.1, 0.0])
+    Bt = anuga.Transmissive_boundary(domain)
+    Bs = anuga.Transmissive_stage_zero_momentum_boundary(domain)
+
+    if boundaries == 'native':
+        domain.set_boundary({'left': Bd, 'right': Bt, 'top': Br, 'bottom': Bs})
+    else:
+        Bf = anuga.Time_boundary(domain,
+                                 function=lambda t: [0.2 + 0.01*t, 0.0, 0.0])
+        domain.set_boundary({'left': Bf, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+class Test_evolve_native(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def evolve_both(self, flow_algorithm, boundaries='native',
+                    operator=False, native_steps=100):
+        """Evolve the same model with the Python and the native loop and
+        return both domains and the yield times
+        """
+
+        results = []
+        for n in [0, native_steps]:
+            domain = create_domain(flow_algorithm, boundaries)
+            domain.set_native_steps(n)
+            if operator:
+                anuga.Rate_operator(domain, rate=0.001)
+
+            times = []
+            for t in domain.evolve(yieldstep=0.5, finaltime=2.0):
+                times.append(t)
+
+            results.append((domain, times))
+
+        return results
+
+
+    def check_same(self, results):
+
+        (domain, times), (native_domain, native_times) = results
+
+        assert domain.can_evolve_native()
+        assert num.allclose(times, native_times)
+        assert num.allclose(times, [0.0, 0.5, 1.0, 1.5, 2.0])
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q = domain.quantities[name]
+            native_Q = native_domain.quantities[name]
+            assert num.allclose(Q.centroid_values, native_Q.centroid_values)
+            assert num.allclose(Q.edge_values, native_Q.edge_values)
+            assert num.allclose(Q.boundary_values, native_Q.boundary_values)
+
+        assert num.allclose(domain.get_boundary_flux_integral(),
+                            native_domain.get_boundary_flux_integral())
+        assert domain.number_of_steps == native_domain.number_of_steps
+        assert num.allclose(domain.recorded_min_timestep,
+                            native_domain.recorded_min_timestep)
+        assert num.allclose(domain.recorded_max_timestep,
+                            native_domain.recorded_max_timestep)
+
+
+    def test_native_euler(self):
+
+        results = self.evolve_both('DE0')
+        assert results[0][0].get_timestepping_method() == 'euler'
+
+        self.check_same(results)
+
+
+    def test_native_rk2(self):
+
+        results = self.evolve_both('DE1')
+        assert results[0][0].get_timestepping_method() == 'rk2'
+
+        self.check_same(results)
+
+
+    def test_native_python_callbacks(self):
+        """Python boundaries and operators are called from the native loop
+        """
+
+        for flow_algorithm in ['DE0', 'DE1']:
+            results = self.evolve_both(flow_algorithm, boundaries='python',
+                                       operator=True, native_steps=7)
+            self.check_same(results)
+
+            domain = results[1][0]
+            boundary_type, boundary_values, python_tags = \
+                           domain.get_native_boundaries()
+            assert python_tags == ['left']
+            ids = domain.tag_boundary_cells['left']
+            assert num.all(boundary_type[ids] == 0)
+            assert num.all(boundary_type[boundary_type > 0] == 1)
+
+
+    def test_native_steps(self):
+
+        domain = create_domain('DE0')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=1.0):
+            if t == 0.0:
+                steps = domain.evolve_steps_native(3)
+                assert steps == 3
+                assert domain.number_of_steps == 3
+                assert 0.0 < domain.get_time() < 1.0
+
+        # Stopped at the yield time
+        assert domain.get_time() == 1.0
+
+
+    def test_native_unsupported(self):
+        """Setups not supported natively use the Python evolve loop
+        """
+
+        domain = create_domain('DE2')
+        domain.set_native_steps(10)
+
+        assert domain.get_timestepping_method() == 'rk3'
+        assert not domain.can_evolve_native()
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+        assert domain.get_time() == 1.0
+
+        domain = create_domain('1_5')
+        assert not domain.can_evolve_native()
+
+        domain = create_domain('DE0')
+        domain.set_timestepping_method('rk3')
+        assert not domain.can_evolve_native()
+        try:
+            domain.evolve_steps_native(10)
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Expected AssertionError')
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_evolve_native, 'test')
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
@@ -8901,6 +8901,67 @@ friction  \n \
         domain.statistics()
         domain.get_extent()
 
+    def test_compact_storage(self):
+        """Compact storage does not change the flow and reduces memory
+        """
+
+        from anuga.operators.collect_max_stage_operator import \
+             Collect_max_stage_operator
+
+        def run(compact):
+            points, vertices, boundary = rectangular_cross(10, 10,
+                                                           len1=10.0,
+                                                           len2=10.0)
+            domain = Domain(points, vertices, boundary)
+            domain.set_store(False)
+            if compact:
+                domain.set_compact_storage()
+
+            domain.set_quantity('elevation', lambda x, y: -x/10.0)
+            domain.set_quantity('friction', 0.03)
+            domain.set_quantity('stage', expression='elevation + 0.5*(x<3)')
+            Collect_max_stage_operator(domain)
+
+            Br = Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br,
+                                 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+                pass
+
+            return domain
+
+        domain = run(False)
+        compact_domain = run(True)
+
+        assert compact_domain.get_compact_storage()
+        for name in ['stage', 'xmomentum', 'ymomentum', 'height']:
+            Q = compact_domain.get_quantity(name)
+            assert Q.get_precision() == num.float
+            assert num.allclose(Q.centroid_values,
+                                domain.get_quantity(name).centroid_values)
+
+        for name in ['x', 'y', 'max_stage']:
+            Q = compact_domain.get_quantity(name)
+            assert Q.get_precision() == num.float32
+            assert num.allclose(Q.centroid_values,
+                                domain.get_quantity(name).centroid_values,
+                                atol=1.0e-5)
+
+        def total(usage):
+            return sum([sum(arrays.values()) for arrays in usage.values()])
+
+        usage = compact_domain.get_memory_usage()
+        assert 'x_gradient' not in usage['x']
+        assert 'x_gradient' in usage['stage']
+        assert total(usage) < 0.75*total(domain.get_memory_usage())
+
+        msg = compact_domain.memory_statistics()
+        assert 'max_stage' in msg and 'float32' in msg
+
+        compact_domain.set_compact_storage(False)
+        assert compact_domain.get_quantity('x').get_precision() == num.float
+
 
 
 #################################################################################
@@ -395,6 +395,9 @@ class RiverWall:
             riverwall_rowIndex[riverwallInds].astype(int)
         # index of edges which are riverwalls 
         self.riverwall_edges=riverwallInds
+        # index into the above arrays for each riverwall edge of the domain
+        domain.edge_riverwall_index[:]=-1
+        domain.edge_riverwall_index[riverwallInds]=numpy.arange(len(riverwallInds))
 
         # Record the names of the riverwalls
         self.names=nw_names
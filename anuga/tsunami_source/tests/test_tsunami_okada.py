@@ -294,6 +294,46 @@ class Test_eq(unittest.TestCase):
         #print 'hello',stage   
         assert num.allclose(stage,tmp,atol=1.e-3)
 
+    def test_Okada_func_vectorised(self):
+        """The vectorised evaluation agrees with the point by point
+        evaluation, also when the points are blocked and the sub-faults
+        shared between processes
+        """
+        from anuga.abstract_2d_finite_volumes.mesh_factory \
+        import rectangular_cross
+        from anuga.abstract_2d_finite_volumes.quantity import Quantity
+
+        points, vertices, boundary = rectangular_cross(10, 10,
+                                               len1=100000, len2=100000)
+        domain = Domain(points, vertices, boundary)
+
+        zrec0 = Quantity(domain)
+        zrec0.set_values(-1000.0)
+        zrec = zrec0.get_vertex_values(xy=True)
+        x = zrec[0]
+        y = zrec[1]
+
+        # Sub-faults of various orientations, one with zero width
+        Ts = Okada_func(ns=3, NSMAX=3, length=[10.0, 20.0, 5.0],
+                        width=[6.0, 8.0, 0.0], dip=[15.0, 30.0, 90.0],
+                        x0=num.array([7000.0, 30000.0, 50000.0]),
+                        y0=num.array([10000.0, 40000.0, 60000.0]),
+                        strike=[0.0, 45.0, 300.0], depth=[15.0, 20.0, 10.0],
+                        slip=[10.0, 3.0, 1.0], rake=[90.0, 30.0, 0.0],
+                        zrec=zrec, vectorised=False)
+
+        z_scalar = num.array(Ts(x, y))
+        assert num.max(num.abs(z_scalar)) > 0.1
+
+        Ts.vectorised = True
+        z = Ts(x, y)
+        assert num.allclose(z, z_scalar, rtol=1.0e-10, atol=1.0e-12)
+
+        Ts.max_points = 50
+        Ts.processes = 2
+        z = Ts(x, y)
+        assert num.allclose(z, z_scalar, rtol=1.0e-10, atol=1.0e-12)
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -35,7 +35,8 @@ import anuga.utilities.log as log
 
 def earthquake_tsunami(ns,NSMAX,length, width, strike, depth,\
                        dip, xi, yi,z0, slip, rake,\
-                       domain=None, verbose=False):
+                       domain=None, verbose=False,
+                       vectorised=True, processes=1, max_points=50000):
 
     from anuga.abstract_2d_finite_volumes.quantity import Quantity
     from math import sin, radians
@@ -83,7 +84,9 @@ def earthquake_tsunami(ns,NSMAX,length, width, strike, depth,\
 
     return Okada_func(ns=ns,NSMAX=NSMAX,length=length, width=width, dip=dip, \
                       x0=x0, y0=y0, strike=strike, depth=depth, \
-                      slip=slip, rake=rake, zrec=zrec)
+                      slip=slip, rake=rake, zrec=zrec,
+                      vectorised=vectorised, processes=processes,
+                      max_points=max_points)
 
 #
 # Okada class
@@ -106,13 +109,19 @@ Optional
  y0      y origin (0)
  slip    metres of fault slip (1)
  rake    angle of slip (w.r.t. horizontal) in fault plane (90 degrees)
+ vectorised  evaluate all points at once for each sub-fault with numpy
+             (True). Otherwise, or if there are point sources, the
+             original point by point implementation is used.
+ processes   number of processes the sub-faults are shared between (1)
+ max_points  number of points evaluated at once (50000), bounds memory
 
 """
 
 class Okada_func:
 
     def __init__(self, ns,NSMAX,length, width, dip, x0, y0, strike, \
-                     depth, slip, rake,zrec):
+                     depth, slip, rake,zrec,
+                     vectorised=True, processes=1, max_points=50000):
         self.dip = dip
         self.length = length
         self.width = width
@@ -124,6 +133,9 @@ class Okada_func:
         self.rake = rake
         self.ns=ns
         self.zrec=zrec
+        self.vectorised=vectorised
+        self.processes=processes
+        self.max_points=max_points
         
     def __call__(self, x, y):
         """Make Okada_func a callable object.
@@ -132,6 +144,113 @@ class Okada_func:
         the initial 3D distribution of water heights at the points (x,y,z)
         produced by a submarine mass failure.
         """
+
+        subfaults = self.get_subfaults()
+
+        if self.vectorised and subfaults is not None:
+            return self.vectorised_call(x, y, subfaults)
+        else:
+            return self.scalar_call(x, y)
+
+    def get_subfaults(self):
+        """Return list of sub-fault parameters in Okada's system
+        (xs, ys, strike, dip, depth, AL2, AW1, DISL1, DISL2) as used by
+        scalar_call or None if there are point sources.
+        """
+        from math import sin, cos, radians
+
+        def as_array(value):
+            return num.resize(num.array(value, num.float), self.ns)
+
+        # The x and y axes are swapped as in scalar_call
+        xs = as_array(self.y0)
+        ys = as_array(self.x0)
+        strikes = as_array(self.strike)
+        dips = as_array(self.dip)
+        depths = as_array(self.depth)
+        lengths = as_array(self.length)
+        widths = as_array(self.width)
+        slips = as_array(self.slip)
+        rakes = as_array(self.rake)
+
+        eps = 1.0e-6
+        subfaults = []
+        for ist in range(self.ns):
+            if lengths[ist] == 0 and widths[ist] == 0:
+                return None
+
+            ra = radians(rakes[ist])
+            AL2 = lengths[ist]
+            AW1 = -widths[ist]
+            DISL1 = slips[ist]*cos(ra)
+            DISL2 = slips[ist]*sin(ra)
+            if lengths[ist] == 0:
+                AL2 = widths[ist]*eps
+                DISL1 = DISL1/AL2
+                DISL2 = DISL2/AL2
+            elif widths[ist] == 0.0:
+                AW1 = -lengths[ist]*eps
+                DISL1 = DISL1/(-AW1)
+                DISL2 = DISL2/(-AW1)
+
+            subfaults.append((xs[ist], ys[ist], strikes[ist], dips[ist],
+                              depths[ist], AL2, AW1, DISL1, DISL2))
+
+        return subfaults
+
+    def get_receiver_depth(self, x, y):
+        """Depth Z (km, negative) of the receivers as found by
+        scalar_call: the elevation of the first vertex in zrec whose x
+        coordinate is one of x and whose y coordinate is one of y.
+        """
+
+        zrec = self.zrec
+        found = num.flatnonzero(num.in1d(zrec[0], x) & num.in1d(zrec[1], y))
+        if len(found) == 0:
+            msg = 'Elevation of Okada receivers not found in zrec'
+            raise Exception, msg
+
+        return 0.001*zrec[2][found[0]]
+
+    def vectorised_call(self, x, y, subfaults):
+        """Vertical displacement at points x, y from finite sub-faults
+
+        The points are evaluated in blocks of max_points against each
+        sub-fault. With processes > 1 the sub-faults are shared between a
+        pool of processes whose displacements are summed.
+        """
+
+        x = num.array(x, num.float)
+        y = num.array(y, num.float)
+        assert len(x) == len(y)
+
+        Z = self.get_receiver_depth(x, y)
+
+        processes = min(self.processes, len(subfaults))
+        if processes <= 1:
+            z = _okada_subfaults_uz(y, x, Z, subfaults, self.max_points)
+        else:
+            from multiprocessing import Pool
+
+            pool = Pool(processes, _init_okada_worker, (y, x, Z,
+                                                        self.max_points))
+            try:
+                results = [pool.apply_async(_okada_worker_uz,
+                                            (subfaults[i::processes],))
+                           for i in range(processes)]
+
+                z = num.zeros(len(x), num.float)
+                for result in results:
+                    z += result.get()
+            finally:
+                pool.terminate()
+                pool.join()
+
+        return z
+
+    def scalar_call(self, x, y):
+        """Original point by point evaluation of __call__"""
+
         from string import replace,strip
         from math import sin, cos, radians, exp, cosh
         #ensure vectors x and y have the same length
@@ -1883,3 +2002,234 @@ class Okada_func:
 
 
   
+
+
+#
+# Vectorised Okada kernel
+#
+
+"""Vertical displacement of DC3D evaluated for arrays of receivers.
+
+Only UZ of finite sources with strike- and dip-slip (DISL3 == 0) is
+computed, which is all Okada_func uses, following the same steps as
+DC3D, DCCON2, UA, UB and UC.
+"""
+
+_okada_worker = None
+
+def _init_okada_worker(xrec, yrec, Z, max_points):
+
+    global _okada_worker
+    _okada_worker = (xrec, yrec, Z, max_points)
+
+
+def _okada_worker_uz(subfaults):
+
+    xrec, yrec, Z, max_points = _okada_worker
+    return _okada_subfaults_uz(xrec, yrec, Z, subfaults, max_points)
+
+
+def _okada_subfaults_uz(xrec, yrec, Z, subfaults, max_points=50000,
+                        ALPHA=0.5):
+    """Sum of UZ at receivers xrec, yrec (m, Okada's axes) at depth Z (km)
+    over subfaults as returned by Okada_func.get_subfaults.
+
+    The receivers are processed in blocks of max_points.
+    """
+    from math import sin, cos, radians
+
+    N = len(xrec)
+    uz = num.zeros(N, num.float)
+    for start in range(0, N, max_points):
+        stop = min(start + max_points, N)
+        for xs, ys, strike, dip, depth, AL2, AW1, DISL1, DISL2 in subfaults:
+            st = radians(strike)
+            csst = cos(st)
+            ssst = sin(st)
+
+            X = 0.001*((xrec[start:stop]-xs)*csst+(yrec[start:stop]-ys)*ssst)
+            Y = 0.001*((xrec[start:stop]-xs)*ssst-(yrec[start:stop]-ys)*csst)
+
+            UZ, singular = _dc3d_uz(ALPHA, X, Y, Z, depth, dip,
+                                    0.0, AL2, AW1, 0.0, DISL1, DISL2)
+            if num.any(singular):
+                log.critical('There is a problem in Okada subroutine! '
+                             '%d receivers on a fault edge'
+                             % num.sum(singular))
+
+            uz[start:stop] += UZ
+
+    return uz
+
+
+def _dc3d_uz(ALPHA, X, Y, Z, DEPTH, DIP, AL1, AL2, AW1, AW2, DISL1, DISL2):
+    """UZ of DC3D for arrays X, Y of receivers
+
+    Return UZ and a boolean array marking the singular receivers (IRET=1),
+    for which UZ is 0.
+    """
+    from math import sin, cos
+
+    F0 = 0.0
+    EPS = 1.0e-6
+
+    # DCCON0
+    ALP = ((1.0-ALPHA)/2.0, ALPHA/2.0, (1.0-ALPHA)/ALPHA, 1.0-ALPHA, ALPHA)
+    P18 = 6.283185307179586/360.0
+    SD = sin(DIP*P18)
+    CD = cos(DIP*P18)
+    if abs(CD) < EPS:
+        CD = F0
+        if SD > F0: SD = 1.0
+        if SD < F0: SD = -1.0
+
+    XI = [X-AL1, X-AL2]
+    for J in range(2):
+        XI[J] = num.where(abs(XI[J]) < EPS, F0, XI[J])
+
+    U = num.zeros(X.shape, num.float)
+    singular = num.zeros(X.shape, num.bool)
+
+    for image in [False, True]:
+        if image:
+            D = DEPTH-Z
+        else:
+            D = DEPTH+Z
+        P = Y*CD+D*SD
+        Q = Y*SD-D*CD
+        ET = [P-AW1, P-AW2]
+        Q = num.where(abs(Q) < EPS, F0, Q)
+        for K in range(2):
+            ET[K] = num.where(abs(ET[K]) < EPS, F0, ET[K])
+
+        # Reject singular case: on fault edge
+        singular |= (Q == F0) & \
+                    (((XI[0]*XI[1] < F0) & (ET[0]*ET[1] == F0)) |
+                     ((ET[0]*ET[1] < F0) & (XI[0]*XI[1] == F0)))
+
+        # On negative extension of fault edge
+        R12 = num.sqrt(XI[0]*XI[0]+ET[1]*ET[1]+Q*Q)
+        R21 = num.sqrt(XI[1]*XI[1]+ET[0]*ET[0]+Q*Q)
+        R22 = num.sqrt(XI[1]*XI[1]+ET[1]*ET[1]+Q*Q)
+        KXI = [(XI[0] < F0) & (R21+XI[1] < EPS),
+               (XI[0] < F0) & (R22+XI[1] < EPS)]
+        KET = [(ET[0] < F0) & (R12+ET[1] < EPS),
+               (ET[0] < F0) & (R22+ET[1] < EPS)]
+
+        for K in range(2):
+            for J in range(2):
+                DU = _okada_corner_uz(XI[J], ET[K], Q, Z, SD, CD,
+                                      KXI[K], KET[J], ALP,
+                                      DISL1, DISL2, image)
+                if (J+K) != 1:
+                    U += DU
+                else:
+                    U -= DU
+
+    U[singular] = F0
+
+    return U, singular
+
+
+def _okada_corner_uz(XI, ET, Q, Z, SD, CD, KXI, KET, ALP,
+                     DISL1, DISL2, image):
+    """Contribution of one corner of the fault to UZ: DCCON2 followed by
+    the displacement terms of UA (and UB, UC for the image source).
+
+    Where R == 0 DCCON2 leaves the geometry undefined; the contribution
+    of such a corner is taken as 0.
+    """
+
+    F0 = 0.0
+    F1 = 1.0
+    F2 = 2.0
+    PI2 = 6.283185307179586
+    EPS = 1.0e-6
+    ALP1, ALP2, ALP3, ALP4, ALP5 = ALP
+
+    err = num.seterr(divide='ignore', invalid='ignore')
+    try:
+        # DCCON2
+        XI = num.where(abs(XI) < EPS, F0, XI)
+        ET = num.where(abs(ET) < EPS, F0, ET)
+        Q = num.where(abs(Q) < EPS, F0, Q)
+        XI2 = XI*XI
+        ET2 = ET*ET
+        Q2 = Q*Q
+        R2 = XI2+ET2+Q2
+        R = num.sqrt(R2)
+        R3 = R*R2
+        Y = ET*CD+Q*SD
+        D = ET*SD-Q*CD
+
+        TT = num.where(Q == F0, F0, num.arctan(XI*ET/(Q*R)))
+
+        RXI = R+XI
+        ALX = num.where(KXI, -num.log(R-XI), num.log(RXI))
+        X11 = num.where(KXI, F0, F1/(R*RXI))
+        X32 = num.where(KXI, F0, (R+RXI)*X11*X11/R)
+
+        RET = R+ET
+        ALE = num.where(KET, -num.log(R-ET), num.log(RET))
+        Y11 = num.where(KET, F0, F1/(R*RET))
+        Y32 = num.where(KET, F0, (R+RET)*Y11*Y11/R)
+
+        QX = Q*X11
+        QY = Q*Y11
+
+        # UA: y and z displacements
+        UY = F0
+        UZ = F0
+        if DISL1 != F0:
+            UY = UY + DISL1/PI2*(ALP2*Q/R)
+            UZ = UZ + DISL1/PI2*(ALP1*ALE-ALP2*Q*QY)
+        if DISL2 != F0:
+            UY = UY + DISL2/PI2*(TT/F2+ALP2*ET*QX)
+            UZ = UZ + DISL2/PI2*(ALP1*ALX-ALP2*Q*QX)
+
+        if not image:
+            DU = -UY*SD-UZ*CD
+        else:
+            # UB
+            RD = R+D
+            if CD != F0:
+                X = num.sqrt(XI2+Q2)
+                AI4 = num.where(XI == F0, F0,
+                                F1/(CD*CD)*(XI/RD*SD*CD
+                                + F2*num.arctan((ET*(X+Q*CD)+X*(R+X)*SD)
+                                                /(XI*(R+X)*CD))))
+                AI3 = (Y*CD/RD-ALE+SD*num.log(RD))/(CD*CD)
+            else:
+                RD2 = RD*RD
+                AI3 = (ET/RD+Y*Q/RD2-ALE)/F2
+                AI4 = XI*Y/RD2/F2
+            AI2 = num.log(RD)+AI3*SD
+
+            if DISL1 != F0:
+                UY = UY + DISL1/PI2*(-Q/R+ALP3*Y/RD*SD)
+                UZ = UZ + DISL1/PI2*(Q*QY-ALP3*AI2*SD)
+            if DISL2 != F0:
+                UY = UY + DISL2/PI2*(-ET*QX-TT-ALP3*XI/RD*SD*CD)
+                UZ = UZ + DISL2/PI2*(Q*QX+ALP3*AI4*SD*CD)
+
+            # UC
+            C = D+Z
+            H = Q*CD-Z
+            Z32 = SD/R3-H*Y32
+            XY = XI*Y11
+
+            UCY = F0
+            UCZ = F0
+            if DISL1 != F0:
+                UCY = UCY + DISL1/PI2*(ALP4*(CD/R+F2*QY*SD)-ALP5*C*Q/R3)
+                UCZ = UCZ + DISL1/PI2*(ALP4*QY*CD
+                                       -ALP5*(C*ET/R3-Z*Y11+XI2*Z32))
+            if DISL2 != F0:
+                UCY = UCY + DISL2/PI2*(ALP4*Y*X11-ALP5*C*ET*Q*X32)
+                UCZ = UCZ + DISL2/PI2*(-D*X11-XY*SD-ALP5*C*(X11-Q2*X32))
+
+            DU = (UY-Z*UCY)*SD+(UZ-Z*UCZ)*CD
+    finally:
+        num.seterr(**err)
+
+    return num.where(R == F0, F0, DU)
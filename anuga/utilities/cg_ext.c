@@ -214,6 +214,107 @@ int _jacobi_precon_c(double* data,
 
 }
 
+// Store iteration statistics of a solve
+// @input stats: NULL or double vector of length 3
+//        i: number of iterations
+//        rTr0: initial residual
+//        rTr: final residual
+void set_stats(double * stats, int i, double rTr0, double rTr){
+  if (stats != NULL){
+    stats[0] = i;
+    stats[1] = rTr0;
+    stats[2] = rTr;
+  }
+}
+
+// Incomplete Cholesky factorisation IC(0): A ~ L*L^T where L has the
+// sparsity pattern of the lower triangle of A. Done in place on the lower
+// triangle of A, given in CSR format with the columns of each row sorted
+// and the diagonal entry last.
+//
+// Pivots which are not positive (the factorisation breaks down) are
+// replaced by the diagonal entry of A, i.e. Jacobi for that row.
+// @input data: double vector with the lower triangle of A, overwritten by L
+//        colind: long vector of column indicies
+//        row_ptr: long vector giving index of rows
+//        M: number of rows
+// @return: number of replaced pivots
+int _ic_factor_c(double* data,
+                long* colind,
+                long* row_ptr,
+                int M){
+
+  long i, j, k, m, n;
+  double value, diag;
+  int replaced = 0;
+
+  for (i=0; i<M; i++){
+    for (k=row_ptr[i]; k<row_ptr[i+1]; k++){
+      j = colind[k];
+      value = data[k];
+
+      // Subtract L[i,:j].L[j,:j] over the common pattern of rows i and j
+      m = row_ptr[i];
+      n = row_ptr[j];
+      while (m < k && n < row_ptr[j+1]-1){
+        if (colind[m] == colind[n]){
+          value -= data[m]*data[n];
+          m++;
+          n++;
+        } else if (colind[m] < colind[n]){
+          m++;
+        } else {
+          n++;
+        }
+      }
+
+      if (j < i){
+        data[k] = value/data[row_ptr[j+1]-1];
+      } else {
+        diag = value;
+        if (diag <= 0.0){
+          diag = fabs(data[k]);
+          if (diag == 0.0) diag = 1.0;
+          replaced++;
+        }
+        data[k] = sqrt(diag);
+      }
+    }
+  }
+
+  return replaced;
+}
+
+// Incomplete Cholesky preconditioner: z = (L*L^T)^-1 r
+// @input z: double vector to store the result
+//        data, colind, row_ptr: L in CSR format as computed by _ic_factor_c
+//        r: double vector to be preconditioned
+//        M: length of vector r
+void zLinx(double * z, double * data, long * colind, long * row_ptr,
+           double * r, int M){
+
+  long i, ckey, diag;
+
+  // Forward substitution L y = r
+  for (i=0; i<M; i++){
+    z[i] = r[i];
+    diag = row_ptr[i+1]-1;
+    for (ckey=row_ptr[i]; ckey<diag; ckey++){
+      z[i] -= data[ckey]*z[colind[ckey]];
+    }
+    z[i] = z[i]/data[diag];
+  }
+
+  // Backward substitution L^T z = y, going through L by rows
+  for (i=M-1; i>=0; i--){
+    diag = row_ptr[i+1]-1;
+    z[i] = z[i]/data[diag];
+    for (ckey=row_ptr[i]; ckey<diag; ckey++){
+      z[colind[ckey]] -= data[ckey]*z[i];
+    }
+  }
+}
+
 // Conjugate gradient solve Ax = b for x, A given in Sparse CSR format
 // @input data: double vector with non-zero entries of A
 //        colind: long vector of column indicies of non-zero entries of A
@@ -223,6 +324,8 @@ int _jacobi_precon_c(double* data,
 //        imax: maximum number of iterations
 //        tol: error tollerance for stopping criteria
 //        M: length of vectors x and b
+//        stats: NULL or double vector of length 3 to store the number of
+//               iterations and the initial and final residuals rTr
 // @return: 0 on success  
 int _cg_solve_c(double* data, 
                 long* colind,
@@ -232,7 +335,8 @@ int _cg_solve_c(double* data,
                 int imax,
                 double tol,
                 double a_tol,
-                int M){
+                int M,
+                double * stats){
 
   int i = 1;
   double alpha,rTr,rTrOld,bt,rTr0;
@@ -267,6 +371,8 @@ int _cg_solve_c(double* data,
     i=i+1;
 
   }
+
+  set_stats(stats,i,rTr0,rTr);
   
   free(d);
   free(r);
@@ -294,6 +400,7 @@ int _cg_solve_c(double* data,
 //        tol: error tollerance for stopping criteria
 //        M: length of vectors x and b
 //        precon: diagonal preconditioner given as vector
+//        stats: NULL or double vector of length 3 (see _cg_solve_c)
 // @return: 0 on success  
 int _cg_solve_c_precon(double* data, 
                 long* colind,
@@ -304,7 +411,8 @@ int _cg_solve_c_precon(double* data,
                 double tol,
                 double a_tol,
                 int M,
-                double * precon){
+                double * precon,
+                double * stats){
 
   int i = 1;
   double alpha,rTr,rTrOld,bt,rTr0;
@@ -343,6 +451,9 @@ int _cg_solve_c_precon(double* data,
     i=i+1;
 
   }
+
+  set_stats(stats,i,rTr0,rTr);
+
   free(temp);
   free(rhat);
   free(d);
@@ -360,10 +471,242 @@ int _cg_solve_c_precon(double* data,
 
 }       
 
+// Conjugate gradient solve Ax = b for x, A given in Sparse CSR format,
+// using the incomplete Cholesky factor L computed by _ic_factor_c as
+// preconditioner.
+// @input data, colind, row_ptr: A in CSR format
+//        b: double vector specifying right hand side of equation to solve
+//        x: double vector with initial guess and to store result
+//        imax: maximum number of iterations
+//        tol: error tollerance for stopping criteria
+//        M: length of vectors x and b
+//        L_data, L_colind, L_row_ptr: L in CSR format
+//        stats: NULL or double vector of length 3 (see _cg_solve_c)
+// @return: 0 on success
+int _cg_solve_c_ic(double* data,
+                long* colind,
+                long* row_ptr,
+                double * b,
+                double * x,
+                int imax,
+                double tol,
+                double a_tol,
+                int M,
+                double * L_data,
+                long * L_colind,
+                long * L_row_ptr,
+                double * stats){
+
+  int i = 1;
+  double alpha,rTr,rTrOld,bt,rTr0;
+
+  double * d = malloc(sizeof(double)*M);
+  double * r = malloc(sizeof(double)*M);
+  double * q = malloc(sizeof(double)*M);
+  double * rhat = malloc(sizeof(double)*M);
+
+  zaAxpy(r,-1.0,data,colind,row_ptr,x,b,M);
+  zLinx(rhat,L_data,L_colind,L_row_ptr,r,M);
+  dcopy(M,rhat,d);
+
+  rTr=ddot(M,r,rhat);
+  rTr0 = rTr;
+
+  while((i<imax) && (rTr>pow(tol,2)*rTr0) && (rTr > pow(a_tol,2))){
+
+    zAx(q,data,colind,row_ptr,d,M);
+    alpha = rTr/ddot(M,d,q);
+    daxpy(M,alpha,d,x);
+
+    daxpy(M,-alpha,q,r);
+    zLinx(rhat,L_data,L_colind,L_row_ptr,r,M);
+    rTrOld = rTr;
+    rTr = ddot(M,r,rhat);
+
+    bt= rTr/rTrOld;
+
+    dscal(M,bt,d);
+    daxpy(M,1.0,rhat,d);
+
+    i=i+1;
+
+  }
+
+  set_stats(stats,i,rTr0,rTr);
+
+  free(rhat);
+  free(d);
+  free(r);
+  free(q);
+
+  if (i>=imax){
+    return -1;
+  }
+  else{
+    return 0;
+  }
+}
+
 		     
 /////////////////////////////////////////////////
 // Gateways to Python
 
+// Extract the three arrays making up a sparse matrix in CSR format.
+// New references are returned in data, colind and row_ptr.
+// @return: 0 on success
+int get_csr_arrays(PyObject *csr_sparse,
+                   PyArrayObject **data,
+                   PyArrayObject **colind,
+                   PyArrayObject **row_ptr){
+
+  *data = (PyArrayObject*) PyObject_GetAttrString(csr_sparse, "data");
+  *colind = (PyArrayObject*) PyObject_GetAttrString(csr_sparse, "colind");
+  *row_ptr = (PyArrayObject*) PyObject_GetAttrString(csr_sparse, "row_ptr");
+
+  if (!*data || !*colind || !*row_ptr) {
+    Py_XDECREF(*data);
+    Py_XDECREF(*colind);
+    Py_XDECREF(*row_ptr);
+    PyErr_SetString(PyExc_RuntimeError,
+        "Sparse CSR arrays could not be read");
+    return -1;
+  }
+
+  return 0;
+}
+
+// Pointer to data of optional stats array or NULL
+double * stats_pointer(PyObject *stats){
+  if (stats == NULL || stats == Py_None){
+    return NULL;
+  }
+  return (double *) ((PyArrayObject *) stats)->data;
+}
+
+PyObject *ic_factor_c(PyObject *self, PyObject *args){
+
+  int M, replaced;
+  PyObject *csr_sparse; // lower triangle of matrix, factorised in place
+  PyArrayObject *data, *colind, *row_ptr;
+
+  // Convert Python arguments to C
+  if (!PyArg_ParseTuple(args, "O", &csr_sparse)) {
+    PyErr_SetString(PyExc_RuntimeError, "ic_factor_c could not parse input");
+    return NULL;
+  }
+
+  if (get_csr_arrays(csr_sparse, &data, &colind, &row_ptr) != 0) {
+    return NULL;
+  }
+
+  M = (row_ptr -> dimensions[0])-1;
+
+  replaced = _ic_factor_c((double*) data->data,
+                (long*) colind->data,
+                (long*) row_ptr->data,
+                M);
+
+  Py_DECREF(data);
+  Py_DECREF(colind);
+  Py_DECREF(row_ptr);
+
+  return Py_BuildValue("i", replaced);
+}
+
+PyObject *ic_solve_c(PyObject *self, PyObject *args){
+
+  int M;
+  PyObject *csr_sparse; // incomplete Cholesky factor L
+  PyArrayObject *data, *colind, *row_ptr,
+    *r,                 // vector to be preconditioned
+    *z;                 // result
+
+  // Convert Python arguments to C
+  if (!PyArg_ParseTuple(args, "OOO", &csr_sparse, &r, &z)) {
+    PyErr_SetString(PyExc_RuntimeError, "ic_solve_c could not parse input");
+    return NULL;
+  }
+
+  if (get_csr_arrays(csr_sparse, &data, &colind, &row_ptr) != 0) {
+    return NULL;
+  }
+
+  M = (row_ptr -> dimensions[0])-1;
+
+  zLinx((double *) z->data,
+        (double*) data->data,
+        (long*) colind->data,
+        (long*) row_ptr->data,
+        (double *) r->data,
+        M);
+
+  Py_DECREF(data);
+  Py_DECREF(colind);
+  Py_DECREF(row_ptr);
+
+  return Py_BuildValue("");
+}
+
+PyObject *cg_solve_c_ic(PyObject *self, PyObject *args) {
+
+  PyObject *csr_sparse; // input sparse matrix (must be CSR format)
+  PyObject *csr_factor; // incomplete Cholesky factor (CSR format)
+  PyObject *stats = NULL;
+
+  int imax,M,err,bcols;
+  double tol,a_tol;
+
+  PyArrayObject
+    *data, *colind, *row_ptr,           // A
+    *L_data, *L_colind, *L_row_ptr,     // L
+    *x0,               //Initial guess - and sotrage of result.
+    *b;                //Right hand side
+
+  // Convert Python arguments to C
+  if (!PyArg_ParseTuple(args, "OOOiddiO|O", &csr_sparse, &x0, &b, &imax,
+                        &tol, &a_tol, &bcols, &csr_factor, &stats)) {
+    PyErr_SetString(PyExc_RuntimeError, "cg_solve_c_ic could not parse input");
+    return NULL;
+  }
+
+  if (get_csr_arrays(csr_sparse, &data, &colind, &row_ptr) != 0) {
+    return NULL;
+  }
+
+  if (get_csr_arrays(csr_factor, &L_data, &L_colind, &L_row_ptr) != 0) {
+    Py_DECREF(data);
+    Py_DECREF(colind);
+    Py_DECREF(row_ptr);
+    return NULL;
+  }
+
+  M = (row_ptr -> dimensions[0])-1;
+
+  // Solve system using preconditioned conjugate gradient
+  err = _cg_solve_c_ic((double*) data->data,
+                (long*) colind->data,
+                (long*) row_ptr->data,
+                (double *) b->data,
+                (double *) x0->data,
+                imax,
+                tol,
+                a_tol,
+                M,
+                (double*) L_data->data,
+                (long*) L_colind->data,
+                (long*) L_row_ptr->data,
+                stats_pointer(stats));
+
+  Py_DECREF(data);
+  Py_DECREF(colind);
+  Py_DECREF(row_ptr);
+  Py_DECREF(L_data);
+  Py_DECREF(L_colind);
+  Py_DECREF(L_row_ptr);
+
+  return Py_BuildValue("i",err);
+}
+
 PyObject *jacobi_precon_c(PyObject *self, PyObject *args){
 
   int M,err,bcols;
@@ -430,6 +773,7 @@ PyObject *cg_solve_c(PyObject *self, PyObject *args) {
   
   
   PyObject *csr_sparse; // input sparse matrix (must be CSR format)
+  PyObject *stats = NULL; // optional vector for iteration statistics
  
   int imax,M,err,bcols;
   double tol,a_tol;
@@ -443,7 +787,7 @@ PyObject *cg_solve_c(PyObject *self, PyObject *args) {
 
   
   // Convert Python arguments to C  
-  if (!PyArg_ParseTuple(args, "OOOiddi", &csr_sparse, &x0, &b, &imax, &tol, &a_tol, &bcols)) {
+  if (!PyArg_ParseTuple(args, "OOOiddi|O", &csr_sparse, &x0, &b, &imax, &tol, &a_tol, &bcols, &stats)) {
     PyErr_SetString(PyExc_RuntimeError, "cg_solve_c could not parse input");  
     return NULL;
   }
@@ -483,7 +827,8 @@ PyObject *cg_solve_c(PyObject *self, PyObject *args) {
                 imax,
                 tol,
                 a_tol,
-                M);
+                M,
+                stats_pointer(stats));
   
   // Free extra references to sparse matrix parts
   Py_DECREF(data);    
@@ -497,6 +842,7 @@ PyObject *cg_solve_c_precon(PyObject *self, PyObject *args) {
   
   
   PyObject *csr_sparse; // input sparse matrix (must be CSR format)
+  PyObject *stats = NULL; // optional vector for iteration statistics
  
   int imax,M,err,bcols;
   double tol,a_tol;
@@ -511,7 +857,7 @@ PyObject *cg_solve_c_precon(PyObject *self, PyObject *args) {
 
   
   // Convert Python arguments to C  
-  if (!PyArg_ParseTuple(args, "OOOiddiO", &csr_sparse, &x0, &b, &imax, &tol, &a_tol, &bcols, &precon)) {
+  if (!PyArg_ParseTuple(args, "OOOiddiO|O", &csr_sparse, &x0, &b, &imax, &tol, &a_tol, &bcols, &precon, &stats)) {
     PyErr_SetString(PyExc_RuntimeError, "cg_solve_c_precon could not parse input");  
     return NULL;
   }
@@ -552,7 +898,8 @@ PyObject *cg_solve_c_precon(PyObject *self, PyObject *args) {
                 tol,
                 a_tol,
                 M,
-                (double *) precon->data);
+                (double *) precon->data,
+                stats_pointer(stats));
   
   // Free extra references to sparse matrix parts
   Py_DECREF(data);    
@@ -569,6 +916,9 @@ static struct PyMethodDef MethodTable[] = {
   {"cg_solve_c", cg_solve_c, METH_VARARGS, "Print out"},
   {"cg_solve_c_precon", cg_solve_c_precon, METH_VARARGS, "Print out"},
   {"jacobi_precon_c", jacobi_precon_c, METH_VARARGS, "Print out"},    
+  {"cg_solve_c_ic", cg_solve_c_ic, METH_VARARGS, "Print out"},
+  {"ic_factor_c", ic_factor_c, METH_VARARGS, "Print out"},
+  {"ic_solve_c", ic_solve_c, METH_VARARGS, "Print out"},
   {NULL, NULL, 0, NULL}   /* sentinel */
 };
 
@@ -12,6 +12,9 @@ from anuga.utilities.sparse import Sparse, Sparse_CSR
 from cg_ext import cg_solve_c
 from cg_ext import cg_solve_c_precon
 from cg_ext import jacobi_precon_c
+from cg_ext import cg_solve_c_ic
+from cg_ext import ic_factor_c
+from cg_ext import ic_solve_c
 
 
 class Stats:
@@ -34,8 +37,9 @@ class Stats:
 # additional argument 'use_c_cg' solve, which instead of using the current
 # python implementation calls a c implementation of the cg algorithm. This
 # has not been tested when trying to perform the cg routine on multiple
-# quantities, but should work. No stats are currently returned by the c
-# function.
+# quantities, but should work. The c function returns the number of
+# iterations and the initial and final residuals, the remaining stats are
+# computed here.
 # Note Padarn 26/11/12: Further note that to use the c routine, the matrix
 # A must currently be in the sparse_csr format implemented in anuga.util.sparse
 
@@ -49,6 +53,16 @@ def conjugate_gradient(A, b, x0=None, imax=10000, tol=1.0e-8, atol=1.0e-14,
 
     If b is an array, solve it as if it was a set of vectors, solving each
     vector.
+
+    precon: 'None', 'Jacobi' or 'IC' (incomplete Cholesky). The
+            preconditioners require A to be of type Sparse_CSR.
+
+    x0 is used as initial guess (warm start) if given. Otherwise the
+    preconditioned and the c solvers start from b, the python solver
+    from the 0 vector.
+
+    If output_stats is True the Stats of the last column solved are
+    returned as well.
     """
     
     if use_c_cg:
@@ -57,64 +71,51 @@ def conjugate_gradient(A, b, x0=None, imax=10000, tol=1.0e-8, atol=1.0e-14,
                 be of type %s') % (str(Sparse_CSR))
         assert isinstance(A, Sparse_CSR), msg
 
+    b = num.array(b, dtype=num.float)
+
     if x0 is None:
-        x0 = num.zeros(b.shape, dtype=num.float)
+        if precon != 'None' or (use_c_cg and len(b.shape) == 1):
+            x0 = b.copy()
+        else:
+            x0 = num.zeros(b.shape, dtype=num.float)
     else:
         x0 = num.array(x0, dtype=num.float)
 
-    b = num.array(b, dtype=num.float)
-
     err = 0
+    stats = None
 
     # preconditioner 
-    # Padarn Note: currently a fairly lazy implementation, needs fixing
     M = None
     if precon == 'Jacobi':
-
         M = num.zeros(b.shape[0])
         jacobi_precon_c(A, M)
-        x0 = b.copy()     
-
-        if len(b.shape) != 1:   
+    elif precon == 'IC':
+        M = incomplete_cholesky(A)
+    elif precon != 'None':
+        msg = 'Unknown preconditioner %s' % str(precon)
+        raise PreconditionerError, msg
 
-            for i in range(b.shape[1]): 
+    if len(b.shape) != 1:
 
-                if not use_c_cg:
-                    x0[:, i], stats = _conjugate_gradient_preconditioned(A, b[:, i], x0[:, i], M,
-                                               imax, tol, atol, iprint, Type="Jacobi")
-                else:
-                    # need to copy into new array to ensure contiguous access
-                    xnew = x0[:, i].copy()
-                    err = cg_solve_c_precon(A, xnew, b[:, i].copy(), imax, tol, atol, b.shape[1], M)
-                    x0[:, i] = xnew
-        else:
+        for i in range(b.shape[1]):
 
             if not use_c_cg:
-                x0, stats = _conjugate_gradient_preconditioned(A, b, x0, M, imax, tol, atol, iprint, Type="Jacobi")
+                x0[:, i], stats = _conjugate_gradient_preconditioned(A, b[:, i],
+                             x0[:, i], M, imax, tol, atol, iprint, Type=precon)
             else:
-                err = cg_solve_c_precon(A, x0, b, imax, tol, atol, 1, M)
+                # need to copy into new array to ensure contiguous access
+                xnew = x0[:, i].copy()
+                err, stats = _cg_solve_c(A, xnew, b[:, i].copy(), imax, tol,
+                                         atol, b.shape[1], M, precon)
+                x0[:, i] = xnew
 
     else:
 
-        if len(b.shape) != 1:
-
-            for i in range(b.shape[1]):
-
-                if not use_c_cg:
-                    x0[:, i], stats = _conjugate_gradient(A, b[:, i], x0[:, i],
-                                               imax, tol, atol, iprint)
-                else:
-                    # need to copy into new array to ensure contiguous access
-                    xnew = x0[:, i].copy()
-                    err = cg_solve_c(A, xnew, b[:, i].copy(), imax, tol, atol, b.shape[1])
-                    x0[:, i] = xnew
-        else:   
-
-            if not use_c_cg:
-                x0, stats = _conjugate_gradient(A, b, x0, imax, tol, atol, iprint)
-            else:
-                x0 = b.copy()
-                err = cg_solve_c(A, x0, b, imax, tol, atol, 1)
+        if not use_c_cg:
+            x0, stats = _conjugate_gradient_preconditioned(A, b, x0, M,
+                             imax, tol, atol, iprint, Type=precon)
+        else:
+            err, stats = _cg_solve_c(A, x0, b, imax, tol, atol, 1, M, precon)
 
     if err == -1:
         
@@ -127,7 +128,80 @@ def conjugate_gradient(A, b, x0=None, imax=10000, tol=1.0e-8, atol=1.0e-14,
     else:
         return x0
 
-    
+
+def _cg_solve_c(A, x, b, imax, tol, atol, bcols, M, precon):
+    """Solve Ax = b in place in x with the c conjugate gradient
+
+    Return the error code of the c routine and the Stats of the solve
+    """
+
+    stats = Stats()
+    stats.x0 = num.linalg.norm(x)
+
+    c_stats = num.zeros(3, dtype=num.float)
+    if precon == 'Jacobi':
+        err = cg_solve_c_precon(A, x, b, imax, tol, atol, bcols, M, c_stats)
+    elif precon == 'IC':
+        err = cg_solve_c_ic(A, x, b, imax, tol, atol, bcols, M, c_stats)
+    else:
+        err = cg_solve_c(A, x, b, imax, tol, atol, bcols, c_stats)
+
+    stats.iter = int(c_stats[0])
+    stats.rTr0 = c_stats[1]
+    stats.rTr = c_stats[2]
+    stats.x = num.linalg.norm(x)
+    stats.dx = 0.0 # Not computed by the c routine
+
+    return err, stats
+
+
+def incomplete_cholesky(A):
+    """Incomplete Cholesky factorisation IC(0) of symmetric matrix A
+
+    A: matrix of type Sparse_CSR
+
+    Return the factor L, A ~ L*L^T, as Sparse_CSR. L has the sparsity
+    pattern of the lower triangle of A. Where the factorisation breaks
+    down the diagonal of A is used instead.
+    """
+
+    msg = 'Incomplete Cholesky preconditioner requires matrix of type %s' \
+          % str(Sparse_CSR)
+    if not isinstance(A, Sparse_CSR):
+        raise PreconditionerError, msg
+
+    n = A.M
+    row_ptr = num.array(A.row_ptr, dtype=num.int)
+    rows = num.repeat(num.arange(n), num.diff(row_ptr))
+    cols = num.array(A.colind, dtype=num.int)
+
+    # Lower triangle sorted by row and column: the diagonal comes last
+    lower = num.flatnonzero(cols <= rows)
+    order = lower[num.lexsort((cols[lower], rows[lower]))]
+
+    data = num.array(A.data[order], dtype=num.float)
+    colind = cols[order]
+    L_rows = rows[order]
+
+    L_row_ptr = num.zeros(n+1, dtype=num.int)
+    L_row_ptr[1:] = num.cumsum(num.bincount(L_rows, minlength=n))
+
+    last = L_row_ptr[1:] - 1
+    if num.any(num.diff(L_row_ptr) == 0) or \
+       num.any(colind[last] != num.arange(n)):
+        msg = 'Incomplete Cholesky preconditioner requires a nonzero diagonal'
+        raise PreconditionerError, msg
+
+    L = Sparse_CSR(None, data, colind, L_row_ptr, int(n), int(n))
+
+    replaced = ic_factor_c(L)
+    if replaced > 0:
+        log.info('Incomplete Cholesky: %d pivots replaced by diagonal'
+                 % replaced)
+
+    return L
+
+
 def _conjugate_gradient(A, b, x0, 
                         imax=10000, tol=1.0e-8, atol=1.0e-10, iprint=None):
     """
@@ -234,25 +308,29 @@ def _conjugate_gradient_preconditioned(A, b, x0, M,
       (__mul__ just needs to be defined)
    b: right hand side
    x0: inital guess (default the 0 vector)
+   M: preconditioner, the diagonal of A for Type 'Jacobi' or the
+      incomplete Cholesky factor for Type 'IC'
    imax: max number of iterations
    tol: tolerance used for residual
+   Type: 'None', 'Jacobi' or 'IC'
 
    Output
    x: approximate solution
    """
 
-    # Padarn note: This is temporary while the Jacboi preconditioner is the only
-    # one avaliable.
-    D=[]
-    if not Type=='Jacobi':
-        log.warning('Only the Jacobi Preconditioner is impletment cg_solve python')
-        msg = 'Only the Jacobi Preconditioner is impletment in cg_solve python'
-        raise PreconditionerError, msg
+    if Type == 'None':
+        return _conjugate_gradient(A, b, x0, imax, tol, atol, iprint)
+    elif Type == 'Jacobi':
+        def apply_precon(r):
+            return r / M
+    elif Type == 'IC':
+        def apply_precon(r):
+            z = num.zeros(r.shape, dtype=num.float)
+            ic_solve_c(M, num.ascontiguousarray(r), z)
+            return z
     else:
-        D=Sparse(A.M, A.M)
-        for i in range(A.M):
-            D[i,i]=1/M[i]
-        D=Sparse_CSR(D)
+        msg = 'Unknown preconditioner %s' % str(Type)
+        raise PreconditionerError, msg
 
     stats = Stats()
 
@@ -275,8 +353,8 @@ def _conjugate_gradient_preconditioned(A, b, x0, M,
     i = 1
     x = x0
     r = b - A * x
-    z = D * r
-    d = r
+    z = apply_precon(r)
+    d = z
     rTr = num.dot(r, z)
     rTr0 = rTr
 
@@ -305,7 +383,7 @@ def _conjugate_gradient_preconditioned(A, b, x0, M,
         else:
             r = r - alpha * q
         rTrOld = rTr
-        z = D * r
+        z = apply_precon(r)
         rTr = num.dot(r, z)
         bt = rTr / rTrOld
 
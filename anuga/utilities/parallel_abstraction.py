@@ -2,6 +2,9 @@
 
 Use pypar for parallism if installed.
 Otherwise define a rudimentary interface for sequential execution.
+
+The collective operations allreduce, allgather and bcast work on scalars
+and numeric arrays in both cases.
 """
 
 class NullStream:
@@ -56,7 +59,10 @@ except:
     def reduce(*args, **kwargs):
         pass
         
-    MIN = None
+    # Same codes as the operations of pypar and mpiextras
+    MAX = 1
+    MIN = 2
+    SUM = 3
 
     pypar_available = False
 else:
@@ -64,4 +70,123 @@ else:
     sys.stdout = NullStream()
     from pypar import *
     sys.stdout = sys.__stdout__ 
-    pypar_available = True 
+    pypar_available = True
+
+
+import numpy as num
+
+
+#------------------------------------------------------------------------------
+# Collective operations
+#
+# Each is a single MPI collective (MPI_Allreduce, MPI_Allgather or
+# MPI_Bcast) instead of a loop of sends and receives through processor 0.
+# Sequentially they simply return the local values.
+#------------------------------------------------------------------------------
+
+def _parallel():
+
+    return pypar_available and size() > 1
+
+
+def _to_array(x):
+    """Return contiguous 1D copy of scalar or array x, in a type MPI can
+    communicate, and a function restoring the shape and type of x
+    """
+
+    is_scalar = num.isscalar(x)
+    x = num.array(x)
+    is_bool = x.dtype == num.bool
+
+    shape = x.shape
+    if is_bool:
+        x = x.astype(num.int)
+    elif x.dtype.char not in ['i', 'l', 'f', 'd']:
+        x = x.astype(num.float)
+
+    def restore(a, extra_shape=()):
+        a = a.reshape(extra_shape + shape)
+        if is_bool:
+            a = a.astype(num.bool)
+        if is_scalar and extra_shape == ():
+            return a.item()
+        return a
+
+    return num.ascontiguousarray(x.reshape(-1)), restore
+
+
+def allreduce(x, op=SUM):
+    """Return x combined elementwise over all processors with op
+    (SUM, MIN or MAX).
+
+    x is a scalar or numeric array (the same shape on all processors)
+    and the result has the same shape and type. For booleans MIN is a
+    logical and and MAX a logical or.
+    """
+
+    if not _parallel():
+        if num.isscalar(x):
+            return x
+        return num.array(x)
+
+    import anuga.parallel.pypar_ext as pypar_ext
+
+    x, restore = _to_array(x)
+    buffer = num.zeros_like(x)
+    pypar_ext.allreduce(x, op, buffer=buffer, bypass=True)
+
+    return restore(buffer)
+
+
+def allgather(x):
+    """Return array of the values x of all processors stacked along a
+    new first axis of length numprocs.
+
+    x is a scalar or numeric array (the same shape on all processors).
+    """
+
+    if not _parallel():
+        return num.array([x])
+
+    import anuga.parallel.pypar_ext as pypar_ext
+
+    numprocs = size()
+    x, restore = _to_array(x)
+    buffer = num.zeros(numprocs*len(x), x.dtype)
+    pypar_ext.allgather(x, buffer=buffer, bypass=True)
+
+    return restore(buffer, (numprocs,))
+
+
+def bcast(x, root=0):
+    """Return the value x of processor root on all processors.
+
+    Numeric arrays are sent directly and must have the same shape and type
+    on all processors. Any other picklable object is pickled on root and
+    its length broadcast first, so the other processors may pass any
+    value, e.g. None.
+    """
+
+    if not _parallel():
+        return x
+
+    if isinstance(x, num.ndarray):
+        # pypar broadcasts arrays in place
+        return broadcast(x.copy(), root)
+
+    import cPickle
+
+    if rank() == root:
+        s = cPickle.dumps(x, cPickle.HIGHEST_PROTOCOL)
+        length = num.array([len(s)], num.int)
+    else:
+        length = num.zeros(1, num.int)
+    length = broadcast(length, root)
+
+    if rank() == root:
+        buffer = num.fromstring(s, num.uint8)
+    else:
+        buffer = num.zeros(length[0], num.uint8)
+    buffer = broadcast(buffer, root)
+
+    return cPickle.loads(buffer.tostring())
@@ -591,7 +591,23 @@ def quantityRasterFun(domain, rasterFile, interpolation='pixel'):
    
     OUTPUT: Function which takes x,y in ANUGA coordinates, and outputs their
             corresponding raster values 
+
+    ANUGA grids (.ers or .dem) are sampled a tile at a time with
+    fit_interpolate.raster_sampling, which reads only the blocks of the grid
+    under the points. Other rasters are read with GDAL.
     """
+    if os.path.splitext(rasterFile)[1] in ['.ers', '.dem']:
+        import numpy
+        from anuga.fit_interpolate.raster_sampling import sample_raster
+        def QFun(x,y):
+            xll=domain.geo_reference.xllcorner
+            yll=domain.geo_reference.yllcorner
+            inDat=numpy.vstack([x+xll,y+yll]).transpose()
+            return sample_raster(rasterFile, inDat, mode=interpolation,
+                                 bounds_error=True)
+
+        return QFun
+
     import scipy
     from anuga.utilities.spatialInputUtil import rasterValuesAtPoints
     def QFun(x,y):
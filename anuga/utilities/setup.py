@@ -14,7 +14,9 @@ def configuration(parent_package='',top_path=None):
     config.add_data_dir(join('tests','data'))
 
     config.add_extension('sparse_ext',
-                         sources='sparse_ext.c')
+                         sources='sparse_ext.c',
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
 
     config.add_extension('sparse_matrix_ext',
                          sources=['sparse_matrix_ext.c', 'sparse_dok.c'])
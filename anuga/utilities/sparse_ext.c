@@ -25,6 +25,8 @@ int _csr_mv(int M,
   		
   long i, j, ckey;
 
+  // Rows are independent, so they are shared between threads
+  #pragma omp parallel for private(ckey,j,i)
   for (i=0; i<M; i++ ) 
     for (ckey=row_ptr[i]; ckey<row_ptr[i+1]; ckey++) {
       j = colind[ckey];
@@ -45,6 +47,7 @@ int _csr_mm(int M,
   		
   long i, j, ckey, c, rowind_i, rowind_j;
 
+  #pragma omp parallel for private(ckey,j,i,c,rowind_i,rowind_j)
   for (i=0; i<M; i++ ) {
     rowind_i = i*columns;
     
@@ -1,8 +1,18 @@
 #!/usr/bin/env python2
 """
     Merge a list of .sww files together into a single file.
+
+    The global triangulation and the maps from each file to the merged
+    file are built once. Dynamic quantities are then streamed from the
+    input files into the output file in blocks of frames, so memory use is
+    bounded by one block (see frames_per_block and max_block_memory) rather
+    than by the size of the merged file. With jobs > 1 the input files are
+    read by a pool of processes.
 """
 
+import os
+import itertools
+
 import numpy as num
 from anuga.utilities.numerical_tools import ensure_numeric
 
@@ -10,199 +20,106 @@ from anuga.file.netcdf import NetCDFFile
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
 from anuga.config import netcdf_float, netcdf_float32, netcdf_int
 from anuga.file.sww import SWW_file, Write_sww
+from anuga.file.sww import get_frames_per_block, max_block_memory
+
+
+# Quantities which are merged, if present in the files
+vertex_quantities = ['elevation', 'friction', 'stage', 'xmomentum',
+                     'ymomentum', 'xvelocity', 'yvelocity', 'height']
+centroid_quantities = [q + '_c' for q in vertex_quantities]
+
 
-def sww_merge(domain_global_name, np, verbose=False):
+def sww_merge(domain_global_name, np, verbose=False, jobs=1,
+              frames_per_block=None):
 
     output = domain_global_name+".sww"
     swwfiles = [ domain_global_name+"_P"+str(np)+"_"+str(v)+".sww" for v in range(np)]
 
-    _sww_merge(swwfiles, output, verbose)
+    _sww_merge(swwfiles, output, verbose, jobs, frames_per_block)
 
 
-def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
+def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False,
+                       jobs=1, frames_per_block=None):
 
     output = domain_global_name+".sww"
     swwfiles = [ domain_global_name+"_P"+str(np)+"_"+str(v)+".sww" for v in range(np)]
 
     fid = NetCDFFile(swwfiles[0], netcdf_mode_r)
 
-    try: # works with netcdf4
-        number_of_volumes = len(fid.dimensions['number_of_volumes'])
-        number_of_points = len(fid.dimensions['number_of_points'])
-    except: # works with scientific.io.netcdf
-        number_of_volumes = int(fid.dimensions['number_of_volumes'])
-        number_of_points = int(fid.dimensions['number_of_points'])
+    number_of_volumes = _get_dimension(fid, 'number_of_volumes')
+    number_of_points = _get_dimension(fid, 'number_of_points')
 
     fid.close()
 
     if 3*number_of_volumes == number_of_points:
-        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old)
+        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old,
+                                       jobs, frames_per_block)
     else:
-        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old)
-        
+        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old,
+                                   jobs, frames_per_block)
 
-def _sww_merge(swwfiles, output, verbose=False):
+
+def _sww_merge(swwfiles, output, verbose=False, jobs=1, frames_per_block=None):
     """
         Merge a list of sww files into a single file.
-        
+
         May be useful for parallel runs. Note that colinear points and
         edges are not merged: there will essentially be multiple meshes within
         the one sww file.
-        
+
         The sww files to be merged must have exactly the same timesteps. Note
         that some advanced information and custom quantities may not be
         exported.
-        
+
         swwfiles is a list of .sww files to merge.
         output is the output filename, including .sww extension.
         verbose True to log output information
+        jobs is the number of processes reading the sww files.
+        frames_per_block is the number of timesteps merged at a time.
     """
 
-    if verbose:
-        print "MERGING SWW Files"
-        
-    static_quantities = ['elevation']
-    dynamic_quantities = ['stage', 'xmomentum', 'ymomentum']
-    
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print 'Reading file ', filename, ':'    
-    
-        fid = NetCDFFile(filename, netcdf_mode_r)
-
-
-
-        
-        
-        tris = fid.variables['volumes'][:]       
-         
-        if first_file:
-            times = fid.variables['time'][:]
-            x = []
-            y = []
-            out_tris = list(tris)  
-            out_s_quantities = {}
-            out_d_quantities = {}
-
-
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
-
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
-
-            
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = []
-
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_quantities:
-                out_d_quantities[quantity] = [ [] for _ in range(len(times))]
-                 
-            description = 'merged:' + getattr(fid, 'description')          
-            first_file = False
-        else:
-            for tri in tris:
-                # Advance new tri indices to point at newly appended points.
-                verts = [vertex+tri_offset for vertex in tri]
-                out_tris.append(verts)
-
+    _merge_files(swwfiles, output, 'append', verbose=verbose, jobs=jobs,
+                 frames_per_block=frames_per_block)
 
 
-        try: # works with netcdf4
-            num_pts = len(fid.dimensions['number_of_points'])
-        except: # works with scientific.io.netcdf
-            num_pts = int(fid.dimensions['number_of_points'])
-
-        tri_offset += num_pts
-        
-        if verbose:
-            print '  new triangle index offset is ', tri_offset
-            
-        x.extend(list(fid.variables['x'][:]))
-        y.extend(list(fid.variables['y'][:]))
-        
-        # Grow the list of static quantities associated with the x,y points
-        for quantity in static_quantities:
-            out_s_quantities[quantity].extend(fid.variables[quantity][:])
-            
-        #Collate all dynamic quantities according to their timestep
-        for quantity in dynamic_quantities:
-            time_chunks = fid.variables[quantity][:]
-            for i, time_chunk in enumerate(time_chunks):
-                out_d_quantities[quantity][i].extend(time_chunk)            
-    
-    # Mash all points into a single big list    
-    points = [[xx, yy] for xx, yy in zip(x, y)]
-
-    points = num.asarray(points).astype(netcdf_float32)
+def _sww_merge_parallel_smooth(swwfiles, output, verbose=False,
+                               delete_old=False, jobs=1,
+                               frames_per_block=None):
+    """
+        Merge a list of sww files into a single file.
 
-    fid.close()
+        Use to merge files created by parallel runs.
 
-    #---------------------------
-    # Write out the SWW file
-    #---------------------------
+        The sww files to be merged must have exactly the same timesteps.
 
-    if verbose:
-        print 'Writing file ', output, ':'
-    fido = NetCDFFile(output, netcdf_mode_w)
-    sww = Write_sww(static_quantities, dynamic_quantities)
-    sww.store_header(fido, times,
-                             len(out_tris),
-                             len(points),
-                             description=description,
-                             sww_precision=netcdf_float32)
+        It is assumed that the separate sww files have been stored in smooth
+        format.
 
+        Note that some advanced information and custom quantities may not be
+        exported.
 
+        swwfiles is a list of .sww files to merge.
+        output is the output filename, including .sww extension.
+        verbose True to log output information
+        delete_old True to remove the sww files once merged
+        jobs is the number of processes reading the sww files.
+        frames_per_block is the number of timesteps merged at a time.
+    """
 
-    from anuga.coordinate_transforms.geo_reference import Geo_reference
-    geo_reference = Geo_reference()
-    
-    sww.store_triangulation(fido, points, out_tris, points_georeference=geo_reference)
-
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
-       
-    sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
-
-    # Write out all the dynamic quantities for each timestep
-    for q in dynamic_quantities:
-        q_values = out_d_quantities[q]
-        for i, time_slice in enumerate(q_values):
-            fido.variables[q][i] = num.array(time_slice, netcdf_float32)
-        
-        # This updates the _range values
-        q_range = fido.variables[q + Write_sww.RANGE][:]
-        q_values_min = num.min(q_values)
-        if q_values_min < q_range[0]:
-            fido.variables[q + Write_sww.RANGE][0] = q_values_min
-        q_values_max = num.max(q_values)
-        if q_values_max > q_range[1]:
-            fido.variables[q + Write_sww.RANGE][1] = q_values_max        
+    _merge_files(swwfiles, output, 'smooth', verbose=verbose, jobs=jobs,
+                 frames_per_block=frames_per_block)
 
-                                        
-    fido.close()
+    if delete_old:
+        _delete_files(swwfiles, verbose)
 
 
-def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False):
+def _sww_merge_parallel_non_smooth(swwfiles, output, verbose=False,
+                                   delete_old=False, jobs=1,
+                                   frames_per_block=None):
     """
         Merge a list of sww files into a single file.
-        
-        Use to merge files created by parallel runs.
+
+        Used to merge files created by parallel runs.
 
         The sww files to be merged must have exactly the same timesteps.
 
@@ -211,593 +128,379 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
 
         Note that some advanced information and custom quantities may not be
         exported.
-        
+
         swwfiles is a list of .sww files to merge.
         output is the output filename, including .sww extension.
         verbose True to log output information
+        delete_old True to remove the sww files once merged
+        jobs is the number of processes reading the sww files.
+        frames_per_block is the number of timesteps merged at a time.
     """
 
-    if verbose:
-        print "MERGING SWW Files"
-        
-    
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print 'Reading file ', filename, ':'    
-    
-        fid = NetCDFFile(filename, netcdf_mode_r)
-         
-        if first_file:
-
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            #number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
-            
-            out_s_quantities = {}
-            out_d_quantities = {}
-
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
-
-
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
-
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
-
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
-
-            g_volumes = num.zeros((number_of_global_triangles,3),num.int)
-            g_x = num.zeros((number_of_global_nodes,),num.float32)
-            g_y = num.zeros((number_of_global_nodes,),num.float32)
-
-            g_points = num.zeros((number_of_global_nodes,2),num.float32)
-
-            #=====================================
-            # Deal with the vertex based variables
-            #=====================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
-
-            quantities = list(quantities & variables)
-            
-            static_quantities = []
-            dynamic_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
-                
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((number_of_global_nodes,),num.float32)
-
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_quantities:
-                out_d_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_nodes),num.float32)
-
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
-
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
-
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_c_quantities:
-                out_d_c_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_triangles),num.float32)
-                 
-            description = 'merged:' + getattr(fid, 'description')          
-            first_file = False
-
-
-        # Read in from files and add to global arrays
-
-        tri_l2g  = fid.variables['tri_l2g'][:]
-        node_l2g = fid.variables['node_l2g'][:]
-        tri_full_flag = fid.variables['tri_full_flag'][:]
-        volumes = num.array(fid.variables['volumes'][:],dtype=num.int)
-        l_volumes = num.zeros_like(volumes)
-        l_old_volumes = num.zeros_like(volumes)
+    _merge_files(swwfiles, output, 'non_smooth', verbose=verbose, jobs=jobs,
+                 frames_per_block=frames_per_block)
 
+    if delete_old:
+        _delete_files(swwfiles, verbose)
 
-        # Change the local node ids to global id in the
-        # volume array
-
-        # FIXME SR: Surely we can knock up a numpy way of doing this
-        #for i in range(len(l_volumes)):
-        #    g_n0 = node_l2g[volumes[i,0]]
-        #    g_n1 = node_l2g[volumes[i,1]]
-        #    g_n2 = node_l2g[volumes[i,2]]
-        #
-        #    l_old_volumes[i,:] = [g_n0,g_n1,g_n2]
-
-        g_n0 = node_l2g[volumes[:,0]].reshape(-1,1)
-        g_n1 = node_l2g[volumes[:,1]].reshape(-1,1)
-        g_n2 = node_l2g[volumes[:,2]].reshape(-1,1)
-
-        #print g_n0.shape
-        l_volumes = num.hstack((g_n0,g_n1,g_n2))
 
-        #assert num.allclose(l_volumes, l_old_volumes)
+def _merge_files(swwfiles, output, mode, verbose=False, jobs=1,
+                 frames_per_block=None):
+    """Merge engine shared by the merge functions.
 
-        # Just pick out the full triangles
-        ftri_ids = num.where(tri_full_flag>0)
-        ftri_l2g = num.compress(tri_full_flag, tri_l2g)
-        
-        #f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-        #f_gids = tri_l2g[f_ids]
-
-        #print l_volumes
-        #print tri_full_flag
-        #print tri_l2g
-        #print ftri_l2g
-        
-        f_volumes0 = num.compress(tri_full_flag,volumes[:,0])
-        f_volumes1 = num.compress(tri_full_flag,volumes[:,1])
-        f_volumes2 = num.compress(tri_full_flag,volumes[:,2])
-        
-        g_volumes[ftri_l2g,0] = node_l2g[f_volumes0]
-        g_volumes[ftri_l2g,1] = node_l2g[f_volumes1]
-        g_volumes[ftri_l2g,2] = node_l2g[f_volumes2]
+    mode is 'append' to place the meshes of the files side by side, or
+    'smooth' / 'non_smooth' to assemble the global mesh of a parallel run
+    from the full triangles of each file (using tri_l2g and node_l2g).
+    """
 
-        #fg_volumes = num.compress(tri_full_flag,l_volumes,axis=0)
-        #g_volumes[ftri_l2g] = fg_volumes
+    msg = 'Unknown sww merge mode %s' % mode
+    assert mode in ['append', 'smooth', 'non_smooth'], msg
 
+    msg = 'Number of jobs must be a positive integer'
+    assert int(jobs) >= 1, msg
 
+    if verbose:
+        print "MERGING SWW Files"
 
+    #---------------------------------------
+    # Header information from the first file
+    #---------------------------------------
+    fid = NetCDFFile(swwfiles[0], netcdf_mode_r)
 
-        #g_x[node_l2g] = fid.variables['x']
-        #g_y[node_l2g] = fid.variables['y']
+    times = num.array(fid.variables['time'][:])
+    n_steps = len(times)
+    starttime = fid.starttime
 
-        g_points[node_l2g,0] = fid.variables['x'][:]
-        g_points[node_l2g,1] = fid.variables['y'][:]
-        
+    attributes = {}
+    for name in ['order', 'xllcorner', 'yllcorner', 'zone', 'false_easting',
+                 'false_northing', 'datum', 'projection']:
+        attributes[name] = getattr(fid, name)
 
-        #print number_of_timesteps
+    description = 'merged:' + getattr(fid, 'description')
 
+    if mode == 'append':
+        static_quantities = ['elevation']
+        dynamic_quantities = ['stage', 'xmomentum', 'ymomentum']
+        static_c_quantities = []
+        dynamic_c_quantities = []
+    else:
+        number_of_global_triangles = int(fid.number_of_global_triangles)
+        number_of_global_nodes = int(fid.number_of_global_nodes)
 
-        # FIXME SR: It seems that some of the "ghost" node quantity values
-        # are being storded. We should only store those nodes which are associated with
-        # full triangles. So we need an index array of "full" nodes, ie those in
-        # full triangles
+        static_quantities, dynamic_quantities = \
+                           _split_quantities(fid, vertex_quantities, n_steps)
+        static_c_quantities, dynamic_c_quantities = \
+                           _split_quantities(fid, centroid_quantities, n_steps)
 
-        #use numpy.compress and numpy.unique to get "full nodes
+    fid.close()
 
-        f_volumes = num.compress(tri_full_flag,volumes,axis=0)
-        fl_nodes = num.unique(f_volumes)
-        f_node_l2g = node_l2g[fl_nodes]
+    pool = None
+    imap = itertools.imap
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(int(jobs))
+        imap = pool.imap
 
-        #print len(node_l2g)
-        #print len(fl_nodes)
+    try:
+        #---------------------------------------------------
+        # Global mesh, static quantities and maps of each file
+        #---------------------------------------------------
+        tasks = [(filename, mode, static_quantities, static_c_quantities)
+                 for filename in swwfiles]
+
+        if mode == 'append':
+            # Sizes are only known once all files have been read
+            meshes = list(imap(_read_mesh, tasks))
+
+            number_of_points = sum([len(m['x']) for m in meshes])
+            number_of_volumes = sum([len(m['volumes']) for m in meshes])
+            offset = 0
+            volume_offset = 0
+            for m in meshes:
+                m['volumes'] = m['volumes'] + offset
+                m['vertex_global'] = m['vertex_global'] + offset
+                m['centroid_global'] = m['centroid_global'] + volume_offset
+                offset += len(m['x'])
+                volume_offset += len(m['volumes'])
+
+            number_of_values = number_of_points
+            number_of_c_values = number_of_volumes
+        else:
+            meshes = imap(_read_mesh, tasks)
+
+            number_of_volumes = number_of_global_triangles
+            number_of_c_values = number_of_global_triangles
+            if mode == 'smooth':
+                number_of_points = number_of_global_nodes
+            else:
+                number_of_points = 3*number_of_global_triangles
+            number_of_values = number_of_points
+
+        if mode == 'non_smooth':
+            volumes = num.arange(number_of_volumes*3).reshape(-1,3)
+        else:
+            volumes = num.zeros((number_of_volumes, 3), num.int)
+        points = num.zeros((number_of_points, 2), num.float32)
 
-        # Read in static quantities
+        s_quantities = {}
         for quantity in static_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            #print quantity, q.shape
-            out_s_quantities[quantity][f_node_l2g] = \
-                         num.array(q[:],dtype=num.float32)[fl_nodes]
-
-        
-        #Collate all dynamic quantities according to their timestep
-        for quantity in dynamic_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                #out_d_quantities[quantity][i][node_l2g] = \
-                #           num.array(q[i],dtype=num.float32)
-                out_d_quantities[quantity][i][f_node_l2g] = \
-                           num.array(q[i],dtype=num.float32)[fl_nodes]
-
-
-        # Read in static c quantities
+            s_quantities[quantity] = num.zeros((number_of_values,), num.float32)
+        s_c_quantities = {}
         for quantity in static_c_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            out_s_c_quantities[quantity][ftri_l2g] = \
-                         num.array(q).astype(num.float32)[ftri_ids]
-
-        
-        #Collate all dynamic c quantities according to their timestep
-        for quantity in dynamic_c_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                out_d_c_quantities[quantity][i][ftri_l2g] = \
-                           num.array(q[i]).astype(num.float32)[ftri_ids]
+            s_c_quantities[quantity] = num.zeros((number_of_c_values,),
+                                                 num.float32)
 
+        maps = []
+        for filename, m in itertools.izip(swwfiles, meshes):
+            if verbose:
+                print 'Reading file ', filename, ':'
 
-        fid.close()
+            vertex_global = m['vertex_global']
+            centroid_global = m['centroid_global']
 
+            points[vertex_global, 0] = m['x']
+            points[vertex_global, 1] = m['y']
 
-    #---------------------------
-    # Write out the SWW file
-    #---------------------------
-    #print g_points.shape
+            if mode != 'non_smooth':
+                volumes[centroid_global] = m['volumes']
 
-    #print number_of_global_triangles
-    #print number_of_global_nodes
+            for quantity in static_quantities:
+                s_quantities[quantity][vertex_global] = m[quantity]
+            for quantity in static_c_quantities:
+                s_c_quantities[quantity][centroid_global] = m[quantity]
 
+            maps.append((filename, m['vertex_local'], vertex_global,
+                         m['centroid_local'], centroid_global))
 
-    if verbose:
+        #---------------------------
+        # Write out the SWW file
+        #---------------------------
+        if verbose:
             print 'Writing file ', output, ':'
-    fido = NetCDFFile(output, netcdf_mode_w)
 
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
-    sww.store_header(fido, starttime,
-                             number_of_global_triangles,
-                             number_of_global_nodes,
+        fido = NetCDFFile(output, netcdf_mode_w)
+
+        sww = Write_sww(static_quantities, dynamic_quantities,
+                        static_c_quantities, dynamic_c_quantities)
+
+        if mode == 'append':
+            sww.store_header(fido, times,
+                             number_of_volumes,
+                             number_of_points,
                              description=description,
                              sww_precision=netcdf_float32)
+        else:
+            sww.store_header(fido, int(starttime),
+                             number_of_volumes,
+                             number_of_points,
+                             description=description,
+                             smoothing=(mode == 'smooth'),
+                             sww_precision=netcdf_float32)
 
+        from anuga.coordinate_transforms.geo_reference import Geo_reference
+        geo_reference = Geo_reference()
 
+        sww.store_triangulation(fido, points, volumes,
+                                points_georeference=geo_reference)
 
-    from anuga.coordinate_transforms.geo_reference import Geo_reference
-    geo_reference = Geo_reference()
-    
-    sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
-
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
-       
-    sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
-    sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
+        for name, value in attributes.items():
+            setattr(fido, name, value)
 
-    # Write out all the dynamic quantities for each timestep
+        sww.store_static_quantities(fido, verbose=verbose, **s_quantities)
+        sww.store_static_quantities_centroid(fido, verbose=verbose,
+                                             **s_c_quantities)
 
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
+        del points, volumes, s_quantities, s_c_quantities
 
-        
-    for q in dynamic_quantities:
-        q_values = out_d_quantities[q]
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-        
-        # This updates the _range values
-        q_range = fido.variables[q + Write_sww.RANGE][:]
-        q_values_min = num.min(q_values)
-        if q_values_min < q_range[0]:
-            fido.variables[q + Write_sww.RANGE][0] = q_values_min
-        q_values_max = num.max(q_values)
-        if q_values_max > q_range[1]:
-            fido.variables[q + Write_sww.RANGE][1] = q_values_max        
-
-    for q in dynamic_c_quantities:
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        q_values = out_d_c_quantities[q]
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-
-                                        
-    #print out_s_quantities
-    #print out_d_quantities
-    
-    #print g_x
-    #print g_y
-
-    #print g_volumes
-
-    fido.close()
-    
-    if delete_old:
-        import os
-        for filename in swwfiles:
+        if mode != 'append':
+            fido.variables['time'][:] = times
 
-            if verbose:
-                print 'Deleting file ', filename, ':'
-            os.remove(filename)
+        #----------------------------------------------
+        # Stream the dynamic quantities block by block
+        #----------------------------------------------
+        quantities = dynamic_quantities + dynamic_c_quantities
+        sizes = [number_of_values]*len(dynamic_quantities) + \
+                [number_of_c_values]*len(dynamic_c_quantities)
 
+        if frames_per_block is None:
+            frames_per_block = get_frames_per_block(sum(sizes))
 
-def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False):
-    """
-        Merge a list of sww files into a single file.
+        q_min = dict((q, num.inf) for q in dynamic_quantities)
+        q_max = dict((q, -num.inf) for q in dynamic_quantities)
 
-        Used to merge files created by parallel runs.
+        for start in range(0, n_steps, frames_per_block):
+            stop = min(start + frames_per_block, n_steps)
 
-        The sww files to be merged must have exactly the same timesteps.
-
-        It is assumed that the separate sww files have been stored in non_smooth
-        format.
-
-        Note that some advanced information and custom quantities may not be
-        exported.
-
-        swwfiles is a list of .sww files to merge.
-        output is the output filename, including .sww extension.
-        verbose True to log output information
-    """
-
-    if verbose:
-        print "MERGING SWW Files"
+            if verbose:
+                print '  Merging timesteps %d to %d' % (start, stop-1)
 
+            block = [num.zeros((stop-start, size), num.float32)
+                     for size in sizes]
 
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print 'Reading file ', filename, ':'
+            tasks = [(filename, start, stop, dynamic_quantities,
+                      dynamic_c_quantities, vertex_local, centroid_local)
+                     for filename, vertex_local, vertex_global,
+                         centroid_local, centroid_global in maps]
 
-        fid = NetCDFFile(filename, netcdf_mode_r)
+            for values, (filename, vertex_local, vertex_global,
+                         centroid_local, centroid_global) in \
+                    itertools.izip(imap(_read_frame_block, tasks), maps):
 
-        if first_file:
+                for i, q in enumerate(quantities):
+                    if q in dynamic_quantities:
+                        block[i][:, vertex_global] = values[i]
+                    else:
+                        block[i][:, centroid_global] = values[i]
 
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
+            for i, q in enumerate(quantities):
+                fido.variables[q][start:stop] = block[i]
 
-            out_s_quantities = {}
-            out_d_quantities = {}
+                if q in dynamic_quantities and block[i].size > 0:
+                    q_min[q] = min(q_min[q], num.min(block[i]))
+                    q_max[q] = max(q_max[q], num.max(block[i]))
 
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
+            del block
 
+        # This updates the _range values
+        for q in dynamic_quantities:
+            q_range = fido.variables[q + Write_sww.RANGE][:]
+            if q_min[q] < q_range[0]:
+                fido.variables[q + Write_sww.RANGE][0] = q_min[q]
+            if q_max[q] > q_range[1]:
+                fido.variables[q + Write_sww.RANGE][1] = q_max[q]
 
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
+        fido.close()
 
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
-            number_of_global_triangle_vertices = 3*number_of_global_triangles
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
 
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
+def _get_dimension(fid, name):
 
-            g_volumes = num.arange(number_of_global_triangles*3).reshape(-1,3)
+    try: # works with netcdf4
+        return len(fid.dimensions[name])
+    except: # works with scientific.io.netcdf
+        return int(fid.dimensions[name])
 
 
+def _split_quantities(fid, quantities, n_steps):
+    """Return lists of static and dynamic quantities stored in fid
+    """
 
-            g_x = num.zeros((number_of_global_triangle_vertices,),num.float32)
-            g_y = num.zeros((number_of_global_triangle_vertices,),num.float32)
+    variables = set(fid.variables.keys())
 
-            g_points = num.zeros((number_of_global_triangle_vertices,2),num.float32)
+    static_quantities = []
+    dynamic_quantities = []
+    for quantity in quantities:
+        if quantity not in variables:
+            continue
 
-            #=======================================
-            # Deal with the vertex based variables
-            #=======================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
+        # Test if quantity is static
+        if len(fid.variables[quantity].shape) == 2 and \
+               n_steps == fid.variables[quantity].shape[0]:
+            dynamic_quantities.append(quantity)
+        else:
+            static_quantities.append(quantity)
 
-            quantities = list(quantities & variables)
+    return static_quantities, dynamic_quantities
 
-            static_quantities = []
-            dynamic_quantities = []
 
-            for quantity in quantities:
-                # Test if elevation is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
+def _read_mesh(args):
+    """Read the part of the merged mesh and static quantities held in one
+    sww file, together with the maps from its vertex and centroid values
+    to those of the merged file.
 
-            # Static Quantities are stored as a 1D array
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((3*number_of_global_triangles,),num.float32)
-
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
-
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
+    Used directly or by the processes of a multiprocessing pool.
+    """
 
-            description = 'merged:' + getattr(fid, 'description')
-            first_file = False
+    filename, mode, static_quantities, static_c_quantities = args
 
+    fid = NetCDFFile(filename, netcdf_mode_r)
 
-        # Read in from files and add to global arrays
+    x = num.array(fid.variables['x'][:], dtype=num.float32)
+    y = num.array(fid.variables['y'][:], dtype=num.float32)
+    volumes = num.array(fid.variables['volumes'][:], dtype=num.int)
 
-        tri_l2g  = fid.variables['tri_l2g'][:]
-        node_l2g = fid.variables['node_l2g'][:]
+    m = {}
+    if mode == 'append':
+        vertex_local = num.arange(len(x))
+        m['vertex_global'] = vertex_local
+        m['centroid_local'] = num.arange(len(volumes))
+        m['centroid_global'] = m['centroid_local']
+        m['volumes'] = volumes
+    else:
+        tri_l2g = num.array(fid.variables['tri_l2g'][:], dtype=num.int)
+        node_l2g = num.array(fid.variables['node_l2g'][:], dtype=num.int)
         tri_full_flag = fid.variables['tri_full_flag'][:]
 
-        f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
+        # Just pick out the full triangles
+        f_ids = num.flatnonzero(tri_full_flag > 0)
         f_gids = tri_l2g[f_ids]
 
-        g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-        l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-
-
-        l_x = num.array(fid.variables['x'][:],dtype=num.float32)
-        l_y = num.array(fid.variables['y'][:],dtype=num.float32)
+        if mode == 'smooth':
+            # Only store values of nodes which belong to full triangles
+            f_volumes = volumes[f_ids]
+            vertex_local = num.unique(f_volumes)
+            m['vertex_global'] = node_l2g[vertex_local]
+            m['volumes'] = node_l2g[f_volumes]
+        else:
+            vertex_local = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+            m['vertex_global'] = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
 
-        
-        g_x[g_vids] = l_x[l_vids]
-        g_y[g_vids] = l_y[l_vids]
+        m['centroid_local'] = f_ids
+        m['centroid_global'] = f_gids
 
-        g_points[g_vids,0] = g_x[g_vids]
-        g_points[g_vids,1] = g_y[g_vids]
+    m['vertex_local'] = vertex_local
+    m['x'] = x[vertex_local]
+    m['y'] = y[vertex_local]
 
+    for quantity in static_quantities:
+        q = num.array(fid.variables[quantity][:], dtype=num.float32)
+        m[quantity] = q[vertex_local]
 
-        ## Read in static quantities
-        for quantity in static_quantities:
-            q = fid.variables[quantity]
-            out_s_quantities[quantity][g_vids] = \
-                         num.array(q).astype(num.float32)[l_vids]
-                         #num.array(q,dtype=num.float32)[l_vids]
+    for quantity in static_c_quantities:
+        q = num.array(fid.variables[quantity][:], dtype=num.float32)
+        m[quantity] = q[m['centroid_local']]
 
+    fid.close()
 
-        # Read in static c quantities
-        for quantity in static_c_quantities:
-            q = fid.variables[quantity]
-            out_s_c_quantities[quantity][f_gids] = \
-                         num.array(q).astype(num.float32)[f_ids]
-                         #num.array(q,dtype=num.float32)[f_ids]
+    return m
 
-        
-        fid.close()
 
-    #---------------------------
-    # Write out the SWW file
-    #---------------------------
+def _read_frame_block(args):
+    """Read timesteps start to stop-1 of the dynamic quantities of one sww
+    file, restricted to the values which go into the merged file.
 
-    if verbose:
-            print 'Writing file ', output, ':'
+    Used directly or by the processes of a multiprocessing pool.
+    """
 
-    fido = NetCDFFile(output, netcdf_mode_w)
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
-    sww.store_header(fido, starttime,
-                             number_of_global_triangles,
-                             number_of_global_triangles*3,
-                             description=description,
-                             sww_precision=netcdf_float32)
+    filename, start, stop, dynamic_quantities, dynamic_c_quantities, \
+              vertex_local, centroid_local = args
 
+    fid = NetCDFFile(filename, netcdf_mode_r)
 
-    from anuga.coordinate_transforms.geo_reference import Geo_reference
-    geo_reference = Geo_reference()
+    values = []
+    for quantity in dynamic_quantities:
+        q = num.array(fid.variables[quantity][start:stop], dtype=num.float32)
+        values.append(q[:, vertex_local])
 
-    sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
+    for quantity in dynamic_c_quantities:
+        q = num.array(fid.variables[quantity][start:stop], dtype=num.float32)
+        values.append(q[:, centroid_local])
 
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
+    fid.close()
 
-    sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
-    sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
-    
-    # Write out all the dynamic quantities for each timestep
+    return values
 
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
 
-    for q in (dynamic_quantities + dynamic_c_quantities):
+def _delete_files(swwfiles, verbose=False):
 
+    for filename in swwfiles:
         if verbose:
-            print '  Writing quantity: ',q
-                    
-        # Initialise q_values with zeros
-        if q in dynamic_quantities:
-            q_values = num.zeros((n_steps, 3*number_of_global_triangles), num.float32)
-        elif q in dynamic_c_quantities:
-            q_values = num.zeros((n_steps, number_of_global_triangles), num.float32)
-
-
-        # Read the quantities one at a time, to reduce memory usage
-        for filename in swwfiles:
-            fid = NetCDFFile(filename, netcdf_mode_r)
-
-            # Index information
-            tri_l2g  = fid.variables['tri_l2g'][:]
-            node_l2g = fid.variables['node_l2g'][:]
-            tri_full_flag = fid.variables['tri_full_flag'][:]
-            f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-            f_gids = tri_l2g[f_ids]
-            g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            for i in range(n_steps):
-                # Different indices for vertex and centroid quantities
-                if q in dynamic_quantities:
-                    q_values[i][g_vids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[l_vids]
-                elif q in dynamic_c_quantities:
-                    q_values[i][f_gids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[f_ids]
-
-            fid.close()
-
-        # Write to the file
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-
-        if q in dynamic_quantities:
-            # This updates the _range values
-            q_range = fido.variables[q + Write_sww.RANGE][:]
-            q_values_min = num.min(q_values)
-            if q_values_min < q_range[0]:
-                fido.variables[q + Write_sww.RANGE][0] = q_values_min
-            q_values_max = num.max(q_values)
-            if q_values_max > q_range[1]:
-                fido.variables[q + Write_sww.RANGE][1] = q_values_max
-
-    fido.close()
-
-    if delete_old:
-        import os
-        for filename in swwfiles:
-
-            if verbose:
-                print 'Deleting file ', filename, ':'
-            os.remove(filename)
-
-
-
-
+            print 'Deleting file ', filename, ':'
+        os.remove(filename)
 
 
 if __name__ == "__main__":
@@ -815,6 +518,11 @@ if __name__ == "__main__":
                    help='verbosity')
     parser.add_argument('-delete_old', nargs='?', type=bool, const=True, default=False,
                    help='Flag to delete the input files')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                   help='number of processes reading the sww files')
+    parser.add_argument('-frames_per_block', type=int, default=None,
+                   help='number of timesteps merged at a time (default: fit in %d MB)'
+                        % (max_block_memory/2**20))
     args = parser.parse_args()
 
     np = args.np
@@ -824,7 +532,9 @@ if __name__ == "__main__":
 
 
     try:
-        sww_merge_parallel(domain_global_name, np, verbose, delete_old)
+        sww_merge_parallel(domain_global_name, np, verbose, delete_old,
+                           jobs=args.jobs,
+                           frames_per_block=args.frames_per_block)
     except:
         msg = 'ERROR: When merging sww files %s '% domain_global_name
         print msg
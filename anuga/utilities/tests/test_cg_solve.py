@@ -559,6 +559,153 @@ class Test_CG_Solve(unittest.TestCase):
 
         assert num.allclose(x,xe)
 
+    def laplacian_2d(self, n, m):
+        """Standard 2d laplacian in csr format"""
+
+        A = Sparse(m*n, m*n)
+
+        for i in num.arange(0,n):
+            for j in num.arange(0,m):
+                I = j+m*i
+                A[I,I] = 4.0
+                if i > 0  :
+                    A[I,I-m] = -1.0
+                if i < n-1 :
+                    A[I,I+m] = -1.0
+                if j > 0  :
+                    A[I,I-1] = -1.0
+                if j < m-1 :
+                    A[I,I+1] = -1.0
+
+        return Sparse_CSR(A)
+
+
+    def test_incomplete_cholesky(self):
+        """IC(0) of a tridiagonal matrix is its exact Cholesky factor"""
+
+        A = [[4.0, -1.0, 0.0, 0.0 ],
+             [-1.0, 4.0, -1.0, 0.0],
+             [0.0, -1.0, 4.0, -1.0],
+             [0.0,0.0, -1.0, 4.0]]
+
+        L = incomplete_cholesky(Sparse_CSR(Sparse(A)))
+
+        assert num.allclose(L.row_ptr, [0, 1, 3, 5, 7])
+        assert num.allclose(L.colind, [0, 0, 1, 1, 2, 2, 3])
+
+        Ld = num.zeros((4,4))
+        for i in range(4):
+            for k in range(L.row_ptr[i], L.row_ptr[i+1]):
+                Ld[i, L.colind[k]] = L.data[k]
+
+        assert num.allclose(num.dot(Ld, Ld.T), A)
+        assert num.allclose(Ld, num.linalg.cholesky(A))
+
+
+    def test_incomplete_cholesky_missing_diagonal(self):
+
+        A = [[0.0, 1.0],
+             [1.0, 2.0]]
+
+        try:
+            incomplete_cholesky(Sparse_CSR(Sparse(A)))
+        except PreconditionerError:
+            pass
+        else:
+            msg = 'Should have raised exception'
+            raise TestError, msg
+
+
+    def test_solve_large_2d_with_ic(self):
+        """Standard 2d laplacian with incomplete Cholesky preconditioner,
+        c and python versions
+        """
+
+        A = self.laplacian_2d(30, 20)
+
+        xe = num.ones( (30*20,), num.float)
+        b = A*xe
+
+        x, stats_c = conjugate_gradient(A, b, use_c_cg=True, precon='IC',
+                                        output_stats=True)
+        assert num.allclose(x,xe)
+
+        x, stats_py = conjugate_gradient(A, b, use_c_cg=False, precon='IC',
+                                         output_stats=True)
+        assert num.allclose(x,xe)
+
+        x, stats_none = conjugate_gradient(A, b, use_c_cg=True,
+                                           output_stats=True)
+
+        assert stats_c.iter == stats_py.iter
+        assert stats_c.iter < stats_none.iter
+
+
+    def test_solve_2d_matrix_with_ic(self):
+        """Several right hand sides with incomplete Cholesky"""
+
+        A = self.laplacian_2d(10, 10)
+
+        xe = num.ones( (100, 2), num.float)
+        xe[:, 1] = num.arange(100)
+        b = A*xe
+
+        x = conjugate_gradient(A, b, use_c_cg=True, precon='IC')
+        assert num.allclose(x,xe)
+
+
+    def test_stats_using_c_ext(self):
+        """Iteration statistics are returned by the c solvers"""
+
+        A = self.laplacian_2d(10, 10)
+
+        xe = num.ones( (100,), num.float)
+        b = A*xe
+
+        for precon in ['None', 'Jacobi', 'IC']:
+            x0 = num.zeros(100)
+            x, stats = conjugate_gradient(A, b, x0, use_c_cg=True,
+                                          precon=precon, output_stats=True)
+            _, stats_py = conjugate_gradient(A, b, x0, use_c_cg=False,
+                                             precon=precon, output_stats=True)
+
+            assert num.allclose(x,xe)
+            assert stats.iter == stats_py.iter
+            assert num.allclose(stats.rTr0, stats_py.rTr0)
+            assert stats.x0 == 0.0
+            assert num.allclose(stats.x, num.linalg.norm(xe))
+
+
+    def test_warm_start(self):
+        """The initial guess is used by all solvers"""
+
+        A = self.laplacian_2d(10, 10)
+
+        xe = num.ones( (100,), num.float)
+        b = A*xe
+
+        for use_c_cg in [True, False]:
+            for precon in ['None', 'Jacobi', 'IC']:
+                x, stats = conjugate_gradient(A, b, xe, use_c_cg=use_c_cg,
+                                              precon=precon, output_stats=True)
+
+                assert num.allclose(x,xe)
+                assert stats.iter == 1
+                assert stats.rTr0 == 0.0
+
+
+    def test_unknown_preconditioner(self):
+
+        A = self.laplacian_2d(2, 2)
+
+        try:
+            conjugate_gradient(A, num.ones(4), precon='Multigrid')
+        except PreconditionerError:
+            pass
+        else:
+            msg = 'Should have raised exception'
+            raise TestError, msg
+
 ################################################################################
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""Test the collective operations of the parallel abstraction in
+sequential execution
+"""
+
+import unittest
+
+import numpy as num
+
+from anuga.utilities.parallel_abstraction import allreduce, allgather, bcast
+from anuga.utilities.parallel_abstraction import size, SUM, MIN, MAX
+from anuga.utilities.parallel_abstraction import _to_array
+
+
+class Test_parallel_abstraction(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def test_allreduce(self):
+
+        if size() > 1: return
+
+        assert allreduce(2.5, SUM) == 2.5
+        assert allreduce(3, MAX) == 3
+        assert allreduce(True, MIN) is True
+
+        x = num.array([[1.0, 2.0], [3.0, 4.0]])
+        y = allreduce(x, SUM)
+        assert num.all(y == x)
+        assert y is not x
+
+
+    def test_allgather(self):
+
+        if size() > 1: return
+
+        assert num.all(allgather(1.5) == [1.5])
+
+        x = num.array([1, 2, 3])
+        y = allgather(x)
+        assert y.shape == (1, 3)
+        assert num.all(y[0] == x)
+
+
+    def test_bcast(self):
+
+        if size() > 1: return
+
+        assert bcast(4.0) == 4.0
+        assert bcast({'a': 1}) == {'a': 1}
+
+        x = num.arange(4)
+        assert num.all(bcast(x, 0) == x)
+
+
+    def test_to_array(self):
+        """Values are communicated as contiguous 1D arrays and restored
+        to their original shape and type
+        """
+
+        a, restore = _to_array(True)
+        assert a.shape == (1,) and a.dtype.char in ['i', 'l']
+        assert restore(a) is True
+
+        a, restore = _to_array(2.0)
+        assert restore(a*3) == 6.0
+
+        x = num.arange(6, dtype=num.float).reshape(3, 2)[:, ::-1]
+        a, restore = _to_array(x)
+        assert a.flags['C_CONTIGUOUS'] and a.shape == (6,)
+        assert num.all(restore(a) == x)
+
+        gathered = restore(num.concatenate([a, 2*a]), (2,))
+        assert gathered.shape == (2, 3, 2)
+        assert num.all(gathered[1] == 2*x)
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_parallel_abstraction, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,143 @@
+"""Test merging of the sww files of a parallel run
+"""
+
+import unittest
+import os
+
+import numpy as num
+
+import anuga
+
+from anuga.file.netcdf import NetCDFFile
+from anuga.config import netcdf_mode_r
+from anuga.utilities.sww_merge import sww_merge_parallel
+from anuga.file.sww import get_frames_per_block
+from anuga.parallel.sequential_distribute import sequential_distribute_dump
+from anuga.parallel.sequential_distribute import \
+     sequential_distribute_load_pickle_file
+
+
+numprocs = 3
+
+
+def setup_domain(domain, name, smooth):
+
+    domain.set_name(name)
+    domain.set_store_vertices_smoothly(smooth)
+    domain.set_quantities_to_be_stored({'elevation': 1, 'friction': 1,
+                                        'stage': 2, 'xmomentum': 2})
+    domain.set_quantity('elevation', lambda x,y: -x/2)
+    domain.set_quantity('friction', lambda x,y: 0.01*y)
+
+
+def store_frames(domain):
+    """Store frames of known values without evolving the domain
+    """
+
+    domain.initialise_storage()
+    domain.store_timestep()
+    for t in [0.5, 1.0, 1.5, 2.0]:
+        domain.set_time(t)
+        domain.set_quantity('stage', lambda x,y: t*num.sin(x) + y)
+        domain.set_quantity('xmomentum', lambda x,y: t*x*y)
+        domain.store_timestep()
+
+
+def create_files(smooth):
+    """Write the sww file of a sequential domain (seq.sww) and those of
+    its partition into numprocs domains (par_P3_*.sww)
+    """
+
+    domain = anuga.rectangular_cross_domain(8, 5, len1=2.0, len2=1.5)
+    setup_domain(domain, 'seq', smooth)
+    sequential_distribute_dump(domain, numprocs)
+    store_frames(domain)
+
+    for p in range(numprocs):
+        pickle_name = 'seq_P%d_%d.pickle' % (numprocs, p)
+        pdomain = sequential_distribute_load_pickle_file(pickle_name, numprocs)
+        setup_domain(pdomain, 'par', smooth)
+        store_frames(pdomain)
+        os.remove(pickle_name)
+
+
+def read_variables(filename):
+
+    fid = NetCDFFile(filename, netcdf_mode_r)
+    variables = dict((name, num.array(fid.variables[name][:]))
+                     for name in fid.variables)
+    smoothing = fid.smoothing
+    fid.close()
+
+    return variables, smoothing
+
+
+class Test_sww_merge(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['seq.sww', 'par.sww', 'merged.sww'] + \
+                ['par_P%d_%d.sww' % (numprocs, p) for p in range(numprocs)]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+    def check_merge(self, smooth):
+
+        create_files(smooth)
+
+        sww_merge_parallel('par', numprocs)
+        os.rename('par.sww', 'merged.sww')
+        merged, smoothing = read_variables('merged.sww')
+        sequential, sequential_smoothing = read_variables('seq.sww')
+
+        assert smoothing == sequential_smoothing
+
+        for name in ['x', 'y', 'volumes', 'time', 'elevation_c', 'friction_c',
+                     'stage_c', 'xmomentum_c']:
+            assert num.allclose(merged[name], sequential[name])
+
+        if not smooth:
+            # Vertex values are not averaged over the partition
+            for name in ['elevation', 'stage', 'xmomentum', 'stage_range']:
+                assert num.allclose(merged[name], sequential[name])
+
+        # Parallel reads and small blocks give the same file
+        sww_merge_parallel('par', numprocs, jobs=2, frames_per_block=2,
+                           delete_old=True)
+        variables, _ = read_variables('par.sww')
+        assert sorted(variables.keys()) == sorted(merged.keys())
+        for name in variables:
+            assert num.all(variables[name] == merged[name])
+
+        for p in range(numprocs):
+            assert not os.access('par_P%d_%d.sww' % (numprocs, p), os.F_OK)
+
+
+    def test_merge_smooth(self):
+
+        self.check_merge(smooth=True)
+
+
+    def test_merge_non_smooth(self):
+
+        self.check_merge(smooth=False)
+
+
+    def test_get_frames_per_block(self):
+
+        assert get_frames_per_block(1000, block_memory=40000) == 10
+        assert get_frames_per_block(10**9, block_memory=40000) == 1
+        assert get_frames_per_block(0, block_memory=40) == 10
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_sww_merge, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)